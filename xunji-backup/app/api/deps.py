@@ -1,21 +1,70 @@
 from fastapi import Depends, HTTPException, status, Header
 from jose import jwt, JWTError
 from sqlalchemy.orm import Session
-from app.db.session import get_db
-from app.models.sql_models import User
+from app.db.session import get_db, open_replica_session, reads_from_primary
+from app.models.sql_models import User, gen_uuid
 from app.core.security import SECRET_KEY, ALGORITHM
+from app.services.principal_cache import Principal, principal_cache
 import uuid
+from typing import Optional
 
 
 def generate_anonymous_username() -> str:
     return f"user_{uuid.uuid4().hex[:8]}"
 
 
-async def get_current_user(
+# 同步依赖：FastAPI 会把它放到线程池里执行，查询用户时不会阻塞事件循环上的 SSE 流
+# 返回的是脱离会话的 Principal（只有 id 和标记），命中 principal_cache 时整个请求的认证不查库
+def get_current_user(
         db: Session = Depends(get_db),
         authorization: str = Header(None, alias="Authorization"),
         x_device_id: str = Header(None, alias="X-Device-ID")
-) -> User:
+) -> Principal:
+    principal = _resolve_user(db, authorization, x_device_id)
+    # 记下本次请求的用户：该会话提交写入后，这个用户的只读请求会暂时走主库（读己之写）
+    db.info["user_id"] = principal.id
+    return principal
+
+
+def get_read_db(
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_user),
+):
+    """只读接口用的会话：配置了副本且用户最近没有写入时用副本，否则就是请求里的主库会话"""
+    if reads_from_primary(current_user.id):
+        yield db
+        return
+    replica = open_replica_session()
+    try:
+        yield replica
+    finally:
+        replica.close()
+
+
+def _lookup(db: Session, kind: str, value: str, column) -> Optional[Principal]:
+    """先查缓存，未命中再查库并写回缓存；同一用户的 id/用户名/设备号三个键一起缓存"""
+    principal = principal_cache.get(kind, value)
+    if principal:
+        return principal
+    token = principal_cache.version_token()
+    user = db.query(User).filter(column == value).first()
+    if not user:
+        return None
+    principal = Principal.from_user(user)
+    _remember(principal, token)
+    return principal
+
+
+def _remember(principal: Principal, token: int) -> None:
+    keys = [("id", principal.id)]
+    if principal.username:
+        keys.append(("username", principal.username))
+    if principal.device_id:
+        keys.append(("device", principal.device_id))
+    principal_cache.remember(principal, token, keys)
+
+
+def _resolve_user(db: Session, authorization: str, x_device_id: str) -> Principal:
     # 1. 优先尝试通过 Token 认证
     if authorization and authorization.startswith("Bearer "):
         token = authorization.replace("Bearer ", "")
@@ -29,15 +78,15 @@ async def get_current_user(
             username: str = payload.get("sub")
             
             if user_id:
-                user = db.query(User).filter(User.id == user_id).first()
-                if user:
-                    return user
+                principal = _lookup(db, "id", user_id, User.id)
+                if principal:
+                    return principal
             
             if not user_id and username:
                 # 尝试通过用户名查找
-                user = db.query(User).filter(User.username == username).first()
-                if user:
-                    return user
+                principal = _lookup(db, "username", username, User.username)
+                if principal:
+                    return principal
                     
         except JWTError:
             pass  # Token 无效，降级处理
@@ -47,23 +96,27 @@ async def get_current_user(
         # 注意：这里可能存在隐患，如果一个设备 ID 对应多个用户（如登录用户和匿名用户）
         # 应该优先找匿名用户，或者根据业务逻辑调整
         # 但通常登录用户会走上面的 Token 逻辑，走到这里说明没有 Token
-        user = db.query(User).filter(User.device_id == x_device_id).first()
-        if user:
-            return user
+        principal = _lookup(db, "device", x_device_id, User.device_id)
+        if principal:
+            return principal
 
     # 3. 如果都没有，创建新的匿名用户
     device_id = x_device_id or str(uuid.uuid4())
     anonymous_username = generate_anonymous_username()
     
+    # 主键在这里生成，提交后不必再 refresh 一次
+    token = principal_cache.version_token()
     new_user = User(
+        id=gen_uuid(),
         username=anonymous_username,
         device_id=device_id,
         hashed_password="",
         is_anonymous=True
     )
+    principal = Principal.from_user(new_user)
     
     db.add(new_user)
     db.commit()
-    db.refresh(new_user)
+    _remember(principal, token)
     
-    return new_user
+    return principal
@@ -4,20 +4,20 @@ from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, Principal
 from app.core.config import SIGNED_URL_EXPIRES_SECONDS_DEFAULT, SIGNED_URL_EXPIRES_SECONDS_MAX
 from app.db.session import get_db
-from app.models.sql_models import MessageAttachment, User
+from app.models.sql_models import MessageAttachment
 from app.services.aliyun_oss_service import aliyun_oss_service
 
 router = APIRouter()
 
 
 @router.get("/attachments/{attachment_id}/signed-url")
-async def get_attachment_signed_url(
+def get_attachment_signed_url(
     attachment_id: str,
     expires_seconds: Optional[int] = Query(default=None, ge=1),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     """
@@ -30,7 +30,7 @@ async def get_attachment_signed_url(
     Args:
         attachment_id (str): 附件的唯一ID。
         expires_seconds (Optional[int]): 签名URL的有效时间（秒）。如果未提供，则使用云服务商的默认值。
-        current_user (User): 当前认证的用户（无论是注册用户还是匿名用户），由FastAPI的依赖注入提供。
+        current_user (Principal): 当前认证的用户（无论是注册用户还是匿名用户），由FastAPI的依赖注入提供。
         db (Session): 数据库会话，由FastAPI的依赖注入提供。
 
     Raises:
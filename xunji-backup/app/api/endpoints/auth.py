@@ -1,3 +1,5 @@
+import asyncio
+
 from fastapi import APIRouter, Depends, HTTPException, status, Header
 from sqlalchemy.orm import Session
 from datetime import timedelta
@@ -5,21 +7,47 @@ from datetime import timedelta
 from app.db.session import get_db
 from app.models.sql_models import User
 from app.schemas.auth import UserCreate, UserLogin, Token, UserOut, DeviceLogin, UpgradeAccount
-from app.core.security import get_password_hash, verify_password, create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.core.security import create_access_token, ACCESS_TOKEN_EXPIRE_MINUTES
+from app.services.password_hasher import PasswordHasherBusy, password_hasher
+from app.services.principal_cache import principal_cache
 import uuid
 
 router = APIRouter()
 
 
+# 注册、登录、升级账号是 async 接口：bcrypt 在 password_hasher 的进程池里算，事件循环只等待结果，
+# 不占用线程池；数据库读写照常用 asyncio.to_thread 放到线程池
+async def _hashing(call):
+    try:
+        return await call
+    except PasswordHasherBusy:
+        # 排队已满：快速失败，让客户端稍后重试，而不是把请求堆在服务里
+        raise HTTPException(status_code=503, detail="请求过多，请稍后重试", headers={"Retry-After": "1"})
+
+
+def _find_user(db: Session, *criteria) -> User | None:
+    # 查完立即关闭会话、把连接还给连接池：后面的 bcrypt 要等上百毫秒，登录高峰时不能占着连接让聊天流等待
+    user = db.query(User).filter(*criteria).first()
+    db.close()
+    return user
+
+
+def _save(db: Session, user: User) -> None:
+    # add 会把 _find_user 关闭会话后游离的对象重新挂回来；提交后顺带 refresh，之后在事件循环上读取属性不会再触发懒加载查询
+    db.add(user)
+    db.commit()
+    db.refresh(user)
+
+
 @router.post("/register", response_model=UserOut)
-def register(user_in: UserCreate, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_in.username).first()
+async def register(user_in: UserCreate, db: Session = Depends(get_db)):
+    user = await asyncio.to_thread(_find_user, db, User.username == user_in.username)
     if user:
         raise HTTPException(
             status_code=400,
             detail="用户名已被注册"
         )
-    password = get_password_hash(user_in.password) or ""
+    password = await _hashing(password_hasher.hash(user_in.password)) or ""
     new_user = User(
         username=user_in.username,
         email=user_in.email,
@@ -27,21 +55,21 @@ def register(user_in: UserCreate, db: Session = Depends(get_db)):
         is_anonymous=False
     )
 
-    db.add(new_user)
-    db.commit()
-    db.refresh(new_user)
+    await asyncio.to_thread(_save, db, new_user)
     return new_user
 
 
 @router.post("/login", response_model=Token)
-def login(user_in: UserLogin, db: Session = Depends(get_db)):
-    user = db.query(User).filter(User.username == user_in.username).first()
-    if not user or not verify_password(user_in.password, user.hashed_password):
+async def login(user_in: UserLogin, db: Session = Depends(get_db)):
+    user = await asyncio.to_thread(_find_user, db, User.username == user_in.username)
+    if not user or not await _hashing(password_hasher.verify(user_in.password, user.hashed_password)):
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="用户名或密码错误",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    # 重新登录后丢掉该用户缓存的身份，下一次请求按数据库里的最新状态认证
+    principal_cache.forget([user.id])
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
         data={"sub": user.username, "user_id": user.id, "device_id": user.device_id},
@@ -86,26 +114,27 @@ def anonymous_login(payload: DeviceLogin, db: Session = Depends(get_db)):
 
 
 @router.post("/upgrade-account", response_model=Token)
-def upgrade_account(
+async def upgrade_account(
     payload: UpgradeAccount,
     db: Session = Depends(get_db),
     x_device_id: str = Header(None, alias="X-Device-ID")
 ):
     if not x_device_id:
         raise HTTPException(status_code=400, detail="缺少设备标识")
-    user = db.query(User).filter(User.device_id == x_device_id).first()
+    user = await asyncio.to_thread(_find_user, db, User.device_id == x_device_id)
     if not user:
         raise HTTPException(status_code=404, detail="未找到当前用户")
 
-    existing = db.query(User).filter(User.username == payload.username).first()
+    existing = await asyncio.to_thread(_find_user, db, User.username == payload.username)
     if existing and existing.id != user.id:
         raise HTTPException(status_code=400, detail="用户名已被注册")
 
+    hashed_password = await _hashing(password_hasher.hash(payload.password)) or ""
     user.username = payload.username
-    user.hashed_password = get_password_hash(payload.password) or ""
+    user.hashed_password = hashed_password
     user.is_anonymous = False
-    db.commit()
-    db.refresh(user)
+    # 提交时会话钩子会让 principal_cache 里该用户的旧身份（匿名、旧用户名）失效
+    await asyncio.to_thread(_save, db, user)
 
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
@@ -1,103 +1,160 @@
+import asyncio
 import json
 import logging
+from typing import Optional, Tuple
 
 from fastapi import APIRouter, Depends, HTTPException
 from fastapi.responses import StreamingResponse  # ★ 引入流式响应
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, Principal
 from app.db.session import get_db
-from app.models.sql_models import Conversation, Message, User, TreeNode, MessageAttachment, gen_uuid
+from app.models.sql_models import Conversation, Message, TreeNode, MessageAttachment, gen_uuid
 from app.schemas.chat import ChatRequest
 from app.services.chat_services import chat_service
-from app.services.title_generator import title_generator # ★ 引入标题生成服务
-from app.db.session import SessionLocal # 引入 SessionLocal 用于后台任务
+from app.services.title_generator import CHAT_TITLE_TIMEOUT_SECONDS, title_generator # ★ 引入标题生成服务
 from app.services.attachment_service import save_chat_attachments
 
 router = APIRouter()
 _logger = logging.getLogger(__name__)
 
 
+# 一轮对话最多两个写事务：
+#   事务 1（开始流式输出前）：新会话 + 用户消息 + 用户树节点
+#   事务 2（回复生成完之后）：AI 消息 + AI 树节点 + 附件记录 + 新标题
+# id 都在客户端用 gen_uuid 生成，提交后不再 refresh；提交会让 ORM 对象过期，之后只使用事先记下的 id
+def _save_user_message(db: Session, request: ChatRequest) -> Tuple[str, str, bool]:
+    """事务 1：建会话（如需要）并保存用户消息与树节点；在线程池中执行
+
+    返回 (user_message_id, user_node_id, 本轮结束后是否需要生成标题)
+    """
+    # 2. 会话处理 (如果不存在则创建)
+    if request.conversation_id is None:
+        request.conversation_id = gen_uuid()
+        db.add(Conversation(
+            id=request.conversation_id,
+            title="新对话",  # 初始标题，本轮回复结束后更新
+            user_id=request.user_id
+        ))
+        should_generate_title = True
+    else:
+        # 每 10 条消息（约 5 轮）重新生成一次标题：本轮结束后的消息数 = 现有数量 + 2
+        msg_count = db.query(func.count(Message.id)).filter(Message.conversation_id == request.conversation_id).scalar()
+        _logger.info(f"msg_count {msg_count + 2}")
+        should_generate_title = (msg_count + 2) % 10 == 0
+
+    # 3. ★ 立即保存【用户消息】 (防止流中断导致用户消息丢失)
+    user_message_id, user_node_id = gen_uuid(), gen_uuid()
+    db.add(Message(
+        id=user_message_id,
+        conversation_id=request.conversation_id,
+        role="user",
+        content=request.message
+    ))
+
+    # ★ 新增：创建树节点（用户），挂载到前端传来的父节点上
+    db.add(TreeNode(
+        id=user_node_id,
+        conversation_id=request.conversation_id,
+        message_id=user_message_id,
+        parent_id=request.parent_id
+    ))
+
+    db.commit()
+    return user_message_id, user_node_id, should_generate_title
+
+
+def _save_ai_message(db: Session, request: ChatRequest, ai_message_id: str, ai_node_id: str, user_node_id: str,
+                     content: str, title: Optional[str] = None) -> None:
+    """事务 2：保存 AI 回复与树节点，连同已 add 的附件记录和新标题一起提交；在线程池中执行"""
+    db.add(Message(
+        id=ai_message_id,
+        conversation_id=request.conversation_id,
+        role="ai",
+        content=content
+    ))
+    db.add(TreeNode(
+        id=ai_node_id,
+        conversation_id=request.conversation_id,
+        message_id=ai_message_id,
+        parent_id=user_node_id
+    ))
+    if title:
+        db.query(Conversation).filter(Conversation.id == request.conversation_id).update(
+            {Conversation.title: title}, synchronize_session=False
+        )
+    db.commit()
+
+
+async def _generate_title(request: ChatRequest, ai_response: str) -> Optional[str]:
+    try:
+        # 使用当前的 prompt 和 response 生成新标题
+        # 注意：request.message 是当前最新的用户输入
+        # 标题和 AI 回复在同一个事务里提交：限时等待，标题模型卡住时放弃标题，回复照常保存
+        return await asyncio.wait_for(title_generator.generate_title(request.message, ai_response),
+                                      timeout=CHAT_TITLE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        _logger.warning(f"Title generation timed out after {CHAT_TITLE_TIMEOUT_SECONDS}s")
+        return None
+    except Exception:
+        _logger.exception("Failed to generate title")
+        return None
+
+
 async def chat_response_generator(
     *,
     request: ChatRequest,
     db: Session,
-    user_node: TreeNode,
-    user_message: Message,
-    user_message_id: str | None = None,
-    is_new_conversation: bool,
+    user_node_id: str,
+    user_message_id: str,
+    should_generate_title: bool,
 ):
     full_ai_response = ""
 
-    yield f"data: {json.dumps({'session_id': request.conversation_id, 'user_node_id': user_node.id})}\n\n"
+    yield f"data: {json.dumps({'session_id': request.conversation_id, 'user_node_id': user_node_id})}\n\n"
 
-    async for chunk in chat_service.astream_chat_with_model(request, db, current_node_id=user_node.id):
+    async for chunk in chat_service.astream_chat_with_model(request, db, current_node_id=user_node_id):
         if chunk:
             full_ai_response += chunk
             yield f"data: {json.dumps({'content': chunk})}\n\n"
 
-    ai_message = Message(
-        id=gen_uuid(),
-        conversation_id=request.conversation_id,
-        role="ai",
-        content=full_ai_response
-    )
-    db.add(ai_message)
-
-    ai_node = TreeNode(
-        id=gen_uuid(),
-        conversation_id=request.conversation_id,
-        message_id=ai_message.id,
-        parent_id=user_node.id
-    )
-    db.add(ai_node)
-    db.commit()
-    db.refresh(ai_node)
+    # 附件上传到对象存储与标题生成（新会话或每隔一定轮次，最多等 CHAT_TITLE_TIMEOUT_SECONDS）同时进行，完成后与 AI 回复在同一个事务里提交
+    ai_message_id, ai_node_id = gen_uuid(), gen_uuid()
+    try:
+        saved_attachments, new_title = await asyncio.gather(
+            asyncio.to_thread(
+                save_chat_attachments,
+                db=db,
+                files=request.files,
+                user_id=request.user_id,
+                conversation_id=request.conversation_id,
+                message_id=user_message_id,
+                commit=False,
+            ),
+            _generate_title(request, full_ai_response) if should_generate_title else asyncio.sleep(0),
+        )
+        await asyncio.to_thread(_save_ai_message, db, request, ai_message_id, ai_node_id, user_node_id,
+                                full_ai_response, new_title)
+    except asyncio.CancelledError:
+        # 客户端在提交前断开：回复已完整生成，用独立会话单独保存（不含附件与标题），
+        # 请求会话可能仍被上传附件或提交的线程使用；那边已经提交成功时这里会因主键冲突失败，忽略即可
+        # 带上当前用户，提交后该用户同样粘住主库（读己之写）
+        try:
+            with Session(bind=db.get_bind(), info={"user_id": db.info.get("user_id")}) as fallback_db:
+                _save_ai_message(fallback_db, request, ai_message_id, ai_node_id, user_node_id, full_ai_response)
+        except Exception as e:
+            _logger.warning(f"Failed to save AI reply after disconnect: {e}")
+        raise
 
-    yield f"data: {json.dumps({'ai_node_id': ai_node.id})}\n\n"
+    yield f"data: {json.dumps({'ai_node_id': ai_node_id})}\n\n"
 
-    saved_attachments = save_chat_attachments(
-        db=db,
-        files=request.files,
-        user_id=request.user_id,
-        conversation_id=request.conversation_id,
-        message_id=user_message_id or user_message.id,
-    )
     if saved_attachments:
         yield f"data: {json.dumps({'user_attachments_saved': saved_attachments})}\n\n"
 
-    # 6. 生成标题（新会话或每隔一定轮次）
-    should_generate_title = is_new_conversation
-    
-    if not should_generate_title:
-        try:
-            # 检查消息数量，每 10 条消息（约 5 轮）重新生成一次
-            # 注意：这里的 db 是当前请求的 session，可以直接用
-            msg_count = db.query(Message).filter(Message.conversation_id == request.conversation_id).count()
-            _logger.info(f"msg_count {msg_count}")
-            if msg_count > 0 and msg_count % 10 == 0:
-                should_generate_title = True
-        except Exception as e:
-            print(f"Failed to check message count for title generation: {e}")
-
-    if should_generate_title:
-        try:
-            # 使用当前的 prompt 和 response 生成新标题
-            # 注意：request.message 是当前最新的用户输入
-            new_title = await title_generator.generate_title(request.message, full_ai_response)
-            
-            # 使用新的 Session 更新数据库，避免影响当前 db session 的状态（虽然当前 db 马上要结束了）
-            # 这里用 SessionLocal 是为了保险，且与原逻辑保持一致
-            with SessionLocal() as background_db:
-                conv = background_db.query(Conversation).filter(Conversation.id == request.conversation_id).first()
-                if conv:
-                    conv.title = new_title
-                    background_db.commit()
-            
-            # 推送新标题给前端
-            yield f"data: {json.dumps({'new_title': new_title})}\n\n"
-        except Exception as e:
-            print(f"Failed to generate title: {e}")
+    if new_title:
+        # 推送新标题给前端
+        yield f"data: {json.dumps({'new_title': new_title})}\n\n"
 
     yield "data: [DONE]\n\n"
 
@@ -105,7 +162,7 @@ async def chat_response_generator(
 @router.post("/chat")  # 注意：这里不再指定 response_model，因为返回的是 Stream
 async def chat_endpoint(
         request: ChatRequest,
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
         db: Session = Depends(get_db)
 ):
     # 1. 基础信息处理
@@ -119,50 +176,17 @@ async def chat_endpoint(
         else:
             raise HTTPException(status_code=422, detail="message 不能为空")
 
-    # 2. 会话处理 (如果不存在则创建)
-    is_new_conversation = request.conversation_id is None # 标记是否为新会话
-    if is_new_conversation:
-        conversation = Conversation(
-            id=gen_uuid(),
-            title="新对话",  # 初始标题，稍后异步更新
-            user_id=request.user_id
-        )
-        db.add(conversation)
-        db.commit()
-        db.refresh(conversation)
-        request.conversation_id = conversation.id
-
-    # 3. ★ 立即保存【用户消息】 (防止流中断导致用户消息丢失)
-    user_message = Message(
-        id=gen_uuid(),
-        conversation_id=request.conversation_id,
-        role="user",
-        content=request.message
-    )
-    db.add(user_message)
-    user_message_id = user_message.id
-    
-    # ★ 新增：创建树节点（用户）
-    user_node = TreeNode(
-        id=gen_uuid(),
-        conversation_id=request.conversation_id,
-        message_id=user_message.id,
-        parent_id=request.parent_id  # 挂载到前端传来的父节点上
-    )
-    db.add(user_node)
-    
-    db.commit()
-    db.refresh(user_node) # 获取ID
+    # 2~4. 建会话、保存用户消息与树节点（事务 1）：同步 Session 的提交放到线程池，不阻塞事件循环上的其他流
+    user_message_id, user_node_id, should_generate_title = await asyncio.to_thread(_save_user_message, db, request)
 
     # 5. 返回流式响应
     return StreamingResponse(
         chat_response_generator(
             request=request,
             db=db,
-            user_node=user_node,
-            user_message=user_message,
+            user_node_id=user_node_id,
             user_message_id=user_message_id,
-            is_new_conversation=is_new_conversation,
+            should_generate_title=should_generate_title,
         ),
         media_type="text/event-stream"
     )
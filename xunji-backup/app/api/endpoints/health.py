@@ -0,0 +1,44 @@
+import logging
+
+from fastapi import APIRouter, Depends
+from fastapi.responses import JSONResponse
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.db.session import get_db, replica_engine
+from app.services.warmup_service import rag_warmup_service
+
+router = APIRouter()
+_logger = logging.getLogger(__name__)
+
+
+# --- 存活检查：进程能响应即可 ---
+@router.get("/health/live")
+async def live():
+    return {"status": "ok"}
+
+
+# --- 就绪检查：数据库可用且 RAG 预热完成（RAG_WARMUP_ENABLED=true 时）才返回 200，负载均衡据此摘除冷实例 ---
+@router.get("/health/ready")
+def ready(db: Session = Depends(get_db)):
+    checks = {"rag": rag_warmup_service.state()}
+    try:
+        db.execute(text("SELECT 1"))
+        checks["database"] = {"status": "ok"}
+    except Exception:
+        # 接口不需要认证：异常详情（连接串、主机名等）只写日志，不返回给调用方
+        _logger.exception("就绪检查：数据库不可用")
+        checks["database"] = {"status": "failed"}
+    # 副本只做报告，不影响就绪状态：只读请求在副本不可用时仍可改走主库排查
+    if replica_engine is not None:
+        try:
+            with replica_engine.connect() as conn:
+                conn.execute(text("SELECT 1"))
+            checks["replica"] = {"status": "ok"}
+        except Exception:
+            _logger.exception("就绪检查：只读副本不可用")
+            checks["replica"] = {"status": "failed"}
+
+    is_ready = checks["database"]["status"] == "ok" and rag_warmup_service.ready
+    body = {"status": "ready" if is_ready else "not_ready", "checks": checks}
+    return JSONResponse(status_code=200 if is_ready else 503, content=body)
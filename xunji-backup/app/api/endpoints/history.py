@@ -1,16 +1,49 @@
+import base64
+import binascii
+
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Response
+from sqlalchemy import and_, func, literal, or_
 from sqlalchemy.orm import Session
-from typing import List, Optional, Dict, Any
+from typing import List, Optional, Dict, Any, Tuple
 from pydantic import BaseModel
 from datetime import datetime
 
 from app.db.session import get_db
-from app.models.sql_models import Conversation, Message, TreeNode, MessageAttachment, User
-from app.api.deps import get_current_user
+from app.models.sql_models import Conversation, Message, TreeNode, MessageAttachment
+from app.api.deps import get_current_user, Principal, get_read_db
+from app.services.tree_service import tree_service
 
 router = APIRouter()
 
+# light 视图下消息正文预览的最大字符数，完整内容通过单条消息接口获取
+MESSAGE_PREVIEW_CHARS = 200
+MAX_PAGE_SIZE = 500
+# 下一页游标放在响应头里，响应体仍是列表，旧前端不受影响
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+# /tree 接口每个节点的消息预览字符数；修改后 ETag 随之改变
+TREE_PREVIEW_CHARS = 60
+
+
+def _encode_cursor(ts: datetime, row_id: str) -> str:
+    return base64.urlsafe_b64encode(f"{ts.isoformat()}|{row_id}".encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        ts, row_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").split("|", 1)
+        return datetime.fromisoformat(ts), row_id
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+
+def _after(ts_column, id_column, cursor: Optional[str], descending: bool):
+    """(时间, id) 复合键上的 keyset 条件：只取游标之后的行"""
+    ts, row_id = _decode_cursor(cursor)
+    if descending:
+        return or_(ts_column < ts, and_(ts_column == ts, id_column < row_id))
+    return or_(ts_column > ts, and_(ts_column == ts, id_column > row_id))
+
 
 # --- 定义响应模型 (DTO) ---
 class ConversationDTO(BaseModel):
@@ -32,39 +65,83 @@ class MessageDTO(BaseModel):
     node_id: Optional[str] = None # 新增节点ID
     parent_node_id: Optional[str] = None # 新增父节点ID
     attachments: List[Dict[str, Any]] = []
+    truncated: bool = False # light 视图下 content 只是预览
 
     class Config:
         from_attributes = True
 
 
+class ConversationTreeDTO(BaseModel):
+    """整棵树的紧凑邻接表：各数组按下标对齐，节点按先序（父节点总在子节点之前）排列"""
+    conversation_id: str
+    version: int
+    ids: List[str]               # 节点 id
+    parents: List[int]           # 父节点在 ids 中的下标，根节点为 -1
+    message_ids: List[str]       # 完整内容用单条消息接口获取
+    roles: List[str]
+    previews: List[str]          # 前 TREE_PREVIEW_CHARS 个字符
+
+
+def _tree_etag(version: int) -> str:
+    return f'"{version}.{TREE_PREVIEW_CHARS}"'
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match 使用弱比较：忽略 W/ 前缀"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+
+
 # --- 接口 1: 获取会话列表 (侧边栏) ---
 @router.get("/conversations", response_model=List[ConversationDTO])
-async def get_conversations(
-        limit: int = 20,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+def get_conversations(
+        response: Response,
+        limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        db: Session = Depends(get_read_db),
+        current_user: Principal = Depends(get_current_user)
 ):
     """
     获取当前用户的会话列表，按更新时间倒序排列（最近聊的在最上面）
+    还有更多时响应头 X-Next-Cursor 给出下一页游标，作为 cursor 参数传回即可（基于 (updated_at, id) 的 keyset 分页）
     """
-    conversations = db.query(Conversation) \
+    query = db.query(Conversation) \
         .filter(Conversation.user_id == current_user.id) \
-        .filter(Conversation.is_deleted == False) \
-        .order_by(Conversation.updated_at.desc()) \
-        .limit(limit) \
+        .filter(Conversation.is_deleted == False)
+    if cursor:
+        query = query.filter(_after(Conversation.updated_at, Conversation.id, cursor, descending=True))
+    conversations = query \
+        .order_by(Conversation.updated_at.desc(), Conversation.id.desc()) \
+        .limit(limit + 1) \
         .all()
+    if len(conversations) > limit:
+        conversations = conversations[:limit]
+        last = conversations[-1]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(last.updated_at, last.id)
     return conversations
 
 
 # --- 接口 2: 获取指定会话的消息记录 (点击进入聊天) ---
 @router.get("/conversations/{conversation_id}/messages", response_model=List[MessageDTO])
-async def get_messages(
+def get_messages(
         conversation_id: str,
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        response: Response,
+        limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+        cursor: Optional[str] = None,
+        order: str = Query("asc", pattern="^(asc|desc)$"),
+        view: str = Query("full", pattern="^(full|light)$"),
+        db: Session = Depends(get_read_db),
+        current_user: Principal = Depends(get_current_user)
 ):
     """
     加载具体的聊天记录
+    - 不传 limit 时返回全部消息（兼容旧前端）；传 limit 时按 (created_at, id) keyset 分页，
+      还有更多时响应头 X-Next-Cursor 给出下一页游标
+    - order=desc 从最新的消息往前翻页
+    - view=light 只返回前 MESSAGE_PREVIEW_CHARS 个字符（truncated=true），完整内容用单条消息接口获取
     """
     # 1. 检查会话是否存在且属于当前用户
     conversation = db.query(Conversation).filter(
@@ -74,15 +151,32 @@ async def get_messages(
     if not conversation:
         raise HTTPException(status_code=404, detail="会话不存在")
 
-    # 2. 查消息 (按时间正序，最旧的在上面)
+    # 2. 查消息 (默认按时间正序，最旧的在上面)，只取需要的列
     # 并且我们需要 Join TreeNode 来获取 node_id
     # 注意：这里我们使用 outerjoin，因为旧消息可能没有 node 记录
-    results = db.query(Message, TreeNode.id.label("node_id"), TreeNode.parent_id.label("parent_node_id")) \
+    light = view == "light"
+    content = func.substr(Message.content, 1, MESSAGE_PREVIEW_CHARS) if light else Message.content
+    query = db.query(
+        Message.id, Message.role, content.label("content"), Message.created_at, Message.type,
+        (func.length(Message.content) > MESSAGE_PREVIEW_CHARS if light else literal(False)).label("truncated"),
+        TreeNode.id.label("node_id"), TreeNode.parent_id.label("parent_node_id"),
+    ) \
         .outerjoin(TreeNode, TreeNode.message_id == Message.id) \
-        .filter(Message.conversation_id == conversation_id) \
-        .order_by(Message.created_at.asc()) \
-        .all()
-    message_ids = [msg.id for msg, _, _ in results]
+        .filter(Message.conversation_id == conversation_id)
+    descending = order == "desc"
+    if cursor:
+        query = query.filter(_after(Message.created_at, Message.id, cursor, descending))
+    if descending:
+        query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    else:
+        query = query.order_by(Message.created_at.asc(), Message.id.asc())
+    if limit is not None:
+        query = query.limit(limit + 1)
+    results = query.all()
+    if limit is not None and len(results) > limit:
+        results = results[:limit]
+        response.headers[NEXT_CURSOR_HEADER] = _encode_cursor(results[-1].created_at, results[-1].id)
+    message_ids = [row.id for row in results]
     attachments = db.query(MessageAttachment).filter(MessageAttachment.message_id.in_(message_ids)).all() if message_ids else []
     attachments_map = {}
     for a in attachments:
@@ -97,28 +191,122 @@ async def get_messages(
     
     # 构造 DTO
     messages_dto = []
-    for msg, node_id, parent_node_id in results:
+    for row in results:
         dto = MessageDTO(
-            id=msg.id,
-            role=msg.role,
-            content=msg.content,
-            created_at=msg.created_at,
-            type=msg.type,
-            node_id=node_id,
-            parent_node_id=parent_node_id,
-            attachments=attachments_map.get(msg.id, []),
+            id=row.id,
+            role=row.role,
+            content=row.content or "",
+            created_at=row.created_at,
+            type=row.type,
+            node_id=row.node_id,
+            parent_node_id=row.parent_node_id,
+            attachments=attachments_map.get(row.id, []),
+            truncated=bool(row.truncated),
         )
         messages_dto.append(dto)
 
     return messages_dto
 
 
+# --- 接口 2.1: 获取单条消息的完整内容 (配合 view=light) ---
+@router.get("/conversations/{conversation_id}/messages/{message_id}", response_model=MessageDTO)
+def get_message(
+        conversation_id: str,
+        message_id: str,
+        db: Session = Depends(get_read_db),
+        current_user: Principal = Depends(get_current_user)
+):
+    row = db.query(Message, TreeNode.id.label("node_id"), TreeNode.parent_id.label("parent_node_id")) \
+        .join(Conversation, Conversation.id == Message.conversation_id) \
+        .outerjoin(TreeNode, TreeNode.message_id == Message.id) \
+        .filter(Message.id == message_id,
+                Message.conversation_id == conversation_id,
+                Conversation.user_id == current_user.id) \
+        .first()
+    if not row:
+        raise HTTPException(status_code=404, detail="消息不存在")
+    msg, node_id, parent_node_id = row
+    attachments = db.query(MessageAttachment).filter(MessageAttachment.message_id == msg.id).all()
+    return MessageDTO(
+        id=msg.id,
+        role=msg.role,
+        content=msg.content or "",
+        created_at=msg.created_at,
+        type=msg.type,
+        node_id=node_id,
+        parent_node_id=parent_node_id,
+        attachments=[{
+            "id": a.id,
+            "filename": a.filename,
+            "mime": a.mime,
+            "size": a.size,
+            "storage_provider": a.storage_provider,
+            "storage_key": a.storage_key,
+        } for a in attachments],
+    )
+
+
+# --- 接口 2.2: 整棵对话树的紧凑结构 (树状视图，支持 ETag 条件请求) ---
+@router.get("/conversations/{conversation_id}/tree", response_model=ConversationTreeDTO)
+def get_conversation_tree(
+        conversation_id: str,
+        response: Response,
+        if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_user)
+):
+    """
+    返回节点 id、父节点下标、角色和短预览，代替为了画树而拉取全部消息正文
+    - ETag 由会话的 tree_version 生成；树没变时带 If-None-Match 请求直接返回 304，
+      版本号命中内存缓存时不查询数据库
+    - 固定读主库：副本上可能读到旧版本号，缓存后会把已变化的树答成 304
+    """
+    headers = {"Cache-Control": "private, no-cache"}
+    version = tree_service.cached_version(conversation_id, current_user.id)
+    if version is not None and _etag_matches(if_none_match, _tree_etag(version)):
+        return Response(status_code=304, headers={**headers, "ETag": _tree_etag(version)})
+
+    # 先读版本号再读节点：两次读取之间若有新节点，只会让客户端下次多拉一次，不会把新内容配上旧 ETag
+    token = tree_service.version_token()
+    conversation = db.query(Conversation.tree_version).filter(
+        Conversation.id == conversation_id,
+        Conversation.user_id == current_user.id
+    ).first()
+    if not conversation:
+        raise HTTPException(status_code=404, detail="会话不存在")
+    version = conversation.tree_version or 0
+    tree_service.remember_version(conversation_id, current_user.id, version, token)
+    etag = _tree_etag(version)
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers={**headers, "ETag": etag})
+
+    rows = db.query(
+        TreeNode.id, TreeNode.parent_id, Message.id.label("message_id"), Message.role,
+        func.substr(Message.content, 1, TREE_PREVIEW_CHARS).label("preview"),
+    ) \
+        .join(Message, Message.id == TreeNode.message_id) \
+        .filter(TreeNode.conversation_id == conversation_id) \
+        .order_by(TreeNode.path, TreeNode.created_at) \
+        .all()
+    index = {row.id: i for i, row in enumerate(rows)}
+    response.headers.update({**headers, "ETag": etag})
+    return ConversationTreeDTO(
+        conversation_id=conversation_id,
+        version=version,
+        ids=[row.id for row in rows],
+        parents=[index.get(row.parent_id, -1) for row in rows],
+        message_ids=[row.message_id for row in rows],
+        roles=[row.role for row in rows],
+        previews=[row.preview or "" for row in rows],
+    )
+
+
 # --- 接口 3: 删除会话 (软删除) ---
 @router.delete("/conversations/{conversation_id}")
-async def delete_conversation(
+def delete_conversation(
         conversation_id: str,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        current_user: Principal = Depends(get_current_user)
 ):
     """
     删除会话（前端点击垃圾桶图标）
@@ -132,22 +320,21 @@ async def delete_conversation(
 
     # 执行软删除
     conversation.is_deleted = True
+    conversation.deleted_at = datetime.now()
     db.commit()
     return {"message": "会话已删除", "conversation_id": conversation_id}
 
 
 # --- 接口 4: 根据节点ID获取完整路径消息 (面包屑) ---
 @router.get("/tree/path/{node_id}", response_model=List[MessageDTO])
-async def get_node_path(
+def get_node_path(
         node_id: str, 
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)
+        db: Session = Depends(get_read_db),
+        current_user: Principal = Depends(get_current_user)
 ):
     """
-    根据指定节点ID，向上递归获取完整路径上的所有消息（从根节点 -> 当前节点）
+    根据指定节点ID，获取完整路径上的所有消息（从根节点 -> 当前节点）
     """
-    from sqlalchemy import text
-    
     # 检查节点是否存在，并间接检查是否属于当前用户
     target_node = db.query(TreeNode).join(Message).join(Conversation).filter(
         TreeNode.id == node_id,
@@ -156,30 +343,8 @@ async def get_node_path(
     if not target_node:
         raise HTTPException(status_code=404, detail="Node not found or access denied")
 
-    # 使用 CTE 递归查询路径
-    # 注意：SQLite 和 Postgres 都支持 WITH RECURSIVE
-    recursive_query = text("""
-        WITH RECURSIVE path_cte AS (
-            -- 锚点成员：从目标节点开始
-            SELECT t.id, t.parent_id, t.message_id, 0 as level
-            FROM tree_nodes t
-            WHERE t.id = :target_id
-            
-            UNION ALL
-            
-            -- 递归成员：向上查找父节点
-            SELECT t.id, t.parent_id, t.message_id, pc.level + 1
-            FROM tree_nodes t
-            JOIN path_cte pc ON t.id = pc.parent_id
-        )
-        SELECT pc.id as node_id, pc.parent_id as parent_node_id, 
-               m.id, m.role, m.content, m.created_at, m.type, m.conversation_id
-        FROM path_cte pc
-        JOIN messages m ON pc.message_id = m.id
-        ORDER BY pc.level DESC; -- level越大说明越靠上（根节点level最大），所以倒序排列就是 从根->叶子
-    """)
-    
-    results = db.execute(recursive_query, {"target_id": node_id}).fetchall()
+    # 物化路径：根 -> 当前节点的整条链是 (conversation_id, path) 索引上的一次查询
+    results = tree_service.ancestors(db, target_node)
     message_ids = [row.id for row in results]
     attachments = db.query(MessageAttachment).filter(MessageAttachment.message_id.in_(message_ids)).all() if message_ids else []
     attachments_map = {}
@@ -196,13 +361,11 @@ async def get_node_path(
     # 构造返回
     path_messages = []
     for row in results:
-        # 手动映射 SQLAlchemy Row 到 Pydantic 模型
-        # 注意：db.execute 返回的是 RowProxy / Row，可以直接按属性访问
         dto = MessageDTO(
             id=row.id,
             role=row.role,
             content=row.content,
-            created_at=datetime.fromisoformat(str(row.created_at)) if isinstance(row.created_at, str) else row.created_at,
+            created_at=row.created_at,
             type=row.type,
             node_id=row.node_id,
             parent_node_id=row.parent_node_id
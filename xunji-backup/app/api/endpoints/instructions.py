@@ -5,9 +5,9 @@ from pydantic import BaseModel
 from sqlalchemy import func
 from sqlalchemy.orm import Session
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, Principal, get_read_db
 from app.db.session import get_db
-from app.models.sql_models import AiInstruction, Conversation, ConversationAiInstruction, User
+from app.models.sql_models import AiInstruction, Conversation, ConversationAiInstruction
 
 router = APIRouter()
 
@@ -48,7 +48,7 @@ class ConversationAiInstructionDTO(BaseModel):
         from_attributes = True
 
 
-def _get_owned_conversation(db: Session, conversation_id: str, current_user: User) -> Conversation:
+def _get_owned_conversation(db: Session, conversation_id: str, current_user: Principal) -> Conversation:
     # 1. 先尝试严格匹配（当前用户拥有的会话）
     conversation = (
         db.query(Conversation)
@@ -65,9 +65,9 @@ def _get_owned_conversation(db: Session, conversation_id: str, current_user: Use
 
 
 @router.get("/instructions", response_model=List[AiInstructionDTO])
-async def get_instructions(
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+def get_instructions(
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     return (
         db.query(AiInstruction)
@@ -79,10 +79,10 @@ async def get_instructions(
 
 
 @router.post("/instructions", response_model=AiInstructionDTO)
-async def create_instruction(
+def create_instruction(
     payload: AiInstructionCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     content = (payload.content or "").strip()
     if not content:
@@ -104,11 +104,11 @@ async def create_instruction(
 
 
 @router.put("/instructions/{instruction_id}", response_model=AiInstructionDTO)
-async def update_instruction(
+def update_instruction(
     instruction_id: str,
     payload: AiInstructionUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     row = (
         db.query(AiInstruction)
@@ -135,10 +135,10 @@ async def update_instruction(
 
 
 @router.delete("/instructions/{instruction_id}")
-async def delete_instruction(
+def delete_instruction(
     instruction_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     row = (
         db.query(AiInstruction)
@@ -156,10 +156,10 @@ async def delete_instruction(
 
 
 @router.get("/conversations/{conversation_id}/instructions", response_model=List[ConversationAiInstructionDTO])
-async def get_conversation_instructions(
+def get_conversation_instructions(
     conversation_id: str,
-    db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_read_db),
+    current_user: Principal = Depends(get_current_user),
 ):
     _get_owned_conversation(db, conversation_id, current_user)
     return (
@@ -173,11 +173,11 @@ async def get_conversation_instructions(
 
 
 @router.post("/conversations/{conversation_id}/instructions", response_model=ConversationAiInstructionDTO)
-async def create_conversation_instruction(
+def create_conversation_instruction(
     conversation_id: str,
     payload: ConversationAiInstructionCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     _get_owned_conversation(db, conversation_id, current_user)
     content = (payload.content or "").strip()
@@ -209,12 +209,12 @@ async def create_conversation_instruction(
     "/conversations/{conversation_id}/instructions/{instruction_id}",
     response_model=ConversationAiInstructionDTO,
 )
-async def update_conversation_instruction(
+def update_conversation_instruction(
     conversation_id: str,
     instruction_id: str,
     payload: ConversationAiInstructionUpdate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     _get_owned_conversation(db, conversation_id, current_user)
     row = (
@@ -243,11 +243,11 @@ async def update_conversation_instruction(
 
 
 @router.delete("/conversations/{conversation_id}/instructions/{instruction_id}")
-async def delete_conversation_instruction(
+def delete_conversation_instruction(
     conversation_id: str,
     instruction_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
 ):
     _get_owned_conversation(db, conversation_id, current_user)
     row = (
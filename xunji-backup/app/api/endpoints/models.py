@@ -3,8 +3,8 @@ from fastapi import APIRouter, Depends, HTTPException
 from sqlalchemy.orm import Session
 from pydantic import BaseModel
 from app.db.session import get_db
-from app.models.sql_models import ModelConfig, User
-from app.api.deps import get_current_user
+from app.models.sql_models import ModelConfig
+from app.api.deps import get_current_user, Principal
 import uuid
 
 router = APIRouter()
@@ -25,9 +25,9 @@ class ModelConfigDTO(BaseModel):
 # --- Endpoints ---
 
 @router.get("/models", response_model=List[ModelConfigDTO])
-async def get_models(
+def get_models(
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     获取当前用户可用的模型列表
@@ -42,10 +42,10 @@ async def get_models(
     return user_models
 
 @router.post("/models", response_model=ModelConfigDTO)
-async def create_model(
+def create_model(
     model_in: ModelConfigCreate,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     添加新模型
@@ -72,10 +72,10 @@ async def create_model(
     return new_model
 
 @router.delete("/models/{model_id}")
-async def delete_model(
+def delete_model(
     model_id: str,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: Principal = Depends(get_current_user)
 ):
     """
     删除模型
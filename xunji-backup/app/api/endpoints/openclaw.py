@@ -96,13 +96,13 @@ class OpenClawChatRequest(BaseModel):
 # --- 辅助函数 ---
 
 @router.get("/configs", response_model=list[OpenClawConfigSchema])
-async def get_openclaw_configs(user_id: str, db: Session = Depends(get_db)):
+def get_openclaw_configs(user_id: str, db: Session = Depends(get_db)):
     """获取用户的所有 OpenClaw 配置"""
     configs = db.query(OpenClawConfigModel).filter(OpenClawConfigModel.user_id == user_id).all()
     return configs
 
 @router.post("/configs", response_model=OpenClawConfigSchema)
-async def create_openclaw_config(request: OpenClawConfigCreate, db: Session = Depends(get_db)):
+def create_openclaw_config(request: OpenClawConfigCreate, db: Session = Depends(get_db)):
     """创建新的 OpenClaw 配置"""
     db_config = OpenClawConfigModel(**request.model_dump())
     db.add(db_config)
@@ -111,7 +111,7 @@ async def create_openclaw_config(request: OpenClawConfigCreate, db: Session = De
     return db_config
 
 @router.put("/configs/{config_id}", response_model=OpenClawConfigSchema)
-async def update_openclaw_config(config_id: str, request: OpenClawConfigUpdate, db: Session = Depends(get_db)):
+def update_openclaw_config(config_id: str, request: OpenClawConfigUpdate, db: Session = Depends(get_db)):
     """更新 OpenClaw 配置"""
     db_config = db.query(OpenClawConfigModel).filter(OpenClawConfigModel.id == config_id).first()
     if not db_config:
@@ -127,7 +127,7 @@ async def update_openclaw_config(config_id: str, request: OpenClawConfigUpdate,
     return db_config
 
 @router.delete("/configs/{config_id}")
-async def delete_openclaw_config(config_id: str, user_id: str, db: Session = Depends(get_db)):
+def delete_openclaw_config(config_id: str, user_id: str, db: Session = Depends(get_db)):
     """删除 OpenClaw 配置"""
     db_config = db.query(OpenClawConfigModel).filter(OpenClawConfigModel.id == config_id, OpenClawConfigModel.user_id == user_id).first()
     if not db_config:
@@ -1,8 +1,12 @@
 # app/api/endpoints/retrieval.py
 
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, Depends, HTTPException
 from pydantic import BaseModel
+from sqlalchemy.orm import Session
 from typing import List, Optional
+from app.db.session import get_db
+from app.services.chunk_index_service import chunk_index_service
+from app.services.knowledge_base_service import knowledge_base_service
 from app.services.rag_service import rag_service
 
 router = APIRouter()
@@ -17,16 +21,25 @@ class SearchRequest(BaseModel):
 
 # --- 2. 接口 A: 验证数据库状态 (看看存进去了没) ---
 @router.get("/debug/db_status")
-async def get_db_status():
+def get_db_status(sample: bool = False, db: Session = Depends(get_db)):
     """
-    调试接口：查看向量库里到底有多少条数据
+    调试接口：查看知识库里到底有多少条数据
+    切块数、token 数等来自 SQL 切块表；sample=true 时额外查询向量库自身的数量与抽样
     """
-    return rag_service.get_db_stats()
+    stats = rag_service.get_db_stats(include_sample=sample)
+    chunk_stats = chunk_index_service.stats(db)
+    stats.update({
+        "total_count": chunk_stats["chunks"],
+        "total_tokens": chunk_stats["tokens"],
+        "total_chars": chunk_stats["chars"],
+        "file_count": chunk_stats["files"],
+    })
+    return stats
 
 
 # --- 3. 接口 B: 纯文本检索 (验证能不能查到) ---
 @router.post("/retrieval/search")
-async def search_vectors(request: SearchRequest, ):
+def search_vectors(request: SearchRequest, db: Session = Depends(get_db)):
     """
     测试接口：根据 query 找相似文档
     """
@@ -36,7 +49,8 @@ async def search_vectors(request: SearchRequest, ):
         results = rag_service.simple_search(
             query=request.query,
             k=request.top_k,
-            file_ids=request.file_ids
+            # 内容相同的文件共享向量，转换为向量库中的 file_id
+            file_ids=knowledge_base_service.vector_keys(db, request.file_ids)
         )
 
         if not results:
@@ -1,21 +1,25 @@
-import shutil
+import itertools
 import uuid
-from typing import List, Optional
+import zipfile
+from typing import Dict, List, Optional
 from datetime import datetime
 
 from dotenv import load_dotenv
 from fsspec.implementations.http import file_size
 
-from app.api.deps import get_current_user
-from app.models.sql_models import FileRecord, User
+from app.api.deps import get_current_user, Principal, get_read_db
+from app.models.sql_models import FileRecord
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 from app.models.sql_models import FileRecord
+from app.services.bulk_ingest_service import BulkSource, bulk_ingest_service, iter_zip_sources
+from app.services.knowledge_base_service import UnsafeFilename, knowledge_base_service, safe_filename
 from app.services.rag_service import rag_service
+from app.services.upload_session_service import upload_session_service
 from fastapi import APIRouter, UploadFile, File, HTTPException, Depends, Form, BackgroundTasks
 from fastapi import FastAPI, BackgroundTasks, UploadFile
 
-from app.db.session import get_db
+from app.db.session import SessionLocal, get_db
 
 import os
 
@@ -42,47 +46,48 @@ class FileDTO(BaseModel):
         from_attributes = True
 
 
+class UpdateFileResponse(BaseModel):
+    file_id: str
+    filename: str
+    chunks: int
+    reused_chunks: int
+    embedded_chunks: int
+    deleted_chunks: int
+    message: str
+
+
+class BulkIngestFileDTO(BaseModel):
+    filename: str
+    status: str  # indexed / reused / skipped / failed
+    file_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+class BulkIngestJobDTO(BaseModel):
+    job_id: str
+    status: str  # queued / running / done / failed
+    done: int
+    counts: Dict[str, int]
+    files: List[BulkIngestFileDTO]
+    error: Optional[str] = None
+
+
 class ClearKnowledgeBaseRequest(BaseModel):
     confirm: bool = False
 
 
 # --- 接口 1 文件上传接口 ---
-def save_file(file, filename) -> tuple[str, int]:
-    # 2. 获取并校验本地存储路径
-    upload_dir = os.getenv("RAG_FILE_PATH")
-    if not upload_dir:
-        # 严格执行：如果环境变量未配置，不猜测路径，直接抛错
+def check_storage_env() -> None:
+    # 严格执行：如果环境变量未配置，不猜测路径，直接抛错
+    if not os.getenv("RAG_FILE_PATH"):
         raise HTTPException(status_code=500, detail="未配置环境变量 RAG_FILE_PATH")
-
-    # 确保目录存在
-    os.makedirs(upload_dir, exist_ok=True)
-
-    # 生成本地完整存储路径 (建议使用 uuid 避免同名文件覆盖)
-    # 若需保持原名，直接使用 filename，但需注意路径安全
-    safe_filename = filename
-    save_path = os.path.join(upload_dir, safe_filename)
-
-    try:
-        # todo 为啥 await file.seek(0)可以 file.seek(0)  不行
-        file.file.seek(0)
-        # 3. 将文件写入本地磁盘
-        with open(save_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        # 获取真实文件大小 (字节)
-        size = os.path.getsize(save_path)
-        # 关键点：重置文件指针，否则后续 rag_service 读取时会从末尾开始导致内容为空
-        return save_path, size
-    except Exception as e:
-        # 如果处理失败，且本地文件已创建，建议清理，防止产生垃圾文件
-        if os.path.exists(save_path):
-            os.remove(save_path)
-        raise HTTPException(status_code=500, detail=f"文件处理失败: {str(e)}")
+    if not os.getenv("SPLIT_FILENAME_ID"):
+        raise HTTPException(status_code=500, detail="未配置环境变量 SPLIT_FILENAME_ID")
 
 
 @router.post("/upload", response_model=UploadResponse)
-async def upload_file(file: UploadFile = File(...),
-                      current_user: User = Depends(get_current_user),
+def upload_file(file: UploadFile = File(...),
+                      current_user: Principal = Depends(get_current_user),
                       background_tasks: BackgroundTasks = BackgroundTasks(),
                       db: Session = Depends(get_db),  # ★ 注入数据库会话
                       ):
@@ -90,7 +95,11 @@ async def upload_file(file: UploadFile = File(...),
       上传文档接口
       支持 PDF, TXT, MD
       """
-    # 1. 简单的格式校验
+    # 1. 简单的格式校验；文件名会拼进 RAG_FILE_PATH 下的存储路径，不允许带目录或 ..
+    try:
+        safe_filename(file.filename)
+    except UnsafeFilename as e:
+        raise HTTPException(status_code=400, detail=str(e))
     allowed_extensions = [".pdf", ".txt", ".md"]
     ext = os.path.splitext(file.filename)[1].lower()
 
@@ -98,44 +107,107 @@ async def upload_file(file: UploadFile = File(...),
         raise HTTPException(status_code=400, detail="仅支持 PDF, TXT 或 MD 文件")
 
     try:
-        # 2. 调用 Service 处理
-        # 注意：这里直接传 file 对象给 service
-        file_id = rag_service.process_uploaded_file(file, file.filename)
+        check_storage_env()
 
-        split_filename_id = os.getenv("SPLIT_FILENAME_ID")
-        if not split_filename_id:
-            raise HTTPException(status_code=500, detail="未配置环境变量 SPLIT_FILENAME_ID")
-
-        file_path, size = save_file(file, f"{file_id}{split_filename_id}{file.filename}")
-
-        # 3. ★ 新增：将文件记录写入 SQL 数据库 ★
-        new_file = FileRecord(
-            id=file_id,  # 与 Chroma 里的 file_id 保持一致
-            user_id=current_user.id,  # 单机版暂为空，多用户时填 user.id
-            filename=file.filename,
-            file_path=os.getenv("RAG_FILE_PATH"),  # 文件储存的位置
-            file_size=size,  # 以后可以优化计算真实大小
-        )
-        db.add(new_file)
-        db.commit()
-        db.refresh(new_file)
+        # 2. 调用 Service 处理：上传内容只写一次，直接写入 RAG_FILE_PATH 下的最终位置，
+        #    写入时计算 sha256 与大小，随后直接解析该文件；内容已存在时复用已有切块与向量
+        new_file, reused = knowledge_base_service.ingest_upload(db, file, file.filename, current_user.id)
+        file_id = new_file.id
 
         return UploadResponse(
             filename=file.filename,
             file_id=file_id,
-            message="上传成功，知识库已构建索引"
+            message="上传成功，已复用相同内容的索引" if reused else "上传成功，知识库已构建索引"
         )
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _bulk_job_dto(job: dict) -> BulkIngestJobDTO:
+    return BulkIngestJobDTO(
+        job_id=job["id"],
+        status=job["status"],
+        done=job["done"],
+        counts=dict(job["counts"]),
+        files=[BulkIngestFileDTO(**f) for f in list(job["files"])],
+        error=job.get("error"),
+    )
+
+
+# --- 接口 1.1: 批量上传 (多文件 / ZIP 压缩包) ---
+@router.post("/upload/bulk", response_model=BulkIngestJobDTO, status_code=202)
+def bulk_upload(
+        files: List[UploadFile] = File(...),
+        background_tasks: BackgroundTasks = BackgroundTasks(),
+        current_user: Principal = Depends(get_current_user),
+):
+    """
+    批量上传接口：
+    1. 普通文件（PDF / TXT / MD）直接写入 RAG_FILE_PATH 下的最终位置
+    2. ZIP 压缩包先暂存，后台逐个条目流式读取并写入最终位置，不整体解压
+    3. 解析与向量化由后台工作线程池并发执行，FileRecord 分批入库
+    客户端通过 GET /upload/bulk/{job_id} 轮询每个文件的处理结果
+    """
+    check_storage_env()
+    job = bulk_ingest_service.create_job(current_user.id)
+    sources: List[BulkSource] = []
+    archives: List[str] = []
+    written: List[str] = []
+    try:
+        for f in files:
+            name = os.path.basename(f.filename or "")
+            ext = os.path.splitext(name)[1].lower()
+            if ext == ".zip":
+                staged = upload_session_service.bulk_archive_path(job["id"], len(archives))
+                knowledge_base_service.write_stream(f.file, staged)
+                written.append(staged)
+                if not zipfile.is_zipfile(staged):
+                    raise HTTPException(status_code=400, detail=f"{name} 不是有效的 ZIP 文件")
+                archives.append(staged)
+            elif ext in [".pdf", ".txt", ".md"]:
+                file_id = str(uuid.uuid4())
+                path = knowledge_base_service.stored_file_path(file_id, name)
+                content_hash, size = knowledge_base_service.write_stream(f.file, path)
+                written.append(path)
+                sources.append(BulkSource(name, stored=(file_id, path, content_hash, size)))
+            else:
+                # 不支持的格式交给后台任务记录为 skipped
+                sources.append(BulkSource(name))
+    except Exception as e:
+        for path in written:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        if isinstance(e, HTTPException):
+            raise
+        if isinstance(e, UnsafeFilename):
+            raise HTTPException(status_code=400, detail=str(e))
+        raise HTTPException(status_code=500, detail=str(e))
+
+    all_sources = itertools.chain(sources, *(iter_zip_sources(p, remove_after=True) for p in archives))
+    background_tasks.add_task(bulk_ingest_service.run, SessionLocal, current_user.id, all_sources, job)
+    return _bulk_job_dto(job)
+
+
+@router.get("/upload/bulk/{job_id}", response_model=BulkIngestJobDTO)
+def get_bulk_upload(
+        job_id: str,
+        current_user: Principal = Depends(get_current_user),
+):
+    try:
+        return _bulk_job_dto(bulk_ingest_service.get_job(job_id, current_user.id))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 # --- 接口 2: 获取文件列表 (知识库管理) ---
 # --- 修改后的查询接口 ---
 @router.get("/files", response_model=List[FileDTO])
-async def get_files(
-        db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user)  # ★ 关键：注入当前用户
+def get_files(
+        db: Session = Depends(get_read_db),
+        current_user: Principal = Depends(get_current_user)  # ★ 关键：注入当前用户
 ):
     """
     获取【当前登录用户】的文件列表
@@ -148,12 +220,58 @@ async def get_files(
 
     return files
 
+# --- 接口 2.1: 更新文件内容 (按切块增量重建索引) ---
+@router.put("/files/{file_id}", response_model=UpdateFileResponse)
+def update_file(
+        file_id: str,
+        file: UploadFile = File(...),
+        db: Session = Depends(get_db),
+        current_user: Principal = Depends(get_current_user),
+):
+    """
+    上传文件的新版本：
+    1. 新版本切块后与已存储切块按内容 hash 比对
+    2. 只对新增切块做向量化，已消失的切块从向量库删除
+    3. 若旧内容还被其他文件引用，则为本文件复制一份（未变化切块复用已有向量）
+    """
+    file_record = db.query(FileRecord).filter(FileRecord.id == file_id).first()
+    if not file_record or file_record.is_deleted:
+        raise HTTPException(status_code=404, detail="文件不存在")
+    if file_record.user_id and file_record.user_id != current_user.id:
+        raise HTTPException(status_code=403, detail="无权限修改该文件")
+    if file_record.source_path:
+        raise HTTPException(status_code=409, detail="该文件由目录监听同步，请直接修改 RAG_FILE_PATH 下的源文件")
+
+    ext = os.path.splitext(file.filename or "")[1].lower()
+    if ext != os.path.splitext(file_record.filename or "")[1].lower():
+        raise HTTPException(status_code=400, detail="新版本的文件格式需与原文件一致")
+
+    check_storage_env()
+
+    old_hash = file_record.content_hash
+    try:
+        # 新版本写入一次后直接解析，成功后替换原文件
+        stats = knowledge_base_service.update_file(db, file_record, file)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"更新索引失败: {str(e)}")
+
+    return UpdateFileResponse(
+        file_id=file_id,
+        filename=file_record.filename,
+        chunks=stats["chunks"],
+        reused_chunks=stats["reused"],
+        embedded_chunks=stats["embedded"],
+        deleted_chunks=stats["deleted"],
+        message="文件内容未变化" if file_record.content_hash == old_hash else "文件已更新，索引已增量重建",
+    )
+
+
 # --- 接口 3: 删除文件 (同时删数据库和 Chroma) ---
 @router.delete("/files/{file_id}")
-async def delete_file(
+def delete_file(
         file_id: str,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
 ):
     """
     删除文件：
@@ -166,11 +284,8 @@ async def delete_file(
     if file_record.user_id and file_record.user_id != current_user.id:
         raise HTTPException(status_code=403, detail="无权限删除该文件")
 
-    # 1. 软删除 SQL
-    file_record.is_deleted = True
-    db.commit()
-
-    rag_service.delete_doc(file_id)
+    # 1. 软删除 SQL；2. 该内容没有其他引用时才删除向量
+    knowledge_base_service.delete_files(db, [file_record])
 
     split_filename_id = os.getenv("SPLIT_FILENAME_ID")
     if split_filename_id:
@@ -187,10 +302,10 @@ async def delete_file(
 
 
 @router.post("/knowledge-base/clear")
-async def clear_knowledge_base(
+def clear_knowledge_base(
         payload: ClearKnowledgeBaseRequest,
         db: Session = Depends(get_db),
-        current_user: User = Depends(get_current_user),
+        current_user: Principal = Depends(get_current_user),
 ):
     if not payload.confirm:
         raise HTTPException(status_code=400, detail="confirm=true 才会执行清空操作")
@@ -203,11 +318,7 @@ async def clear_knowledge_base(
     )
     file_ids = [f.id for f in files]
 
-    for f in files:
-        f.is_deleted = True
-    db.commit()
-
-    rag_service.delete_docs(file_ids)
+    knowledge_base_service.delete_files(db, files)
 
     split_filename_id = os.getenv("SPLIT_FILENAME_ID")
     if split_filename_id:
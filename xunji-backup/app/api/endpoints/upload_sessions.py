@@ -0,0 +1,169 @@
+import asyncio
+import os
+import re
+from typing import Any, Dict, Optional
+
+from fastapi import APIRouter, BackgroundTasks, Depends, Header, HTTPException, Request
+from pydantic import BaseModel
+
+from app.api.deps import get_current_user, Principal
+from app.db.session import SessionLocal
+from app.services.upload_session_service import (
+    UPLOAD_SESSION_CHUNK_BYTES,
+    UploadSessionConflict,
+    upload_session_service,
+)
+
+router = APIRouter()
+
+ALLOWED_EXTENSIONS = [".pdf", ".txt", ".md"]
+_CONTENT_RANGE_RE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+
+class CreateUploadSessionRequest(BaseModel):
+    filename: str
+    size: int
+    sha256: Optional[str] = None
+
+
+class UploadSessionDTO(BaseModel):
+    session_id: str
+    filename: str
+    size: int
+    offset: int
+    chunk_size: int
+    status: str  # uploading / processing / done / failed
+    file_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+def _to_dto(state: Dict[str, Any]) -> UploadSessionDTO:
+    return UploadSessionDTO(
+        session_id=state["id"],
+        filename=state["filename"],
+        size=state["size"],
+        offset=state["offset"],
+        chunk_size=state["chunk_size"],
+        status=state["status"],
+        file_id=state.get("file_id"),
+        error=state.get("error"),
+    )
+
+
+def _raise_for(exc: Exception) -> None:
+    if isinstance(exc, LookupError):
+        raise HTTPException(status_code=404, detail=str(exc))
+    if isinstance(exc, UploadSessionConflict):
+        raise HTTPException(status_code=409, detail={"message": str(exc), "offset": exc.offset})
+    if isinstance(exc, ValueError):
+        raise HTTPException(status_code=400, detail=str(exc))
+    raise exc
+
+
+# --- 接口 1: 创建断点续传会话 ---
+@router.post("/upload/sessions", response_model=UploadSessionDTO)
+def create_upload_session(
+        payload: CreateUploadSessionRequest,
+        current_user: Principal = Depends(get_current_user),
+):
+    """
+    创建分片上传会话：
+    返回 session_id 与建议分片大小 chunk_size，客户端随后按顺序 PUT 各分片
+    """
+    ext = os.path.splitext(payload.filename)[1].lower()
+    if ext not in ALLOWED_EXTENSIONS:
+        raise HTTPException(status_code=400, detail="仅支持 PDF, TXT 或 MD 文件")
+    if not os.getenv("RAG_FILE_PATH") or not os.getenv("SPLIT_FILENAME_ID"):
+        raise HTTPException(status_code=500, detail="未配置环境变量 RAG_FILE_PATH 或 SPLIT_FILENAME_ID")
+    try:
+        state = upload_session_service.create(current_user.id, payload.filename, payload.size, payload.sha256)
+    except Exception as e:
+        _raise_for(e)
+    return _to_dto(state)
+
+
+# --- 接口 2: 查询会话（断线后获取已接收偏移 / 入库状态） ---
+@router.get("/upload/sessions/{session_id}", response_model=UploadSessionDTO)
+def get_upload_session(
+        session_id: str,
+        current_user: Principal = Depends(get_current_user),
+):
+    try:
+        return _to_dto(upload_session_service.get(session_id, current_user.id))
+    except Exception as e:
+        _raise_for(e)
+
+
+# --- 接口 3: 上传分片 ---
+@router.put("/upload/sessions/{session_id}", response_model=UploadSessionDTO)
+async def put_upload_chunk(
+        session_id: str,
+        request: Request,
+        content_range: str = Header(..., alias="Content-Range"),
+        chunk_sha256: Optional[str] = Header(default=None, alias="X-Chunk-SHA256"),
+        current_user: Principal = Depends(get_current_user),
+):
+    """
+    上传一个分片：
+    - 请求体为原始字节，Content-Range: bytes <start>-<end>/<total>
+    - 可选 X-Chunk-SHA256 校验分片内容，不一致时该分片不会被接收
+    - start 必须等于已接收偏移，否则返回 409 及当前 offset，客户端从该位置继续
+    """
+    match = _CONTENT_RANGE_RE.match(content_range.strip())
+    if not match:
+        raise HTTPException(status_code=400, detail="Content-Range 格式应为 bytes <start>-<end>/<total>")
+    start, end, total = (int(g) for g in match.groups())
+    if end < start or end - start + 1 > UPLOAD_SESSION_CHUNK_BYTES:
+        raise HTTPException(status_code=400, detail=f"分片范围无效或超过 {UPLOAD_SESSION_CHUNK_BYTES} 字节")
+
+    # 只读取本分片大小的数据，内存占用以分片大小为上限
+    expected = end - start + 1
+    body = bytearray()
+    async for piece in request.stream():
+        body.extend(piece)
+        if len(body) > expected:
+            raise HTTPException(status_code=400, detail="请求体长度与 Content-Range 不一致")
+    if len(body) != expected:
+        raise HTTPException(status_code=400, detail="请求体长度与 Content-Range 不一致")
+
+    # 写入并 fsync 最多 8 MB，放到线程池执行，不阻塞事件循环上的 SSE 流
+    try:
+        state = await asyncio.to_thread(
+            upload_session_service.write_chunk,
+            session_id, current_user.id, start, bytes(body), total=total, chunk_sha256=chunk_sha256,
+        )
+    except Exception as e:
+        _raise_for(e)
+    return _to_dto(state)
+
+
+# --- 接口 4: 完成上传，后台入库 ---
+@router.post("/upload/sessions/{session_id}/complete", response_model=UploadSessionDTO, status_code=202)
+def complete_upload_session(
+        session_id: str,
+        background_tasks: BackgroundTasks,
+        current_user: Principal = Depends(get_current_user),
+):
+    """
+    校验完整文件并移动到 RAG_FILE_PATH，解析与向量化在后台执行，
+    客户端通过 GET /upload/sessions/{session_id} 轮询 status（processing -> done / failed）
+    """
+    try:
+        state = upload_session_service.complete(session_id, current_user.id)
+    except Exception as e:
+        _raise_for(e)
+    background_tasks.add_task(upload_session_service.ingest, session_id, SessionLocal)
+    return _to_dto(state)
+
+
+# --- 接口 5: 取消上传 ---
+@router.delete("/upload/sessions/{session_id}")
+def abort_upload_session(
+        session_id: str,
+        current_user: Principal = Depends(get_current_user),
+):
+    try:
+        upload_session_service.abort(session_id, current_user.id)
+    except Exception as e:
+        _raise_for(e)
+    return {"message": "上传已取消"}
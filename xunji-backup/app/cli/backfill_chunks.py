@@ -0,0 +1,35 @@
+"""Create document_chunks rows for vectors indexed before the chunk table existed.
+
+Looks up every vector key still referenced by a FileBlob and, for keys without
+rows in the active collection, reads their chunks from the vector store and
+records them. Keys that already have rows are skipped, so the command can be
+re-run safely.
+
+Usage (from xunji-backup/):
+    python -m app.cli.backfill_chunks
+"""
+
+import argparse
+import time
+
+from app.db.session import SessionLocal, init_db
+from app.models.sql_models import FileBlob
+from app.services.chunk_index_service import chunk_index_service
+
+
+def main() -> None:
+    argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter).parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    db = SessionLocal()
+    try:
+        keys = [row[0] for row in db.query(FileBlob.vector_key).all()]
+        created = chunk_index_service.backfill(db, keys)
+    finally:
+        db.close()
+    print(f"{created} chunk rows created for {len(keys)} vector keys in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
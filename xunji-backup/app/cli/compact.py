@@ -0,0 +1,36 @@
+"""Reclaim disk and memory held by deleted knowledge-base vectors.
+
+Deleting files only marks their vectors as deleted. This rewrites the NumPy
+index with its live rows (vector ids are kept, so the SQL chunk table stays
+valid) or VACUUMs Chroma's SQLite file, and prints the bytes reclaimed. Best run
+while the API is stopped; RAG_COMPACT_INTERVAL_HOURS schedules the same job
+inside the API process instead.
+
+Usage (from xunji-backup/):
+    python -m app.cli.compact
+    python -m app.cli.compact --min-deleted-ratio 0.3   # skip lightly fragmented indexes
+"""
+
+import argparse
+import time
+
+from app.services.vector_compaction_service import vector_compaction_service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--min-deleted-ratio", type=float, default=0.0,
+                        help="only rewrite when at least this share of rows is deleted")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = vector_compaction_service.run(args.min_deleted_ratio)
+    print(
+        f"{stats['collection']}: {stats['removed']} deleted rows removed, "
+        f"{stats['bytes_before']} -> {stats['bytes_after']} bytes "
+        f"({stats['reclaimed_bytes']} reclaimed) in {time.perf_counter() - started:.1f}s"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Bulk-ingest local files, directories and ZIP archives into the knowledge base.
+
+Files are written to RAG_FILE_PATH, parsed and embedded by a pool of workers, and
+recorded as FileRecords owned by --user (id or username). ZIP archives are read
+entry by entry without being extracted first. One line is printed per file.
+
+Usage (from xunji-backup/):
+    python -m app.cli.ingest --user alice docs/ handbook.zip notes.md
+    python -m app.cli.ingest --user alice --workers 8 --batch-size 100 archive.zip
+"""
+
+import argparse
+import sys
+import time
+
+from app.db.session import SessionLocal, init_db
+from app.models.sql_models import User
+from app.services.bulk_ingest_service import (
+    BULK_INGEST_BATCH_SIZE,
+    BULK_INGEST_WORKERS,
+    BulkIngestService,
+    iter_path_sources,
+)
+
+
+def resolve_user_id(user: str) -> str:
+    db = SessionLocal()
+    try:
+        record = db.query(User).filter((User.id == user) | (User.username == user)).first()
+    finally:
+        db.close()
+    if record is None:
+        raise SystemExit(f"user not found: {user}")
+    return record.id
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("paths", nargs="+", help="files, directories or .zip archives")
+    parser.add_argument("--user", required=True, help="owner user id or username")
+    parser.add_argument("--workers", type=int, default=BULK_INGEST_WORKERS)
+    parser.add_argument("--batch-size", type=int, default=BULK_INGEST_BATCH_SIZE)
+    args = parser.parse_args()
+
+    init_db()
+    user_id = resolve_user_id(args.user)
+    service = BulkIngestService(workers=args.workers, batch_size=args.batch_size)
+    started = time.perf_counter()
+
+    def report(result: dict) -> None:
+        line = f"[{result['status']:>7}] {result['filename']}"
+        if result["file_id"]:
+            line += f"  {result['file_id']}"
+        if result["error"]:
+            line += f"  ({result['error']})"
+        print(line, flush=True)
+
+    job = service.run(SessionLocal, user_id, iter_path_sources(args.paths), progress=report)
+    counts = job["counts"]
+    print(
+        f"{job['done']} files in {time.perf_counter() - started:.1f}s: "
+        f"{counts['indexed']} indexed, {counts['reused']} reused, "
+        f"{counts['skipped']} skipped, {counts['failed']} failed"
+    )
+    sys.exit(1 if counts["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""Apply versioned schema migrations to SQLALCHEMY_DATABASE_URL.
+
+The API applies pending migrations on startup as well (init_db); run this
+before deploying to build new indexes ahead of time, or to see what is
+pending. Index builds do not block writes on PostgreSQL and MySQL.
+
+Usage (from xunji-backup/):
+    python -m app.cli.migrate --status
+    python -m app.cli.migrate
+    python -m app.cli.migrate --target 5
+"""
+
+import argparse
+import time
+
+from app.db.migrations import MIGRATIONS, applied_versions, run_migrations
+from app.db.session import engine
+from app.models.sql_models import Base
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--status", action="store_true", help="list applied and pending migrations only")
+    parser.add_argument("--target", type=int, default=None, help="stop after this version")
+    args = parser.parse_args()
+
+    if args.status:
+        applied = set(applied_versions(engine))
+        for migration in MIGRATIONS:
+            print(f"{'applied' if migration.version in applied else 'pending'}  {migration.version:>3}  {migration.name}")
+        return
+
+    Base.metadata.create_all(bind=engine)
+    started = time.perf_counter()
+    done = run_migrations(engine, target=args.target)
+    if done:
+        print(f"applied {', '.join(map(str, done))} in {time.perf_counter() - started:.1f}s")
+    else:
+        print("schema is up to date")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Hard-delete soft-deleted data past its retention period, and orphaned data.
+
+Removes conversations (with messages, tree nodes and attachment objects), tree
+nodes and knowledge-base files that were soft-deleted more than
+PURGE_RETENTION_DAYS ago, plus leaked temp vectors, attachments without a
+message and stored files without a FileRecord. Prints what was removed and the
+bytes reclaimed on disk and in object storage. PURGE_INTERVAL_HOURS runs the
+same job inside the API process instead.
+
+Usage (from xunji-backup/):
+    python -m app.cli.purge --dry-run
+    python -m app.cli.purge --retention-days 7
+    python -m app.cli.purge --compact          # also compact the vector store afterwards
+"""
+
+import argparse
+import time
+
+from app.db.session import SessionLocal, init_db
+from app.services.purge_service import purge_service
+from app.services.vector_compaction_service import vector_compaction_service
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--retention-days", type=float, default=None,
+                        help="override PURGE_RETENTION_DAYS")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be purged")
+    parser.add_argument("--compact", action="store_true", help="compact the vector store after purging")
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    report = purge_service.run(SessionLocal, retention_days=args.retention_days, dry_run=args.dry_run)
+    for error in report["errors"]:
+        print(f"error: {error}")
+    print(
+        f"{'would purge' if args.dry_run else 'purged'}: {report['conversations']} conversations, "
+        f"{report['messages']} messages, {report['tree_nodes']} tree nodes, {report['attachments']} attachments, "
+        f"{report['files']} files, {report['orphan_files']} orphan files, {report['temp_vectors']} temp vectors"
+    )
+    print(
+        f"reclaimed {report['reclaimed_bytes']} bytes ({report['disk_bytes']} on disk, "
+        f"{report['object_bytes']} in object storage) in {time.perf_counter() - started:.1f}s"
+    )
+    if args.compact and not args.dry_run:
+        stats = vector_compaction_service.run()
+        print(f"vector store {stats['collection']}: {stats['reclaimed_bytes']} bytes reclaimed by compaction")
+
+
+if __name__ == "__main__":
+    main()
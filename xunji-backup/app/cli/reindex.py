@@ -0,0 +1,62 @@
+"""Rebuild all knowledge-base vectors into a new collection, then switch to it.
+
+Run after changing EMBEDDING_MODEL / RAG_EMBEDDING_PROVIDER (or the splitter
+settings). Every live file is re-parsed from RAG_FILE_PATH and embedded with the
+model configured in the environment into a shadow collection; the API keeps
+serving searches from the current collection until the rebuild completes and the
+active-collection pointer in PERSIST_DIRECTORY is switched. Interrupted runs
+resume from their checkpoint when the command is started again.
+
+Usage (from xunji-backup/):
+    python -m app.cli.reindex --workers 8
+    python -m app.cli.reindex --no-switch          # build only, switch later
+    python -m app.cli.reindex --allow-missing --drop-old
+"""
+
+import argparse
+import sys
+import time
+
+from app.db.session import SessionLocal, init_db
+from app.services.reindex_service import REINDEX_WORKERS, ReindexService
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=REINDEX_WORKERS)
+    parser.add_argument("--no-switch", action="store_true", help="build the shadow collection but keep the current one active")
+    parser.add_argument("--allow-missing", action="store_true", help="switch even if some files are missing or failed")
+    parser.add_argument("--drop-old", action="store_true", help="delete the previous collection after switching")
+    args = parser.parse_args()
+
+    init_db()
+    started = time.perf_counter()
+    counter = {"n": 0}
+
+    def report(key: str, status: str, error) -> None:
+        counter["n"] += 1
+        line = f"[{counter['n']:>6}] {status:<7} {key}"
+        print(line + (f"  ({error})" if error else ""), flush=True)
+
+    summary = ReindexService(workers=args.workers).run(
+        SessionLocal,
+        switch=not args.no_switch,
+        allow_missing=args.allow_missing,
+        drop_old=args.drop_old,
+        progress=report,
+    )
+    for key, filename in summary["missing"].items():
+        print(f"missing file for {key}: {filename}")
+    print(
+        f"{summary['collection']}: {summary['indexed']} indexed, {len(summary['failed'])} failed, "
+        f"{len(summary['missing'])} missing in {time.perf_counter() - started:.1f}s"
+    )
+    if summary["switched"]:
+        print(f"active collection switched from {summary['previous']} to {summary['collection']}")
+    elif not args.no_switch:
+        print("not switched: fix the failures above and run again (progress is kept), or pass --allow-missing")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
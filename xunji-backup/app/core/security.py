@@ -11,6 +11,7 @@ ACCESS_TOKEN_EXPIRE_MINUTES = 60 * 24 * 365 * 10
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 
 
+# 下面两个函数是 CPU 密集的 bcrypt 计算；接口里通过 app.services.password_hasher 放到独立进程池执行
 def get_password_hash(password: str) -> Optional[str]:
     if not password:
         return None
@@ -22,7 +23,6 @@ def verify_password(plain_password: str, hashed_password: Optional[str]) -> bool
     if not hashed_password:
         return True
     sha256_bin = hashlib.sha256(plain_password.encode('utf-8')).digest()
-    print(pwd_context.hash(sha256_bin))
     return pwd_context.verify(sha256_bin, hashed_password)
 
 
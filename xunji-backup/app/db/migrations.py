@@ -0,0 +1,277 @@
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, inspect, literal, select, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError
+
+from app.models.sql_models import Base, split_tree_path, tree_path_ordinal, tree_path_segment
+
+_logger = logging.getLogger(__name__)
+
+schema_migrations = Table(
+    "schema_migrations",
+    MetaData(),
+    Column("version", Integer, primary_key=True, autoincrement=False),
+    Column("name", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+class Migration(NamedTuple):
+    """One schema step; `apply` must be idempotent (a fresh database already has the change)."""
+
+    version: int
+    name: str
+    apply: Callable[[Engine], None]
+
+
+# ---------------------------------------------------------------------- helpers
+
+def add_column(engine: Engine, table: str, column: str, default: Any = None) -> bool:
+    """Add a model column to an existing table; returns False if it is already there.
+
+    The column type is rendered from `sql_models` for the engine's dialect.
+    """
+    inspector = inspect(engine)
+    if table not in inspector.get_table_names():
+        return False
+    if column in {c["name"] for c in inspector.get_columns(table)}:
+        return False
+    col_type = Base.metadata.tables[table].c[column].type.compile(dialect=engine.dialect)
+    ddl = f"ALTER TABLE {table} ADD COLUMN {column} {col_type}"
+    if default is not None:
+        rendered = literal(default).compile(dialect=engine.dialect, compile_kwargs={"literal_binds": True})
+        ddl += f" DEFAULT {rendered}"
+    with engine.begin() as connection:
+        connection.execute(text(ddl))
+    return True
+
+
+def create_index(engine: Engine, name: str, table: str, columns: Sequence[str], unique: bool = False) -> bool:
+    """Create an index without blocking writes where the backend allows it.
+
+    PostgreSQL builds it with `CREATE INDEX CONCURRENTLY` outside a transaction
+    (an invalid leftover of an interrupted build is dropped and rebuilt first),
+    MySQL/MariaDB with `ALGORITHM=INPLACE, LOCK=NONE`. SQLite has no online
+    build; its `CREATE INDEX` holds the write lock for the duration, which is
+    short at the sizes SQLite is used for here.
+
+    Returns:
+        False if the table is missing or a valid index of that name exists.
+    """
+    inspector = inspect(engine)
+    if table not in inspector.get_table_names():
+        return False
+    dialect = engine.dialect.name
+    exists = name in {ix["name"] for ix in inspector.get_indexes(table)}
+    cols = ", ".join(columns)
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+
+    if dialect == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            if exists:
+                valid = connection.execute(
+                    text("SELECT i.indisvalid FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid "
+                         "WHERE c.relname = :name"),
+                    {"name": name},
+                ).scalar()
+                if valid is not False:
+                    return False
+                connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+            connection.execute(text(f"CREATE {kind} CONCURRENTLY IF NOT EXISTS {name} ON {table} ({cols})"))
+        return True
+
+    if exists:
+        return False
+    if dialect in ("mysql", "mariadb"):
+        ddl = f"CREATE {kind} {name} ON {table} ({cols}) ALGORITHM=INPLACE LOCK=NONE"
+    else:
+        ddl = f"CREATE {kind} IF NOT EXISTS {name} ON {table} ({cols})"
+    with engine.begin() as connection:
+        connection.execute(text(ddl))
+    return True
+
+
+def drop_index(engine: Engine, name: str, table: str) -> bool:
+    """Drop an index if it exists (concurrently on PostgreSQL); returns False if it was absent."""
+    inspector = inspect(engine)
+    if table not in inspector.get_table_names() or name not in {ix["name"] for ix in inspector.get_indexes(table)}:
+        return False
+    dialect = engine.dialect.name
+    if dialect == "postgresql":
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as connection:
+            connection.execute(text(f"DROP INDEX CONCURRENTLY IF EXISTS {name}"))
+        return True
+    ddl = f"DROP INDEX {name} ON {table}" if dialect in ("mysql", "mariadb") else f"DROP INDEX IF EXISTS {name}"
+    with engine.begin() as connection:
+        connection.execute(text(ddl))
+    return True
+
+
+def backfill_tree_paths(engine: Engine) -> int:
+    """Fill `tree_nodes.path` / `depth` for nodes written before the columns existed.
+
+    Works one conversation (one transaction) at a time. Siblings are numbered
+    in creation order after the highest ordinal already in use; a node whose
+    parent is missing becomes a root.
+
+    Returns:
+        Number of nodes updated.
+    """
+    nodes = Base.metadata.tables["tree_nodes"]
+    with engine.connect() as connection:
+        conversations = connection.execute(
+            select(nodes.c.conversation_id).where(nodes.c.path.is_(None)).distinct()
+        ).scalars().all()
+    update = nodes.update().where(nodes.c.id == bindparam("b_id")).values(
+        path=bindparam("b_path"), depth=bindparam("b_depth"))
+
+    updated = 0
+    for conversation_id in conversations:
+        with engine.begin() as connection:
+            rows = connection.execute(
+                select(nodes.c.id, nodes.c.parent_id, nodes.c.path, nodes.c.depth)
+                .where(nodes.c.conversation_id.is_(None) if conversation_id is None
+                       else nodes.c.conversation_id == conversation_id)
+                .order_by(nodes.c.created_at, nodes.c.id)
+            ).all()
+            by_id = {row.id: row for row in rows}
+            children: Dict[Optional[str], List[str]] = {}
+            for row in rows:
+                parent = row.parent_id if row.parent_id in by_id else None
+                children.setdefault(parent, []).append(row.id)
+
+            paths = {row.id: (row.path, row.depth) for row in rows if row.path is not None}
+            changes = []
+            stack: List[Tuple[Optional[str], str, int]] = [(None, "", -1)]
+            while stack:
+                parent, parent_path, parent_depth = stack.pop()
+                kids = children.get(parent, [])
+                ordinal = max((tree_path_ordinal(split_tree_path(paths[kid][0])[-1]) + 1
+                               for kid in kids if kid in paths), default=0)
+                for kid in kids:
+                    if kid not in paths:
+                        paths[kid] = (parent_path + tree_path_segment(ordinal), parent_depth + 1)
+                        changes.append({"b_id": kid, "b_path": paths[kid][0], "b_depth": paths[kid][1]})
+                        ordinal += 1
+                    stack.append((kid, *paths[kid]))
+            if changes:
+                connection.execute(update, changes)
+            updated += len(changes)
+    return updated
+
+
+# ---------------------------------------------------------------------- migrations
+
+def _m1_anonymous_users(engine: Engine) -> None:
+    add_column(engine, "users", "device_id")
+    add_column(engine, "users", "is_anonymous", default=True)
+    create_index(engine, "ix_users_device_id", "users", ["device_id"], unique=True)
+
+
+def _m2_file_dedupe(engine: Engine) -> None:
+    add_column(engine, "files", "content_hash")
+    create_index(engine, "ix_files_content_hash", "files", ["content_hash"])
+
+
+def _m3_file_source_path(engine: Engine) -> None:
+    add_column(engine, "files", "source_path")
+    create_index(engine, "ix_files_source_path", "files", ["source_path"])
+
+
+def _m4_soft_delete_timestamps(engine: Engine) -> None:
+    for table in ("conversations", "files", "tree_nodes"):
+        add_column(engine, table, "deleted_at")
+
+
+def _m5_history_indexes(engine: Engine) -> None:
+    create_index(engine, "ix_conversations_user_updated", "conversations",
+                 ["user_id", "is_deleted", "updated_at", "id"])
+    create_index(engine, "ix_messages_conversation_created", "messages", ["conversation_id", "created_at", "id"])
+    create_index(engine, "ix_tree_nodes_message_id", "tree_nodes", ["message_id"])
+    create_index(engine, "ix_message_attachments_message_id", "message_attachments", ["message_id"])
+
+
+def _m6_hot_path_indexes(engine: Engine) -> None:
+    create_index(engine, "ix_tree_nodes_parent_id", "tree_nodes", ["parent_id"])
+    create_index(engine, "ix_tree_nodes_conversation_id", "tree_nodes", ["conversation_id"])
+    create_index(engine, "ix_files_user_deleted", "files", ["user_id", "is_deleted", "created_at"])
+    create_index(engine, "ix_ai_instructions_user_order", "ai_instructions",
+                 ["user_id", "is_deleted", "sort_order", "created_at"])
+    create_index(engine, "ix_conversation_ai_instructions_order", "conversation_ai_instructions",
+                 ["conversation_id", "user_id", "is_deleted", "sort_order", "created_at"])
+    create_index(engine, "ix_message_attachments_conversation_id", "message_attachments", ["conversation_id"])
+    create_index(engine, "ix_model_configs_user_id", "model_configs", ["user_id"])
+
+
+def _m7_tree_paths(engine: Engine) -> None:
+    add_column(engine, "tree_nodes", "path")
+    add_column(engine, "tree_nodes", "depth")
+    backfill_tree_paths(engine)
+    create_index(engine, "ix_tree_nodes_conversation_path", "tree_nodes", ["conversation_id", "path"])
+    # (conversation_id, path) covers every conversation_id lookup
+    drop_index(engine, "ix_tree_nodes_conversation_id", "tree_nodes")
+
+
+def _m8_tree_version(engine: Engine) -> None:
+    add_column(engine, "conversations", "tree_version", default=0)
+
+
+# Append only: a released version number must never change meaning.
+MIGRATIONS: List[Migration] = [
+    Migration(1, "users.device_id / users.is_anonymous", _m1_anonymous_users),
+    Migration(2, "files.content_hash", _m2_file_dedupe),
+    Migration(3, "files.source_path", _m3_file_source_path),
+    Migration(4, "deleted_at on conversations, files and tree_nodes", _m4_soft_delete_timestamps),
+    Migration(5, "history pagination indexes", _m5_history_indexes),
+    Migration(6, "hot-path indexes for tree, files and instructions", _m6_hot_path_indexes),
+    Migration(7, "materialized path on tree_nodes", _m7_tree_paths),
+    Migration(8, "conversations.tree_version", _m8_tree_version),
+]
+
+
+# ---------------------------------------------------------------------- runner
+
+def applied_versions(engine: Engine) -> List[int]:
+    """Return the versions recorded in `schema_migrations`, ascending."""
+    schema_migrations.create(bind=engine, checkfirst=True)
+    with engine.connect() as connection:
+        return sorted(connection.execute(select(schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    """Return the migrations not yet applied to the database, in order."""
+    applied = set(applied_versions(engine))
+    return [m for m in MIGRATIONS if m.version not in applied]
+
+
+def run_migrations(engine: Engine, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations in version order and record each one.
+
+    Every step is idempotent, so several processes starting at once may run the
+    same step; the first to record it wins and the others ignore the duplicate.
+
+    Args:
+        engine: Engine of the application database.
+        target: Stop after this version (default: apply all).
+
+    Returns:
+        Versions applied by this call.
+    """
+    done: List[int] = []
+    for migration in pending_migrations(engine):
+        if target is not None and migration.version > target:
+            break
+        _logger.info("执行数据库迁移 %s: %s", migration.version, migration.name)
+        migration.apply(engine)
+        try:
+            with engine.begin() as connection:
+                connection.execute(schema_migrations.insert().values(
+                    version=migration.version, name=migration.name, applied_at=datetime.now(),
+                ))
+        except IntegrityError:
+            pass  # recorded concurrently by another process
+        done.append(migration.version)
+    return done
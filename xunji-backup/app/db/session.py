@@ -1,10 +1,15 @@
 import os
+import threading
+import time
 from pathlib import Path
+from typing import Dict, List, Optional
 
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, inspect, text
-from sqlalchemy.engine import make_url
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.orm import Session, sessionmaker
+from app.db.migrations import run_migrations
 from app.models.sql_models import Base
 
 load_dotenv(override=False)
@@ -24,41 +29,178 @@ def _normalize_database_url(database_url: str) -> str:
             if not path.is_absolute():
                 path = (_PROJECT_ROOT / path).resolve()
             path.parent.mkdir(parents=True, exist_ok=True)
-            url = url.set(database=path.as_posix())
-    return str(url)
+            # str(url) 会把密码替换成 *** 并转义 ":memory:"，只在改写了路径时重新生成
+            return url.set(database=path.as_posix()).render_as_string(hide_password=False)
+    return database_url
 
 if not SQLALCHEMY_DATABASE_URL:
     raise ValueError("SQLALCHEMY_DATABASE_URL is required. See .env.example for a working default.")
 
+# SQLite 生产配置：每个新连接上执行的 PRAGMA（journal_mode=WAL 对内存库无效，会被跳过）
+SQLITE_PRAGMAS_ENABLED = os.getenv("SQLITE_PRAGMAS_ENABLED", "true").lower() == "true"
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_SIZE_KIB = int(os.getenv("SQLITE_CACHE_SIZE_KIB", str(64 * 1024)))
+SQLITE_TEMP_STORE = os.getenv("SQLITE_TEMP_STORE", "MEMORY")
+# SQLite 同一时刻只有一个写者，连接多了只是在 busy_timeout 里排队；WAL 下读者不受影响
+SQLITE_POOL_SIZE = int(os.getenv("SQLITE_POOL_SIZE", "8"))
+SQLITE_MAX_OVERFLOW = int(os.getenv("SQLITE_MAX_OVERFLOW", "8"))
+
+# PostgreSQL 等服务端数据库：连接池大小与每个连接的会话参数
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+PG_STATEMENT_TIMEOUT_MS = int(os.getenv("PG_STATEMENT_TIMEOUT_MS", "30000"))
+PG_APPLICATION_NAME = os.getenv("PG_APPLICATION_NAME", "xunji-backend")
+
+# 只读副本：配置后只读查询接口走副本；写入、以及刚写过数据的用户在 REPLICA_STICKY_SECONDS 内的读取仍走主库
+SQLALCHEMY_REPLICA_URL = os.getenv("SQLALCHEMY_REPLICA_URL", "")
+REPLICA_STICKY_SECONDS = float(os.getenv("REPLICA_STICKY_SECONDS", "5"))
+
+
+def sqlite_pragmas(database: str = "") -> List[str]:
+    """新连接上要执行的 PRAGMA 语句；内存库不设置 journal_mode 和 mmap_size"""
+    pragmas = [
+        f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}",
+        f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KIB}",
+        f"PRAGMA temp_store={SQLITE_TEMP_STORE}",
+    ]
+    if database and database != ":memory:":
+        pragmas[:0] = [f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}", f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}"]
+    return pragmas
+
+
+def create_app_engine(database_url: str, sqlite_profile: bool = SQLITE_PRAGMAS_ENABLED,
+                      read_only: bool = False) -> Engine:
+    """按数据库类型创建引擎
+
+    - SQLite 文件库：QueuePool(SQLITE_POOL_SIZE)，连接建立时执行 sqlite_pragmas()；
+      不做 pre_ping / recycle（本地文件没有会断开的网络连接）
+    - SQLite 内存库：使用 SQLAlchemy 默认的 SingletonThreadPool，不能传连接池大小参数
+    - PostgreSQL：连接池 DB_POOL_SIZE，连接时设置 statement_timeout 与 application_name
+    - 其他数据库：同样的连接池参数
+
+    read_only=True 用于只读副本：PostgreSQL 设置 default_transaction_read_only，
+    SQLite 设置 query_only，误写副本会直接报错而不是悄悄写进去
+    """
+    url = make_url(database_url)
+    if not url.drivername.startswith("sqlite"):
+        connect_args = {}
+        if url.get_backend_name() == "postgresql":
+            options = [f"-c statement_timeout={PG_STATEMENT_TIMEOUT_MS}"]
+            if read_only:
+                options.append("-c default_transaction_read_only=on")
+            connect_args = {"application_name": PG_APPLICATION_NAME, "options": " ".join(options)}
+        # 配置连接池参数以解决连接池耗尽问题
+        return create_engine(
+            database_url,
+            connect_args=connect_args,
+            pool_size=DB_POOL_SIZE,          # 基础连接池大小
+            max_overflow=DB_MAX_OVERFLOW,    # 最大溢出连接数
+            pool_timeout=60,                 # 连接超时时间（秒）
+            pool_recycle=3600,               # 连接回收时间（秒）
+            pool_pre_ping=True               # 连接预检查
+        )
+
+    memory = url.database in (None, "", ":memory:")
+    kwargs = {} if memory else {"poolclass": QueuePool, "pool_size": SQLITE_POOL_SIZE,
+                                "max_overflow": SQLITE_MAX_OVERFLOW, "pool_timeout": 60}
+    sqlite_engine = create_engine(database_url, connect_args={"check_same_thread": False}, **kwargs)
+    pragmas = sqlite_pragmas(url.database or "") if sqlite_profile else []
+    if read_only:
+        pragmas.append("PRAGMA query_only=1")
+    if pragmas:
+        @event.listens_for(sqlite_engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for pragma in pragmas:
+                    cursor.execute(pragma)
+            finally:
+                cursor.close()
+
+    return sqlite_engine
+
+
 _normalized_database_url = _normalize_database_url(SQLALCHEMY_DATABASE_URL)
-_connect_args = {"check_same_thread": False} if _normalized_database_url.startswith("sqlite") else {}
-
-# 配置连接池参数以解决连接池耗尽问题
-engine = create_engine(
-    _normalized_database_url, 
-    connect_args=_connect_args,
-    # 连接池配置
-    pool_size=20,                    # 基础连接池大小
-    max_overflow=30,                 # 最大溢出连接数
-    pool_timeout=60,                 # 连接超时时间（秒）
-    pool_recycle=3600,               # 连接回收时间（秒）
-    pool_pre_ping=True               # 连接预检查
-)
+engine = create_app_engine(_normalized_database_url)
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# 未配置副本时为 None，只读接口直接使用主库会话
+replica_engine: Optional[Engine] = (
+    create_app_engine(_normalize_database_url(SQLALCHEMY_REPLICA_URL), read_only=True)
+    if SQLALCHEMY_REPLICA_URL else None
+)
+ReplicaSessionLocal = (
+    sessionmaker(autocommit=False, autoflush=False, bind=replica_engine) if replica_engine is not None else None
+)
+
+# 读己之写：用户在主库提交写入后的一段时间内，其只读请求也走主库，避免副本延迟读不到刚写的数据。
+# 记录在进程内存里（单进程部署）；多进程部署时每个进程各自记录自己处理过的写入。
+_sticky_until: Dict[str, float] = {}
+_sticky_lock = threading.Lock()
+
+
+def stick_to_primary(user_id: str, seconds: Optional[float] = None) -> None:
+    """让 user_id 接下来的读请求在 seconds 秒内走主库"""
+    if ReplicaSessionLocal is None:
+        return
+    now = time.monotonic()
+    with _sticky_lock:
+        _sticky_until[user_id] = now + (REPLICA_STICKY_SECONDS if seconds is None else seconds)
+        if len(_sticky_until) > 10000:
+            for key in [k for k, until in _sticky_until.items() if until <= now]:
+                del _sticky_until[key]
+
+
+def reads_from_primary(user_id: Optional[str]) -> bool:
+    """未配置副本，或该用户刚写过数据时返回 True"""
+    if ReplicaSessionLocal is None:
+        return True
+    if user_id is None:
+        return False
+    with _sticky_lock:
+        until = _sticky_until.get(user_id)
+    return until is not None and until > time.monotonic()
+
+
+def open_replica_session() -> Session:
+    """新建一个副本会话；调用前先用 reads_from_primary 判断"""
+    return ReplicaSessionLocal()
+
+
+# 会话里记下当前用户（get_current_user 设置 session.info["user_id"]）；有写入的事务提交后该用户粘住主库
+@event.listens_for(Session, "after_flush")
+def _mark_flushed_write(session, flush_context):
+    session.info["wrote"] = True
+
+
+@event.listens_for(Session, "do_orm_execute")
+def _mark_bulk_write(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+
+@event.listens_for(Session, "after_commit")
+def _stick_writer_to_primary(session):
+    wrote = session.info.pop("wrote", False)
+    user_id = session.info.get("user_id")
+    if wrote and user_id:
+        stick_to_primary(user_id)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_write(session, previous_transaction):
+    session.info.pop("wrote", None)
+
 # 自动建表 把继承Base的类给当作表建立了(相当于 Hibernate ddl-auto)
+# 已存在的表不会被 create_all 修改：新增列与索引由版本化迁移补上 (app/db/migrations.py)
 def init_db():
     Base.metadata.create_all(bind=engine)
-    inspector = inspect(engine)
-    if "users" in inspector.get_table_names():
-        columns = {column["name"] for column in inspector.get_columns("users")}
-        with engine.begin() as connection:
-            if "device_id" not in columns:
-                connection.execute(text("ALTER TABLE users ADD COLUMN device_id VARCHAR"))
-                connection.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_users_device_id ON users (device_id)"))
-            if "is_anonymous" not in columns:
-                connection.execute(text("ALTER TABLE users ADD COLUMN is_anonymous BOOLEAN DEFAULT 1"))
+    run_migrations(engine)
 
 # 依赖注入用的函数 (给 FastAPI Depends 用)
 def get_db():
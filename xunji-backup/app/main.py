@@ -11,8 +11,13 @@ from fastapi.middleware.cors import CORSMiddleware
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
 
 
-from app.api.endpoints import chat, upload, retrieval, history, auth, models, attachments, instructions, openclaw
-from app.db.session import init_db
+from app.api.endpoints import chat, upload, upload_sessions, retrieval, history, auth, models, attachments, instructions, openclaw, health
+from app.db.session import SessionLocal, init_db
+from app.services.directory_watch_service import RAG_WATCH_ENABLED, directory_watch_service
+from app.services.password_hasher import password_hasher
+from app.services.purge_service import purge_service
+from app.services.vector_compaction_service import vector_compaction_service
+from app.services.warmup_service import rag_warmup_service
 
 load_dotenv()
 
@@ -36,7 +41,8 @@ app.add_middleware(
     allow_origins=["*"],
     allow_credentials=True, # 允许携带 Cookie/Token
     allow_methods=["*"],    # 允许所有方法 (GET, POST, PUT, DELETE...)
-    allow_headers=["Content-Type", "Authorization", "X-Device-ID"],    # 显式允许自定义的 X-Device-ID 头
+    allow_headers=["Content-Type", "Authorization", "X-Device-ID", "Content-Range", "X-Chunk-SHA256"],    # 显式允许自定义的 X-Device-ID 头及分片上传头
+    expose_headers=["X-Next-Cursor", "ETag"],  # 分页游标、树接口的 ETag 放在响应头里，需要暴露给前端
 )
 
 
@@ -44,6 +50,7 @@ app.add_middleware(
 # 把 chat.py 里的路由挂载到 /api 路径下
 app.include_router(chat.router, prefix="/api", tags=["Chat"])
 app.include_router(upload.router, prefix="/api", tags=["Upload/File"]) # Upload 里现在也有查询接口了
+app.include_router(upload_sessions.router, prefix="/api", tags=["Upload/File"]) # 大文件断点续传
 app.include_router(retrieval.router, prefix="/api", tags=["Retrieval/Debug"])
 app.include_router(history.router, prefix="/api", tags=["History/Session"]) # 获取消息
 app.include_router(attachments.router, prefix="/api", tags=["Attachments"]) # 附件签名URL
@@ -51,12 +58,71 @@ app.include_router(auth.router, prefix="/api/auth", tags=["Authentication"]) # 
 app.include_router(models.router, prefix="/api", tags=["Models"]) # ★ 模型管理
 app.include_router(instructions.router, prefix="/api", tags=["Instructions"]) # ★ AI 指令
 app.include_router(openclaw.router, prefix="/api/openclaw", tags=["OpenClaw"]) # ★ OpenClaw 独立接口
-# 4. 根路径测试
+app.include_router(health.router, prefix="/api", tags=["Health"]) # 存活 / 就绪检查
+
+
+# 4. 可选：启动后在后台预热向量库与嵌入模型连接，预热完成前 /api/health/ready 返回 503
+@app.on_event("startup")
+def start_rag_warmup():
+    rag_warmup_service.start()
+
+
+@app.on_event("shutdown")
+def stop_rag_warmup():
+    rag_warmup_service.stop(timeout=5)
+
+
+# 可选：监听 RAG_FILE_PATH 目录，自动导入 / 更新 / 删除放入其中的文件
+@app.on_event("startup")
+def start_directory_watch():
+    if RAG_WATCH_ENABLED:
+        directory_watch_service.start(SessionLocal)
+
+
+@app.on_event("shutdown")
+def stop_directory_watch():
+    directory_watch_service.stop(timeout=5)
+
+
+# 可选：定期压缩向量库，回收已删除向量占用的磁盘和内存 (RAG_COMPACT_INTERVAL_HOURS)
+@app.on_event("startup")
+def start_vector_compaction():
+    vector_compaction_service.start()
+
+
+@app.on_event("shutdown")
+def stop_vector_compaction():
+    vector_compaction_service.stop(timeout=5)
+
+
+# 可选：定期物理删除超过保留期的软删除数据及孤儿数据 (PURGE_INTERVAL_HOURS)
+@app.on_event("startup")
+def start_purge():
+    purge_service.start(SessionLocal)
+
+
+@app.on_event("shutdown")
+def stop_purge():
+    purge_service.stop(timeout=5)
+
+
+# bcrypt 进程池：启动时就拉起工作进程，避免第一批登录请求等待进程启动 (PASSWORD_HASH_WORKERS)
+@app.on_event("startup")
+def start_password_hasher():
+    password_hasher.start()
+
+
+@app.on_event("shutdown")
+def stop_password_hasher():
+    password_hasher.shutdown()
+
+
+# 5. 根路径测试
 @app.get("/")
 def root():
     return {"message": "知微后端服务已启动 🚀"}
 
-# 5. 启动代码 (仅在直接运行此文件时执行)
+# 6. 启动代码 (仅在直接运行此文件时执行)
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 21801))
     import uvicorn
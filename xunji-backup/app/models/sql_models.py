@@ -1,5 +1,5 @@
-from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Boolean, Integer
-from sqlalchemy.orm import relationship, declarative_base
+from sqlalchemy import Column, String, Text, DateTime, ForeignKey, Boolean, Integer, Index, and_, event, func, select
+from sqlalchemy.orm import Session, relationship, declarative_base
 from datetime import datetime
 import uuid
 
@@ -44,6 +44,10 @@ class User(Base):
 # --- 2. 会话表 (Conversation) ---
 class Conversation(Base):
     __tablename__ = "conversations"
+    __table_args__ = (
+        # 侧边栏会话列表的 keyset 分页 (updated_at, id)
+        Index("ix_conversations_user_updated", "user_id", "is_deleted", "updated_at", "id"),
+    )
 
     # 对应草图: id String
     id = Column(String, primary_key=True, default=gen_uuid)
@@ -56,6 +60,10 @@ class Conversation(Base):
     # 对应草图: user_id 外键
     user_id = Column(String, ForeignKey("users.id"), nullable=True)
     is_deleted = Column(Boolean, default=False)
+    # 软删除时间，超过保留期后由清理任务物理删除 (purge_service)
+    deleted_at = Column(DateTime, nullable=True)
+    # 树结构版本号：会话的节点或消息有改动时 +1 (_bump_tree_versions)，作为 /tree 接口的 ETag
+    tree_version = Column(Integer, default=0)
 
     # 关联关系
     user = relationship("User", back_populates="conversations")
@@ -65,6 +73,10 @@ class Conversation(Base):
 # --- 3. 聊天消息表 (Message) ---
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        # 会话消息的 keyset 分页 (created_at, id)
+        Index("ix_messages_conversation_created", "conversation_id", "created_at", "id"),
+    )
 
     # 对应草图: id String
     id = Column(String, primary_key=True, default=gen_uuid)
@@ -91,6 +103,10 @@ class Message(Base):
 # --- 4. 文档表 (FileRecord) ---
 class FileRecord(Base):
     __tablename__ = "files"
+    __table_args__ = (
+        # 知识库文件列表：按用户 + 未删除过滤，按创建时间排序
+        Index("ix_files_user_deleted", "user_id", "is_deleted", "created_at"),
+    )
 
     # 这个 ID 同时也是 ChromaDB 里的 file_id
     id = Column(String, primary_key=True, default=gen_uuid)
@@ -107,16 +123,79 @@ class FileRecord(Base):
     # 文件的大小
     file_size = Column(Integer, default=0)
 
+    # 文件内容 sha256，对应 FileBlob.id；为空表示去重上线前的旧记录（向量以 id 为 file_id）
+    content_hash = Column(String, index=True, nullable=True)
+
+    # 目录监听导入的文件：相对 RAG_FILE_PATH 的源文件路径（原地解析，不复制）；上传的文件为空
+    source_path = Column(String, index=True, nullable=True)
+
     created_at = Column(DateTime, default=datetime.now)
     is_deleted = Column(Boolean, default=False)
+    # 软删除时间，超过保留期后由清理任务物理删除 (purge_service)
+    deleted_at = Column(DateTime, nullable=True)
 
     # 关联关系
     user = relationship("User", back_populates="files")
 
 
+# --- 4.1 文档内容表 (FileBlob) ---
+# 相同内容的文件（同一用户重复上传或不同用户上传）共享一份切块与向量
+class FileBlob(Base):
+    __tablename__ = "file_blobs"
+
+    # 内容 sha256 (hex)
+    id = Column(String, primary_key=True)
+
+    # 向量库中这些切块使用的 file_id（首次上传该内容的 FileRecord.id）
+    vector_key = Column(String, nullable=False)
+
+    size = Column(Integer, default=0)
+
+    # 仍引用该内容的未删除 FileRecord 数量，归零时删除向量
+    ref_count = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.now)
+
+
+# --- 4.2 切块表 (DocumentChunk) ---
+# 向量库中每个切块在 SQL 中的镜像（不存正文），统计、按文件删除、相邻切块查询都走索引
+class DocumentChunk(Base):
+    __tablename__ = "document_chunks"
+    __table_args__ = (
+        Index("ix_document_chunks_key_ordinal", "collection", "vector_key", "ordinal"),
+        Index("ix_document_chunks_key_hash", "collection", "vector_key", "chunk_hash"),
+    )
+
+    # 向量库中的向量 id
+    id = Column(String, primary_key=True)
+
+    # 所在向量集合（重建索引时影子集合与当前集合的切块并存）
+    collection = Column(String, nullable=False)
+
+    # 向量库 metadata 中的 file_id（FileBlob.vector_key 或旧记录的 FileRecord.id）
+    vector_key = Column(String, nullable=False)
+
+    # 切块在文件中的序号，从 0 开始
+    ordinal = Column(Integer, nullable=False)
+
+    # 切块正文 sha256，与向量 metadata 中的 chunk_hash 一致
+    chunk_hash = Column(String, nullable=False)
+
+    token_count = Column(Integer, default=0)
+    char_count = Column(Integer, default=0)
+
+    created_at = Column(DateTime, default=datetime.now)
+
+
 # --- 5. 树状节点表 (TreeNode) ---
 class TreeNode(Base):
     __tablename__ = "tree_nodes"
+    __table_args__ = (
+        Index("ix_tree_nodes_message_id", "message_id"),
+        Index("ix_tree_nodes_parent_id", "parent_id"),
+        # 物化路径：祖先链 / 子树都是该索引上的单次查询 (tree_service)
+        Index("ix_tree_nodes_conversation_path", "conversation_id", "path"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     conversation_id = Column(String, ForeignKey("conversations.id"))
@@ -126,6 +205,12 @@ class TreeNode(Base):
     
     # 父节点ID (实现树状结构)
     parent_id = Column(String, ForeignKey("tree_nodes.id"), nullable=True)
+
+    # 物化路径：从根到本节点每层一个兄弟序号编码 (tree_path_segment)，插入时自动填写
+    # 祖先的 path 都是本节点 path 的前缀，子树是以本节点 path 为前缀的区间
+    path = Column(String, nullable=True)
+    # 根节点为 0
+    depth = Column(Integer, nullable=True)
     
     created_at = Column(DateTime, default=datetime.now)
 
@@ -136,11 +221,150 @@ class TreeNode(Base):
     created_at = Column(DateTime, default=datetime.now)
 
     is_deleted = Column(Boolean, default=False)
+    # 软删除时间，超过保留期后由清理任务物理删除 (purge_service)
+    deleted_at = Column(DateTime, nullable=True)
+
+
+_PATH_ALPHABET = "0123456789abcdefghijklmnopqrstuvwxyz"
+_PATH_SHORT = len(_PATH_ALPHABET) - 1          # 序号 0..34 用一个字符 ('0'..'y')
+_PATH_LONG_LIMIT = _PATH_SHORT ** 3            # 之后 'z' + 3 位 35 进制
+
+
+def tree_path_segment(ordinal: int) -> str:
+    """兄弟序号 -> 路径段。编码无前缀冲突且按序号排序，path 排序即先序遍历顺序"""
+    if ordinal < _PATH_SHORT:
+        return _PATH_ALPHABET[ordinal]
+    rest = ordinal - _PATH_SHORT
+    if rest >= _PATH_LONG_LIMIT:
+        raise ValueError("同一父节点下的分支过多")
+    digits = ""
+    for _ in range(3):
+        rest, digit = divmod(rest, _PATH_SHORT)
+        digits = _PATH_ALPHABET[digit] + digits
+    return "z" + digits
+
+
+def tree_path_ordinal(segment: str) -> int:
+    """路径段 -> 兄弟序号（tree_path_segment 的逆运算）"""
+    if len(segment) == 1:
+        return _PATH_ALPHABET.index(segment)
+    rest = 0
+    for char in segment[1:]:
+        rest = rest * _PATH_SHORT + _PATH_ALPHABET.index(char)
+    return _PATH_SHORT + rest
+
+
+def split_tree_path(path: str) -> list:
+    """把 path 拆成各层路径段"""
+    segments, i = [], 0
+    while i < len(path):
+        step = 4 if path[i] == "z" else 1
+        segments.append(path[i:i + step])
+        i += step
+    return segments
+
+
+@event.listens_for(Session, "before_flush")
+def _assign_tree_paths(session, flush_context, instances):
+    """新建的 TreeNode 在写入前按父节点补上 path / depth（同一次 flush 里的父节点先处理）"""
+    nodes = [node for node in session.new if isinstance(node, TreeNode) and node.path is None]
+    if not nodes:
+        return
+    with session.no_autoflush:
+        for node in nodes:
+            if node.id is None:
+                node.id = gen_uuid()
+        for node in nodes:
+            if node.parent_id is None and node.parent is not None:
+                node.parent_id = node.parent.id
+        pending = {node.id: node for node in nodes}
+        table = TreeNode.__table__
+        taken = {}  # 下一个可用的兄弟序号，按 (conversation_id, parent_id)
+
+        # 兄弟序号是 max(path) + 1：查询前先锁住会话行，往同一会话并发插入节点的事务排队执行，
+        # 后来者的查询能看到先提交的兄弟节点，不会分到相同的 path。
+        # PostgreSQL 上是行锁；SQLite 上这条 UPDATE 会拿到写锁（其余写事务在 busy_timeout 内等待）
+        conversation_ids = {node.conversation_id for node in nodes if node.conversation_id}
+        if conversation_ids:
+            conversations = Conversation.__table__
+            session.execute(
+                conversations.update().where(conversations.c.id.in_(conversation_ids))
+                .values(tree_version=conversations.c.tree_version)
+            )
+
+        for node in nodes:
+            # 先沿父链找到已有 path 的祖先，再自上而下逐个分配
+            chain = [node]
+            while (chain[-1].parent_id in pending and pending[chain[-1].parent_id].path is None
+                   and len(chain) <= len(nodes)):
+                chain.append(pending[chain[-1].parent_id])
+            for item in reversed(chain):
+                if item.path is not None:
+                    continue
+                parent = pending.get(item.parent_id)
+                if parent is not None:
+                    parent_path, parent_depth = parent.path, parent.depth
+                elif item.parent_id:
+                    row = session.execute(
+                        select(table.c.path, table.c.depth).where(table.c.id == item.parent_id)
+                    ).first()
+                    parent_path, parent_depth = (row.path, row.depth) if row else (None, None)
+                else:
+                    parent_path, parent_depth = "", -1
+                if parent_path is None:
+                    break  # 父节点不存在或尚未回填：留空，tree_service 对无 path 的节点逐层回溯
+
+                key = (item.conversation_id, item.parent_id)
+                if key not in taken:
+                    siblings = table.c.parent_id == item.parent_id if item.parent_id else and_(
+                        table.c.conversation_id == item.conversation_id, table.c.parent_id.is_(None))
+                    # 用最大序号而不是兄弟数：清理任务删掉的兄弟会留下空号
+                    last = session.execute(select(func.max(table.c.path)).where(siblings)).scalar()
+                    taken[key] = tree_path_ordinal(split_tree_path(last)[-1]) + 1 if last else 0
+                item.path = parent_path + tree_path_segment(taken[key])
+                item.depth = parent_depth + 1
+                taken[key] += 1
+
+
+def bump_tree_versions(session, conversation_ids, bump=True):
+    """会话 tree_version + 1，并把会话 id 记在 session.info 里，提交后让缓存的版本号失效
+
+    flush 时由 _bump_tree_versions 自动调用；绕过 ORM 的批量 query.delete() 不会触发它，需要手动调用。
+    bump=False 只让缓存失效（例如会话行本身被删除）。
+    """
+    conversation_ids = set(conversation_ids)
+    if not conversation_ids:
+        return
+    if bump:
+        table = Conversation.__table__
+        session.execute(
+            table.update().where(table.c.id.in_(conversation_ids))
+            .values(tree_version=func.coalesce(table.c.tree_version, 0) + 1)
+        )
+    session.info.setdefault("tree_changed", set()).update(conversation_ids)
+
+
+@event.listens_for(Session, "before_flush")
+def _bump_tree_versions(session, flush_context, instances):
+    """节点或消息有增删改的会话 tree_version + 1；改动过的会话 id 记在 session.info 里供缓存失效"""
+    changed, touched = set(), set()
+    with session.no_autoflush:
+        for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+            if isinstance(obj, (TreeNode, Message)):
+                if obj.conversation_id and (obj not in session.dirty or session.is_modified(obj)):
+                    changed.add(obj.conversation_id)
+            elif isinstance(obj, Conversation) and obj not in session.new:
+                touched.add(obj.id)
+        bump_tree_versions(session, changed)
+    bump_tree_versions(session, touched, bump=False)
 
 
 # --- 6. 模型配置表 (ModelConfig) ---
 class ModelConfig(Base):
     __tablename__ = "model_configs"
+    __table_args__ = (
+        Index("ix_model_configs_user_id", "user_id"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=True)  # 绑定用户，如果为空则为系统默认
@@ -156,6 +380,9 @@ class ModelConfig(Base):
 
 class AiInstruction(Base):
     __tablename__ = "ai_instructions"
+    __table_args__ = (
+        Index("ix_ai_instructions_user_order", "user_id", "is_deleted", "sort_order", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     user_id = Column(String, ForeignKey("users.id"), nullable=False)
@@ -172,6 +399,10 @@ class AiInstruction(Base):
 
 class ConversationAiInstruction(Base):
     __tablename__ = "conversation_ai_instructions"
+    __table_args__ = (
+        Index("ix_conversation_ai_instructions_order",
+              "conversation_id", "user_id", "is_deleted", "sort_order", "created_at"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     conversation_id = Column(String, ForeignKey("conversations.id"), nullable=False)
@@ -190,6 +421,10 @@ class ConversationAiInstruction(Base):
 
 class MessageAttachment(Base):
     __tablename__ = "message_attachments"
+    __table_args__ = (
+        Index("ix_message_attachments_message_id", "message_id"),
+        Index("ix_message_attachments_conversation_id", "conversation_id"),
+    )
 
     id = Column(String, primary_key=True, default=gen_uuid)
     conversation_id = Column(String, ForeignKey("conversations.id"))
@@ -121,5 +121,10 @@ class AliyunOssService:
         )
         return pre_result.url  # 从返回对象中获取URL
 
+    def delete_object(self, *, key: str) -> None:
+        if self._oss is None:
+            self._get_client()
+        self._get_client().delete_object(self._oss.DeleteObjectRequest(bucket=ALIYUN_OSS_BUCKET, key=key))
+
 
 aliyun_oss_service = AliyunOssService()
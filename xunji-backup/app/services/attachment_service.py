@@ -15,7 +15,13 @@ def save_chat_attachments(
     user_id: str,
     conversation_id: str,
     message_id: str,
+    commit: bool = True,
 ) -> List[Dict[str, Any]]:
+    """Upload chat attachments to object storage and add a MessageAttachment row for each.
+
+    With commit=False the rows are only added to the session, so the caller can
+    commit them in its own transaction (/chat commits them with the AI reply).
+    """
     saved: List[Dict[str, Any]] = []
     if not files:
         return saved
@@ -65,7 +71,7 @@ def save_chat_attachments(
             }
         )
 
-    if saved:
+    if saved and commit:
         db.commit()
 
     return saved
@@ -0,0 +1,306 @@
+import os
+import threading
+import time
+import uuid
+import zipfile
+from collections import Counter, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, BinaryIO, Callable, Deque, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import FileBlob, FileRecord
+from app.services.chunk_index_service import chunk_index_service
+from app.services.knowledge_base_service import _remove_quietly, knowledge_base_service
+from app.services.rag_service import rag_service
+
+load_dotenv()
+
+BULK_INGEST_WORKERS = int(os.getenv("BULK_INGEST_WORKERS", "4"))
+BULK_INGEST_BATCH_SIZE = int(os.getenv("BULK_INGEST_BATCH_SIZE", "50"))
+ALLOWED_EXTENSIONS = (".pdf", ".txt", ".md")
+# Finished jobs are kept in memory this long so clients can still poll the result.
+_JOB_RETENTION_SECONDS = 24 * 3600
+
+
+class BulkSource(NamedTuple):
+    """One file to ingest.
+
+    Either `open` returns a fresh readable stream of the content, or `stored`
+    describes a file already written to its stored path as
+    `(file_id, path, sha256, size)`.
+    """
+
+    filename: str
+    open: Optional[Callable[[], BinaryIO]] = None
+    stored: Optional[Tuple[str, str, str, int]] = None
+
+
+def iter_zip_sources(zip_path: str, remove_after: bool = False) -> Iterator[BulkSource]:
+    """Yield archive members one at a time; each is read straight from the archive.
+
+    Args:
+        zip_path: Path of the ZIP archive.
+        remove_after: Delete the archive once all members were yielded.
+
+    Yields:
+        A BulkSource per regular file (directories and macOS metadata are skipped).
+    """
+    try:
+        with zipfile.ZipFile(zip_path) as archive:
+            for info in archive.infolist():
+                name = os.path.basename(info.filename)
+                if info.is_dir() or not name or name.startswith(".") or info.filename.startswith("__MACOSX/"):
+                    continue
+                yield BulkSource(name, open=lambda info=info: archive.open(info))
+    finally:
+        if remove_after:
+            try:
+                os.remove(zip_path)
+            except OSError:
+                pass
+
+
+def iter_path_sources(paths: Iterable[str]) -> Iterator[BulkSource]:
+    """Yield files, directory trees and ZIP archives given on the command line.
+
+    Args:
+        paths: File, directory or `.zip` paths.
+
+    Yields:
+        A BulkSource per file found.
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, dirs, files in os.walk(path):
+                dirs[:] = sorted(d for d in dirs if not d.startswith("."))
+                for name in sorted(files):
+                    if not name.startswith("."):
+                        full = os.path.join(root, name)
+                        yield from iter_path_sources([full]) if name.lower().endswith(".zip") else [
+                            BulkSource(name, open=lambda full=full: open(full, "rb"))
+                        ]
+        elif path.lower().endswith(".zip"):
+            yield from iter_zip_sources(path)
+        else:
+            yield BulkSource(os.path.basename(path), open=lambda path=path: open(path, "rb"))
+
+
+class BulkIngestService:
+    """Ingest many knowledge-base files with a bounded pool of parse/embed workers.
+
+    The calling thread walks the sources lazily, writes each one once to its stored
+    path (hashing it on the way), and only submits content it has not seen to the
+    worker pool; repeats inside the same run wait for the first copy. At most
+    `2 * workers` files are in flight, so a large archive never sits on disk twice.
+    All database work stays on the calling thread: FileRecord rows and blob
+    reference counts are written in batches of `batch_size`, one commit each.
+    Every file ends as indexed, reused, skipped or failed, reported through the
+    job state and an optional progress callback.
+    """
+
+    def __init__(self, workers: int = BULK_INGEST_WORKERS, batch_size: int = BULK_INGEST_BATCH_SIZE) -> None:
+        """Create the service.
+
+        Args:
+            workers: Parallel parse/embed workers.
+            batch_size: FileRecords per database commit.
+        """
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self._jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ jobs
+
+    def create_job(self, user_id: Optional[str]) -> Dict[str, Any]:
+        """Register a job whose progress can be polled with get_job."""
+        now = time.time()
+        job = {
+            "id": uuid.uuid4().hex,
+            "user_id": user_id,
+            "status": "queued",
+            "done": 0,
+            "counts": {"indexed": 0, "reused": 0, "skipped": 0, "failed": 0},
+            "files": [],
+            "created_at": now,
+        }
+        with self._lock:
+            for old_id, old in list(self._jobs.items()):
+                if old["status"] in ("done", "failed") and now - old["created_at"] > _JOB_RETENTION_SECONDS:
+                    del self._jobs[old_id]
+            self._jobs[job["id"]] = job
+        return job
+
+    def get_job(self, job_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Return a job's state.
+
+        Raises:
+            LookupError: Unknown job or owned by another user.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or (user_id is not None and job["user_id"] != user_id):
+            raise LookupError("导入任务不存在")
+        return job
+
+    def _report(self, job: Dict[str, Any], progress: Optional[Callable[[Dict[str, Any]], None]],
+                entry: Dict[str, Any], status: str, error: Optional[str] = None) -> None:
+        result = {"filename": entry["filename"], "status": status, "file_id": entry.get("file_id"), "error": error}
+        if status in ("skipped", "failed"):
+            result["file_id"] = None
+        with self._lock:
+            job["files"].append(result)
+            job["done"] += 1
+            job["counts"][status] += 1
+        if progress:
+            progress(result)
+
+    # ------------------------------------------------------------------ pipeline
+
+    def run(
+        self,
+        session_factory: Callable[[], Session],
+        user_id: Optional[str],
+        sources: Iterable[BulkSource],
+        job: Optional[Dict[str, Any]] = None,
+        progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Ingest sources and return the finished job state.
+
+        Args:
+            session_factory: Creates the SQLAlchemy session for this run.
+            user_id: Owner of the new FileRecords.
+            sources: Files to ingest, consumed lazily.
+            job: Job from create_job to update; a new one is created if omitted.
+            progress: Called with each file's result as soon as it is final.
+
+        Returns:
+            The job state.
+        """
+        job = job or self.create_job(user_id)
+        job["status"] = "running"
+        db = session_factory()
+        pending: Dict[str, Dict[str, Any]] = {}
+        in_flight: Deque[Dict[str, Any]] = deque()
+        batch: List[Dict[str, Any]] = []
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bulk-ingest") as pool:
+                for source in sources:
+                    entry = self._store(source, job, progress)
+                    if entry is None:
+                        continue
+                    owner = pending.get(entry["hash"])
+                    if owner is not None:
+                        if owner["state"] == "embedding":
+                            owner["followers"].append(entry)
+                        else:
+                            batch.append(entry)
+                    elif db.query(FileBlob.id).filter(FileBlob.id == entry["hash"]).first():
+                        batch.append(entry)
+                    else:
+                        entry.update(new=True, state="embedding", followers=[])
+                        entry["future"] = pool.submit(
+                            rag_service.index_file, entry["path"], entry["filename"], entry["file_id"]
+                        )
+                        pending[entry["hash"]] = entry
+                        in_flight.append(entry)
+
+                    while len(in_flight) >= self.workers * 2 or (in_flight and in_flight[0]["future"].done()):
+                        self._collect(in_flight.popleft(), pending, batch, job, progress)
+                    if len(batch) >= self.batch_size:
+                        self._flush(db, batch, pending, job, progress)
+
+                while in_flight:
+                    self._collect(in_flight.popleft(), pending, batch, job, progress)
+                self._flush(db, batch, pending, job, progress)
+            job["status"] = "done"
+        except Exception as exc:
+            job.update(status="failed", error=str(exc))
+            raise
+        finally:
+            db.close()
+        return job
+
+    def _store(self, source: BulkSource, job: Dict[str, Any],
+               progress: Optional[Callable[[Dict[str, Any]], None]]) -> Optional[Dict[str, Any]]:
+        """Write one source to its stored path; returns the entry or None if it was skipped/failed."""
+        entry: Dict[str, Any] = {"filename": source.filename}
+        if source.stored:
+            entry["file_id"], entry["path"], entry["hash"], entry["size"] = source.stored
+            return entry
+        if os.path.splitext(source.filename)[1].lower() not in ALLOWED_EXTENSIONS:
+            self._report(job, progress, entry, "skipped", "仅支持 PDF, TXT 或 MD 文件")
+            return None
+        entry["file_id"] = str(uuid.uuid4())
+        try:
+            entry["path"] = knowledge_base_service.stored_file_path(entry["file_id"], source.filename)
+            with source.open() as stream:
+                entry["hash"], entry["size"] = knowledge_base_service.write_stream(stream, entry["path"])
+        except Exception as exc:
+            self._report(job, progress, entry, "failed", str(exc))
+            return None
+        return entry
+
+    def _collect(self, entry: Dict[str, Any], pending: Dict[str, Dict[str, Any]], batch: List[Dict[str, Any]],
+                 job: Dict[str, Any], progress: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        """Wait for one embedding job and queue it (and files sharing its content) for the next batch."""
+        future: Future = entry.pop("future")
+        try:
+            entry["rows"] = future.result()
+        except Exception as exc:
+            pending.pop(entry["hash"], None)
+            rag_service.delete_docs([entry["file_id"]])
+            for failed in [entry] + entry["followers"]:
+                _remove_quietly(failed["path"])
+                self._report(job, progress, failed, "failed", str(exc))
+            return
+        entry["state"] = "embedded"
+        batch.append(entry)
+        batch.extend(entry.pop("followers"))
+
+    def _flush(self, db: Session, batch: List[Dict[str, Any]], pending: Dict[str, Dict[str, Any]],
+               job: Dict[str, Any], progress: Optional[Callable[[Dict[str, Any]], None]]) -> None:
+        """Insert one batch of FileRecords and blob reference counts in a single commit."""
+        if not batch:
+            return
+        entries, batch[:] = list(batch), []
+        owners = {e["hash"]: e for e in entries if e.get("new")}
+        refs = Counter(e["hash"] for e in entries)
+        base_dir = os.getenv("RAG_FILE_PATH")
+        try:
+            for content_hash, count in refs.items():
+                owner = owners.get(content_hash)
+                if owner is not None:
+                    db.add(FileBlob(id=content_hash, vector_key=owner["file_id"], size=owner["size"], ref_count=count))
+                    chunk_index_service.add(db, owner["file_id"], owner.pop("rows", []))
+                else:
+                    db.query(FileBlob).filter(FileBlob.id == content_hash).update(
+                        {FileBlob.ref_count: FileBlob.ref_count + count}, synchronize_session=False
+                    )
+            db.add_all([
+                FileRecord(
+                    id=e["file_id"],
+                    user_id=job["user_id"],
+                    filename=e["filename"],
+                    file_path=base_dir,
+                    file_size=e["size"],
+                    content_hash=e["hash"],
+                )
+                for e in entries
+            ])
+            db.commit()
+        except Exception as exc:
+            db.rollback()
+            rag_service.delete_docs([o["file_id"] for o in owners.values()])
+            for e in entries:
+                pending.pop(e["hash"], None)
+                _remove_quietly(e["path"])
+                self._report(job, progress, e, "failed", str(exc))
+            return
+        for e in entries:
+            pending.pop(e["hash"], None)
+            self._report(job, progress, e, "indexed" if e.get("new") else "reused")
+
+
+bulk_ingest_service = BulkIngestService()
@@ -1,7 +1,9 @@
 import asyncio
 import base64
+import logging
 import os
 import tempfile
+import time
 from datetime import datetime
 from typing import Any, AsyncIterable, Dict, List, Optional, Tuple
 
@@ -15,14 +17,21 @@ from sqlalchemy.orm import Session
 
 from app.models.sql_models import AiInstruction, ConversationAiInstruction, FileRecord, Message, TreeNode
 from app.schemas.chat import ChatRequest, SearchQuery
+from app.services.chunk_index_service import chunk_index_service
+from app.services.context_packer import ContextSource, context_packer
+from app.services.knowledge_base_service import knowledge_base_service
 from app.services.model_manager import model_manager
 from app.services.rag_service import rag_service
+from app.services.tree_service import tree_service
 
 load_dotenv()
+_logger = logging.getLogger(__name__)
 
 MAX_DIRECT_READ_SIZE_BYTES = 5 * 1024 * 1024
 MAX_HISTORY_MESSAGES = 10
 RAG_TOP_K = 4
+# 知识库命中切块前后各附带的相邻切块数（按 SQL 切块表的序号取，不做额外相似度检索）
+RAG_NEIGHBOR_CHUNKS = int(os.getenv("RAG_NEIGHBOR_CHUNKS", "0"))
 
 
 class ChatService:
@@ -74,14 +83,36 @@ class ChatService:
         )
         return prompt | self.search_model.with_structured_output(SearchQuery)
 
-    def get_internet_info(self, question: str) -> str:
+    def _format_search_results(self, results: Any) -> List[str]:
+        """Format Tavily results as one readable snippet per hit, best score first.
+
+        Args:
+            results: Raw Tavily tool output (list of dicts, or an error string).
+
+        Returns:
+            Snippets with title, source URL and content.
+        """
+        if not isinstance(results, list):
+            return [str(results)] if results else []
+        hits = [r for r in results if isinstance(r, dict) and r.get("content")]
+        hits.sort(key=lambda r: r.get("score") or 0, reverse=True)
+        snippets: List[str] = []
+        for r in hits:
+            lines = [r["title"]] if r.get("title") else []
+            if r.get("url"):
+                lines.append(f"来源: {r['url']}")
+            lines.append(str(r["content"]).strip())
+            snippets.append("\n".join(lines))
+        return snippets
+
+    def get_internet_info(self, question: str) -> List[str]:
         """Fetch internet information using Tavily search.
 
         Args:
             question: User question.
 
         Returns:
-            Search results as a string.
+            Search result snippets, most relevant first.
         """
         search_tool = TavilySearchResults(max_results=3)
         try:
@@ -93,10 +124,10 @@ class ChatService:
                 else str(search_query_obj)
             )
             results = search_tool.invoke({"query": query})
-            return str(results)
+            return self._format_search_results(results)
         except Exception:
             results = search_tool.invoke({"query": question})
-            return str(results)
+            return self._format_search_results(results)
 
     def get_history_from_tree(self, db: Session, current_node_id: str, limit: int = MAX_HISTORY_MESSAGES) -> List[Any]:
         """Reconstruct conversation history from the TreeNode chain.
@@ -116,23 +147,7 @@ class ChatService:
         if not curr_node:
             return []
 
-        history_messages: List[Message] = []
-        curr_id = curr_node.parent_id
-        count = 0
-
-        while curr_id and count < limit:
-            node = db.query(TreeNode).filter(TreeNode.id == curr_id).first()
-            if not node:
-                break
-
-            msg = db.query(Message).filter(Message.id == node.message_id).first()
-            if msg:
-                history_messages.append(msg)
-
-            curr_id = node.parent_id
-            count += 1
-
-        history_messages.reverse()
+        history_messages = tree_service.ancestors(db, curr_node, include_self=False, limit=limit)
 
         history: List[Any] = []
         for msg in history_messages:
@@ -234,6 +249,17 @@ class ChatService:
         blocks = [b for b in [user_instructions, conversation_instructions] if b]
         return "\n\n".join(blocks)
 
+    def _rag_file_keys(self, db: Session, request: ChatRequest) -> List[str]:
+        """Vector-store file ids to search: the requested files, or all of the user's files."""
+        file_ids = request.file_ids
+        if not file_ids:
+            f_records = db.query(FileRecord).filter(FileRecord.user_id == request.user_id).all()
+            file_ids = [f.id for f in f_records]
+        if not file_ids:
+            return []
+        # 内容相同的文件共享向量，检索时使用向量库中的 file_id
+        return knowledge_base_service.vector_keys(db, file_ids)
+
     def _build_kimi_multimodal_parts(self, files: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
         """Build Kimi multimodal parts list for HumanMessage(content=list).
 
@@ -284,7 +310,7 @@ class ChatService:
             except Exception:
                 pass
 
-    def _rag_search_large_document(self, filename: str, file_bytes: bytes, query: str) -> str:
+    def _rag_search_large_document(self, filename: str, file_bytes: bytes, query: str) -> List[str]:
         """Run temporary RAG for a large document.
 
         Args:
@@ -293,7 +319,7 @@ class ChatService:
             query: User query.
 
         Returns:
-            Relevant snippets joined as a string.
+            Relevant snippets, most similar first.
         """
         temp_file_id = f"temp-{os.urandom(8).hex()}"
         suffix = os.path.splitext(filename)[1].lower()
@@ -305,6 +331,9 @@ class ChatService:
             for doc in split_docs:
                 doc.metadata["file_id"] = temp_file_id
                 doc.metadata["filename"] = filename
+                # 进程中断时残留的临时向量由清理任务按这两个字段回收 (purge_service)
+                doc.metadata["temp"] = True
+                doc.metadata["temp_created_at"] = time.time()
             if split_docs:
                 rag_service.vector_store.add_documents(split_docs)
             docs = rag_service.vector_store.similarity_search(
@@ -312,14 +341,14 @@ class ChatService:
                 k=RAG_TOP_K,
                 filter={"file_id": temp_file_id},
             )
-            return "\n\n---\n".join([d.page_content for d in docs]) if docs else ""
+            return [d.page_content for d in docs]
         finally:
             try:
                 os.remove(tmp_path)
             except Exception:
                 pass
             try:
-                rag_service.vector_store._collection.delete(where={"file_id": temp_file_id})
+                rag_service.vector_store.delete_by_file_ids([temp_file_id])
             except Exception:
                 pass
 
@@ -341,8 +370,9 @@ class ChatService:
         """
         model = self.get_model(request.model_name)
 
+        # The session is synchronous: run its queries on a worker thread so other streams keep flowing.
         chat_history = (
-            self.get_history_from_tree(db, current_node_id, limit=MAX_HISTORY_MESSAGES)
+            await asyncio.to_thread(self.get_history_from_tree, db, current_node_id, MAX_HISTORY_MESSAGES)
             if current_node_id
             else []
         )
@@ -363,55 +393,64 @@ class ChatService:
             file_bytes = self._decode_base64(b64)
 
             if size_bytes > MAX_DIRECT_READ_SIZE_BYTES:
-                temp_rag_blocks.append(self._rag_search_large_document(name, file_bytes, request.message))
+                temp_rag_blocks.extend(self._rag_search_large_document(name, file_bytes, request.message))
             else:
                 inline_text_blocks.append(self._read_small_document_as_text(name, file_bytes))
 
-        async def run_search_task() -> str:
+        async def run_search_task() -> List[str]:
             if request.enable_search:
                 return await asyncio.to_thread(self.get_internet_info, request.message)
-            return ""
+            return []
 
-        async def run_rag_task() -> str:
+        async def run_rag_task() -> List[str]:
             if request.enable_rag or (request.file_ids and len(request.file_ids) > 0):
-                file_ids = request.file_ids
-                if not file_ids:
-                    f_records = db.query(FileRecord).filter(FileRecord.user_id == request.user_id).all()
-                    file_ids = [f.id for f in f_records]
+                file_ids = await asyncio.to_thread(self._rag_file_keys, db, request)
                 if not file_ids:
-                    return ""
+                    return []
                 docs = await asyncio.to_thread(
                     rag_service.search,
                     query=request.message,
                     filters={"file_id": {"$in": file_ids}},
                     k=RAG_TOP_K,
                 )
-                if docs:
-                    return "\n\n---\n".join([doc.page_content for doc in docs])
-            return ""
+                if RAG_NEIGHBOR_CHUNKS > 0:
+                    return await asyncio.to_thread(
+                        chunk_index_service.expand_neighbors, db, docs, radius=RAG_NEIGHBOR_CHUNKS
+                    )
+                return [doc.page_content for doc in docs]
+            return []
 
         search_result, rag_result = await asyncio.gather(run_search_task(), run_rag_task())
 
-        context_parts: List[str] = []
-        if search_result:
-            context_parts.append(f"【联网搜索结果】:\n{search_result}")
-        if rag_result:
-            context_parts.append(f"【本地知识库内容】:\n{rag_result}")
-        if inline_text_blocks:
-            context_parts.append("【上传附件内容】:\n" + "\n\n---\n".join(inline_text_blocks))
-        if temp_rag_blocks:
-            merged = "\n\n---\n".join([b for b in temp_rag_blocks if b])
-            if merged:
-                context_parts.append(f"【大文件检索结果】:\n{merged}")
-
-        final_context = "\n\n".join(context_parts) if context_parts else "（无参考上下文，请直接回答）"
+        packed = context_packer.pack(
+            [
+                ContextSource("联网搜索结果", search_result),
+                ContextSource("本地知识库内容", rag_result),
+                ContextSource("上传附件内容", inline_text_blocks),
+                ContextSource("大文件检索结果", temp_rag_blocks),
+            ],
+            budget_tokens=model_manager.get_context_budget(request.model_name),
+        )
+        if packed.dropped_tokens or packed.deduped_tokens:
+            _logger.info(
+                "context packed for %s: used=%d budget=%d dropped=%d deduped=%d per_source=%s",
+                request.model_name,
+                packed.used_tokens,
+                packed.budget_tokens,
+                packed.dropped_tokens,
+                packed.deduped_tokens,
+                packed.sources,
+            )
+        final_context = packed.text or "（无参考上下文，请直接回答）"
 
         if has_multimodal:
             if not self.is_multimodal_supported(request.model_name):
                 yield f"❌ 当前模型 ({request.model_name}) 不支持图片/视频理解，请切换到 Kimi。"
                 return
 
-            extra_instructions = self._get_combined_instructions(db, request.user_id, request.conversation_id)
+            extra_instructions = await asyncio.to_thread(
+                self._get_combined_instructions, db, request.user_id, request.conversation_id
+            )
             sys_msg_content = (
                 "你是一个名为'知微'的AI助手。\n"
                 "请结合以下参考信息回答用户的问题。\n\n"
@@ -432,7 +471,9 @@ class ChatService:
                 yield getattr(chunk, "content", str(chunk))
             return
 
-        extra_instructions = self._get_combined_instructions(db, request.user_id, request.conversation_id)
+        extra_instructions = await asyncio.to_thread(
+            self._get_combined_instructions, db, request.user_id, request.conversation_id
+        )
         qa_prompt = ChatPromptTemplate.from_messages(
             [
                 (
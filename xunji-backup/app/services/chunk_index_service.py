@@ -0,0 +1,231 @@
+from typing import Any, Dict, Iterable, List, Optional
+
+from langchain_core.documents import Document
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import DocumentChunk
+from app.services.rag_service import ChunkRow, VectorStore, chunk_hash, rag_service
+
+
+class ChunkIndexService:
+    """SQL mirror of the chunks stored in the vector store.
+
+    Every chunk written through `rag_service.index_file` / `reindex_file` gets a
+    `DocumentChunk` row (vector id, vector key, ordinal, chunk hash, token and
+    character counts) committed in the same transaction as the FileBlob that owns
+    it. Rows carry the collection they belong to, so a shadow collection built by
+    the re-index coexists with the active one. Stats, per-file counts, vector ids
+    for deletes and neighbor lookups are indexed SQL queries instead of vector-store
+    scans. Chunk text stays in the vector store only.
+    """
+
+    def _collection(self, collection: Optional[str]) -> str:
+        return collection or rag_service.collection_name
+
+    def add(self, db: Session, vector_key: str, rows: Iterable[ChunkRow], collection: Optional[str] = None) -> None:
+        """Stage rows for one vector key (the caller commits)."""
+        name = self._collection(collection)
+        db.add_all([
+            DocumentChunk(
+                id=row.vector_id,
+                collection=name,
+                vector_key=vector_key,
+                ordinal=row.ordinal,
+                chunk_hash=row.chunk_hash,
+                token_count=row.token_count,
+                char_count=row.char_count,
+            )
+            for row in rows
+        ])
+
+    def replace(self, db: Session, vector_key: str, rows: Iterable[ChunkRow], collection: Optional[str] = None) -> None:
+        """Stage the rows of a re-indexed key, replacing the previous ones (the caller commits)."""
+        self.delete_keys(db, [vector_key], collection)
+        self.add(db, vector_key, rows, collection)
+
+    def delete_keys(self, db: Session, vector_keys: List[str], collection: Optional[str] = None) -> int:
+        """Stage deletion of every row of the given keys; returns the row count."""
+        if not vector_keys:
+            return 0
+        return (
+            db.query(DocumentChunk)
+            .filter(DocumentChunk.collection == self._collection(collection),
+                    DocumentChunk.vector_key.in_(list(vector_keys)))
+            .delete(synchronize_session=False)
+        )
+
+    def drop_collection(self, db: Session, collection: str) -> int:
+        """Stage deletion of all rows of a collection (e.g. after the re-index dropped it)."""
+        return db.query(DocumentChunk).filter(DocumentChunk.collection == collection).delete(synchronize_session=False)
+
+    def vector_ids(self, db: Session, vector_keys: List[str], collection: Optional[str] = None) -> Dict[str, List[str]]:
+        """Map vector keys to their vector ids; keys without rows are absent."""
+        if not vector_keys:
+            return {}
+        result: Dict[str, List[str]] = {}
+        rows = (
+            db.query(DocumentChunk.vector_key, DocumentChunk.id)
+            .filter(DocumentChunk.collection == self._collection(collection),
+                    DocumentChunk.vector_key.in_(list(vector_keys)))
+            .all()
+        )
+        for key, vector_id in rows:
+            result.setdefault(key, []).append(vector_id)
+        return result
+
+    def file_stats(self, db: Session, vector_keys: List[str], collection: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+        """Return `{vector_key: {"chunks", "tokens", "chars"}}` for the given keys."""
+        if not vector_keys:
+            return {}
+        rows = (
+            db.query(DocumentChunk.vector_key, func.count(DocumentChunk.id),
+                     func.sum(DocumentChunk.token_count), func.sum(DocumentChunk.char_count))
+            .filter(DocumentChunk.collection == self._collection(collection),
+                    DocumentChunk.vector_key.in_(list(vector_keys)))
+            .group_by(DocumentChunk.vector_key)
+            .all()
+        )
+        return {key: {"chunks": n, "tokens": int(tokens or 0), "chars": int(chars or 0)} for key, n, tokens, chars in rows}
+
+    def stats(self, db: Session, collection: Optional[str] = None) -> Dict[str, Any]:
+        """Return totals for one collection: chunks, tokens, chars and distinct vector keys."""
+        chunks, tokens, chars, keys = (
+            db.query(func.count(DocumentChunk.id), func.sum(DocumentChunk.token_count),
+                     func.sum(DocumentChunk.char_count), func.count(func.distinct(DocumentChunk.vector_key)))
+            .filter(DocumentChunk.collection == self._collection(collection))
+            .one()
+        )
+        return {"chunks": chunks, "tokens": int(tokens or 0), "chars": int(chars or 0), "files": keys}
+
+    def expand_neighbors(
+        self,
+        db: Session,
+        docs: List[Document],
+        radius: int = 1,
+        store: Optional[VectorStore] = None,
+        collection: Optional[str] = None,
+    ) -> List[str]:
+        """Join each search hit with the chunks ordinal ± radius around it.
+
+        Hits are located by their `file_id` / `ordinal` metadata, checked against the
+        row's chunk hash; hits whose ordinal is missing (indexed before it was stored)
+        or stale (chunk kept in place by an update) fall back to the first row of the
+        file with the same hash. All hits' rows come from one SQL query, neighbor ids
+        from a second one and their text from one `get(ids=...)` call. Hits of the same
+        file whose windows overlap are merged into one block. Hits without a SQL row
+        (chunks indexed before the chunk table existed) are returned unchanged.
+
+        Args:
+            db: SQLAlchemy session.
+            docs: Search results in rank order.
+            radius: Neighbors on each side; 0 returns the hits' text.
+            store: Vector store to read neighbor text from; defaults to the active one.
+            collection: Collection name of the rows; defaults to the active one.
+
+        Returns:
+            One text block per (merged) hit, in rank order of its best hit.
+        """
+        if radius <= 0 or not docs:
+            return [doc.page_content for doc in docs]
+        name = self._collection(collection)
+
+        # (vector_key, ordinal, chunk hash) per hit; the key is None if the hit has no file_id.
+        hits: List[tuple] = []
+        for doc in docs:
+            meta = doc.metadata or {}
+            ordinal = meta.get("ordinal")
+            hits.append((meta.get("file_id"), ordinal if isinstance(ordinal, int) else None,
+                         meta.get("chunk_hash") or chunk_hash(doc.page_content)))
+        cond = []
+        for key, ordinal, h in hits:
+            if key:
+                cond.append(and_(DocumentChunk.vector_key == key, DocumentChunk.chunk_hash == h))
+                if ordinal is not None:
+                    cond.append(and_(DocumentChunk.vector_key == key, DocumentChunk.ordinal == ordinal))
+        hash_at: Dict[tuple, str] = {}
+        first_of: Dict[tuple, int] = {}
+        if cond:
+            for key, ordinal, h in (
+                db.query(DocumentChunk.vector_key, DocumentChunk.ordinal, DocumentChunk.chunk_hash)
+                .filter(DocumentChunk.collection == name, or_(*cond))
+                .all()
+            ):
+                hash_at[(key, ordinal)] = h
+                if ordinal < first_of.get((key, h), ordinal + 1):
+                    first_of[(key, h)] = ordinal
+
+        # (vector_key, first ordinal, last ordinal) per hit, or None if the hit is not mirrored.
+        windows: List[Optional[List[Any]]] = []
+        for key, ordinal, h in hits:
+            if ordinal is None or hash_at.get((key, ordinal)) != h:
+                ordinal = first_of.get((key, h))
+            windows.append([key, ordinal - radius, ordinal + radius] if key and ordinal is not None else None)
+
+        # Merge overlapping windows of the same file into the earliest-ranked one.
+        for i, win in enumerate(windows):
+            if win is None:
+                continue
+            for j in range(i):
+                other = windows[j]
+                if other and other[0] == win[0] and win[1] <= other[2] + 1 and other[1] <= win[2] + 1:
+                    other[1], other[2] = min(other[1], win[1]), max(other[2], win[2])
+                    windows[i] = False
+                    break
+
+        ranges = [and_(DocumentChunk.vector_key == win[0], DocumentChunk.ordinal.between(win[1], win[2]))
+                  for win in windows if win]
+        ordinals: Dict[tuple, str] = {}
+        if ranges:
+            for key, ordinal, vector_id in (
+                db.query(DocumentChunk.vector_key, DocumentChunk.ordinal, DocumentChunk.id)
+                .filter(DocumentChunk.collection == name, or_(*ranges))
+                .all()
+            ):
+                ordinals[(key, ordinal)] = vector_id
+
+        found = (store or rag_service.vector_store).get(ids=list(ordinals.values())) if ordinals else {"ids": []}
+        text_by_id = dict(zip(found["ids"], found.get("documents") or []))
+
+        blocks: List[str] = []
+        for doc, win in zip(docs, windows):
+            if win is False:
+                continue
+            if win is None:
+                blocks.append(doc.page_content)
+                continue
+            key, lo, hi = win
+            parts = [text_by_id.get(ordinals.get((key, o))) for o in range(lo, hi + 1)]
+            text = "\n".join(p for p in parts if p)
+            blocks.append(text or doc.page_content)
+        return blocks
+
+    def backfill(self, db: Session, vector_keys: List[str], store: Optional[VectorStore] = None,
+                 collection: Optional[str] = None) -> int:
+        """Create rows for keys indexed before the chunk table existed.
+
+        Ordinals follow the order the store returns the chunks in (insertion order
+        for both backends). Keys that already have rows are skipped.
+
+        Returns:
+            Number of rows created (committed).
+        """
+        store = store or rag_service.vector_store
+        mirrored = set(self.vector_ids(db, vector_keys, collection))
+        created = 0
+        for key in vector_keys:
+            if key in mirrored:
+                continue
+            found = store.get(filter={"file_id": key})
+            rows = [
+                ChunkRow(vid, i, (meta or {}).get("chunk_hash") or chunk_hash(text or ""),
+                         rag_service.splitter.counter(text or ""), len(text or ""))
+                for i, (vid, text, meta) in enumerate(zip(found["ids"], found["documents"], found["metadatas"]))
+            ]
+            self.add(db, key, rows, collection)
+            db.commit()
+            created += len(rows)
+        return created
+
+
+chunk_index_service = ChunkIndexService()
@@ -0,0 +1,202 @@
+from typing import Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from app.services.text_splitter import estimate_tokens, truncate_to_tokens
+
+# Shortest head/tail match treated as chunk overlap rather than coincidence.
+MIN_OVERLAP_CHARS = 16
+# A truncated snippet shorter than this is not worth its header and separator.
+MIN_PARTIAL_TOKENS = 32
+ITEM_SEPARATOR = "\n\n---\n"
+SOURCE_SEPARATOR = "\n\n"
+TRUNCATED_MARK = "…"
+
+
+class ContextSource(NamedTuple):
+    """A titled group of snippets, most relevant first."""
+
+    title: str
+    items: List[str]
+
+
+class PackedContext(NamedTuple):
+    """Result of packing: prompt text plus accounting for what was removed."""
+
+    text: str
+    budget_tokens: int
+    used_tokens: int
+    dropped_tokens: int
+    deduped_tokens: int
+    sources: Dict[str, Dict[str, int]]
+
+
+def strip_overlap(previous: str, text: str, min_chars: int = MIN_OVERLAP_CHARS) -> str:
+    """Remove the longest prefix of text that repeats a suffix of previous.
+
+    Neighbouring chunks produced with overlap share text at the seam; this keeps
+    only the new part of the second chunk.
+
+    Args:
+        previous: Text already placed in the context.
+        text: Candidate text.
+        min_chars: Shortest overlap that is stripped.
+
+    Returns:
+        text without the overlapping head.
+    """
+    if len(previous) < min_chars or len(text) < min_chars:
+        return text
+    probe = text[:min_chars]
+    start = previous.find(probe, max(0, len(previous) - len(text)))
+    while start != -1:
+        tail = previous[start:]
+        if text.startswith(tail):
+            return text[len(tail):]
+        start = previous.find(probe, start + 1)
+    return text
+
+
+class ContextPacker:
+    """Pack ranked snippets from several sources into one token-budgeted context.
+
+    Snippets are de-duplicated first (exact repeats and containment are dropped,
+    overlapping heads and tails between chunks are stripped), then the budget is
+    shared between sources by water-filling: a source that needs less than an
+    even share gives the remainder to the others. Inside a source, snippets are
+    kept in rank order and the first one that does not fit is cut at a sentence
+    boundary.
+    """
+
+    def __init__(
+        self,
+        counter: Optional[Callable[[str, int, int], int]] = None,
+        min_partial_tokens: int = MIN_PARTIAL_TOKENS,
+    ) -> None:
+        """Create a packer.
+
+        Args:
+            counter: Token counter `(text, start, end) -> int`; defaults to estimate_tokens.
+            min_partial_tokens: Smallest remaining allowance worth a truncated snippet.
+        """
+        self.counter = counter or estimate_tokens
+        self.min_partial_tokens = min_partial_tokens
+
+    def _count(self, text: str) -> int:
+        return self.counter(text, 0, len(text))
+
+    def _dedupe(self, sources: List[ContextSource]) -> Tuple[List[List[Tuple[str, int]]], int]:
+        """Drop repeated snippets and overlapping seams across all sources."""
+        kept: List[str] = []
+        deduped = 0
+        result: List[List[Tuple[str, int]]] = []
+        for source in sources:
+            items: List[Tuple[str, int]] = []
+            for raw in source.items:
+                text = (raw or "").strip()
+                if not text:
+                    continue
+                original_tokens = self._count(text)
+                if any(text in prev for prev in kept):
+                    deduped += original_tokens
+                    continue
+                for prev in kept:
+                    text = strip_overlap(prev, text)
+                    # text may also end where prev begins (chunks retrieved out of order).
+                    tail = len(prev) - len(strip_overlap(text, prev))
+                    if tail:
+                        text = text[: len(text) - tail]
+                text = text.strip()
+                if not text:
+                    deduped += original_tokens
+                    continue
+                tokens = self._count(text)
+                deduped += original_tokens - tokens
+                kept.append(text)
+                items.append((text, tokens))
+            result.append(items)
+        return result, deduped
+
+    @staticmethod
+    def _allocate(needs: List[int], budget: int) -> List[int]:
+        """Give each source min(need, even share of what is left), smallest needs first."""
+        allocation = [0] * len(needs)
+        remaining = budget
+        pending = sorted(range(len(needs)), key=lambda i: needs[i])
+        while pending:
+            share = remaining // len(pending)
+            i = pending.pop(0)
+            allocation[i] = min(needs[i], share)
+            remaining -= allocation[i]
+        return allocation
+
+    def pack(self, sources: List[ContextSource], budget_tokens: int) -> PackedContext:
+        """Pack sources into a single context string within budget_tokens.
+
+        Args:
+            sources: Sources in prompt order; each source's items ranked best first.
+            budget_tokens: Token budget for the whole context.
+
+        Returns:
+            PackedContext with the text and token accounting.
+        """
+        deduped_items, deduped_tokens = self._dedupe(sources)
+        separator_tokens = self._count(ITEM_SEPARATOR)
+        headers = [f"【{s.title}】:\n" for s in sources]
+        header_tokens = [self._count(h) for h in headers]
+
+        needs: List[int] = []
+        for items, header_cost in zip(deduped_items, header_tokens):
+            if not items:
+                needs.append(0)
+                continue
+            body = sum(t for _, t in items) + separator_tokens * (len(items) - 1)
+            needs.append(header_cost + body)
+
+        allocation = self._allocate(needs, max(budget_tokens, 0))
+        blocks: List[str] = []
+        stats: Dict[str, Dict[str, int]] = {}
+        used = dropped = 0
+        for source, header, header_cost, items, allowance in zip(
+            sources, headers, header_tokens, deduped_items, allocation
+        ):
+            total = sum(t for _, t in items)
+            kept: List[str] = []
+            kept_tokens = 0
+            left = allowance - header_cost
+            for text, tokens in items:
+                cost = tokens + (separator_tokens if kept else 0)
+                if cost <= left:
+                    kept.append(text)
+                    kept_tokens += tokens
+                    left -= cost
+                    continue
+                room = left - (separator_tokens if kept else 0)
+                if room >= self.min_partial_tokens:
+                    end, part_tokens = truncate_to_tokens(text, room - 1, self.counter)
+                    if end:
+                        kept.append(text[:end].rstrip() + TRUNCATED_MARK)
+                        kept_tokens += part_tokens + 1
+                break
+            if kept:
+                blocks.append(header + ITEM_SEPARATOR.join(kept))
+                used += header_cost + kept_tokens + separator_tokens * (len(kept) - 1)
+            source_dropped = max(total - kept_tokens, 0)
+            dropped += source_dropped
+            stats[source.title] = {
+                "items": len(items),
+                "kept_items": len(kept),
+                "tokens": total,
+                "kept_tokens": kept_tokens,
+                "dropped_tokens": source_dropped,
+            }
+
+        return PackedContext(
+            text=SOURCE_SEPARATOR.join(blocks),
+            budget_tokens=budget_tokens,
+            used_tokens=used,
+            dropped_tokens=dropped,
+            deduped_tokens=deduped_tokens,
+            sources=stats,
+        )
+
+
+context_packer = ContextPacker()
@@ -0,0 +1,285 @@
+import logging
+import os
+import re
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Iterable, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import FileRecord
+from app.services.knowledge_base_service import knowledge_base_service
+
+try:
+    import watchfiles
+except ImportError:  # optional: fall back to polling
+    watchfiles = None
+
+load_dotenv()
+
+RAG_WATCH_ENABLED = os.getenv("RAG_WATCH_ENABLED", "false").lower() == "true"
+RAG_WATCH_MODE = os.getenv("RAG_WATCH_MODE", "auto").lower()  # auto / watchfiles / poll
+RAG_WATCH_POLL_SECONDS = float(os.getenv("RAG_WATCH_POLL_SECONDS", "5"))
+RAG_WATCH_DEBOUNCE_SECONDS = float(os.getenv("RAG_WATCH_DEBOUNCE_SECONDS", "2"))
+RAG_WATCH_USER_ID = os.getenv("RAG_WATCH_USER_ID") or None
+ALLOWED_EXTENSIONS = (".pdf", ".txt", ".md")
+
+_logger = logging.getLogger(__name__)
+_UUID = r"[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}"
+
+FileStat = Optional[Tuple[int, int]]  # (mtime_ns, size); None when the file is gone
+
+
+class DirectoryWatchService:
+    """Keep FileRecords and the vector store in sync with files dropped into RAG_FILE_PATH.
+
+    Files written by the upload endpoints (`<file_id><SPLIT_FILENAME_ID><name>` at the
+    top level) and unsupported extensions are ignored; every other PDF/TXT/MD file
+    under the directory is indexed in place and tracked by `FileRecord.source_path`.
+    Changes come from `watchfiles` when it is installed, otherwise (or with
+    RAG_WATCH_MODE=poll, e.g. on network shares) from periodic stat scans. A path
+    is only processed once its size and mtime stayed unchanged for the debounce
+    interval, so files still being copied are not parsed half-written. New content
+    goes through `knowledge_base_service.ingest_stored_file`, edits through the
+    chunk-level re-index and removals through `delete_files`. On start the whole
+    directory is reconciled against the database, which catches changes made while
+    the service was down. A record deleted through the API stays deleted until its
+    source file changes.
+    """
+
+    def __init__(
+        self,
+        directory: Optional[str] = None,
+        mode: str = RAG_WATCH_MODE,
+        poll_interval: float = RAG_WATCH_POLL_SECONDS,
+        debounce: float = RAG_WATCH_DEBOUNCE_SECONDS,
+        user_id: Optional[str] = RAG_WATCH_USER_ID,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            directory: Directory to watch; defaults to RAG_FILE_PATH when started.
+            mode: `auto` (watchfiles if installed), `watchfiles` or `poll`.
+            poll_interval: Seconds between scans in polling mode.
+            debounce: Seconds a file must stay unchanged before it is processed.
+            user_id: Owner of the FileRecords created for watched files.
+        """
+        self.directory = directory
+        self.mode = mode
+        self.poll_interval = poll_interval
+        self.debounce = debounce
+        self.user_id = user_id
+        self._snapshot: Dict[str, Tuple[int, int]] = {}
+        self._pending: Dict[str, Tuple[float, FileStat]] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ scanning
+
+    def _base(self) -> str:
+        return self.directory or os.getenv("RAG_FILE_PATH") or ""
+
+    def _eligible(self, rel: str) -> bool:
+        parts = rel.replace(os.sep, "/").split("/")
+        if any(p.startswith(".") or p.startswith("~$") for p in parts):
+            return False
+        if os.path.splitext(rel)[1].lower() not in ALLOWED_EXTENSIONS:
+            return False
+        split = os.getenv("SPLIT_FILENAME_ID")
+        if len(parts) == 1 and split and re.match(_UUID + re.escape(split), parts[0]):
+            return False  # written by /upload, already tracked by its own FileRecord
+        return True
+
+    def _stat(self, rel: str) -> FileStat:
+        try:
+            st = os.stat(os.path.join(self._base(), rel))
+        except OSError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def scan(self) -> Dict[str, Tuple[int, int]]:
+        """Stat every eligible file under the directory, keyed by relative path."""
+        base = self._base()
+        found: Dict[str, Tuple[int, int]] = {}
+        for root, dirs, files in os.walk(base):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                rel = os.path.relpath(os.path.join(root, name), base)
+                if self._eligible(rel):
+                    stat = self._stat(rel)
+                    if stat is not None:
+                        found[rel] = stat
+        return found
+
+    def mark(self, paths: Iterable[str], now: Optional[float] = None) -> None:
+        """Queue paths (absolute or relative to the directory) for processing after the debounce."""
+        now = time.time() if now is None else now
+        base = self._base()
+        for path in paths:
+            rel = os.path.relpath(path, base) if os.path.isabs(path) else path
+            if self._eligible(rel):
+                self._pending[rel] = (now, self._stat(rel))
+
+    def poll(self, now: Optional[float] = None) -> None:
+        """Diff a fresh scan against the previous one and queue what changed."""
+        current = self.scan()
+        changed = [rel for rel, stat in current.items() if self._snapshot.get(rel) != stat]
+        changed += [rel for rel in self._snapshot if rel not in current]
+        self._snapshot = current
+        self.mark(changed, now)
+
+    def reconcile(self, db: Session, now: Optional[float] = None) -> None:
+        """Queue every file on disk and every tracked record whose file is missing."""
+        self._snapshot = self.scan()
+        self.mark(self._snapshot, now)
+        tracked = (
+            db.query(FileRecord.source_path)
+            .filter(FileRecord.source_path.isnot(None), FileRecord.is_deleted == False)
+            .all()
+        )
+        self.mark([row[0] for row in tracked if row[0] not in self._snapshot], now)
+
+    # ------------------------------------------------------------------ syncing
+
+    def process_due(self, db: Session, now: Optional[float] = None) -> Dict[str, str]:
+        """Sync queued paths that have been stable for the debounce interval.
+
+        Args:
+            db: SQLAlchemy session.
+            now: Current epoch seconds (for tests).
+
+        Returns:
+            Action taken per processed path.
+        """
+        now = time.time() if now is None else now
+        results: Dict[str, str] = {}
+        for rel, (seen_at, stat) in list(self._pending.items()):
+            if now - seen_at < self.debounce:
+                continue
+            current = self._stat(rel)
+            if current != stat:
+                self._pending[rel] = (now, current)  # still being written
+                continue
+            del self._pending[rel]
+            try:
+                results[rel] = self.sync_path(db, rel)
+            except Exception:
+                db.rollback()
+                _logger.exception("目录监听同步失败: %s", rel)
+                results[rel] = "failed"
+        return results
+
+    def sync_path(self, db: Session, rel: str) -> str:
+        """Bring the FileRecord and vectors of one watched path in line with the disk.
+
+        Args:
+            db: SQLAlchemy session.
+            rel: Path relative to the watched directory.
+
+        Returns:
+            `created`, `updated`, `deleted` or `unchanged`.
+        """
+        path = os.path.join(self._base(), rel)
+        record = (
+            db.query(FileRecord)
+            .filter(FileRecord.source_path == rel)
+            .order_by(FileRecord.is_deleted, FileRecord.created_at.desc())
+            .first()
+        )
+        if not os.path.isfile(path):
+            if record is not None and not record.is_deleted:
+                knowledge_base_service.delete_files(db, [record])
+                return "deleted"
+            return "unchanged"
+
+        content_hash, size = knowledge_base_service.hash_file(path)
+        if record is not None and record.content_hash == content_hash:
+            return "unchanged"
+        if record is None or record.is_deleted:
+            knowledge_base_service.ingest_stored_file(
+                db, path, os.path.basename(rel), self.user_id, str(uuid.uuid4()), content_hash, size,
+                source_path=rel,
+            )
+            return "created"
+        knowledge_base_service.reindex_stored_file(db, record, path, content_hash, size)
+        return "updated"
+
+    # ------------------------------------------------------------------ thread
+
+    def start(self, session_factory: Callable[[], Session]) -> bool:
+        """Start the background watcher thread.
+
+        Args:
+            session_factory: Creates a SQLAlchemy session per processing round.
+
+        Returns:
+            False if no directory is configured.
+        """
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        if not self._base():
+            _logger.warning("目录监听未启动: 未配置 RAG_FILE_PATH")
+            return False
+        os.makedirs(self._base(), exist_ok=True)
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=self._run, args=(session_factory,), name="rag-directory-watch", daemon=True
+        )
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the watcher thread to exit and wait for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _process(self, session_factory: Callable[[], Session]) -> None:
+        if not self._pending:
+            return
+        db = session_factory()
+        try:
+            for rel, action in self.process_due(db).items():
+                if action != "unchanged":
+                    _logger.info("目录监听: %s %s", action, rel)
+        finally:
+            db.close()
+
+    def _run(self, session_factory: Callable[[], Session]) -> None:
+        db = session_factory()
+        try:
+            self.reconcile(db)
+        finally:
+            db.close()
+        self._process(session_factory)
+
+        use_events = watchfiles is not None and self.mode != "poll"
+        if self.mode == "watchfiles" and watchfiles is None:
+            _logger.warning("未安装 watchfiles，目录监听改为轮询")
+        if use_events:
+            try:
+                for changes in watchfiles.watch(
+                    self._base(),
+                    stop_event=self._stop,
+                    debounce=int(self.debounce * 1000),
+                    rust_timeout=int(max(self.debounce, 0.5) * 1000),
+                    yield_on_timeout=True,
+                ):
+                    self.mark(path for _, path in changes)
+                    self._process(session_factory)
+                return
+            except Exception:
+                if self._stop.is_set():
+                    return
+                _logger.exception("watchfiles 监听失败，改为轮询")
+                self._snapshot = self.scan()
+
+        while not self._stop.wait(self.poll_interval):
+            self.poll()
+            self._process(session_factory)
+
+
+directory_watch_service = DirectoryWatchService()
@@ -0,0 +1,383 @@
+import hashlib
+import os
+import uuid
+from datetime import datetime
+from typing import Any, BinaryIO, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import FileBlob, FileRecord
+from app.services.chunk_index_service import chunk_index_service
+from app.services.rag_service import rag_service
+
+load_dotenv()
+
+UPLOAD_READ_CHUNK_BYTES = int(os.getenv("UPLOAD_READ_CHUNK_BYTES", str(1024 * 1024)))
+
+
+class UnsafeFilename(ValueError):
+    """Raised for a client-supplied filename that is not a plain file name."""
+
+
+def safe_filename(filename: Optional[str]) -> str:
+    """Return `filename` unchanged if it can be joined under a storage directory.
+
+    Args:
+        filename: Client-supplied name (UploadFile.filename, upload session, ZIP member).
+
+    Returns:
+        The same name.
+
+    Raises:
+        UnsafeFilename: If the name is empty, `.` / `..`, or contains a path separator or NUL.
+    """
+    name = filename or ""
+    if name in ("", ".", "..") or "/" in name or "\\" in name or "\0" in name or os.path.basename(name) != name:
+        raise UnsafeFilename(f"非法文件名: {filename!r}")
+    return name
+
+
+def _remove_quietly(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class KnowledgeBaseService:
+    """Knowledge-base file lifecycle shared by SQL records and the vector store.
+
+    Uploads are content-addressed: the sha256 of the bytes identifies a FileBlob
+    whose chunks are embedded once under `vector_key` (the id of the first
+    FileRecord that carried the content). Later uploads of the same bytes, by any
+    user, only add a FileRecord and bump `ref_count`; vectors are deleted when
+    the last record referencing them is deleted. Records created before content
+    hashing have no content_hash and keep using their own id as vector key.
+
+    Upload bytes are written exactly once, straight to the stored file path under
+    RAG_FILE_PATH, hashed on the way, and that path is what gets parsed.
+    """
+
+    def stored_file_path(self, file_id: str, filename: str, base_dir: Optional[str] = None) -> str:
+        """Return the on-disk path of a knowledge-base file.
+
+        Args:
+            file_id: FileRecord id.
+            filename: Original filename.
+            base_dir: Directory recorded on the FileRecord; defaults to RAG_FILE_PATH.
+
+        Returns:
+            `<base_dir>/<file_id><SPLIT_FILENAME_ID><filename>`.
+
+        Raises:
+            ValueError: If RAG_FILE_PATH or SPLIT_FILENAME_ID is not configured.
+            UnsafeFilename: If the name is not a plain file name or the path leaves base_dir.
+        """
+        base_dir = base_dir or os.getenv("RAG_FILE_PATH")
+        split_filename_id = os.getenv("SPLIT_FILENAME_ID")
+        if not base_dir or not split_filename_id:
+            raise ValueError("未配置环境变量 RAG_FILE_PATH 或 SPLIT_FILENAME_ID")
+        path = os.path.join(base_dir, f"{file_id}{split_filename_id}{safe_filename(filename)}")
+        # a symlink or SPLIT_FILENAME_ID could still point outside base_dir
+        base_real = os.path.realpath(base_dir)
+        if os.path.commonpath([base_real, os.path.realpath(path)]) != base_real:
+            raise UnsafeFilename(f"非法文件名: {filename!r}")
+        return path
+
+    def hash_stream(self, src: BinaryIO, dst: Optional[BinaryIO]) -> Tuple[str, int]:
+        """Copy src to dst in bounded chunks while computing sha256 and size.
+
+        Args:
+            src: Readable binary stream.
+            dst: Writable binary stream, or None to only hash.
+
+        Returns:
+            (sha256 hex digest, size in bytes).
+        """
+        digest = hashlib.sha256()
+        size = 0
+        while True:
+            chunk = src.read(UPLOAD_READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            size += len(chunk)
+            if dst is not None:
+                dst.write(chunk)
+        return digest.hexdigest(), size
+
+    def write_stream(self, src: BinaryIO, path: str) -> Tuple[str, int]:
+        """Write src to path in one pass, returning (sha256, size); removes path on failure."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        try:
+            with open(path, "wb") as dst:
+                return self.hash_stream(src, dst)
+        except Exception:
+            _remove_quietly(path)
+            raise
+
+    def hash_file(self, path: str) -> Tuple[str, int]:
+        """Return (sha256, size) of a file on disk."""
+        with open(path, "rb") as src:
+            return self.hash_stream(src, None)
+
+    def ingest_upload(self, db: Session, file_obj: Any, filename: str, user_id: Optional[str]) -> Tuple[FileRecord, bool]:
+        """Create a FileRecord for an upload, embedding its content only if unseen.
+
+        Args:
+            db: SQLAlchemy session.
+            file_obj: FastAPI UploadFile-like object.
+            filename: Original filename.
+            user_id: Owner id.
+
+        Returns:
+            (the committed FileRecord, True if existing vectors were reused).
+        """
+        file_id = str(uuid.uuid4())
+        path = self.stored_file_path(file_id, filename)
+        content_hash, size = self.write_stream(file_obj.file, path)
+        try:
+            return self.ingest_stored_file(db, path, filename, user_id, file_id, content_hash, size)
+        except Exception:
+            _remove_quietly(path)
+            raise
+
+    def ingest_stored_file(
+        self,
+        db: Session,
+        file_path: str,
+        filename: str,
+        user_id: Optional[str],
+        file_id: str,
+        content_hash: str,
+        size: int,
+        source_path: Optional[str] = None,
+    ) -> Tuple[FileRecord, bool]:
+        """Register a file already written to its stored path, embedding it only if unseen.
+
+        Args:
+            db: SQLAlchemy session.
+            file_path: Stored file path (parsed in place when the content is new).
+            filename: Original filename.
+            user_id: Owner id.
+            file_id: Id of the new FileRecord (also the vector key for new content).
+            content_hash: sha256 of the file bytes.
+            size: File size in bytes.
+            source_path: Path relative to RAG_FILE_PATH for files picked up by the
+                directory watcher; the file is indexed where it is.
+
+        Returns:
+            (the committed FileRecord, True if existing vectors were reused).
+        """
+        blob = db.query(FileBlob).filter(FileBlob.id == content_hash).first()
+        reused = blob is not None
+        if not reused:
+            rows = rag_service.index_file(file_path, filename, file_id)
+            blob = FileBlob(id=content_hash, vector_key=file_id, size=size, ref_count=0)
+            db.add(blob)
+            chunk_index_service.add(db, file_id, rows)
+        blob.ref_count = (blob.ref_count or 0) + 1
+
+        record = FileRecord(
+            id=file_id,
+            user_id=user_id,
+            filename=filename,
+            file_path=os.getenv("RAG_FILE_PATH"),
+            file_size=size,
+            content_hash=content_hash,
+            source_path=source_path,
+        )
+        db.add(record)
+        try:
+            db.commit()
+        except IntegrityError:
+            # A concurrent upload of the same content created the blob first: use theirs.
+            db.rollback()
+            if reused:
+                raise
+            rag_service.delete_docs([file_id])
+            return self.ingest_stored_file(db, file_path, filename, user_id, file_id, content_hash, size, source_path)
+        except Exception:
+            db.rollback()
+            if not reused:
+                rag_service.delete_docs([file_id])
+            raise
+        return record, reused
+
+    def vector_keys(self, db: Session, file_ids: List[str]) -> List[str]:
+        """Map FileRecord ids to the file_id values used in the vector store.
+
+        Args:
+            db: SQLAlchemy session.
+            file_ids: FileRecord ids.
+
+        Returns:
+            Distinct vector keys in input order; unknown ids are passed through.
+        """
+        if not file_ids:
+            return []
+        rows = (
+            db.query(FileRecord.id, FileBlob.vector_key)
+            .outerjoin(FileBlob, FileBlob.id == FileRecord.content_hash)
+            .filter(FileRecord.id.in_(file_ids))
+            .all()
+        )
+        mapping: Dict[str, str] = {row[0]: row[1] or row[0] for row in rows}
+        keys: List[str] = []
+        seen = set()
+        for file_id in file_ids:
+            key = mapping.get(file_id, file_id)
+            if key not in seen:
+                seen.add(key)
+                keys.append(key)
+        return keys
+
+    def _release(self, db: Session, record: FileRecord) -> Optional[str]:
+        """Drop record's reference to its content; return the vector key if it became unused."""
+        if not record.content_hash:
+            return record.id
+        blob = db.query(FileBlob).filter(FileBlob.id == record.content_hash).first()
+        if blob is None:
+            return record.id
+        blob.ref_count = max((blob.ref_count or 0) - 1, 0)
+        if blob.ref_count == 0:
+            db.delete(blob)
+            db.flush()
+            return blob.vector_key
+        db.flush()
+        return None
+
+    def update_file(self, db: Session, record: FileRecord, file_obj: Any) -> Dict[str, int]:
+        """Replace the content of a file, re-embedding only chunks that changed.
+
+        Chunks are matched by content hash against the stored version. If nobody
+        else shares the old content, its chunks are updated in place; otherwise the
+        record moves to new chunks (copied vectors for unchanged text) and the
+        shared ones stay with the other files. Content that already exists in the
+        knowledge base is reused without embedding.
+
+        Args:
+            db: SQLAlchemy session.
+            record: FileRecord to update (keeps its id and filename).
+            file_obj: FastAPI UploadFile-like object with the new version.
+
+        Returns:
+            Counts: chunks, reused, embedded, deleted.
+        """
+        path = self.stored_file_path(record.id, record.filename, record.file_path)
+        # The new version is parsed from the side file and only replaces the stored one on success.
+        part_path = path + ".part"
+        content_hash, size = self.write_stream(file_obj.file, part_path)
+        try:
+            stats = self._update(db, record, part_path, content_hash, size)
+            os.replace(part_path, path)
+        except Exception:
+            _remove_quietly(part_path)
+            raise
+        return stats
+
+    def reindex_stored_file(
+        self, db: Session, record: FileRecord, file_path: str, content_hash: str, size: int
+    ) -> Dict[str, int]:
+        """Re-index a record whose file was changed in place on disk (see update_file).
+
+        Args:
+            db: SQLAlchemy session.
+            record: FileRecord to update.
+            file_path: Path of the changed file.
+            content_hash: sha256 of the new content.
+            size: New size in bytes.
+
+        Returns:
+            Counts: chunks, reused, embedded, deleted.
+        """
+        return self._update(db, record, file_path, content_hash, size)
+
+    def _update(self, db: Session, record: FileRecord, file_path: str, content_hash: str, size: int) -> Dict[str, int]:
+        if record.content_hash == content_hash:
+            return {"chunks": 0, "reused": 0, "embedded": 0, "deleted": 0}
+
+        old_blob = (
+            db.query(FileBlob).filter(FileBlob.id == record.content_hash).first() if record.content_hash else None
+        )
+        old_key = old_blob.vector_key if old_blob else record.id
+        released: List[str] = []
+        try:
+            new_blob = db.query(FileBlob).filter(FileBlob.id == content_hash).first()
+            if new_blob is not None:
+                new_blob.ref_count = (new_blob.ref_count or 0) + 1
+                reused = len(rag_service.vector_store.get(filter={"file_id": new_blob.vector_key})["ids"])
+                stats = {"chunks": reused, "reused": reused, "embedded": 0, "deleted": 0}
+                key = self._release(db, record)
+                if key:
+                    released.append(key)
+            else:
+                shared = old_blob is not None and (old_blob.ref_count or 0) > 1
+                new_key = str(uuid.uuid4()) if shared else old_key
+                stats = rag_service.reindex_file(file_path, record.filename, old_key, new_key)
+                chunk_index_service.replace(db, new_key, stats.pop("rows"))
+                if shared:
+                    self._release(db, record)
+                elif old_blob is not None:
+                    db.delete(old_blob)
+                    db.flush()
+                db.add(FileBlob(id=content_hash, vector_key=new_key, size=size, ref_count=1))
+
+            record.content_hash = content_hash
+            record.file_size = size
+            vector_ids = self._forget_chunks(db, released)
+            if released:
+                # The old content's vectors go with it when nothing else references them.
+                stats["deleted"] = sum(
+                    len(vector_ids[key]) if key in vector_ids
+                    else len(rag_service.vector_store.get(filter={"file_id": key})["ids"])
+                    for key in released
+                )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        self._drop_vectors(released, vector_ids)
+        return stats
+
+    def _forget_chunks(self, db: Session, keys: List[str]) -> Dict[str, List[str]]:
+        """Stage removal of the chunk rows of released keys; returns their vector ids."""
+        vector_ids = chunk_index_service.vector_ids(db, keys)
+        chunk_index_service.delete_keys(db, keys)
+        return vector_ids
+
+    def _drop_vectors(self, keys: List[str], vector_ids: Dict[str, List[str]]) -> None:
+        """Delete released keys from the vector store: by id when mirrored, else by metadata filter."""
+        rag_service.delete_vector_ids([vid for key in keys for vid in vector_ids.get(key, [])])
+        rag_service.delete_docs([key for key in keys if key not in vector_ids])
+
+    def delete_files(self, db: Session, records: List[FileRecord]) -> List[str]:
+        """Soft-delete records and drop vectors that are no longer referenced.
+
+        Args:
+            db: SQLAlchemy session.
+            records: FileRecords to delete; already deleted ones are ignored.
+
+        Returns:
+            Vector keys whose chunks were removed from the vector store.
+        """
+        released: List[str] = []
+        for record in records:
+            if record.is_deleted:
+                continue
+            record.is_deleted = True
+            record.deleted_at = datetime.now()
+            key = self._release(db, record)
+            if key:
+                released.append(key)
+        vector_ids = self._forget_chunks(db, released)
+        db.commit()
+
+        self._drop_vectors(released, vector_ids)
+        return released
+
+
+knowledge_base_service = KnowledgeBaseService()
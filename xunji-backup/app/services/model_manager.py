@@ -19,6 +19,24 @@ class ModelManager:
         "modalities": ["image", "video"]
     }
 
+    # ★★★ 参考信息 token 预算 ★★★
+    # 按模型前缀配置（最长前缀优先），未命中时使用 CHAT_CONTEXT_TOKEN_BUDGET
+    CONTEXT_BUDGET_CONFIG = {
+        "default": int(os.getenv("CHAT_CONTEXT_TOKEN_BUDGET", "6000")),
+        "models": {
+            "gpt-4o": 24000,
+            "gpt": 8000,
+            "deepseek": 12000,
+            "gemini": 32000,
+            "kimi": 24000,
+            "moonshot": 24000,
+            "qwen": 12000,
+            "llama": 3000,
+            "ollama": 3000,
+            "llm": 3000,
+        },
+    }
+
     def __new__(cls):
         if cls._instance is None:
             cls._instance = super(ModelManager, cls).__new__(cls)
@@ -34,6 +52,16 @@ class ModelManager:
                 return True
         return False
 
+    def get_context_budget(self, model_name: str) -> int:
+        """
+        获取模型的参考信息 token 预算（联网搜索、知识库、附件内容合计）
+        """
+        best, budget = "", self.CONTEXT_BUDGET_CONFIG["default"]
+        for prefix, tokens in self.CONTEXT_BUDGET_CONFIG["models"].items():
+            if model_name.startswith(prefix) and len(prefix) > len(best):
+                best, budget = prefix, tokens
+        return budget
+
     def get_model(self, model_name: str) -> Any:
         """
         工厂方法：根据模型名称获取对应的 LangChain ChatModel 实例
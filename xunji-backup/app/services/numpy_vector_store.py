@@ -0,0 +1,677 @@
+import json
+import os
+import shutil
+import threading
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.rag_service import VectorStore
+from app.services.vector_quantization import VectorCodec, normalize_rows
+
+try:
+    import fcntl
+except ImportError:  # Windows: no inter-process lock, keep to a single writing process
+    fcntl = None
+
+_CODES_FILE = "vectors.npy"
+_SCALES_FILE = "scales.npy"
+_FULL_FILE = "vectors_full.npy"
+_RECORDS_FILE = "records.jsonl"
+_HEADER_FILE = "index.json"
+_CENTROIDS_FILE = "centroids.npy"
+_INITIAL_CAPACITY = 1024
+_KMEANS_ITERATIONS = 10
+_SCAN_BLOCK_ROWS = 65536
+_COMPACT_SUFFIX = ".compact"
+_OLD_SUFFIX = ".old"
+_LOCK_SUFFIX = ".lock"
+
+
+class NumpyVectorStore(VectorStore):
+    """Exact / IVF vector index on NumPy, persisted as memory-mapped `.npy` files.
+
+    Layout of `directory`:
+    - `vectors.npy`: search codes `[capacity, search_dim]` (float32, float16 or int8),
+      opened with `mmap_mode="r+"`.
+    - `scales.npy`: per-row float32 scales, only for int8 codes.
+    - `vectors_full.npy`: full-precision float32 vectors, only when the codes are lossy
+      and reranking is enabled; pages are touched just for rerank candidates.
+    - `records.jsonl`: append-only sidecar, one `{"id", "document", "metadata"}` per row.
+    - `index.json`: header with `dim`, `size`, codec settings and deleted rows; rewritten
+      atomically last and the commit point of an add. A crash before it leaves rows past
+      `size` in the arrays and lines past `size` in `records.jsonl`; the arrays are
+      overwritten by the next add, and the sidecar is truncated back to `size` lines on
+      open and before every append so its lines stay aligned with the vector rows.
+      A missing or short sidecar only drops the rows it has no record for.
+    - `centroids.npy`: IVF centroids, present once the coarse quantizer is trained.
+
+    Deletes are tombstones recorded in the header; `compact()` rewrites the live rows
+    into a fresh directory and swaps it in, which reclaims their disk and memory.
+    With `directory=None` the index lives purely in memory.
+
+    Several processes may open the same directory (the API next to the reindex,
+    ingest or purge CLI). Writes hold an exclusive `flock` on `<directory>.lock`
+    and first reload the index if the header's `generation` moved, so each
+    process appends after the rows the others committed instead of over them.
+    Reads pick up other processes' commits when the header file changes. Without
+    `fcntl` (Windows) only one process may write to a directory.
+    """
+
+    def __init__(
+        self,
+        *,
+        directory: Optional[str],
+        embedding_function: Any,
+        ivf_lists: int = 0,
+        ivf_nprobe: int = 8,
+        quantization: str = "none",
+        truncate_dim: int = 0,
+        rerank_factor: int = 4,
+    ) -> None:
+        """Open (or create) the index.
+
+        Args:
+            directory: Persistence directory, or None for an in-memory index.
+            embedding_function: LangChain Embeddings (embed_documents/embed_query).
+            ivf_lists: Number of IVF lists; 0 keeps exact brute-force search.
+            ivf_nprobe: Lists probed per query when IVF is trained.
+            quantization: Code type for the scan path: none, float16 or int8.
+            truncate_dim: Leading dimensions kept for the scan path; 0 keeps all.
+            rerank_factor: With lossy codes, rerank `k * rerank_factor` candidates
+                against full-precision vectors; 0 disables rerank and does not keep them.
+
+        Note:
+            Codec settings of an existing index are read from its header and win over
+            the arguments; changing them requires a re-index.
+        """
+        self.directory = directory
+        self.embedding_function = embedding_function
+        self.ivf_lists = max(int(ivf_lists), 0)
+        self.ivf_nprobe = max(int(ivf_nprobe), 1)
+        self.quantization = quantization
+        self.truncate_dim = max(int(truncate_dim), 0)
+        self.rerank_factor = max(int(rerank_factor), 0)
+        self._lock = threading.RLock()
+        self._file_lock_depth = 0
+
+        self._dim = 0
+        self._size = 0
+        self._codec: Optional[VectorCodec] = None
+        self._keep_full = False
+        self._codes: Optional[np.ndarray] = None
+        self._scales: Optional[np.ndarray] = None
+        self._full: Optional[np.ndarray] = None
+        self._ids: List[str] = []
+        self._documents: List[str] = []
+        self._metadatas: List[Dict[str, Any]] = []
+        self._id_rows: Dict[str, int] = {}
+        self._records_end = 0
+        self._generation = 0
+        self._header_stamp: Optional[tuple] = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._file_codes = np.zeros(0, dtype=np.int32)
+        self._file_vocab: Dict[str, int] = {}
+        self._centroids: Optional[np.ndarray] = None
+        self._assignments = np.zeros(0, dtype=np.int32)
+
+        if directory:
+            os.makedirs(os.path.dirname(os.path.abspath(directory)), exist_ok=True)
+            with self._lock, self._file_lock():
+                self._recover_compaction()
+                os.makedirs(directory, exist_ok=True)
+                self._load()
+
+    # ------------------------------------------------------------------ persistence
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory or "", name)
+
+    def _init_codec(self, dim: int) -> None:
+        self._dim = int(dim)
+        self._codec = VectorCodec(self._dim, self.quantization, self.truncate_dim)
+        self._keep_full = not self._codec.is_lossless and self.rerank_factor > 0
+
+    def _array_specs(self) -> Dict[str, tuple]:
+        """Map array attribute -> (file name, dtype, row shape) for the current codec."""
+        specs = {"_codes": (_CODES_FILE, self._codec.dtype, (self._codec.search_dim,))}
+        if self._codec.has_scales:
+            specs["_scales"] = (_SCALES_FILE, np.float32, ())
+        if self._keep_full:
+            specs["_full"] = (_FULL_FILE, np.float32, (self._dim,))
+        return specs
+
+    @contextmanager
+    def _file_lock(self) -> Iterator[None]:
+        """Hold the inter-process lock of a persisted index; re-entrant within the holding thread."""
+        if not self.directory or self._file_lock_depth:
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+            return
+        fd = os.open(self.directory + _LOCK_SUFFIX, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            if fcntl is not None:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            self._file_lock_depth += 1
+            try:
+                yield
+            finally:
+                self._file_lock_depth -= 1
+        finally:
+            os.close(fd)  # releases the flock
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """Lock the index for writing and load what other processes committed meanwhile."""
+        with self._lock, self._file_lock():
+            if self.directory and self._file_lock_depth == 1 and self._read_generation() != self._generation:
+                self._reset()
+                self._load()
+            yield
+
+    def _sync(self) -> None:
+        """Before a read: reload if another process rewrote the header since this one saw it."""
+        if self.directory and self._stat_header() != self._header_stamp:
+            with self._exclusive():
+                pass
+
+    def _stat_header(self) -> Optional[tuple]:
+        try:
+            st = os.stat(self._path(_HEADER_FILE))
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+
+    def _read_generation(self) -> int:
+        try:
+            with open(self._path(_HEADER_FILE), "r", encoding="utf-8") as f:
+                return int(json.load(f).get("generation") or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _load(self) -> None:
+        header_path = self._path(_HEADER_FILE)
+        if not os.path.exists(header_path):
+            return
+        self._header_stamp = self._stat_header()
+        with open(header_path, "r", encoding="utf-8") as f:
+            header = json.load(f)
+        self._generation = int(header.get("generation") or 0)
+        self._size = int(header.get("size") or 0)
+        if header.get("dim"):
+            self.quantization = header.get("quantization", "none")
+            self.truncate_dim = int(header.get("truncate_dim") or 0)
+            self._init_codec(int(header["dim"]))
+            self._keep_full = bool(header.get("keep_full", False))
+            for attr, (name, _, _) in self._array_specs().items():
+                if os.path.exists(self._path(name)):
+                    setattr(self, attr, np.load(self._path(name), mmap_mode="r+"))
+
+        # "ab+" recreates a sidecar lost to a crash or a partial copy instead of failing to open.
+        with open(self._path(_RECORDS_FILE), "ab+") as f:
+            f.seek(0)
+            end = 0
+            for _ in range(self._size):
+                line = f.readline()
+                if not line.endswith(b"\n"):
+                    break  # fewer records than the header says: rows past them cannot be served
+                record = json.loads(line)
+                self._ids.append(record["id"])
+                self._documents.append(record.get("document") or "")
+                self._metadatas.append(record.get("metadata") or {})
+                end = f.tell()
+            self._size = len(self._ids)
+            # Drop lines written by an add that crashed before its header was committed.
+            self._records_end = end
+            f.truncate(end)
+
+        self._id_rows = {vid: i for i, vid in enumerate(self._ids)}
+        self._alive = np.ones(self._size, dtype=bool)
+        deleted = [i for i in header.get("deleted", []) if i < self._size]
+        self._alive[deleted] = False
+        self._file_codes = np.array(
+            [self._file_code(m.get("file_id")) for m in self._metadatas], dtype=np.int32
+        )
+        if os.path.exists(self._path(_CENTROIDS_FILE)):
+            self._centroids = np.load(self._path(_CENTROIDS_FILE))
+            self._assignments = self._assign(self._search_matrix(np.arange(self._size)))
+
+    def _recover_compaction(self) -> None:
+        """Finish or roll back a compaction interrupted between its directory renames."""
+        compacted, old = self.directory + _COMPACT_SUFFIX, self.directory + _OLD_SUFFIX
+        if not os.path.exists(self.directory) and os.path.exists(os.path.join(compacted, _HEADER_FILE)):
+            os.replace(compacted, self.directory)
+        elif not os.path.exists(self.directory) and os.path.exists(old):
+            os.replace(old, self.directory)
+        shutil.rmtree(compacted, ignore_errors=True)
+        shutil.rmtree(old, ignore_errors=True)
+
+    def _write_header(self) -> None:
+        if not self.directory:
+            return
+        header = {
+            "generation": self._generation + 1,
+            "dim": self._dim,
+            "size": self._size,
+            "quantization": self.quantization,
+            "truncate_dim": self.truncate_dim,
+            "keep_full": self._keep_full,
+            "deleted": np.flatnonzero(~self._alive[: self._size]).tolist(),
+        }
+        tmp_path = self._path(_HEADER_FILE + ".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(header, f)
+        os.replace(tmp_path, self._path(_HEADER_FILE))
+        self._generation = header["generation"]
+        self._header_stamp = self._stat_header()
+
+    def _ensure_capacity(self, needed: int) -> None:
+        capacity = 0 if self._codes is None else self._codes.shape[0]
+        if needed <= capacity:
+            return
+        new_capacity = max(_INITIAL_CAPACITY, capacity * 2, needed)
+        for attr, (name, dtype, row_shape) in self._array_specs().items():
+            current = getattr(self, attr)
+            shape = (new_capacity,) + row_shape
+            if not self.directory:
+                grown = np.zeros(shape, dtype=dtype)
+                if current is not None:
+                    grown[: self._size] = current[: self._size]
+                setattr(self, attr, grown)
+                continue
+
+            tmp_path = self._path(name + ".tmp")
+            grown = np.lib.format.open_memmap(tmp_path, mode="w+", dtype=dtype, shape=shape)
+            if current is not None:
+                grown[: self._size] = current[: self._size]
+            grown.flush()
+            del grown, current
+            # Release the old mapping before replacing the file (required on Windows).
+            setattr(self, attr, None)
+            os.replace(tmp_path, self._path(name))
+            setattr(self, attr, np.load(self._path(name), mmap_mode="r+"))
+
+    # ------------------------------------------------------------------ helpers
+
+    def _file_code(self, file_id: Optional[str]) -> int:
+        if file_id is None:
+            return -1
+        code = self._file_vocab.get(file_id)
+        if code is None:
+            code = len(self._file_vocab)
+            self._file_vocab[file_id] = code
+        return code
+
+    def _search_matrix(self, rows: np.ndarray) -> np.ndarray:
+        """Decode rows of the scan path into float32 search-space vectors."""
+        if self._codes is None or rows.size == 0:
+            dim = self._codec.search_dim if self._codec else 0
+            return np.zeros((0, dim), dtype=np.float32)
+        scales = self._scales[rows] if self._scales is not None else None
+        return self._codec.decode(self._codes[rows], scales)
+
+    def _approx_scores(self, rows: np.ndarray, query: np.ndarray) -> np.ndarray:
+        """Score candidate rows on the scan path, in bounded blocks."""
+        dense = rows.size * 2 >= self._size
+        out = np.empty(rows.size, dtype=np.float32)
+        for start in range(0, rows.size, _SCAN_BLOCK_ROWS):
+            block = rows[start:start + _SCAN_BLOCK_ROWS]
+            if dense:
+                # Dense candidates: scan a contiguous slice instead of gathering rows.
+                lo, hi = int(block[0]), int(block[-1]) + 1
+                codes = self._codes[lo:hi]
+                scales = self._scales[lo:hi] if self._scales is not None else None
+                out[start:start + block.size] = self._codec.scores(codes, scales, query)[block - lo]
+            else:
+                scales = self._scales[block] if self._scales is not None else None
+                out[start:start + block.size] = self._codec.scores(self._codes[block], scales, query)
+        return out
+
+    def _assign(self, matrix: np.ndarray) -> np.ndarray:
+        if self._centroids is None or matrix.shape[0] == 0:
+            return np.zeros(matrix.shape[0], dtype=np.int32)
+        return np.argmax(matrix @ self._centroids.T, axis=1).astype(np.int32)
+
+    def _filter_mask(self, filter: Optional[dict]) -> np.ndarray:
+        """Build a boolean row mask from a Chroma-style filter."""
+        mask = self._alive[: self._size].copy()
+        if not filter:
+            return mask
+        clauses = filter.get("$and") if "$and" in filter else [{k: v} for k, v in filter.items()]
+        for clause in clauses:
+            for key, condition in clause.items():
+                if isinstance(condition, dict):
+                    if "$in" in condition:
+                        wanted = list(condition["$in"])
+                    elif "$eq" in condition:
+                        wanted = [condition["$eq"]]
+                    else:
+                        raise ValueError(f"不支持的过滤条件: {condition}")
+                else:
+                    wanted = [condition]
+
+                if key == "file_id":
+                    codes = [self._file_vocab[w] for w in wanted if w in self._file_vocab]
+                    mask &= np.isin(self._file_codes[: self._size], np.asarray(codes, dtype=np.int32))
+                else:
+                    wanted_set = set(wanted)
+                    mask &= np.fromiter(
+                        (m.get(key) in wanted_set for m in self._metadatas[: self._size]),
+                        dtype=bool,
+                        count=self._size,
+                    )
+        return mask
+
+    def memory_stats(self) -> Dict[str, Any]:
+        """Report bytes held by the scan path versus full-precision storage."""
+        with self._lock:
+            if self._codec is None:
+                return {"vectors": 0, "scan_bytes": 0, "full_bytes": 0}
+            return {
+                "vectors": self._size,
+                "quantization": self.quantization,
+                "search_dim": self._codec.search_dim,
+                "scan_bytes": self._size * self._codec.bytes_per_vector(),
+                "full_bytes": self._size * self._dim * 4 if self._keep_full else 0,
+            }
+
+    def train_ivf(self) -> bool:
+        """Train the IVF coarse quantizer with spherical k-means on live vectors.
+
+        Returns:
+            True if centroids were (re)trained, False if there is not enough data.
+        """
+        with self._exclusive():
+            rows = np.flatnonzero(self._alive[: self._size])
+            if self.ivf_lists <= 0 or rows.size < self.ivf_lists * 4:
+                return False
+            data = normalize_rows(self._search_matrix(rows))
+            rng = np.random.default_rng(0)
+            centroids = data[rng.choice(rows.size, self.ivf_lists, replace=False)].copy()
+            for _ in range(_KMEANS_ITERATIONS):
+                labels = np.argmax(data @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, labels, data)
+                empty = np.bincount(labels, minlength=self.ivf_lists) == 0
+                sums[empty] = centroids[empty]
+                centroids = normalize_rows(sums)
+            self._centroids = centroids
+            self._assignments = self._assign(self._search_matrix(np.arange(self._size)))
+            if self.directory:
+                np.save(self._path(_CENTROIDS_FILE), centroids)
+            return True
+
+    # ------------------------------------------------------------------ VectorStore API
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        if not documents:
+            return []
+        texts = [d.page_content for d in documents]
+        return self._add_rows(documents, self.embedding_function.embed_documents(texts))
+
+    def add_embedded(self, documents: List[Document], embeddings: List[List[float]]) -> List[str]:
+        if not documents:
+            return []
+        return self._add_rows(documents, embeddings)
+
+    def _add_rows(self, documents: List[Document], vectors: Any) -> List[str]:
+        texts = [d.page_content for d in documents]
+        embeddings = normalize_rows(np.asarray(vectors, dtype=np.float32))
+        ids = [str(uuid.uuid4()) for _ in documents]
+
+        with self._exclusive():
+            if self._codec is None:
+                self._init_codec(embeddings.shape[1])
+            elif embeddings.shape[1] != self._dim:
+                raise ValueError(f"向量维度不一致: 期望 {self._dim}, 实际 {embeddings.shape[1]}")
+
+            start, end = self._size, self._size + len(documents)
+            self._ensure_capacity(end)
+            codes, scales = self._codec.encode(embeddings)
+            self._codes[start:end] = codes
+            if self._scales is not None:
+                self._scales[start:end] = scales
+            if self._full is not None:
+                self._full[start:end] = embeddings
+            for array in (self._codes, self._scales, self._full):
+                if isinstance(array, np.memmap):
+                    array.flush()
+
+            metadatas = [dict(d.metadata or {}) for d in documents]
+            if self.directory:
+                payload = "".join(
+                    json.dumps({"id": vid, "document": text, "metadata": meta}, ensure_ascii=False) + "\n"
+                    for vid, text, meta in zip(ids, texts, metadatas)
+                ).encode("utf-8")
+                with open(self._path(_RECORDS_FILE), "ab") as f:
+                    # Cut any tail left by a failed earlier add; appends then land right after row `start - 1`.
+                    f.truncate(self._records_end)
+                    f.write(payload)
+                self._records_end += len(payload)
+
+            self._id_rows.update((vid, start + i) for i, vid in enumerate(ids))
+            self._ids.extend(ids)
+            self._documents.extend(texts)
+            self._metadatas.extend(metadatas)
+            self._alive = np.concatenate([self._alive[: self._size], np.ones(len(documents), dtype=bool)])
+            self._file_codes = np.concatenate([
+                self._file_codes[: self._size],
+                np.array([self._file_code(m.get("file_id")) for m in metadatas], dtype=np.int32),
+            ])
+            self._assignments = np.concatenate([
+                self._assignments[: self._size],
+                self._assign(self._codec.project(embeddings)),
+            ])
+            self._size = end
+            self._write_header()
+
+            if self.ivf_lists and self._centroids is None:
+                self.train_ivf()
+        return ids
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        if k <= 0:
+            return []
+        q_full = normalize_rows(np.asarray(self.embedding_function.embed_query(query), dtype=np.float32))
+        self._sync()
+        with self._lock:
+            if not self._size or self._codes is None:
+                return []
+            q = self._codec.project(q_full)
+            mask = self._filter_mask(filter)
+            if self._centroids is not None:
+                nprobe = min(self.ivf_nprobe, self._centroids.shape[0])
+                probe = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+                mask &= np.isin(self._assignments[: self._size], probe)
+
+            rows = np.flatnonzero(mask)
+            if rows.size == 0:
+                return []
+            scores = self._approx_scores(rows, q)
+
+            rerank = self._full is not None
+            top = min(k * self.rerank_factor if rerank else k, rows.size)
+            best = np.argpartition(-scores, top - 1)[:top]
+            if rerank:
+                candidates = np.sort(rows[best])
+                exact = np.asarray(self._full[candidates], dtype=np.float32) @ q_full
+                order = np.argsort(-exact)[:k]
+                best_rows = candidates[order]
+            else:
+                best_rows = rows[best[np.argsort(-scores[best])]]
+            return [
+                Document(page_content=self._documents[i], metadata=dict(self._metadatas[i]), id=self._ids[i])
+                for i in best_rows
+            ]
+
+    def get(
+        self, filter: Optional[dict] = None, include_embeddings: bool = False, ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        self._sync()
+        with self._lock:
+            mask = self._filter_mask(filter)
+            if ids is not None:
+                wanted = np.zeros(self._size, dtype=bool)
+                wanted[[self._id_rows[i] for i in ids if i in self._id_rows]] = True
+                mask = mask & wanted
+            rows = np.flatnonzero(mask)
+            result: Dict[str, Any] = {
+                "ids": [self._ids[i] for i in rows],
+                "documents": [self._documents[i] for i in rows],
+                "metadatas": [dict(self._metadatas[i]) for i in rows],
+            }
+            if include_embeddings:
+                if self._full is not None:
+                    result["embeddings"] = np.asarray(self._full[rows], dtype=np.float32).tolist()
+                elif self._codec is not None and self._codec.search_dim == self._dim:
+                    result["embeddings"] = self._search_matrix(rows).tolist()
+                elif self._codec is None:
+                    result["embeddings"] = []
+                else:
+                    # Truncated codes without full vectors cannot be restored.
+                    result["embeddings"] = None
+            return result
+
+    def delete_ids(self, ids: List[str]) -> None:
+        if not ids:
+            return
+        with self._exclusive():
+            rows = [self._id_rows[i] for i in ids if i in self._id_rows]
+            if not rows or not np.any(self._alive[rows]):
+                return
+            self._alive[rows] = False
+            self._write_header()
+
+    def delete_by_file_ids(self, file_ids: List[str]) -> None:
+        if not file_ids:
+            return
+        with self._exclusive():
+            codes = [self._file_vocab[f] for f in file_ids if f in self._file_vocab]
+            if not codes:
+                return
+            hit = np.isin(self._file_codes[: self._size], np.asarray(codes, dtype=np.int32))
+            if not np.any(hit & self._alive[: self._size]):
+                return
+            self._alive[: self._size] &= ~hit
+            self._write_header()
+
+    def _reset(self) -> None:
+        self._codes = self._scales = self._full = self._centroids = None
+        self._dim = self._size = 0
+        self._codec = None
+        self._ids, self._documents, self._metadatas = [], [], []
+        self._id_rows, self._file_vocab = {}, {}
+        self._records_end = 0
+        self._generation = 0
+        self._header_stamp = None
+        self._alive = np.zeros(0, dtype=bool)
+        self._file_codes = np.zeros(0, dtype=np.int32)
+        self._assignments = np.zeros(0, dtype=np.int32)
+
+    def drop(self) -> None:
+        with self._exclusive():
+            self._reset()
+            if self.directory:
+                shutil.rmtree(self.directory, ignore_errors=True)
+
+    def disk_bytes(self) -> int:
+        """Return the bytes held by the index files (0 for an in-memory index)."""
+        if not self.directory or not os.path.isdir(self.directory):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+
+    def compact(self, min_deleted_ratio: float = 0.0) -> Dict[str, Any]:
+        """Rewrite the index with live rows only; vector ids are kept.
+
+        The new arrays are sized to the live rows (no spare capacity) and written to
+        `<directory>.compact`, which then replaces the directory; an interrupted swap
+        is completed (or rolled back) the next time the index is opened. Searches and
+        writes wait on the store lock meanwhile. IVF centroids are kept.
+
+        Args:
+            min_deleted_ratio: Skip the rewrite unless at least this share of rows is deleted.
+
+        Returns:
+            `{"removed", "bytes_before", "bytes_after", "reclaimed_bytes"}`.
+        """
+        with self._exclusive():
+            before = self.disk_bytes()
+            keep = np.flatnonzero(self._alive[: self._size])
+            removed = self._size - keep.size
+            capacity = 0 if self._codes is None else self._codes.shape[0]
+            stats = {"removed": 0, "bytes_before": before, "bytes_after": before, "reclaimed_bytes": 0}
+            if (removed == 0 and capacity == self._size) or removed < self._size * min_deleted_ratio:
+                return stats
+
+            arrays = {attr: np.array(getattr(self, attr)[keep]) for attr in self._array_specs()} if self._codec else {}
+            ids = [self._ids[i] for i in keep]
+            documents = [self._documents[i] for i in keep]
+            metadatas = [self._metadatas[i] for i in keep]
+            centroids = self._centroids
+
+            if not self.directory:
+                for attr, array in arrays.items():
+                    setattr(self, attr, array)
+                self._ids, self._documents, self._metadatas = ids, documents, metadatas
+                self._id_rows = {vid: i for i, vid in enumerate(ids)}
+                self._file_vocab = {}
+                self._file_codes = np.array([self._file_code(m.get("file_id")) for m in metadatas], dtype=np.int32)
+                self._assignments = self._assignments[keep]
+                self._alive = np.ones(keep.size, dtype=bool)
+                self._size = int(keep.size)
+                stats["removed"] = removed
+                return stats
+
+            target = self.directory + _COMPACT_SUFFIX
+            shutil.rmtree(target, ignore_errors=True)
+            os.makedirs(target)
+            for attr, (name, _, _) in self._array_specs().items():
+                np.save(os.path.join(target, name), arrays[attr])
+            with open(os.path.join(target, _RECORDS_FILE), "w", encoding="utf-8") as f:
+                for vid, text, meta in zip(ids, documents, metadatas):
+                    f.write(json.dumps({"id": vid, "document": text, "metadata": meta}, ensure_ascii=False) + "\n")
+            if centroids is not None:
+                np.save(os.path.join(target, _CENTROIDS_FILE), centroids)
+            with open(os.path.join(target, _HEADER_FILE), "w", encoding="utf-8") as f:
+                json.dump({
+                    "generation": self._generation + 1,
+                    "dim": self._dim,
+                    "size": int(keep.size),
+                    "quantization": self.quantization,
+                    "truncate_dim": self.truncate_dim,
+                    "keep_full": self._keep_full,
+                    "deleted": [],
+                }, f)
+
+            # Release the mappings before moving the files (required on Windows).
+            del arrays
+            self._reset()
+            os.replace(self.directory, self.directory + _OLD_SUFFIX)
+            os.replace(target, self.directory)
+            shutil.rmtree(self.directory + _OLD_SUFFIX, ignore_errors=True)
+            self._load()
+
+            after = self.disk_bytes()
+            stats.update(removed=removed, bytes_after=after, reclaimed_bytes=max(before - after, 0))
+            return stats
+
+    def count(self) -> int:
+        self._sync()
+        with self._lock:
+            return int(np.count_nonzero(self._alive[: self._size]))
+
+    def peek(self, limit: int = 3) -> Dict[str, Any]:
+        self._sync()
+        with self._lock:
+            rows = np.flatnonzero(self._alive[: self._size])[:limit]
+            return {
+                "ids": [self._ids[i] for i in rows],
+                "metadatas": [self._metadatas[i] for i in rows],
+                "documents": [self._documents[i] for i in rows],
+            }
@@ -47,6 +47,17 @@ class ObjectStorage:
             raise RuntimeError("cos signed url not implemented")
         raise RuntimeError("OBJECT_STORAGE_PROVIDER is disabled")
 
+    def delete_object(self, *, key: str, provider: Optional[str] = None) -> None:
+        # 按附件记录里的 storage_provider 删除，切换存储后旧附件仍能清理
+        provider = provider or OBJECT_STORAGE_PROVIDER
+        if provider == "aliyun":
+            aliyun_oss_service.delete_object(key=key)
+            return
+        if provider == "cos":
+            cos_service.delete_object(key=key)
+            return
+        raise RuntimeError("OBJECT_STORAGE_PROVIDER is disabled")
+
 
 object_storage = ObjectStorage()
 
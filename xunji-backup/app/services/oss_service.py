@@ -67,6 +67,9 @@ class OssService:
 
         return {"key": key, "url": url, "filename": safe_name, "content_type": content_type or "", "size": len(content)}
 
+    def delete_object(self, *, key: str) -> None:
+        self._get_client().delete_object(Bucket=COS_BUCKET, Key=key)
+
 
 oss_service = OssService()
 
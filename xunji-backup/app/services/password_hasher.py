@@ -0,0 +1,124 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from dotenv import load_dotenv
+
+from app.core.security import get_password_hash, verify_password
+
+load_dotenv()
+
+# bcrypt worker processes; 0 runs hashing in the default thread pool instead (no extra processes).
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# Requests allowed to wait for a worker; beyond that hash / verify fail fast with PasswordHasherBusy.
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", "32"))
+# Niceness added to worker processes so the API process keeps the CPU during a login storm.
+PASSWORD_HASH_NICE = int(os.getenv("PASSWORD_HASH_NICE", "5"))
+
+
+class PasswordHasherBusy(RuntimeError):
+    """Raised when the hashing queue is full or the worker pool died."""
+
+
+def _init_worker(nice: int) -> None:
+    if nice and hasattr(os, "nice"):
+        os.nice(nice)
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification in a dedicated, bounded process pool.
+
+    Each bcrypt call burns ~0.2 s of CPU. In the API process those calls run
+    on the request thread pool and compete with chat streams for the GIL, the
+    thread pool and the cores. Here they run in at most `workers` separate
+    processes (started with spawn, at lower priority), at most `queue_limit`
+    calls wait for a free worker, and the event loop only awaits the result.
+    """
+
+    def __init__(self, workers: int = PASSWORD_HASH_WORKERS, queue_limit: int = PASSWORD_HASH_QUEUE_LIMIT,
+                 nice: int = PASSWORD_HASH_NICE) -> None:
+        """Create the hasher; the pool itself starts on first use.
+
+        Args:
+            workers: Worker processes; 0 hashes in the default thread pool.
+            queue_limit: Calls allowed to wait while all workers are busy.
+            nice: Niceness increment applied to each worker process.
+        """
+        self.workers = max(0, workers)
+        self.queue_limit = max(0, queue_limit)
+        self.nice = nice
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    async def hash(self, password: Optional[str]) -> Optional[str]:
+        """Hash a password; empty passwords return None without touching the pool."""
+        if not password:
+            return None
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, password: str, hashed_password: Optional[str]) -> bool:
+        """Check a password against its stored hash (accounts without a password always pass)."""
+        if not hashed_password:
+            return True
+        return await self._run(verify_password, password, hashed_password)
+
+    def start(self, wait: bool = False) -> None:
+        """Spawn the worker processes now rather than on the first login.
+
+        Spawned workers re-import `__main__` (the whole app under
+        `python app/main.py`), which takes seconds on a busy host.
+
+        Args:
+            wait: Block until every worker has started.
+        """
+        if not self.workers:
+            return
+        pool = self._executor()
+        futures = [pool.submit(os.getpid) for _ in range(self.workers)]
+        if wait:
+            for future in futures:
+                future.result()
+
+    def shutdown(self) -> None:
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        with self._lock:
+            if self._pending >= max(self.workers, 1) + self.queue_limit:
+                raise PasswordHasherBusy("too many password hashing requests in flight")
+            self._pending += 1
+        try:
+            if not self.workers:
+                return await asyncio.to_thread(fn, *args)
+            pool = self._executor()
+            try:
+                return await asyncio.wrap_future(pool.submit(fn, *args))
+            except BrokenProcessPool as exc:
+                # a worker was killed (e.g. OOM); the next call starts a fresh pool
+                with self._lock:
+                    if self._pool is pool:
+                        self._pool = None
+                raise PasswordHasherBusy("password hashing pool is restarting") from exc
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    def _executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                # spawn rather than fork: the API process already runs threads (thread pool, watchers)
+                self._pool = ProcessPoolExecutor(max_workers=self.workers,
+                                                 mp_context=multiprocessing.get_context("spawn"),
+                                                 initializer=_init_worker, initargs=(self.nice,))
+            return self._pool
+
+
+password_hasher = PasswordHasher()
@@ -0,0 +1,139 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, NamedTuple, Optional, Set, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import User
+
+load_dotenv()
+
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+# Upper bound on how stale a principal can get when another process changes the user.
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+# (kind, value): ("id", user_id), ("username", username) or ("device", device_id)
+CacheKey = Tuple[str, str]
+
+
+class Principal(NamedTuple):
+    """The authenticated caller: ids and flags only, detached from any session."""
+    id: str
+    username: Optional[str]
+    device_id: Optional[str]
+    is_anonymous: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "Principal":
+        return cls(id=user.id, username=user.username, device_id=user.device_id,
+                   is_anonymous=bool(user.is_anonymous))
+
+
+class PrincipalCache:
+    """Bounded TTL cache of the principals `get_current_user` resolves.
+
+    A request authenticated by a JWT `user_id`, a JWT `sub` (username) or an
+    `X-Device-ID` header maps to the same `Principal`, so repeated calls from
+    SSE-heavy clients skip the `User` query. Entries expire after the TTL and
+    are dropped as soon as a session that changed or deleted the user commits
+    (see the listeners below), or explicitly on login.
+    """
+
+    def __init__(self, size: int = PRINCIPAL_CACHE_SIZE, ttl: float = PRINCIPAL_CACHE_TTL_SECONDS) -> None:
+        """Create the cache.
+
+        Args:
+            size: Maximum number of cached lookup keys (LRU).
+            ttl: Seconds an entry is trusted; 0 disables the cache.
+        """
+        self.size = max(0, size)
+        self.ttl = ttl
+        self._entries: "OrderedDict[CacheKey, Tuple[Principal, float]]" = OrderedDict()
+        self._keys_by_user: Dict[str, Set[CacheKey]] = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, kind: str, value: str) -> Optional[Principal]:
+        """Return the cached principal for a lookup key, if fresh."""
+        key = (kind, value)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            principal, cached_at = entry
+            if time.monotonic() - cached_at > self.ttl:
+                self._drop(key)
+                return None
+            self._entries.move_to_end(key)
+            return principal
+
+    def version_token(self) -> int:
+        """Take before querying the user; pass to `remember`."""
+        return self._epoch
+
+    def remember(self, principal: Principal, token: int, keys: Iterable[CacheKey]) -> None:
+        """Cache `principal` under `keys`, unless an invalidation happened since `token`."""
+        if not self.size or self.ttl <= 0:
+            return
+        now = time.monotonic()
+        with self._lock:
+            if token != self._epoch:
+                return  # the row may predate a commit that already invalidated it
+            for key in keys:
+                self._drop(key)
+                self._entries[key] = (principal, now)
+                self._keys_by_user.setdefault(principal.id, set()).add(key)
+            while len(self._entries) > self.size:
+                self._drop(next(iter(self._entries)))
+
+    def forget(self, user_ids: Iterable[str]) -> None:
+        """Drop every entry that resolves to one of `user_ids`."""
+        with self._lock:
+            self._epoch += 1
+            for user_id in user_ids:
+                for key in list(self._keys_by_user.get(user_id, ())):
+                    self._drop(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._keys_by_user.clear()
+
+    def _drop(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self._keys_by_user.get(entry[0].id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_user[entry[0].id]
+
+
+principal_cache = PrincipalCache()
+
+
+@event.listens_for(Session, "before_flush")
+def _collect_changed_users(session, flush_context, instances):
+    changed = [obj.id for obj in session.deleted if isinstance(obj, User)]
+    changed += [obj.id for obj in session.dirty
+                if isinstance(obj, User) and session.is_modified(obj) and inspect(obj).has_identity]
+    if changed:
+        session.info.setdefault("users_changed", set()).update(changed)
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_users(session):
+    changed = session.info.pop("users_changed", None)
+    if changed:
+        principal_cache.forget(changed)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_users(session, previous_transaction):
+    session.info.pop("users_changed", None)
@@ -0,0 +1,409 @@
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import (
+    Conversation,
+    ConversationAiInstruction,
+    FileRecord,
+    Message,
+    MessageAttachment,
+    TreeNode,
+    bump_tree_versions,
+)
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.object_storage import object_storage
+from app.services.rag_service import rag_service
+
+load_dotenv()
+
+PURGE_RETENTION_DAYS = float(os.getenv("PURGE_RETENTION_DAYS", "30"))
+PURGE_BATCH_SIZE = int(os.getenv("PURGE_BATCH_SIZE", "500"))
+PURGE_INTERVAL_HOURS = float(os.getenv("PURGE_INTERVAL_HOURS", "0"))
+# Temp vectors, attachments and stored files younger than this may still belong
+# to a running chat request or upload, so orphan checks leave them alone.
+_ORPHAN_GRACE_SECONDS = 3600
+
+_logger = logging.getLogger(__name__)
+_UUID = re.compile(r"^([0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12})")
+
+
+class PurgeService:
+    """Hard-delete soft-deleted data after a retention period, plus orphans.
+
+    Conversations, files and tree nodes are only marked `is_deleted` (with
+    `deleted_at`) by the API; once the retention period has passed this removes
+    their rows for good, together with messages, tree nodes, conversation
+    instructions and attachment objects in object storage, and the stored copies
+    of deleted files under RAG_FILE_PATH (files tracked by the directory watcher
+    are the user's and are never removed; the newest deleted record of a watched
+    path is kept as a tombstone so the watcher does not re-ingest it). It also collects data nobody points to
+    any more: temp vectors left by `_rag_search_large_document` when a request
+    died, attachments whose message is gone and stored files without a
+    FileRecord. Rows are deleted in batches of `batch_size`, one commit each; an
+    attachment object that cannot be deleted keeps its conversation for the next
+    run. Rows soft-deleted before `deleted_at` existed get it stamped on the first
+    run, which starts their retention period.
+    """
+
+    def __init__(
+        self,
+        retention_days: float = PURGE_RETENTION_DAYS,
+        batch_size: int = PURGE_BATCH_SIZE,
+        interval_hours: float = PURGE_INTERVAL_HOURS,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            retention_days: Days soft-deleted rows are kept before being purged.
+            batch_size: Rows per transaction.
+            interval_hours: Hours between scheduled runs; 0 disables the schedule.
+        """
+        self.retention_days = retention_days
+        self.batch_size = max(1, batch_size)
+        self.interval_hours = interval_hours
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ------------------------------------------------------------------ run
+
+    def run(
+        self,
+        session_factory: Callable[[], Session],
+        retention_days: Optional[float] = None,
+        dry_run: bool = False,
+        now: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """Purge everything that is due.
+
+        Args:
+            session_factory: Creates the SQLAlchemy session for this run.
+            retention_days: Overrides the configured retention period.
+            dry_run: Only count what would be purged.
+            now: Current time (for tests).
+
+        Returns:
+            Report: purged counts per kind, `disk_bytes` / `object_bytes` freed,
+            `reclaimed_bytes` (their sum) and `errors`.
+        """
+        now = now or datetime.now()
+        retention = self.retention_days if retention_days is None else retention_days
+        cutoff = now - timedelta(days=retention)
+        grace = now - timedelta(seconds=_ORPHAN_GRACE_SECONDS)
+        report: Dict[str, Any] = {
+            "conversations": 0,
+            "messages": 0,
+            "tree_nodes": 0,
+            "attachments": 0,
+            "files": 0,
+            "temp_vectors": 0,
+            "orphan_files": 0,
+            "disk_bytes": 0,
+            "object_bytes": 0,
+            "errors": [],
+            "dry_run": dry_run,
+        }
+        db = session_factory()
+        try:
+            if not dry_run:
+                self._stamp(db, now)
+            self._purge_conversations(db, cutoff, report, dry_run)
+            self._purge_tree_nodes(db, cutoff, report, dry_run)
+            self._purge_orphan_attachments(db, grace, report, dry_run)
+            self._purge_files(db, cutoff, report, dry_run)
+            self._purge_orphan_files(db, grace, report, dry_run)
+        finally:
+            db.close()
+        self._purge_temp_vectors(grace, report, dry_run)
+        report["reclaimed_bytes"] = report["disk_bytes"] + report["object_bytes"]
+        return report
+
+    def _stamp(self, db: Session, now: datetime) -> None:
+        for model in (Conversation, FileRecord, TreeNode):
+            db.query(model).filter(model.is_deleted == True, model.deleted_at.is_(None)).update(
+                {model.deleted_at: now}, synchronize_session=False
+            )
+        db.commit()
+
+    def _batches(self, db: Session, model: Any, *criteria: Any) -> Any:
+        """Yield batches of ids matching criteria, walking the primary key so dry runs terminate."""
+        last = ""
+        while True:
+            ids = [
+                row[0]
+                for row in db.query(model.id).filter(model.id > last, *criteria).order_by(model.id).limit(self.batch_size)
+            ]
+            if not ids:
+                return
+            last = ids[-1]
+            yield ids
+
+    # ------------------------------------------------------------------ conversations and messages
+
+    def _delete_objects(
+        self, attachments: List[MessageAttachment], report: Dict[str, Any], dry_run: bool
+    ) -> List[MessageAttachment]:
+        """Delete attachment objects from object storage; returns the attachments that failed."""
+        failed: List[MessageAttachment] = []
+        for att in attachments:
+            if not dry_run:
+                try:
+                    object_storage.delete_object(key=att.storage_key, provider=att.storage_provider)
+                except Exception as exc:
+                    failed.append(att)
+                    report["errors"].append(f"附件 {att.storage_key}: {exc}")
+                    continue
+            report["object_bytes"] += att.size or 0
+        return failed
+
+    def _delete_messages(self, db: Session, message_ids: Any) -> int:
+        """Stage deletion of messages and everything attached to them; returns the message count."""
+        db.query(MessageAttachment).filter(MessageAttachment.message_id.in_(message_ids)).delete(synchronize_session=False)
+        db.query(TreeNode).filter(TreeNode.message_id.in_(message_ids)).delete(synchronize_session=False)
+        return db.query(Message).filter(Message.id.in_(message_ids)).delete(synchronize_session=False)
+
+    def _purge_conversations(self, db: Session, cutoff: datetime, report: Dict[str, Any], dry_run: bool) -> None:
+        for ids in self._batches(db, Conversation, Conversation.is_deleted == True, Conversation.deleted_at < cutoff):
+            attachments = (
+                db.query(MessageAttachment)
+                .outerjoin(Message, Message.id == MessageAttachment.message_id)
+                .filter((MessageAttachment.conversation_id.in_(ids)) | (Message.conversation_id.in_(ids)))
+                .all()
+            )
+            # A conversation whose objects could not all be deleted is retried next run.
+            stuck = self._delete_objects(attachments, report, dry_run)
+            failed = {a.conversation_id for a in stuck}
+            stuck_messages = [a.message_id for a in stuck]
+            failed |= {row[0] for row in db.query(Message.conversation_id).filter(Message.id.in_(stuck_messages))}
+            ids = [i for i in ids if i not in failed]
+            if dry_run:
+                report["conversations"] += len(ids)
+                report["attachments"] += len(attachments)
+                report["messages"] += db.query(Message).filter(Message.conversation_id.in_(ids)).count()
+                report["tree_nodes"] += db.query(TreeNode).filter(TreeNode.conversation_id.in_(ids)).count()
+                continue
+            if not ids:
+                continue
+            message_ids = db.query(Message.id).filter(Message.conversation_id.in_(ids)).scalar_subquery()
+            report["attachments"] += (
+                db.query(MessageAttachment)
+                .filter((MessageAttachment.conversation_id.in_(ids)) | (MessageAttachment.message_id.in_(message_ids)))
+                .delete(synchronize_session=False)
+            )
+            report["tree_nodes"] += (
+                db.query(TreeNode)
+                .filter((TreeNode.conversation_id.in_(ids)) | (TreeNode.message_id.in_(message_ids)))
+                .delete(synchronize_session=False)
+            )
+            db.query(ConversationAiInstruction).filter(ConversationAiInstruction.conversation_id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            report["messages"] += db.query(Message).filter(Message.conversation_id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            report["conversations"] += db.query(Conversation).filter(Conversation.id.in_(ids)).delete(
+                synchronize_session=False
+            )
+            # Bulk deletes skip the flush hook; drop the cached tree versions of the removed conversations.
+            bump_tree_versions(db, ids, bump=False)
+            db.commit()
+
+    def _purge_tree_nodes(self, db: Session, cutoff: datetime, report: Dict[str, Any], dry_run: bool) -> None:
+        """Purge soft-deleted tree nodes (and their messages) that no live node hangs below."""
+        for ids in self._batches(db, TreeNode, TreeNode.is_deleted == True, TreeNode.deleted_at < cutoff):
+            candidates = set(ids)
+            # A node is kept while it has a child that is not being purged; that pins its ancestors too.
+            while True:
+                pinned = {
+                    row[0]
+                    for row in db.query(TreeNode.parent_id).filter(
+                        TreeNode.parent_id.in_(candidates), TreeNode.id.notin_(candidates)
+                    )
+                }
+                if not pinned:
+                    break
+                candidates -= pinned
+            if not candidates:
+                continue
+            nodes = list(candidates)
+            message_ids = [row[0] for row in db.query(TreeNode.message_id).filter(TreeNode.id.in_(nodes)) if row[0]]
+            conversation_ids = {row[0] for row in db.query(TreeNode.conversation_id).filter(TreeNode.id.in_(nodes))}
+            attachments = db.query(MessageAttachment).filter(MessageAttachment.message_id.in_(message_ids)).all()
+            if self._delete_objects(attachments, report, dry_run):
+                continue
+            report["attachments"] += len(attachments)
+            if dry_run:
+                report["tree_nodes"] += len(nodes)
+                report["messages"] += len(message_ids)
+                continue
+            report["tree_nodes"] += db.query(TreeNode).filter(TreeNode.id.in_(nodes)).delete(synchronize_session=False)
+            report["messages"] += self._delete_messages(db, message_ids)
+            # Bulk deletes skip the flush hook, so bump the trees by hand: cached versions and ETags must change.
+            bump_tree_versions(db, conversation_ids)
+            db.commit()
+
+    def _purge_orphan_attachments(self, db: Session, grace: datetime, report: Dict[str, Any], dry_run: bool) -> None:
+        """Remove attachments whose message no longer exists."""
+        last = ""
+        while True:
+            attachments = (
+                db.query(MessageAttachment)
+                .outerjoin(Message, Message.id == MessageAttachment.message_id)
+                .filter(Message.id.is_(None), MessageAttachment.created_at < grace, MessageAttachment.id > last)
+                .order_by(MessageAttachment.id)
+                .limit(self.batch_size)
+                .all()
+            )
+            if not attachments:
+                return
+            last = attachments[-1].id
+            # Rows whose object could not be deleted are kept for the next run.
+            failed = {a.id for a in self._delete_objects(attachments, report, dry_run)}
+            deleted = [a.id for a in attachments if a.id not in failed]
+            if dry_run or not deleted:
+                report["attachments"] += len(deleted)
+                continue
+            report["attachments"] += db.query(MessageAttachment).filter(MessageAttachment.id.in_(deleted)).delete(
+                synchronize_session=False
+            )
+            db.commit()
+
+    # ------------------------------------------------------------------ files and vectors
+
+    def _watch_tombstones(self, db: Session, records: List[FileRecord]) -> Set[str]:
+        """Ids of deleted watched records the directory watcher still matches against.
+
+        For each `source_path` the watcher looks at the live record, else the newest
+        deleted one, and compares its content hash with the file on disk; without that
+        record it would re-ingest a file the user deleted through the API.
+        """
+        paths = {r.source_path for r in records if r.source_path}
+        if not paths:
+            return set()
+        latest: Dict[str, str] = {}
+        rows = (
+            db.query(FileRecord.id, FileRecord.source_path)
+            .filter(FileRecord.source_path.in_(paths))
+            .order_by(FileRecord.is_deleted, FileRecord.created_at.desc())
+        )
+        for file_id, source_path in rows:
+            latest.setdefault(source_path, file_id)
+        return set(latest.values())
+
+    def _purge_files(self, db: Session, cutoff: datetime, report: Dict[str, Any], dry_run: bool) -> None:
+        for ids in self._batches(db, FileRecord, FileRecord.is_deleted == True, FileRecord.deleted_at < cutoff):
+            records = db.query(FileRecord).filter(FileRecord.id.in_(ids)).all()
+            tombstones = self._watch_tombstones(db, records)
+            records = [r for r in records if r.id not in tombstones]
+            for record in records:
+                if record.source_path:
+                    continue  # the watched source file belongs to the user
+                try:
+                    path = knowledge_base_service.stored_file_path(record.id, record.filename, record.file_path)
+                except ValueError:
+                    continue
+                report["disk_bytes"] += self._remove(path, dry_run)
+            report["files"] += len(records)
+            if not dry_run and records:
+                db.query(FileRecord).filter(FileRecord.id.in_([r.id for r in records])).delete(
+                    synchronize_session=False
+                )
+                db.commit()
+
+    def _purge_orphan_files(self, db: Session, grace: datetime, report: Dict[str, Any], dry_run: bool) -> None:
+        """Remove stored uploads (`<file_id><SPLIT_FILENAME_ID>...`) without a FileRecord."""
+        base = os.getenv("RAG_FILE_PATH")
+        split = os.getenv("SPLIT_FILENAME_ID")
+        if not base or not split or not os.path.isdir(base):
+            return
+        deadline = grace.timestamp()
+        candidates: Dict[str, List[str]] = {}
+        with os.scandir(base) as entries:
+            for entry in entries:
+                match = _UUID.match(entry.name)
+                if not match or entry.name[match.end():match.end() + len(split)] != split or not entry.is_file():
+                    continue
+                if entry.stat().st_mtime < deadline:
+                    candidates.setdefault(match.group(1), []).append(entry.path)
+        keys = list(candidates)
+        for start in range(0, len(keys), self.batch_size):
+            batch = keys[start:start + self.batch_size]
+            known = {row[0] for row in db.query(FileRecord.id).filter(FileRecord.id.in_(batch))}
+            for file_id in batch:
+                if file_id in known:
+                    continue
+                for path in candidates[file_id]:
+                    report["disk_bytes"] += self._remove(path, dry_run)
+                    report["orphan_files"] += 1
+
+    def _remove(self, path: str, dry_run: bool) -> int:
+        """Delete a file (and a leftover `.part` of it); returns the bytes freed."""
+        freed = 0
+        for candidate in (path, path + ".part"):
+            try:
+                size = os.path.getsize(candidate)
+                if not dry_run:
+                    os.remove(candidate)
+            except OSError:
+                continue
+            freed += size
+        return freed
+
+    def _purge_temp_vectors(self, grace: datetime, report: Dict[str, Any], dry_run: bool) -> None:
+        deadline = grace.timestamp()
+        try:
+            found = rag_service.vector_store.get(filter={"temp": True})
+        except Exception as exc:
+            report["errors"].append(f"临时向量: {exc}")
+            return
+        ids = [
+            vid
+            for vid, meta in zip(found["ids"], found["metadatas"])
+            if float((meta or {}).get("temp_created_at") or 0) < deadline
+        ]
+        if ids and not dry_run:
+            rag_service.delete_vector_ids(ids)
+        report["temp_vectors"] += len(ids)
+
+    # ------------------------------------------------------------------ schedule
+
+    def start(self, session_factory: Callable[[], Session]) -> bool:
+        """Start the scheduled purge thread; returns False if it is disabled."""
+        if self.interval_hours <= 0:
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, args=(session_factory,), name="purge", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the purge thread to exit and wait for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self, session_factory: Callable[[], Session]) -> None:
+        while not self._stop.wait(self.interval_hours * 3600):
+            try:
+                started = time.monotonic()
+                report = self.run(session_factory)
+                _logger.info(
+                    "数据清理完成 (%.1fs): 会话 %s, 消息 %s, 文件 %s, 临时向量 %s, 回收 %s 字节",
+                    time.monotonic() - started, report["conversations"], report["messages"],
+                    report["files"], report["temp_vectors"], report["reclaimed_bytes"],
+                )
+            except Exception:
+                _logger.exception("数据清理失败")
+
+
+purge_service = PurgeService()
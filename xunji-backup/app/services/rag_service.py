@@ -1,12 +1,20 @@
+import hashlib
+import json
+import logging
 import os
+import sqlite3
+import time
 import uuid
-from typing import Any, Dict, List, Optional
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, NamedTuple, Optional
 
 from dotenv import load_dotenv
 from pypdf import PdfReader
 from langchain_ollama import OllamaEmbeddings
 from langchain_core.documents import Document
 
+from app.services.text_splitter import TokenAwareTextSplitter, estimate_tokens, tiktoken_counter
+
 try:
     from langchain_chroma import Chroma
 except Exception:  # pragma: no cover
@@ -18,62 +26,371 @@ load_dotenv(override=True)
 
 CHUNK_SIZE_CHARS = int(os.getenv("RAG_CHUNK_SIZE_CHARS", "2000"))
 CHUNK_OVERLAP_CHARS = int(os.getenv("RAG_CHUNK_OVERLAP_CHARS", "200"))
+RAG_SPLITTER = os.getenv("RAG_SPLITTER", "token").lower()
+CHUNK_SIZE_TOKENS = int(os.getenv("RAG_CHUNK_SIZE_TOKENS", "512"))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("RAG_CHUNK_OVERLAP_TOKENS", "0"))
+RAG_TOKENIZER = os.getenv("RAG_TOKENIZER", "estimate").lower()
 RAG_COLLECTION_NAME = os.getenv("RAG_COLLECTION_NAME", "zhiwei_knowledge_base")
 RAG_EMBEDDING_PROVIDER = os.getenv("RAG_EMBEDDING_PROVIDER", "ollama").lower()
 RAG_RESET_ON_SCHEMA_ERROR = os.getenv("RAG_RESET_ON_SCHEMA_ERROR", "false").lower() == "true"
+RAG_VECTOR_BACKEND = os.getenv("RAG_VECTOR_BACKEND", "chroma").lower()
+RAG_NUMPY_IVF_LISTS = int(os.getenv("RAG_NUMPY_IVF_LISTS", "0"))
+RAG_NUMPY_IVF_NPROBE = int(os.getenv("RAG_NUMPY_IVF_NPROBE", "8"))
+RAG_NUMPY_QUANTIZATION = os.getenv("RAG_NUMPY_QUANTIZATION", "none").lower()
+RAG_NUMPY_TRUNCATE_DIM = int(os.getenv("RAG_NUMPY_TRUNCATE_DIM", "0"))
+RAG_NUMPY_RERANK_FACTOR = int(os.getenv("RAG_NUMPY_RERANK_FACTOR", "4"))
+RAG_DELETE_BATCH_SIZE = int(os.getenv("RAG_DELETE_BATCH_SIZE", "500"))
+ACTIVE_COLLECTION_FILE = "active_collection.json"
 
+_logger = logging.getLogger(__name__)
 
-class RagService:
-    """RAG service based on Chroma vector store.
 
-    This implementation avoids heavy optional dependencies (sentence-transformers/torch)
-    by using a lightweight text splitter and pypdf for PDF extraction.
+def batched(items: List[Any], size: Optional[int] = None) -> Iterator[List[Any]]:
+    """Yield consecutive slices of at most `size` (default RAG_DELETE_BATCH_SIZE) items."""
+    size = max(1, size or RAG_DELETE_BATCH_SIZE)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class VectorStore(ABC):
+    """Backend-neutral vector store used by RagService and the chat flow.
+
+    Filters follow the Chroma `where` subset the app relies on:
+    `{"key": value}`, `{"key": {"$eq": value}}` and `{"key": {"$in": [...]}}`.
     """
 
-    def __init__(self) -> None:
-        """Initialize embeddings and vector store."""
-        if RAG_EMBEDDING_PROVIDER == "dashscope":
+    @abstractmethod
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        """Embed and store documents.
+
+        Args:
+            documents: Documents whose metadata carries at least `file_id`.
+
+        Returns:
+            Vector ids of the stored documents, in input order.
+        """
+
+    @abstractmethod
+    def add_embedded(self, documents: List[Document], embeddings: List[List[float]]) -> List[str]:
+        """Store documents with precomputed embeddings (no embedding call).
+
+        Args:
+            documents: Documents to store.
+            embeddings: One vector per document, as returned by get().
+
+        Returns:
+            Vector ids of the stored documents, in input order.
+        """
+
+    @abstractmethod
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        """Return the top-k documents most similar to the query."""
+
+    @abstractmethod
+    def get(
+        self, filter: Optional[dict] = None, include_embeddings: bool = False, ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        """Return live rows matching filter as `{"ids", "documents", "metadatas"}`.
+
+        With ids only those vectors are returned (unknown or deleted ids are skipped).
+        With include_embeddings the result also has `"embeddings"`; it is None when the
+        store cannot return full-dimension vectors.
+        """
+
+    @abstractmethod
+    def delete_by_file_ids(self, file_ids: List[str]) -> None:
+        """Delete every vector whose metadata `file_id` is in file_ids."""
+
+    @abstractmethod
+    def delete_ids(self, ids: List[str]) -> None:
+        """Delete vectors by vector id."""
+
+    @abstractmethod
+    def count(self) -> int:
+        """Return the number of live vectors."""
+
+    @abstractmethod
+    def peek(self, limit: int = 3) -> Dict[str, Any]:
+        """Return a small sample as `{"ids", "metadatas", "documents"}`."""
+
+    @abstractmethod
+    def drop(self) -> None:
+        """Delete the whole collection, including its persisted data."""
+
+    @abstractmethod
+    def compact(self, min_deleted_ratio: float = 0.0) -> Dict[str, Any]:
+        """Reclaim the space of deleted vectors.
+
+        Args:
+            min_deleted_ratio: Skip the work unless at least this share of rows is
+                deleted (ignored by stores that cannot tell).
+
+        Returns:
+            `{"removed", "bytes_before", "bytes_after", "reclaimed_bytes"}`.
+        """
+
+    def persist(self) -> None:
+        """Flush pending writes; a no-op for stores that write through."""
+        return None
+
+
+class ChromaVectorStore(VectorStore):
+    """VectorStore backed by a LangChain Chroma collection."""
+
+    def __init__(self, *, collection_name: str, embedding_function: Any, persist_directory: Optional[str]) -> None:
+        self.persist_directory = persist_directory
+        self._chroma = Chroma(
+            collection_name=collection_name,
+            embedding_function=embedding_function,
+            persist_directory=persist_directory,
+        )
+
+    def add_documents(self, documents: List[Document]) -> List[str]:
+        return self._chroma.add_documents(documents)
+
+    def add_embedded(self, documents: List[Document], embeddings: List[List[float]]) -> List[str]:
+        if not documents:
+            return []
+        ids = [str(uuid.uuid4()) for _ in documents]
+        self._chroma._collection.add(
+            ids=ids,
+            documents=[d.page_content for d in documents],
+            metadatas=[dict(d.metadata or {}) for d in documents],
+            embeddings=[list(map(float, e)) for e in embeddings],
+        )
+        return ids
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[dict] = None) -> List[Document]:
+        return self._chroma.similarity_search(query, k=k, filter=filter)
+
+    def get(
+        self, filter: Optional[dict] = None, include_embeddings: bool = False, ids: Optional[List[str]] = None
+    ) -> Dict[str, Any]:
+        include = ["documents", "metadatas"] + (["embeddings"] if include_embeddings else [])
+        if ids is not None and not ids:
+            return {"ids": [], "documents": [], "metadatas": [], **({"embeddings": []} if include_embeddings else {})}
+        result = self._chroma._collection.get(ids=ids, where=filter or None, include=include)
+        rows = {
+            "ids": list(result.get("ids") or []),
+            "documents": list(result.get("documents") or []),
+            "metadatas": list(result.get("metadatas") or []),
+        }
+        if include_embeddings:
+            embeddings = result.get("embeddings")
+            rows["embeddings"] = [list(e) for e in embeddings] if embeddings is not None else None
+        return rows
+
+    def delete_by_file_ids(self, file_ids: List[str]) -> None:
+        # Resolve ids per bounded batch of keys, then delete by id in bounded batches,
+        # so a large clear never builds one huge `$in` filter or delete.
+        collection = self._chroma._collection
+        for keys in batched(list(file_ids)):
+            ids = collection.get(where={"file_id": {"$in": keys}}, include=[]).get("ids") or []
+            self.delete_ids(ids)
+
+    def delete_ids(self, ids: List[str]) -> None:
+        for batch in batched(list(ids)):
+            self._chroma._collection.delete(ids=batch)
+
+    def drop(self) -> None:
+        self._chroma.delete_collection()
+
+    def _sqlite_path(self) -> Optional[str]:
+        path = os.path.join(self.persist_directory, "chroma.sqlite3") if self.persist_directory else None
+        return path if path and os.path.exists(path) else None
+
+    def _disk_bytes(self) -> int:
+        if not self.persist_directory:
+            return 0
+        total = 0
+        for root, _, files in os.walk(self.persist_directory):
+            for name in files:
+                try:
+                    total += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    continue
+        return total
+
+    def compact(self, min_deleted_ratio: float = 0.0) -> Dict[str, Any]:
+        """VACUUM Chroma's SQLite file, which keeps the pages of deleted rows.
+
+        HNSW segment files are only rebuilt by writing a new collection, which is
+        what `python -m app.cli.reindex` does.
+        """
+        before = self._disk_bytes()
+        path = self._sqlite_path()
+        if path:
+            conn = sqlite3.connect(path, timeout=60, isolation_level=None)
             try:
-                from langchain_community.embeddings import DashScopeEmbeddings
+                conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+                conn.execute("VACUUM")
+            finally:
+                conn.close()
+        after = self._disk_bytes()
+        return {"removed": 0, "bytes_before": before, "bytes_after": after, "reclaimed_bytes": max(before - after, 0)}
+
+    def count(self) -> int:
+        return self._chroma._collection.count()
 
-                self.embeddings = DashScopeEmbeddings(
-                    model=str(os.getenv("QWEN_EMBEDDING_MODEL")),
-                    dashscope_api_key=os.getenv("QWEN_API_KEY"),
-                )
+    def peek(self, limit: int = 3) -> Dict[str, Any]:
+        return self._chroma._collection.peek(limit=limit)
+
+    def persist(self) -> None:
+        if hasattr(self._chroma, "persist"):
+            try:
+                self._chroma.persist()
             except Exception:
-                self.embeddings = OllamaEmbeddings(
-                    model=str(os.getenv("EMBEDDING_MODEL") or "nomic-embed-text"),
-                    base_url=str(os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"),
-                )
-        else:
-            self.embeddings = OllamaEmbeddings(
+                pass
+
+
+def chunk_hash(text: str) -> str:
+    """Content hash stored as chunk metadata, used to diff re-uploaded files."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ChunkRow(NamedTuple):
+    """One stored chunk of a file, as mirrored into the SQL chunk table."""
+
+    vector_id: str
+    ordinal: int
+    chunk_hash: str
+    token_count: int
+    char_count: int
+
+
+def embedding_config_from_env() -> Dict[str, str]:
+    """Return the embedding provider/model selected by the environment."""
+    if RAG_EMBEDDING_PROVIDER == "dashscope":
+        return {"provider": "dashscope", "model": str(os.getenv("QWEN_EMBEDDING_MODEL"))}
+    return {"provider": RAG_EMBEDDING_PROVIDER, "model": str(os.getenv("EMBEDDING_MODEL") or "nomic-embed-text")}
+
+
+def build_embeddings(config: Dict[str, str]) -> Any:
+    """Create the LangChain embeddings object for an embedding config.
+
+    Args:
+        config: `{"provider", "model"}` as returned by embedding_config_from_env.
+
+    Returns:
+        Embeddings instance (DashScope falls back to Ollama if unavailable).
+    """
+    if config.get("provider") == "dashscope":
+        try:
+            from langchain_community.embeddings import DashScopeEmbeddings
+
+            return DashScopeEmbeddings(model=config["model"], dashscope_api_key=os.getenv("QWEN_API_KEY"))
+        except Exception:
+            return OllamaEmbeddings(
                 model=str(os.getenv("EMBEDDING_MODEL") or "nomic-embed-text"),
                 base_url=str(os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"),
             )
+    return OllamaEmbeddings(
+        model=config["model"],
+        base_url=str(os.getenv("OLLAMA_BASE_URL") or "http://localhost:11434"),
+    )
+
+
+def read_active_collection(persist_directory: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Read the active-collection pointer written by the re-index command.
+
+    Args:
+        persist_directory: PERSIST_DIRECTORY.
+
+    Returns:
+        `{"collection", "embedding", "switched_at"}`, or None when there is no pointer.
+    """
+    if not persist_directory:
+        return None
+    try:
+        with open(os.path.join(persist_directory, ACTIVE_COLLECTION_FILE), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
+
+
+def write_active_collection(persist_directory: str, collection: str, embedding: Dict[str, str]) -> None:
+    """Atomically point the app at another collection (and the embedding model it was built with)."""
+    os.makedirs(persist_directory, exist_ok=True)
+    path = os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"collection": collection, "embedding": embedding, "switched_at": time.time()}, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+class RagService:
+    """RAG service based on a pluggable vector store (Chroma or NumPy).
+
+    This implementation avoids heavy optional dependencies (sentence-transformers/torch)
+    by using a lightweight text splitter and pypdf for PDF extraction.
+    """
+
+    def __init__(self) -> None:
+        """Initialize embeddings and vector store."""
+        self.embedding_config = embedding_config_from_env()
+        self.embeddings = build_embeddings(self.embedding_config)
+        self.collection_name = RAG_COLLECTION_NAME
+        self._pointer_mtime: Optional[int] = None
         self._vector_store = None
+        self.splitter = TokenAwareTextSplitter(
+            chunk_tokens=CHUNK_SIZE_TOKENS,
+            overlap_tokens=CHUNK_OVERLAP_TOKENS,
+            counter=tiktoken_counter() if RAG_TOKENIZER == "tiktoken" else estimate_tokens,
+        )
 
     @property
-    def vector_store(self) -> Any:
+    def vector_store(self) -> VectorStore:
         return self._get_vector_store()
-    def _get_vector_store(self) -> Any:
-        """Lazily initialize Chroma vector store.
+
+    def _create_vector_store(
+        self, collection_name: str, persist_directory: Optional[str], embeddings: Any = None
+    ) -> VectorStore:
+        """Build the vector store selected by RAG_VECTOR_BACKEND.
+
+        Args:
+            collection_name: Logical collection name.
+            persist_directory: Root persistence directory, or None for in-memory.
+            embeddings: Embeddings for the collection; defaults to the active ones.
+
+        Returns:
+            A VectorStore implementation.
+        """
+        if RAG_VECTOR_BACKEND == "numpy":
+            from app.services.numpy_vector_store import NumpyVectorStore
+
+            directory = os.path.join(persist_directory, "numpy", collection_name) if persist_directory else None
+            return NumpyVectorStore(
+                directory=directory,
+                embedding_function=embeddings or self.embeddings,
+                ivf_lists=RAG_NUMPY_IVF_LISTS,
+                ivf_nprobe=RAG_NUMPY_IVF_NPROBE,
+                quantization=RAG_NUMPY_QUANTIZATION,
+                truncate_dim=RAG_NUMPY_TRUNCATE_DIM,
+                rerank_factor=RAG_NUMPY_RERANK_FACTOR,
+            )
+        return ChromaVectorStore(
+            collection_name=collection_name,
+            embedding_function=embeddings or self.embeddings,
+            persist_directory=persist_directory,
+        )
+
+    def _get_vector_store(self) -> VectorStore:
+        """Lazily initialize the configured vector store.
 
         Returns:
-            Initialized Chroma vector store.
+            Initialized vector store.
 
         Raises:
             RuntimeError: If initialization fails and reset is disabled.
         """
+        persist_directory = os.getenv("PERSIST_DIRECTORY")
+        self._follow_active_collection(persist_directory)
         if self._vector_store is not None:
             return self._vector_store
 
-        persist_directory = os.getenv("PERSIST_DIRECTORY")
         try:
-            self._vector_store = Chroma(
-                collection_name=RAG_COLLECTION_NAME,
-                embedding_function=self.embeddings,
-                persist_directory=persist_directory,
-            )
+            self._vector_store = self._create_vector_store(self.collection_name, persist_directory)
             return self._vector_store
         except KeyError as exc:
             if not RAG_RESET_ON_SCHEMA_ERROR:
@@ -84,15 +401,61 @@ class RagService:
                 import shutil
 
                 shutil.rmtree(persist_directory, ignore_errors=True)
-            self._vector_store = Chroma(
-                collection_name=RAG_COLLECTION_NAME,
-                embedding_function=self.embeddings,
-                persist_directory=persist_directory,
-            )
+            self._vector_store = self._create_vector_store(self.collection_name, persist_directory)
             return self._vector_store
 
+    def _follow_active_collection(self, persist_directory: Optional[str]) -> None:
+        """Switch to the collection named by the active-collection pointer when it changes.
+
+        The pointer also records the embedding model the collection was built with, so
+        queries keep using the matching model even if the environment was already
+        changed for a re-index that has not finished yet.
+        """
+        if not persist_directory:
+            return
+        try:
+            mtime = os.stat(os.path.join(persist_directory, ACTIVE_COLLECTION_FILE)).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._pointer_mtime:
+            return
+        self._pointer_mtime = mtime
+        active = read_active_collection(persist_directory)
+        if not active or not active.get("collection"):
+            return
+        embedding = active.get("embedding") or self.embedding_config
+        if active["collection"] == self.collection_name and embedding == self.embedding_config:
+            return
+        if embedding != embedding_config_from_env():
+            _logger.warning(
+                "当前向量集合 %s 使用的嵌入模型为 %s，与环境变量配置不同；如需切换请运行 python -m app.cli.reindex",
+                active["collection"], embedding,
+            )
+        if embedding != self.embedding_config:
+            self.embeddings = build_embeddings(embedding)
+            self.embedding_config = embedding
+        self.collection_name = active["collection"]
+        self._vector_store = None
+
     def _split_text(self, text: str) -> List[str]:
-        """Split text into overlapping chunks.
+        """Split text into chunks.
+
+        Uses the token-aware, sentence-boundary splitter unless RAG_SPLITTER=chars.
+
+        Args:
+            text: Raw text.
+
+        Returns:
+            List of chunk strings.
+        """
+        if not text:
+            return []
+        if RAG_SPLITTER != "chars":
+            return self.splitter.split_text(text)
+        return self._split_text_by_chars(text)
+
+    def _split_text_by_chars(self, text: str) -> List[str]:
+        """Legacy splitter: fixed character windows with character overlap.
 
         Args:
             text: Raw text.
@@ -169,46 +532,113 @@ class RagService:
             docs.append(Document(page_content=chunk, metadata={}))
         return docs
 
-    def process_uploaded_file(self, file_obj: Any, filename: str) -> str:
-        """Process an uploaded file and store into vector DB.
+    def index_file(
+        self, file_path: str, filename: str, file_id: str, store: Optional[VectorStore] = None
+    ) -> List[ChunkRow]:
+        """Split a stored file and add its chunks to the vector store.
 
         Args:
-            file_obj: FastAPI UploadFile-like object.
-            filename: Original filename.
+            file_path: Path of the file on disk.
+            filename: Original filename (its suffix selects the reader).
+            file_id: Value stored as the chunks' file_id metadata.
+            store: Target store; defaults to the active one (the re-index passes a shadow store).
 
         Returns:
-            file_id for later retrieval.
+            The added chunks in document order.
         """
-        file_id = str(uuid.uuid4())
         suffix = os.path.splitext(filename)[1].lower()
+        split_docs = self.load_and_split_file(file_path, suffix)
+        for i, doc in enumerate(split_docs):
+            doc.metadata["file_id"] = file_id
+            doc.metadata["filename"] = filename
+            doc.metadata["chunk_hash"] = chunk_hash(doc.page_content)
+            doc.metadata["ordinal"] = i
+        ids = (store or self._get_vector_store()).add_documents(split_docs) if split_docs else []
+        return [self._chunk_row(vid, i, doc) for i, (vid, doc) in enumerate(zip(ids, split_docs))]
+
+    def _chunk_row(self, vector_id: str, ordinal: int, doc: Document) -> ChunkRow:
+        text = doc.page_content
+        return ChunkRow(vector_id, ordinal, doc.metadata["chunk_hash"], self.splitter.counter(text), len(text))
+
+    def reindex_file(self, file_path: str, filename: str, old_key: str, new_key: str) -> Dict[str, Any]:
+        """Re-index a new version of a file, embedding only chunks whose hash is new.
+
+        With `new_key == old_key` the stored chunks are updated in place: new chunks
+        are added, then chunks missing from the new version are deleted. With a
+        different key (the old chunks are shared with other files) unchanged chunks
+        are copied to new_key with their stored vectors and old_key is left untouched.
+        Chunks kept in place keep their stored metadata, so their `ordinal` may be
+        stale; the SQL rows carry the current one.
 
-        import tempfile
-        import shutil
-
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as tmp_file:
-            shutil.copyfileobj(file_obj.file, tmp_file)
-            tmp_path = tmp_file.name
+        Args:
+            file_path: Path of the new version on disk.
+            filename: Filename stored in chunk metadata (its suffix selects the reader).
+            old_key: file_id of the currently stored chunks.
+            new_key: file_id for the new version's chunks.
 
-        try:
-            split_docs = self.load_and_split_file(tmp_path, suffix)
-            for doc in split_docs:
-                doc.metadata["file_id"] = file_id
-                doc.metadata["filename"] = filename
-            if split_docs:      
-                self._get_vector_store().add_documents(split_docs)
-            return file_id
-        finally:
-            try:
-                os.remove(tmp_path)
-            except Exception:
-                pass
+        Returns:
+            Counts: chunks, reused, embedded, deleted; plus `rows`, the new version's
+            chunks (List[ChunkRow]) in document order.
+        """
+        suffix = os.path.splitext(filename)[1].lower()
+        new_docs = self.load_and_split_file(file_path, suffix)
+        vs = self._get_vector_store()
+        in_place = new_key == old_key
+        existing = vs.get(filter={"file_id": old_key}, include_embeddings=not in_place)
+
+        by_hash: Dict[str, List[int]] = {}
+        for i, (text, meta) in enumerate(zip(existing["documents"], existing["metadatas"])):
+            h = (meta or {}).get("chunk_hash") or chunk_hash(text or "")
+            by_hash.setdefault(h, []).append(i)
+
+        # Positions in new_docs; reused pairs them with a row of `existing`.
+        to_embed: List[int] = []
+        reused: List[tuple] = []
+        for pos, doc in enumerate(new_docs):
+            h = chunk_hash(doc.page_content)
+            doc.metadata.update({"file_id": new_key, "filename": filename, "chunk_hash": h, "ordinal": pos})
+            matches = by_hash.get(h)
+            if matches:
+                reused.append((pos, matches.pop(0)))
+            else:
+                to_embed.append(pos)
+
+        vector_ids: List[Optional[str]] = [None] * len(new_docs)
+        stale: List[str] = []
+        if in_place:
+            stale = [existing["ids"][i] for rows in by_hash.values() for i in rows]
+            for pos, row in reused:
+                vector_ids[pos] = existing["ids"][row]
+        else:
+            embeddings = existing.get("embeddings")
+            if reused and embeddings is not None:
+                added = vs.add_embedded([new_docs[pos] for pos, _ in reused], [embeddings[row] for _, row in reused])
+                for (pos, _), vector_id in zip(reused, added):
+                    vector_ids[pos] = vector_id
+            else:
+                to_embed = sorted(to_embed + [pos for pos, _ in reused])
+                reused = []
+        if to_embed:
+            added = vs.add_documents([new_docs[pos] for pos in to_embed])
+            for pos, vector_id in zip(to_embed, added):
+                vector_ids[pos] = vector_id
+        if stale:
+            vs.delete_ids(stale)
+        vs.persist()
+        return {
+            "chunks": len(new_docs),
+            "reused": len(reused),
+            "embedded": len(to_embed),
+            "deleted": len(stale),
+            "rows": [self._chunk_row(vid, pos, doc) for pos, (vid, doc) in enumerate(zip(vector_ids, new_docs))],
+        }
 
     def search(self, query: str, filters: Optional[dict] = None, k: int = 4) -> List[Document]:
         """Similarity search in the vector store.
 
         Args:
             query: Query text.
-            filters: Optional Chroma filters.
+            filters: Optional Chroma-style filters.
             k: Top-k.
 
         Returns:
@@ -216,38 +646,56 @@ class RagService:
         """
         return self._get_vector_store().similarity_search(query, k=k, filter=filters)
 
-    def get_db_stats(self) -> Dict[str, Any]:
-        """Get basic vector DB stats for debugging."""
+    def get_db_stats(self, include_sample: bool = False) -> Dict[str, Any]:
+        """Get vector store settings, plus its own count and a small sample when asked.
+
+        Chunk counts and sizes come from the SQL chunk table (see chunk_index_service);
+        include_sample queries the vector store itself, for debugging.
+        """
+        stats: Dict[str, Any] = {
+            "backend": RAG_VECTOR_BACKEND,
+            "collection": self.collection_name,
+            "embedding": self.embedding_config,
+        }
+        if not include_sample:
+            return stats
         try:
             vs = self._get_vector_store()
-            count = vs._collection.count()
-            peek_data = vs._collection.peek(limit=3)
-            return {
-                "total_count": count,
+            peek_data = vs.peek(limit=3)
+            stats.update({
+                "vector_count": vs.count(),
                 "sample_ids": peek_data.get("ids"),
                 "sample_metadatas": peek_data.get("metadatas"),
                 "sample_contents": [(c[:50] + "...") for c in (peek_data.get("documents") or [])],
-            }
+            })
         except Exception as exc:
-            return {"error": f"获取数据库状态失败: {str(exc)}"}
+            stats["error"] = f"获取数据库状态失败: {str(exc)}"
+        return stats
 
     def delete_docs(self, file_ids: List[str]) -> None:
+        """Delete every chunk of the given vector keys by a metadata filter, in RAG_DELETE_BATCH_SIZE batches."""
         if not file_ids:
             return
         vs = self._get_vector_store()
-        try:
-            vs._collection.delete(where={"file_id": {"$in": file_ids}})
-        except Exception:
-            for file_id in file_ids:
-                try:
-                    vs._collection.delete(where={"file_id": file_id})
-                except Exception:
-                    continue
-        if hasattr(vs, "persist"):
-            try:
-                vs.persist()
-            except Exception:
-                pass
+        for batch in batched(list(file_ids)):
+            vs.delete_by_file_ids(batch)
+        vs.persist()
+
+    def delete_vector_ids(self, ids: List[str]) -> None:
+        """Delete chunks by vector id (known from the SQL chunk table), in RAG_DELETE_BATCH_SIZE batches."""
+        if not ids:
+            return
+        vs = self._get_vector_store()
+        for batch in batched(list(ids)):
+            vs.delete_ids(batch)
+        vs.persist()
+
+    def compact(self, min_deleted_ratio: float = 0.0) -> Dict[str, Any]:
+        """Compact the active vector store; see VectorStore.compact."""
+        vs = self._get_vector_store()
+        stats = vs.compact(min_deleted_ratio)
+        vs.persist()
+        return {"collection": self.collection_name, **stats}
 
     def delete_doc(self, file_id: str) -> None:
         if not file_id:
@@ -0,0 +1,291 @@
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.models.sql_models import FileBlob, FileRecord
+from app.services.chunk_index_service import chunk_index_service
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.rag_service import (
+    RAG_COLLECTION_NAME,
+    VectorStore,
+    build_embeddings,
+    embedding_config_from_env,
+    rag_service,
+    read_active_collection,
+    write_active_collection,
+)
+
+load_dotenv()
+
+REINDEX_WORKERS = int(os.getenv("REINDEX_WORKERS", "4"))
+REINDEX_CHECKPOINT_SECONDS = float(os.getenv("REINDEX_CHECKPOINT_SECONDS", "5"))
+CHECKPOINT_FILE = "reindex_checkpoint.json"
+
+_logger = logging.getLogger(__name__)
+
+
+class IndexSource(NamedTuple):
+    """Stored file to rebuild one vector key from."""
+
+    path: str
+    filename: str
+    content_hash: Optional[str]
+
+
+class ReindexService:
+    """Rebuild the whole knowledge base into a shadow collection, then switch to it.
+
+    Used after changing EMBEDDING_MODEL / RAG_EMBEDDING_PROVIDER (or the splitter):
+    every vector key still referenced by a live FileRecord is re-parsed from its
+    stored file and embedded with the embedding model from the current environment
+    into a new collection, by a pool of workers. Progress is checkpointed to
+    PERSIST_DIRECTORY, so an interrupted run resumes where it stopped. The running
+    app keeps searching the old collection (with the old model, see
+    `rag_service._follow_active_collection`) until the active-collection pointer is
+    replaced atomically at the end. Files added, changed or deleted during the
+    rebuild are picked up by catch-up passes before and right after the switch.
+    After the switch the API writes into the same collection as the last catch-up
+    pass; the numpy backend serializes the two processes with a file lock (see
+    `NumpyVectorStore`). The old collection is kept for rollback unless `drop_old` is set.
+    """
+
+    def __init__(self, workers: int = REINDEX_WORKERS) -> None:
+        """Create the service.
+
+        Args:
+            workers: Parallel parse/embed workers.
+        """
+        self.workers = max(1, workers)
+
+    # ------------------------------------------------------------------ sources
+
+    def collect_sources(self, db: Session) -> Tuple[Dict[str, IndexSource], Dict[str, str]]:
+        """Map every live vector key to a stored file that can rebuild it.
+
+        Args:
+            db: SQLAlchemy session.
+
+        Returns:
+            (sources by vector key, {vector key: filename} for keys whose files are all missing).
+        """
+        blob_keys = dict(db.query(FileBlob.id, FileBlob.vector_key).all())
+        rows = (
+            db.query(FileRecord.id, FileRecord.filename, FileRecord.file_path,
+                     FileRecord.source_path, FileRecord.content_hash)
+            .filter(FileRecord.is_deleted == False)
+            .all()
+        )
+        sources: Dict[str, IndexSource] = {}
+        missing: Dict[str, str] = {}
+        for file_id, filename, file_path, source_path, content_hash in rows:
+            key = blob_keys.get(content_hash) or file_id
+            if key in sources:
+                continue
+            if source_path:
+                path = os.path.join(os.getenv("RAG_FILE_PATH") or "", source_path)
+            else:
+                try:
+                    path = knowledge_base_service.stored_file_path(file_id, filename, file_path)
+                except ValueError:
+                    path = ""
+            if path and os.path.isfile(path):
+                sources[key] = IndexSource(path, filename, content_hash)
+                missing.pop(key, None)
+            else:
+                missing[key] = filename
+        return sources, missing
+
+    # ------------------------------------------------------------------ checkpoint
+
+    def _checkpoint_path(self, persist_directory: str) -> str:
+        return os.path.join(persist_directory, CHECKPOINT_FILE)
+
+    def load_checkpoint(self, persist_directory: str) -> Optional[Dict[str, Any]]:
+        """Return the checkpoint of an unfinished run, if any."""
+        try:
+            with open(self._checkpoint_path(persist_directory), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def _save_checkpoint(self, persist_directory: str, checkpoint: Dict[str, Any]) -> None:
+        path = self._checkpoint_path(persist_directory)
+        checkpoint["updated_at"] = time.time()
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(checkpoint, f)
+        os.replace(path + ".tmp", path)
+
+    # ------------------------------------------------------------------ run
+
+    def run(
+        self,
+        session_factory: Callable[[], Session],
+        switch: bool = True,
+        allow_missing: bool = False,
+        drop_old: bool = False,
+        progress: Optional[Callable[[str, str, Optional[str]], None]] = None,
+    ) -> Dict[str, Any]:
+        """Rebuild into a shadow collection (resuming a checkpoint) and switch to it.
+
+        Args:
+            session_factory: Creates SQLAlchemy sessions for reading FileRecords.
+            switch: Switch the active collection when the rebuild is complete.
+            allow_missing: Switch even if some files are missing or failed to index
+                (their content will not be searchable in the new collection).
+            drop_old: Delete the previous collection after switching.
+            progress: Called as `progress(vector_key, "indexed" | "failed", error)`.
+
+        Returns:
+            Summary: collection, previous, indexed, failed, missing, switched.
+
+        Raises:
+            ValueError: If PERSIST_DIRECTORY is not configured.
+        """
+        persist_directory = os.getenv("PERSIST_DIRECTORY")
+        if not persist_directory:
+            raise ValueError("未配置 PERSIST_DIRECTORY，无法在影子集合中重建索引")
+        embedding = embedding_config_from_env()
+        active = read_active_collection(persist_directory) or {}
+        previous = active.get("collection") or RAG_COLLECTION_NAME
+
+        checkpoint = self.load_checkpoint(persist_directory)
+        if checkpoint and (checkpoint.get("embedding") != embedding or checkpoint.get("previous") != previous):
+            _logger.info("丢弃与当前配置不一致的重建进度: %s", checkpoint.get("collection"))
+            self._store(checkpoint["collection"], persist_directory, embedding).drop()
+            self._drop_rows(session_factory, checkpoint["collection"])
+            checkpoint = None
+        if checkpoint is None:
+            checkpoint = {
+                "collection": f"{RAG_COLLECTION_NAME}_{time.strftime('%Y%m%d%H%M%S')}",
+                "previous": previous,
+                "embedding": embedding,
+                "done": {},
+            }
+            self._save_checkpoint(persist_directory, checkpoint)
+
+        shadow = self._store(checkpoint["collection"], persist_directory, embedding)
+        failed: Dict[str, str] = {}
+        missing = self._catch_up(session_factory, shadow, checkpoint, persist_directory, failed, progress)
+
+        summary = {
+            "collection": checkpoint["collection"],
+            "previous": previous,
+            "indexed": len(checkpoint["done"]),
+            "failed": failed,
+            "missing": missing,
+            "switched": False,
+        }
+        if not switch or ((failed or missing) and not allow_missing):
+            return summary
+
+        shadow.persist()
+        write_active_collection(persist_directory, checkpoint["collection"], embedding)
+        # Uploads that landed in the old collection just before the switch.
+        self._catch_up(session_factory, shadow, checkpoint, persist_directory, failed, progress)
+        shadow.persist()
+        os.remove(self._checkpoint_path(persist_directory))
+        summary.update(indexed=len(checkpoint["done"]), switched=True)
+
+        if drop_old and previous != checkpoint["collection"]:
+            old_embedding = active.get("embedding") or embedding
+            self._store(previous, persist_directory, old_embedding).drop()
+            self._drop_rows(session_factory, previous)
+        return summary
+
+    def _drop_rows(self, session_factory: Callable[[], Session], collection: str) -> None:
+        db = session_factory()
+        try:
+            chunk_index_service.drop_collection(db, collection)
+            db.commit()
+        finally:
+            db.close()
+
+    def _store(self, collection: str, persist_directory: str, embedding: Dict[str, str]) -> VectorStore:
+        return rag_service._create_vector_store(collection, persist_directory, build_embeddings(embedding))
+
+    def _catch_up(
+        self,
+        session_factory: Callable[[], Session],
+        shadow: VectorStore,
+        checkpoint: Dict[str, Any],
+        persist_directory: str,
+        failed: Dict[str, str],
+        progress: Optional[Callable[[str, str, Optional[str]], None]],
+    ) -> Dict[str, str]:
+        """Index keys missing from the shadow until a pass finds nothing new; returns missing files."""
+        done: Dict[str, Optional[str]] = checkpoint["done"]
+        while True:
+            db = session_factory()
+            try:
+                sources, missing = self.collect_sources(db)
+
+                stale = [key for key in done if key not in sources]
+                stale += [key for key, src in sources.items() if key in done and done[key] != src.content_hash]
+                if stale:
+                    shadow.delete_by_file_ids(stale)
+                    chunk_index_service.delete_keys(db, stale, checkpoint["collection"])
+                    db.commit()
+                    for key in stale:
+                        done.pop(key, None)
+                    self._save_checkpoint(persist_directory, checkpoint)
+
+                todo = [key for key in sources if key not in done and key not in failed]
+                if not todo:
+                    return missing
+                self._index(db, todo, sources, shadow, checkpoint, persist_directory, failed, progress)
+            finally:
+                db.close()
+
+    def _index(
+        self,
+        db: Session,
+        keys: List[str],
+        sources: Dict[str, IndexSource],
+        shadow: VectorStore,
+        checkpoint: Dict[str, Any],
+        persist_directory: str,
+        failed: Dict[str, str],
+        progress: Optional[Callable[[str, str, Optional[str]], None]],
+    ) -> None:
+        def rebuild(key: str) -> List[Any]:
+            src = sources[key]
+            # A crash after indexing but before the checkpoint leaves rows behind: clear them first.
+            shadow.delete_by_file_ids([key])
+            return rag_service.index_file(src.path, src.filename, key, store=shadow)
+
+        last_saved = time.monotonic()
+        try:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="reindex") as pool:
+                futures = {pool.submit(rebuild, key): key for key in keys}
+                for future in as_completed(futures):
+                    key = futures[future]
+                    try:
+                        rows = future.result()
+                    except Exception as exc:
+                        failed[key] = str(exc)
+                        if progress:
+                            progress(key, "failed", str(exc))
+                        continue
+                    chunk_index_service.replace(db, key, rows, checkpoint["collection"])
+                    checkpoint["done"][key] = sources[key].content_hash
+                    if progress:
+                        progress(key, "indexed", None)
+                    if time.monotonic() - last_saved >= REINDEX_CHECKPOINT_SECONDS:
+                        shadow.persist()
+                        db.commit()
+                        self._save_checkpoint(persist_directory, checkpoint)
+                        last_saved = time.monotonic()
+        finally:
+            # Also reached on Ctrl-C, so the next run resumes from here.
+            shadow.persist()
+            db.commit()
+            self._save_checkpoint(persist_directory, checkpoint)
+
+
+reindex_service = ReindexService()
@@ -0,0 +1,241 @@
+import re
+from typing import Callable, Iterator, List, Optional, Tuple
+
+# Boundaries, strongest first: blank-line paragraph breaks, CJK / Latin sentence ends, single newlines.
+# The leading lookahead lets the engine reject most positions with one character-class test.
+_BOUNDARY_RE = re.compile(
+    r"(?=[\n。！？；….!?;])(?:"
+    r"(?P<para>\n[ \t\r]*\n\s*)"
+    r"|(?P<sent>[。！？；…]+[”’」』）】\"']*[ \t]*|[.!?;]+[\"')\]]*(?=\s|$)[ \t]*)"
+    r"|(?P<line>\n))"
+)
+# One match ~ one token: each CJK / kana / hangul char, each Latin word or number run, each symbol.
+_TOKEN_RE = re.compile(r"[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]|[A-Za-z0-9_]+|[^\sA-Za-z0-9_]")
+
+Span = Tuple[int, int, int]
+
+
+def estimate_tokens(text: str, start: int = 0, end: Optional[int] = None) -> int:
+    """Estimate the token count of text[start:end] without slicing it.
+
+    CJK characters count as one token each; Latin words count one token per
+    four characters (rounded up), which tracks BPE tokenizers closely enough
+    for chunk sizing.
+
+    Args:
+        text: Source text.
+        start: Start offset.
+        end: End offset, defaults to len(text).
+
+    Returns:
+        Estimated token count.
+    """
+    end = len(text) if end is None else end
+    total = 0
+    for m in _TOKEN_RE.finditer(text, start, end):
+        width = m.end() - m.start()
+        total += 1 if width == 1 else (width + 3) // 4
+    return total
+
+
+def tiktoken_counter(encoding_name: str = "cl100k_base") -> Callable[[str, int, int], int]:
+    """Build an exact counter backed by tiktoken (slices each segment once).
+
+    Args:
+        encoding_name: tiktoken encoding name.
+
+    Returns:
+        A counter with the same signature as estimate_tokens.
+    """
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(encoding_name)
+
+    def count(text: str, start: int = 0, end: Optional[int] = None) -> int:
+        return len(encoding.encode_ordinary(text[start:end]))
+
+    return count
+
+
+def truncate_to_tokens(
+    text: str,
+    max_tokens: int,
+    counter: Optional[Callable[[str, int, int], int]] = None,
+) -> Tuple[int, int]:
+    """Find the longest prefix of text that fits max_tokens, preferring a sentence end.
+
+    Scans lazily and stops as soon as the budget is exceeded, so truncating a
+    very long text costs roughly max_tokens worth of work.
+
+    Args:
+        text: Source text.
+        max_tokens: Token budget for the prefix.
+        counter: Token counter `(text, start, end) -> int`; defaults to estimate_tokens.
+
+    Returns:
+        (end_offset, tokens) of the kept prefix; end_offset is 0 when nothing fits.
+    """
+    counter = counter or estimate_tokens
+    if max_tokens <= 0 or not text:
+        return 0, 0
+    pos, used = 0, 0
+    for m in _BOUNDARY_RE.finditer(text):
+        end = m.end()
+        if end <= pos:
+            continue
+        cost = counter(text, pos, end)
+        if used + cost > max_tokens:
+            break
+        pos, used = end, used + cost
+    else:
+        cost = counter(text, pos, len(text))
+        if used + cost <= max_tokens:
+            return len(text), used + cost
+    if pos:
+        return pos, used
+    # The first sentence alone is over budget: cut at a token boundary.
+    for m in _TOKEN_RE.finditer(text):
+        width = m.end() - m.start()
+        cost = 1 if width == 1 else (width + 3) // 4
+        if used + cost > max_tokens:
+            break
+        pos, used = m.end(), used + cost
+    return pos, used
+
+
+class TokenAwareTextSplitter:
+    """Split text into token-budgeted chunks that end on paragraph or sentence boundaries.
+
+    The text is scanned once: boundary matches delimit segments, each segment is
+    token-counted once, and only offsets are kept until a chunk is emitted, so the
+    only string copies are the output chunks themselves. A chunk is closed at the
+    last paragraph break when that keeps it at least half full, otherwise at the
+    last sentence boundary; a single sentence longer than the budget is cut at
+    token boundaries.
+    """
+
+    def __init__(
+        self,
+        chunk_tokens: int = 512,
+        overlap_tokens: int = 0,
+        counter: Optional[Callable[[str, int, int], int]] = None,
+    ) -> None:
+        """Create a splitter.
+
+        Args:
+            chunk_tokens: Max tokens per chunk.
+            overlap_tokens: Max tokens of whole trailing sentences repeated at the
+                start of the next chunk; 0 disables overlap.
+            counter: Token counter `(text, start, end) -> int`; defaults to estimate_tokens.
+        """
+        if chunk_tokens <= 0:
+            raise ValueError("chunk_tokens 必须大于 0")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = max(0, min(overlap_tokens, chunk_tokens // 2))
+        self.counter = counter or estimate_tokens
+
+    def _segments(self, text: str) -> Iterator[Tuple[int, int, int, bool]]:
+        """Yield (start, end, tokens, is_paragraph_end) for each boundary-delimited segment."""
+        pos = 0
+        for m in _BOUNDARY_RE.finditer(text):
+            end = m.end()
+            if end > pos:
+                yield pos, end, self.counter(text, pos, end), m.lastgroup == "para"
+                pos = end
+        if pos < len(text):
+            yield pos, len(text), self.counter(text, pos, len(text)), True
+
+    def _hard_split(self, text: str, start: int, end: int) -> Iterator[Span]:
+        """Cut one oversized segment at token boundaries."""
+        piece_start, tokens = start, 0
+        for m in _TOKEN_RE.finditer(text, start, end):
+            width = m.end() - m.start()
+            cost = 1 if width == 1 else (width + 3) // 4
+            if tokens + cost > self.chunk_tokens and tokens:
+                yield piece_start, m.start(), tokens
+                piece_start, tokens = m.start(), 0
+            tokens += cost
+        if piece_start < end:
+            yield piece_start, end, tokens
+
+    @staticmethod
+    def _trim(text: str, start: int, end: int) -> Tuple[int, int]:
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        return start, end
+
+    def split_spans(self, text: str) -> List[Span]:
+        """Split text into (start, end, tokens) spans without copying it.
+
+        Args:
+            text: Raw text.
+
+        Returns:
+            Chunk spans in document order, whitespace-trimmed.
+        """
+        spans: List[Span] = []
+        if not text:
+            return spans
+
+        pending: List[Tuple[int, int, int, bool]] = []
+        pending_tokens = 0
+
+        def emit(segments: List[Tuple[int, int, int, bool]]) -> None:
+            start, end = self._trim(text, segments[0][0], segments[-1][1])
+            if end > start:
+                spans.append((start, end, sum(s[2] for s in segments)))
+
+        def cut() -> None:
+            nonlocal pending, pending_tokens
+            cut_at, acc = len(pending), 0
+            for i, seg in enumerate(pending[:-1]):
+                acc += seg[2]
+                if seg[3] and acc * 2 >= self.chunk_tokens:
+                    cut_at = i + 1
+            head, pending = pending[:cut_at], pending[cut_at:]
+            emit(head)
+            carried: List[Tuple[int, int, int, bool]] = []
+            carried_tokens = 0
+            for seg in reversed(head):
+                if carried_tokens + seg[2] > self.overlap_tokens:
+                    break
+                carried.insert(0, seg)
+                carried_tokens += seg[2]
+            pending = carried + pending
+            pending_tokens = sum(s[2] for s in pending)
+
+        for seg in self._segments(text):
+            if seg[2] > self.chunk_tokens:
+                if pending:
+                    emit(pending)
+                    pending, pending_tokens = [], 0
+                for start, end, tokens in self._hard_split(text, seg[0], seg[1]):
+                    start, end = self._trim(text, start, end)
+                    if end > start:
+                        spans.append((start, end, tokens))
+                continue
+            while pending and pending_tokens + seg[2] > self.chunk_tokens:
+                before = len(pending)
+                cut()
+                if len(pending) >= before:
+                    # Overlap alone cannot make room; drop it for this chunk.
+                    pending, pending_tokens = [], 0
+            pending.append(seg)
+            pending_tokens += seg[2]
+
+        if pending:
+            emit(pending)
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        """Split text into chunk strings.
+
+        Args:
+            text: Raw text.
+
+        Returns:
+            List of chunk strings.
+        """
+        return [text[start:end] for start, end, _ in self.split_spans(text)]
@@ -1,7 +1,15 @@
+import os
+
+from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import StrOutputParser
 from app.services.model_manager import model_manager
 
+load_dotenv()
+
+# 生成标题的最长等待时间（秒）；超时后调用方放弃标题，回复照常保存
+CHAT_TITLE_TIMEOUT_SECONDS = float(os.getenv("CHAT_TITLE_TIMEOUT_SECONDS", "10"))
+
 class TitleGenerator:
     def __init__(self):
         # 使用轻量级模型生成标题，速度快
@@ -0,0 +1,222 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from itertools import accumulate
+from typing import Iterable, List, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy import Row, and_, event, exists
+from sqlalchemy.orm import Session, aliased
+
+from app.models.sql_models import _PATH_ALPHABET, Message, TreeNode, split_tree_path
+
+load_dotenv()
+
+TREE_VERSION_CACHE_SIZE = int(os.getenv("TREE_VERSION_CACHE_SIZE", "10000"))
+# Commits in this process invalidate entries at once; other processes' changes show up after at most the TTL.
+# 0 = entries never expire, which is only safe with a single API process.
+TREE_VERSION_CACHE_TTL_SECONDS = float(os.getenv("TREE_VERSION_CACHE_TTL_SECONDS", "60"))
+
+
+def _subtree_bounds(path: str) -> Tuple[str, str]:
+    """Half-open range of the paths of a node and all its descendants.
+
+    Path segments never end in 'z' (see `tree_path_segment`), so bumping the last
+    character gives the first path after the subtree. Only [0-9a-z] is compared,
+    which orders the same under byte and locale collations.
+    """
+    last = path[-1]
+    return path, path[:-1] + _PATH_ALPHABET[_PATH_ALPHABET.index(last) + 1]
+
+
+# Columns returned for path queries: the node plus the message fields the history views need.
+_PATH_COLUMNS = (
+    TreeNode.id.label("node_id"), TreeNode.parent_id.label("parent_node_id"), TreeNode.depth,
+    Message.id, Message.role, Message.content, Message.created_at, Message.type,
+)
+# Columns returned for structural queries (no message content); rows can be passed back in as `node`.
+_NODE_COLUMNS = (TreeNode.id, TreeNode.conversation_id, TreeNode.parent_id, TreeNode.message_id,
+                 TreeNode.depth, TreeNode.path)
+
+
+class TreeService:
+    """Ancestry queries on the conversation tree via `TreeNode.path`.
+
+    Every node stores its materialized path (one sibling-ordinal segment per
+    level, assigned on insert), so a path to the root, a subtree, the siblings
+    and the leaves are each one query on an index: `(conversation_id, path)`
+    for ancestors and subtrees, `parent_id` for siblings and the leaf
+    anti-join. Results are plain column rows rather than ORM objects, since
+    a subtree can hold thousands of nodes. Nodes without a path (parent missing
+    when they were written) fall back to walking `parent_id` one level at a time.
+
+    It also caches `Conversation.tree_version` per conversation (with its owner),
+    so conditional GETs of an unchanged tree are answered without a query. Entries
+    are dropped when a session that changed the conversation commits, and expire
+    after `cache_ttl` so changes committed by other processes show up too.
+    """
+
+    def __init__(self, cache_size: int = TREE_VERSION_CACHE_SIZE,
+                 cache_ttl: float = TREE_VERSION_CACHE_TTL_SECONDS) -> None:
+        """Create the service.
+
+        Args:
+            cache_size: Conversations whose tree version is kept in memory (LRU).
+            cache_ttl: Seconds a cached version is trusted; 0 means until invalidated.
+        """
+        self.cache_size = max(0, cache_size)
+        self.cache_ttl = cache_ttl
+        self._versions: "OrderedDict[str, Tuple[Optional[str], int, float]]" = OrderedDict()
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    # ------------------------------------------------------------------ version cache
+
+    def cached_version(self, conversation_id: str, user_id: Optional[str]) -> Optional[int]:
+        """Return the cached tree version if the conversation is known to belong to `user_id`."""
+        with self._lock:
+            entry = self._versions.get(conversation_id)
+            if entry is None:
+                return None
+            owner, version, cached_at = entry
+            if self.cache_ttl and time.monotonic() - cached_at > self.cache_ttl:
+                del self._versions[conversation_id]
+                return None
+            self._versions.move_to_end(conversation_id)
+        return version if owner == user_id else None
+
+    def version_token(self) -> int:
+        """Take before reading a version from the database; pass to `remember_version`."""
+        return self._epoch
+
+    def remember_version(self, conversation_id: str, user_id: Optional[str], version: int, token: int) -> None:
+        """Cache a version read from the database, unless a commit invalidated anything since `token`."""
+        if not self.cache_size:
+            return
+        with self._lock:
+            if token != self._epoch:
+                return  # the value may predate a commit that already invalidated it
+            self._versions[conversation_id] = (user_id, version, time.monotonic())
+            self._versions.move_to_end(conversation_id)
+            while len(self._versions) > self.cache_size:
+                self._versions.popitem(last=False)
+
+    def forget_versions(self, conversation_ids: Optional[Iterable[str]] = None) -> None:
+        """Drop cached versions (all of them when no ids are given)."""
+        with self._lock:
+            self._epoch += 1
+            if conversation_ids is None:
+                self._versions.clear()
+            else:
+                for conversation_id in conversation_ids:
+                    self._versions.pop(conversation_id, None)
+
+    # ------------------------------------------------------------------ queries
+
+    def ancestors(self, db: Session, node: TreeNode, include_self: bool = True,
+                  limit: Optional[int] = None) -> List[Row]:
+        """Return the chain from the root down to `node`, joined with each node's message.
+
+        Args:
+            db: SQLAlchemy session.
+            node: Node to start from.
+            include_self: Include `node` itself as the last entry.
+            limit: Only the closest `limit` ancestors (before `node` itself).
+
+        Returns:
+            Rows (node_id, parent_node_id, depth, id, role, content, created_at, type),
+            root first; nodes whose message is gone are skipped.
+        """
+        if node.path is None:
+            return self._walk(db, node, include_self, limit)
+        ends = list(accumulate(len(segment) for segment in split_tree_path(node.path)))[:-1]
+        if limit is not None:
+            ends = ends[-limit:] if limit > 0 else []
+        prefixes = [node.path[:end] for end in ends]
+        if include_self:
+            prefixes.append(node.path)
+        if not prefixes:
+            return []
+        return (
+            db.query(*_PATH_COLUMNS)
+            .join(Message, Message.id == TreeNode.message_id)
+            .filter(TreeNode.conversation_id == node.conversation_id, TreeNode.path.in_(prefixes))
+            .order_by(TreeNode.depth)
+            .all()
+        )
+
+    def _walk(self, db: Session, node: TreeNode, include_self: bool, limit: Optional[int]) -> List[Row]:
+        chain: List[Row] = []
+        node_id: Optional[str] = node.id if include_self else node.parent_id
+        steps = 0
+        while node_id and (limit is None or steps < limit + (1 if include_self else 0)):
+            node_row = db.query(TreeNode.parent_id).filter(TreeNode.id == node_id).first()
+            if node_row is None:
+                break
+            row = (
+                db.query(*_PATH_COLUMNS)
+                .join(Message, Message.id == TreeNode.message_id)
+                .filter(TreeNode.id == node_id)
+                .first()
+            )
+            if row is not None:
+                chain.append(row)
+            node_id = node_row.parent_id
+            steps += 1
+        chain.reverse()
+        return chain
+
+    def subtree(self, db: Session, node: TreeNode, include_self: bool = True) -> List[Row]:
+        """Return `node` and all its descendants in depth-first (path) order.
+
+        Returns:
+            Rows (id, conversation_id, parent_id, message_id, depth, path).
+        """
+        if node.path is None:
+            return db.query(*_NODE_COLUMNS).filter(TreeNode.id == node.id).all() if include_self else []
+        low, high = _subtree_bounds(node.path)
+        query = db.query(*_NODE_COLUMNS).filter(
+            TreeNode.conversation_id == node.conversation_id, TreeNode.path >= low, TreeNode.path < high,
+        )
+        if not include_self:
+            query = query.filter(TreeNode.id != node.id)
+        return query.order_by(TreeNode.path).all()
+
+    def siblings(self, db: Session, node: TreeNode, include_self: bool = False) -> List[Row]:
+        """Return the other children of `node`'s parent (or the other roots), oldest branch first."""
+        if node.parent_id:
+            query = db.query(*_NODE_COLUMNS).filter(TreeNode.parent_id == node.parent_id)
+        else:
+            query = db.query(*_NODE_COLUMNS).filter(TreeNode.conversation_id == node.conversation_id,
+                                                    TreeNode.parent_id.is_(None))
+        if not include_self:
+            query = query.filter(TreeNode.id != node.id)
+        return query.order_by(TreeNode.path, TreeNode.created_at).all()
+
+    def leaves(self, db: Session, conversation_id: str, under: Optional[TreeNode] = None) -> List[Row]:
+        """Return the nodes without children, optionally only inside `under`'s subtree."""
+        child = aliased(TreeNode)
+        query = db.query(*_NODE_COLUMNS).filter(
+            TreeNode.conversation_id == conversation_id,
+            ~exists().where(child.parent_id == TreeNode.id),
+        )
+        if under is not None and under.path is not None:
+            low, high = _subtree_bounds(under.path)
+            query = query.filter(and_(TreeNode.path >= low, TreeNode.path < high))
+        return query.order_by(TreeNode.path).all()
+
+
+tree_service = TreeService()
+
+
+@event.listens_for(Session, "after_commit")
+def _forget_committed_versions(session):
+    changed = session.info.pop("tree_changed", None)
+    if changed:
+        tree_service.forget_versions(changed)
+
+
+@event.listens_for(Session, "after_soft_rollback")
+def _drop_rolled_back_versions(session, previous_transaction):
+    session.info.pop("tree_changed", None)
@@ -0,0 +1,393 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+
+from app.services.knowledge_base_service import UPLOAD_READ_CHUNK_BYTES, knowledge_base_service, safe_filename
+
+load_dotenv()
+
+UPLOAD_STAGING_PATH = os.getenv("UPLOAD_STAGING_PATH", "./upload_staging")
+UPLOAD_SESSION_CHUNK_BYTES = int(os.getenv("UPLOAD_SESSION_CHUNK_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_SESSION_MAX_BYTES = int(os.getenv("UPLOAD_SESSION_MAX_BYTES", str(1024 * 1024 * 1024)))
+UPLOAD_SESSION_TTL_SECONDS = int(os.getenv("UPLOAD_SESSION_TTL_SECONDS", str(24 * 3600)))
+# A session still `processing` after this long lost its ingest (e.g. the process died mid-ingest).
+UPLOAD_SESSION_PROCESSING_TIMEOUT_SECONDS = int(os.getenv("UPLOAD_SESSION_PROCESSING_TIMEOUT_SECONDS", str(6 * 3600)))
+
+_STATE_FILE = "state.json"
+_DATA_FILE = "data.part"
+# ZIP archives staged by /upload/bulk; the leading dot keeps it from being taken for a session id.
+_BULK_DIR = ".bulk"
+
+
+class UploadSessionConflict(Exception):
+    """Raised when a chunk does not start at the session's committed offset."""
+
+    def __init__(self, message: str, offset: int) -> None:
+        super().__init__(message)
+        self.offset = offset
+
+
+class UploadSessionService:
+    """Resumable chunked uploads staged on disk.
+
+    A session is a directory under UPLOAD_STAGING_PATH holding `state.json`
+    (metadata, committed offset, per-chunk sha256) and `data.part` (bytes received
+    so far). Chunks are appended strictly in order, so after a dropped connection
+    the client asks for the committed offset and resumes from there; a chunk is
+    only committed after its checksum (if sent) matches. Completing a session moves
+    `data.part` to its stored path and hands it to
+    `knowledge_base_service.ingest_stored_file`, the same path `/upload` uses.
+    Sessions idle longer than UPLOAD_SESSION_TTL_SECONDS are garbage-collected;
+    a session stuck in `processing` past UPLOAD_SESSION_PROCESSING_TIMEOUT_SECONDS
+    is marked failed first. Bulk-upload ZIP archives are staged apart from the
+    sessions, in `.bulk/`, and collected after the same TTL.
+    """
+
+    def __init__(self, staging_dir: str = UPLOAD_STAGING_PATH) -> None:
+        """Create the service.
+
+        Args:
+            staging_dir: Directory holding one sub-directory per session.
+        """
+        self.staging_dir = staging_dir
+        self._lock = threading.Lock()
+        self._busy: set = set()
+        # Running (bytes hashed, sha256) per session, valid while bytes hashed equals the offset.
+        self._digests: Dict[str, Tuple[int, Any]] = {}
+
+    # ------------------------------------------------------------------ state
+
+    def _dir(self, session_id: str) -> str:
+        if not session_id or os.sep in session_id or "/" in session_id or session_id.startswith("."):
+            raise LookupError("上传会话不存在")
+        return os.path.join(self.staging_dir, session_id)
+
+    def _save(self, state: Dict[str, Any]) -> None:
+        state["updated_at"] = time.time()
+        path = os.path.join(self._dir(state["id"]), _STATE_FILE)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def get(self, session_id: str, user_id: Optional[str] = None) -> Dict[str, Any]:
+        """Load a session's state.
+
+        Args:
+            session_id: Session id.
+            user_id: If given, the session must belong to this user.
+
+        Returns:
+            The session state dict.
+
+        Raises:
+            LookupError: If the session does not exist or belongs to someone else.
+        """
+        path = os.path.join(self._dir(session_id), _STATE_FILE)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (FileNotFoundError, NotADirectoryError, json.JSONDecodeError):
+            raise LookupError("上传会话不存在")
+        if user_id is not None and state.get("user_id") != user_id:
+            raise LookupError("上传会话不存在")
+        return state
+
+    def _claim(self, session_id: str) -> None:
+        with self._lock:
+            if session_id in self._busy:
+                raise UploadSessionConflict("该上传会话正在处理其他请求", -1)
+            self._busy.add(session_id)
+
+    def _release(self, session_id: str) -> None:
+        with self._lock:
+            self._busy.discard(session_id)
+
+    def bulk_archive_path(self, job_id: str, index: int) -> str:
+        """Return the staging path for the `index`-th ZIP archive of a bulk upload job."""
+        directory = os.path.join(self.staging_dir, _BULK_DIR)
+        os.makedirs(directory, exist_ok=True)
+        return os.path.join(directory, f"bulk-{job_id}-{index}.zip")
+
+    # ------------------------------------------------------------------ protocol
+
+    def create(self, user_id: str, filename: str, size: int, sha256: Optional[str] = None) -> Dict[str, Any]:
+        """Open a new upload session.
+
+        Args:
+            user_id: Owner id.
+            filename: Original filename.
+            size: Total size in bytes.
+            sha256: Optional expected sha256 of the whole file, checked on completion.
+
+        Returns:
+            The new session state.
+
+        Raises:
+            ValueError: If size is out of range or filename is not a plain file name
+                (it is later joined under RAG_FILE_PATH by `complete`).
+        """
+        safe_filename(filename)
+        if size <= 0 or size > UPLOAD_SESSION_MAX_BYTES:
+            raise ValueError(f"文件大小需在 1 ~ {UPLOAD_SESSION_MAX_BYTES} 字节之间")
+        self.gc()
+        session_id = uuid.uuid4().hex
+        os.makedirs(self._dir(session_id), exist_ok=True)
+        open(os.path.join(self._dir(session_id), _DATA_FILE), "wb").close()
+        now = time.time()
+        state = {
+            "id": session_id,
+            "user_id": user_id,
+            "filename": filename,
+            "size": int(size),
+            "sha256": (sha256 or "").lower() or None,
+            "offset": 0,
+            "chunk_size": UPLOAD_SESSION_CHUNK_BYTES,
+            "chunks": [],
+            "status": "uploading",
+            "file_id": None,
+            "error": None,
+            "created_at": now,
+        }
+        self._save(state)
+        self._digests[session_id] = (0, hashlib.sha256())
+        return state
+
+    def write_chunk(
+        self,
+        session_id: str,
+        user_id: str,
+        start: int,
+        data: bytes,
+        total: Optional[int] = None,
+        chunk_sha256: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Append one byte range to a session.
+
+        A range that was already committed completely is accepted as a no-op, so a
+        client that lost the response of a successful PUT can simply retry it.
+
+        Args:
+            session_id: Session id.
+            user_id: Caller id (must own the session).
+            start: Offset of the first byte of data.
+            data: Chunk bytes.
+            total: Total size from Content-Range, checked against the session.
+            chunk_sha256: Optional sha256 of data.
+
+        Returns:
+            The updated session state.
+
+        Raises:
+            LookupError: Unknown session.
+            ValueError: Bad range, oversized chunk or checksum mismatch.
+            UploadSessionConflict: start is not the committed offset.
+        """
+        self._claim(session_id)
+        try:
+            state = self.get(session_id, user_id)
+            if state["status"] != "uploading":
+                raise UploadSessionConflict("上传会话已完成，不能继续写入", state["offset"])
+            if total is not None and total != state["size"]:
+                raise ValueError("Content-Range 中的总大小与会话不一致")
+            if len(data) > UPLOAD_SESSION_CHUNK_BYTES:
+                raise ValueError(f"单个分片不能超过 {UPLOAD_SESSION_CHUNK_BYTES} 字节")
+            end = start + len(data)
+            if end > state["size"]:
+                raise ValueError("分片超出文件大小")
+            if start != state["offset"]:
+                if end <= state["offset"]:
+                    return state
+                raise UploadSessionConflict("分片起始位置与已接收偏移不一致", state["offset"])
+            if chunk_sha256 and hashlib.sha256(data).hexdigest() != chunk_sha256.lower():
+                raise ValueError("分片校验失败 (sha256 不一致)")
+
+            data_path = os.path.join(self._dir(session_id), _DATA_FILE)
+            with open(data_path, "r+b") as f:
+                f.seek(start)
+                f.write(data)
+                f.truncate()
+                f.flush()
+                os.fsync(f.fileno())
+
+            hashed, digest = self._digests.pop(session_id, (-1, None))
+            if digest is not None and hashed == start:
+                digest.update(data)
+                self._digests[session_id] = (end, digest)
+
+            state["offset"] = end
+            state["chunks"].append({"start": start, "end": end, "sha256": chunk_sha256})
+            self._save(state)
+            return state
+        finally:
+            self._release(session_id)
+
+    def _full_sha256(self, session_id: str, data_path: str, size: int) -> str:
+        hashed, digest = self._digests.pop(session_id, (-1, None))
+        if digest is not None and hashed == size:
+            return digest.hexdigest()
+        # Process restarted mid-upload: hash the staged file once.
+        digest = hashlib.sha256()
+        with open(data_path, "rb") as f:
+            for block in iter(lambda: f.read(UPLOAD_READ_CHUNK_BYTES), b""):
+                digest.update(block)
+        return digest.hexdigest()
+
+    def complete(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        """Verify a fully uploaded session and move its data to the stored file path.
+
+        The (possibly slow) parse/embed step is run separately by `ingest`.
+
+        Args:
+            session_id: Session id.
+            user_id: Caller id (must own the session).
+
+        Returns:
+            The session state with status `processing` and the assigned file_id.
+
+        Raises:
+            LookupError: Unknown session.
+            ValueError: Incomplete upload or whole-file checksum mismatch.
+            UploadSessionConflict: Session is not in the uploading state.
+        """
+        self._claim(session_id)
+        try:
+            state = self.get(session_id, user_id)
+            if state["status"] != "uploading":
+                raise UploadSessionConflict("上传会话已完成", state["offset"])
+            if state["offset"] != state["size"]:
+                raise ValueError(f"文件尚未上传完整: {state['offset']}/{state['size']}")
+
+            data_path = os.path.join(self._dir(session_id), _DATA_FILE)
+            content_hash = self._full_sha256(session_id, data_path, state["size"])
+            if state["sha256"] and state["sha256"] != content_hash:
+                raise ValueError("文件校验失败 (sha256 不一致)，请重新上传")
+
+            file_id = str(uuid.uuid4())
+            final_path = knowledge_base_service.stored_file_path(file_id, state["filename"])
+            os.makedirs(os.path.dirname(final_path) or ".", exist_ok=True)
+            shutil.move(data_path, final_path)
+
+            state.update({"status": "processing", "file_id": file_id, "content_hash": content_hash})
+            self._save(state)
+            return state
+        finally:
+            self._release(session_id)
+
+    def ingest(self, session_id: str, session_factory: Callable[[], Session]) -> Dict[str, Any]:
+        """Index a completed session's file and record the outcome in its state.
+
+        Args:
+            session_id: Session id in `processing` state.
+            session_factory: Creates the SQLAlchemy session used for ingestion.
+
+        Returns:
+            Final session state (`done` or `failed`).
+        """
+        state = self.get(session_id)
+        final_path = knowledge_base_service.stored_file_path(state["file_id"], state["filename"])
+        db = session_factory()
+        try:
+            _, reused = knowledge_base_service.ingest_stored_file(
+                db, final_path, state["filename"], state["user_id"], state["file_id"],
+                state["content_hash"], state["size"],
+            )
+            state.update({"status": "done", "reused": reused})
+        except Exception as exc:
+            try:
+                os.remove(final_path)
+            except OSError:
+                pass
+            state.update({"status": "failed", "error": str(exc)})
+        finally:
+            db.close()
+        self._save(state)
+        return state
+
+    def abort(self, session_id: str, user_id: str) -> None:
+        """Delete an unfinished session and its staged bytes.
+
+        Raises:
+            LookupError: Unknown session.
+            UploadSessionConflict: The session is already being ingested, or a chunk
+                write or completion on it is still running.
+        """
+        self._claim(session_id)
+        try:
+            state = self.get(session_id, user_id)
+            if state["status"] == "processing":
+                raise UploadSessionConflict("文件正在入库，不能取消", state["offset"])
+            self._digests.pop(session_id, None)
+            shutil.rmtree(self._dir(session_id), ignore_errors=True)
+        finally:
+            self._release(session_id)
+
+    def gc(self, now: Optional[float] = None) -> int:
+        """Remove sessions idle for longer than UPLOAD_SESSION_TTL_SECONDS.
+
+        Sessions still being ingested are kept, unless they have been `processing`
+        for longer than UPLOAD_SESSION_PROCESSING_TIMEOUT_SECONDS: their ingest
+        died with its process, so they are marked failed (and removed once idle
+        past the TTL). The moved file has no FileRecord and is left to the purge
+        service's orphan sweep. Staged bulk archives older than the TTL belong to a
+        job that died and are deleted too, as are stray files next to the sessions.
+
+        Args:
+            now: Current epoch seconds (for tests).
+
+        Returns:
+            Number of sessions removed.
+        """
+        if not os.path.isdir(self.staging_dir):
+            return 0
+        now = time.time() if now is None else now
+        self._gc_files(os.path.join(self.staging_dir, _BULK_DIR), now)
+        self._gc_files(self.staging_dir, now)
+        removed = 0
+        for session_id in os.listdir(self.staging_dir):
+            if session_id == _BULK_DIR or not os.path.isdir(os.path.join(self.staging_dir, session_id)):
+                continue
+            try:
+                state = self.get(session_id)
+                if state["status"] == "processing":
+                    if now - state["updated_at"] > UPLOAD_SESSION_PROCESSING_TIMEOUT_SECONDS:
+                        state.update({"status": "failed", "error": "入库中断，请重新上传"})
+                        self._save(state)
+                    continue
+                if now - state["updated_at"] <= UPLOAD_SESSION_TTL_SECONDS:
+                    continue
+            except LookupError:
+                # Half-created session without state: judge by directory mtime.
+                path = os.path.join(self.staging_dir, session_id)
+                try:
+                    if now - os.path.getmtime(path) <= UPLOAD_SESSION_TTL_SECONDS:
+                        continue
+                except OSError:
+                    continue
+            self._digests.pop(session_id, None)
+            shutil.rmtree(os.path.join(self.staging_dir, session_id), ignore_errors=True)
+            removed += 1
+        return removed
+
+    def _gc_files(self, directory: str, now: float) -> None:
+        """Delete plain files in `directory` not modified within UPLOAD_SESSION_TTL_SECONDS."""
+        try:
+            entries = list(os.scandir(directory))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if entry.is_file() and now - entry.stat().st_mtime > UPLOAD_SESSION_TTL_SECONDS:
+                    os.remove(entry.path)
+            except OSError:
+                continue
+
+
+upload_session_service = UploadSessionService()
@@ -0,0 +1,87 @@
+import logging
+import os
+import threading
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.services.rag_service import rag_service
+
+load_dotenv()
+
+RAG_COMPACT_INTERVAL_HOURS = float(os.getenv("RAG_COMPACT_INTERVAL_HOURS", "0"))
+RAG_COMPACT_MIN_DELETED_RATIO = float(os.getenv("RAG_COMPACT_MIN_DELETED_RATIO", "0.2"))
+
+_logger = logging.getLogger(__name__)
+
+
+class VectorCompactionService:
+    """Reclaim the space deleted vectors keep in the active vector store.
+
+    Deletes only tombstone rows (NumPy backend) or free SQLite pages (Chroma), so
+    after large knowledge-base clears the index keeps its size on disk and in
+    memory. `run` compacts once (used by `python -m app.cli.compact`); `start`
+    repeats it every RAG_COMPACT_INTERVAL_HOURS in a background thread. The NumPy
+    rewrite holds the store lock, so searches wait for it; run it offline or at a
+    quiet hour on large indexes.
+    """
+
+    def __init__(
+        self,
+        interval_hours: float = RAG_COMPACT_INTERVAL_HOURS,
+        min_deleted_ratio: float = RAG_COMPACT_MIN_DELETED_RATIO,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            interval_hours: Hours between scheduled runs; 0 disables the schedule.
+            min_deleted_ratio: Scheduled runs skip a NumPy index with fewer deleted rows.
+        """
+        self.interval_hours = interval_hours
+        self.min_deleted_ratio = min_deleted_ratio
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def run(self, min_deleted_ratio: float = 0.0) -> Dict[str, Any]:
+        """Compact the active collection now.
+
+        Args:
+            min_deleted_ratio: Skip unless at least this share of rows is deleted.
+
+        Returns:
+            Collection name plus removed rows, bytes before/after and reclaimed bytes.
+        """
+        stats = rag_service.compact(min_deleted_ratio)
+        _logger.info(
+            "向量库压缩 %s: 清理 %s 行, 回收 %s 字节",
+            stats["collection"], stats["removed"], stats["reclaimed_bytes"],
+        )
+        return stats
+
+    def start(self) -> bool:
+        """Start the scheduled compaction thread; returns False if it is disabled."""
+        if self.interval_hours <= 0:
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="vector-compaction", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Ask the compaction thread to exit and wait for it."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval_hours * 3600):
+            try:
+                self.run(self.min_deleted_ratio)
+            except Exception:
+                _logger.exception("向量库压缩失败")
+
+
+vector_compaction_service = VectorCompactionService()
@@ -0,0 +1,104 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+QUANTIZATION_MODES = ("none", "float16", "int8")
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """L2-normalize rows (or a single vector) so dot product equals cosine similarity."""
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32, copy=False)
+
+
+class VectorCodec:
+    """Compresses normalized embeddings for the scan path of the NumPy index.
+
+    Two independent knobs:
+    - `truncate_dim`: keep only the leading dimensions and re-normalize
+      (works best with Matryoshka-style embedding models).
+    - `quantization`: `none` (float32), `float16`, or `int8` with a symmetric
+      per-row scale, i.e. `vector ~= codes * scale`.
+
+    Scores from the codec are approximate; callers rerank the best candidates
+    against full-precision vectors when those are kept.
+    """
+
+    def __init__(self, dim: int, quantization: str = "none", truncate_dim: int = 0) -> None:
+        """Create a codec.
+
+        Args:
+            dim: Dimension of the full embeddings.
+            quantization: One of QUANTIZATION_MODES.
+            truncate_dim: Leading dimensions to keep; 0 or >= dim keeps all.
+
+        Raises:
+            ValueError: If quantization is unknown.
+        """
+        if quantization not in QUANTIZATION_MODES:
+            raise ValueError(f"不支持的量化方式: {quantization}（可选 {', '.join(QUANTIZATION_MODES)}）")
+        self.dim = int(dim)
+        self.quantization = quantization
+        self.search_dim = int(truncate_dim) if 0 < int(truncate_dim) < self.dim else self.dim
+        self.dtype = {"none": np.float32, "float16": np.float16, "int8": np.int8}[quantization]
+
+    @property
+    def is_lossless(self) -> bool:
+        return self.quantization == "none" and self.search_dim == self.dim
+
+    @property
+    def has_scales(self) -> bool:
+        return self.quantization == "int8"
+
+    def bytes_per_vector(self) -> int:
+        """Bytes scanned per vector on the search path (codes plus scale)."""
+        return self.search_dim * np.dtype(self.dtype).itemsize + (4 if self.has_scales else 0)
+
+    def project(self, full: np.ndarray) -> np.ndarray:
+        """Truncate normalized vectors to the search dimension and re-normalize."""
+        if self.search_dim == self.dim:
+            return full
+        return normalize_rows(full[..., : self.search_dim])
+
+    def encode(self, full: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        """Encode normalized float32 rows.
+
+        Args:
+            full: `[n, dim]` normalized embeddings.
+
+        Returns:
+            `(codes, scales)`; scales is None unless quantization is int8.
+        """
+        projected = self.project(full)
+        if self.quantization == "int8":
+            scales = np.abs(projected).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            codes = np.clip(np.rint(projected / scales[:, None]), -127, 127).astype(np.int8)
+            return codes, scales.astype(np.float32)
+        return projected.astype(self.dtype), None
+
+    def decode(self, codes: np.ndarray, scales: Optional[np.ndarray]) -> np.ndarray:
+        """Decode codes back to approximate float32 search-space vectors."""
+        decoded = np.asarray(codes, dtype=np.float32)
+        if scales is not None:
+            decoded = decoded * np.asarray(scales, dtype=np.float32)[:, None]
+        return decoded
+
+    def scores(self, codes: np.ndarray, scales: Optional[np.ndarray], query: np.ndarray) -> np.ndarray:
+        """Approximate cosine scores of a projected query against encoded rows.
+
+        Args:
+            codes: `[n, search_dim]` encoded rows.
+            scales: Per-row scales for int8, else None.
+            query: Query already passed through `project`.
+
+        Returns:
+            `[n]` float32 scores.
+        """
+        if self.quantization == "none":
+            return np.asarray(codes @ query, dtype=np.float32)
+        scores = np.asarray(codes, dtype=np.float32) @ query
+        if scales is not None:
+            scores *= np.asarray(scales, dtype=np.float32)
+        return scores
@@ -0,0 +1,117 @@
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from dotenv import load_dotenv
+
+from app.services.rag_service import rag_service
+
+load_dotenv()
+
+RAG_WARMUP_ENABLED = os.getenv("RAG_WARMUP_ENABLED", "false").lower() == "true"
+RAG_WARMUP_QUERY = os.getenv("RAG_WARMUP_QUERY", "warm up")
+RAG_WARMUP_RETRY_SECONDS = float(os.getenv("RAG_WARMUP_RETRY_SECONDS", "30"))
+
+_logger = logging.getLogger(__name__)
+
+
+class RagWarmupService:
+    """Open the vector store and the embedding client before the first request.
+
+    RagService opens the store lazily, so without this the first chat or upload
+    after a deploy pays for loading the collection, the embedding client's first
+    connection and paging in the index. `start` does that work in a background
+    thread: open the store and count it, embed a probe query, then run one
+    similarity search to touch the index. A failed step (e.g. the embedding
+    server is not up yet) is retried every RAG_WARMUP_RETRY_SECONDS. `state`
+    backs the readiness endpoint, which reports 503 until the warm-up succeeded;
+    a failure is reported there by exception class only, the details are logged.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RAG_WARMUP_ENABLED,
+        query: str = RAG_WARMUP_QUERY,
+        retry_seconds: float = RAG_WARMUP_RETRY_SECONDS,
+    ) -> None:
+        """Create the service.
+
+        Args:
+            enabled: Whether readiness waits for the warm-up.
+            query: Probe text embedded and searched.
+            retry_seconds: Delay before retrying a failed warm-up; 0 disables retries.
+        """
+        self.enabled = enabled
+        self.query = query
+        self.retry_seconds = retry_seconds
+        self._state: Dict[str, Any] = {"status": "idle", "attempts": 0, "timings": {}, "error": None}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def ready(self) -> bool:
+        """True once a warm-up succeeded, or when warm-up is disabled."""
+        return not self.enabled or self._state["status"] == "ready"
+
+    def state(self) -> Dict[str, Any]:
+        """Return a copy of the warm-up state for the health endpoint."""
+        return {**self._state, "enabled": self.enabled, "timings": dict(self._state["timings"])}
+
+    def run(self) -> Dict[str, Any]:
+        """Warm up synchronously; returns the state (status `ready` or `failed`)."""
+        self._state.update(status="warming", error=None)
+        self._state["attempts"] += 1
+        timings: Dict[str, float] = {}
+        started = time.perf_counter()
+        try:
+            step = time.perf_counter()
+            store = rag_service.vector_store
+            vectors = store.count()
+            timings["open_store"] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            rag_service.embeddings.embed_query(self.query)
+            timings["embedding"] = time.perf_counter() - step
+
+            step = time.perf_counter()
+            if vectors:
+                store.similarity_search(self.query, k=1)
+            timings["probe_search"] = time.perf_counter() - step
+        except Exception as exc:
+            # Only the exception class is kept: the state is served by the unauthenticated
+            # readiness endpoint, and client messages can carry endpoint URLs or keys.
+            self._state.update(status="failed", error=type(exc).__name__, timings=timings)
+            _logger.warning("RAG 预热失败: %s", exc, exc_info=True)
+            return self.state()
+        timings["total"] = time.perf_counter() - started
+        self._state.update(status="ready", timings=timings, vector_count=vectors)
+        _logger.info("RAG 预热完成: %.2fs, %s 条向量", timings["total"], vectors)
+        return self.state()
+
+    def start(self) -> bool:
+        """Start the background warm-up; returns False if it is disabled."""
+        if not self.enabled:
+            return False
+        if self._thread is not None and self._thread.is_alive():
+            return True
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="rag-warmup", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop retrying and wait for the warm-up thread."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _loop(self) -> None:
+        while self.run()["status"] != "ready" and self.retry_seconds > 0:
+            if self._stop.wait(self.retry_seconds):
+                return
+
+
+rag_warmup_service = RagWarmupService()
@@ -0,0 +1,210 @@
+"""Load test: SSE chat streams and history polling in one API process.
+
+Starts the chat + history routers under uvicorn on a temporary SQLite file,
+with the LLM replaced by a fake model that emits one token every --token-ms.
+Concurrent clients then:
+- stream /api/chat turns (the real endpoint: user message, history and
+  instruction queries, AI message, title check) and record the gap between
+  consecutive tokens, and
+- poll /api/conversations and /api/conversations/{id}/messages and record the
+  request latency.
+Every request authenticates through the real `get_current_user` (X-Device-ID).
+
+Modes:
+- threadpool  the code as shipped: sync endpoints / dependencies run in the
+              threadpool, the chat stream sends its queries through asyncio.to_thread
+- inline      every one of those calls runs on the event loop thread, which is
+              what the previous `async def` endpoints did
+
+--query-ms adds a sleep to every SQL statement to stand in for a slower disk
+or a writer holding the SQLite lock.
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_event_loop --streams 10 --pollers 10 --seconds 10
+    python -m benchmarks.bench_event_loop --mode inline --query-ms 2
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableGenerator
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+import app.api.endpoints.chat as chat_module
+import app.services.chat_services as chat_services_module
+from app.api.endpoints import chat as chat_router, history as history_router
+from app.db.session import create_app_engine, get_db
+from app.models.sql_models import Base, Conversation, User
+from app.services.chat_services import chat_service
+from app.services.title_generator import title_generator
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] * 1000
+
+
+def _patch(mode: str, tokens: int, token_ms: float) -> None:
+    async def fake_tokens(inputs):
+        async for _ in inputs:
+            pass
+        for i in range(tokens):
+            await asyncio.sleep(token_ms / 1000)
+            yield AIMessageChunk(content=f"t{i} ")
+
+    async def fake_title(message: str, answer: str) -> str:
+        return "bench"
+
+    chat_service.get_model = lambda model_name: RunnableGenerator(fake_tokens)
+    title_generator.generate_title = fake_title
+    if mode == "inline":
+        async def inline(fn, *args, **kwargs):
+            return fn(*args, **kwargs)
+
+        class _InlineAsyncio:
+            def __getattr__(self, name):
+                return inline if name == "to_thread" else getattr(asyncio, name)
+
+        import fastapi.dependencies.utils as fastapi_deps
+        import fastapi.routing as fastapi_routing
+
+        chat_module.asyncio = _InlineAsyncio()
+        chat_services_module.asyncio = _InlineAsyncio()
+        fastapi_routing.run_in_threadpool = inline
+        fastapi_deps.run_in_threadpool = inline
+
+
+def _serve(db_path: str, port: int, query_ms: float) -> uvicorn.Server:
+    engine = create_app_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    if query_ms:
+        @event.listens_for(engine, "before_cursor_execute")
+        def _slow(conn, cursor, statement, parameters, context, executemany):
+            time.sleep(query_ms / 1000)
+
+    application = FastAPI()
+    application.include_router(chat_router.router, prefix="/api")
+    application.include_router(history_router.router, prefix="/api")
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    application.dependency_overrides[get_db] = override_get_db
+    with factory() as db:
+        db.add(User(id="bench", username="bench", hashed_password="", device_id="bench-device", is_anonymous=True))
+        db.add(Conversation(id="bench", user_id="bench", title="bench"))
+        db.commit()
+
+    server = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _load(port: int, streams: int, pollers: int, seconds: float) -> Dict[str, float]:
+    base = f"http://127.0.0.1:{port}/api"
+    headers = {"X-Device-ID": "bench-device"}
+    deadline = time.perf_counter() + seconds
+    gaps: List[float] = []
+    polls: List[float] = []
+    turns = [0]
+    timeouts = [0]
+
+    async def streamer(client: httpx.AsyncClient) -> None:
+        parent = None
+        while time.perf_counter() < deadline:
+            payload = {"message": "hello", "conversation_id": "bench", "parent_id": parent}
+            try:
+                async with client.stream("POST", f"{base}/chat", json=payload, headers=headers) as r:
+                    last = None
+                    async for line in r.aiter_lines():
+                        if not line.startswith("data: {"):
+                            continue
+                        data = json.loads(line[6:])
+                        if "content" in data:
+                            now = time.perf_counter()
+                            if last is not None:
+                                gaps.append(now - last)
+                            last = now
+                        elif "ai_node_id" in data:
+                            parent = data["ai_node_id"]
+            except httpx.TimeoutException:
+                timeouts[0] += 1
+                continue
+            turns[0] += 1
+
+    async def poller(client: httpx.AsyncClient, index: int) -> None:
+        urls = [f"{base}/conversations", f"{base}/conversations/bench/messages?limit=50"]
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                (await client.get(urls[index % 2], headers=headers)).raise_for_status()
+            except httpx.TimeoutException:
+                timeouts[0] += 1
+                continue
+            polls.append(time.perf_counter() - started)
+
+    limits = httpx.Limits(max_connections=streams + pollers + 4)
+    async with httpx.AsyncClient(timeout=30, limits=limits) as client:
+        await asyncio.gather(*[streamer(client) for _ in range(streams)],
+                             *[poller(client, i) for i in range(pollers)])
+    return {
+        "turns_per_s": turns[0] / seconds,
+        "gap_p50": statistics.median(gaps) * 1000 if gaps else 0.0,
+        "gap_p99": _percentile(gaps, 0.99),
+        "gap_max": max(gaps, default=0.0) * 1000,
+        "poll_p50": statistics.median(polls) * 1000 if polls else 0.0,
+        "poll_p99": _percentile(polls, 0.99),
+        "timeouts": timeouts[0],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["threadpool", "inline"], default="threadpool")
+    parser.add_argument("--streams", type=int, default=10)
+    parser.add_argument("--pollers", type=int, default=10)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per fake AI reply")
+    parser.add_argument("--token-ms", type=float, default=50.0)
+    parser.add_argument("--query-ms", type=float, default=0.0, help="extra latency per SQL statement")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    _patch(args.mode, args.tokens, args.token_ms)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = _serve(os.path.join(tmp, "bench.db"), args.port, args.query_ms)
+        try:
+            r = asyncio.run(_load(args.port, args.streams, args.pollers, args.seconds))
+        finally:
+            server.should_exit = True
+            time.sleep(0.5)
+    print(f"mode={args.mode} streams={args.streams} pollers={args.pollers} token={args.token_ms:.0f}ms "
+          f"query+{args.query_ms:g}ms")
+    print(f"turns/s {r['turns_per_s']:.1f}  token gap p50 {r['gap_p50']:.1f} ms  p99 {r['gap_p99']:.1f} ms  "
+          f"max {r['gap_max']:.1f} ms  |  poll p50 {r['poll_p50']:.1f} ms  p99 {r['poll_p99']:.1f} ms  "
+          f"|  timeouts {r['timeouts']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,225 @@
+"""Load test: a login storm next to SSE chat streams, at a fixed CPU budget.
+
+Starts the auth + chat routers under uvicorn on a temporary SQLite file (the
+LLM replaced by a fake model that emits one token every --token-ms) and pins
+the process, and every worker process it spawns, to --cpus. Concurrent
+clients then:
+- POST /api/auth/login in a loop with valid credentials and record logins/s,
+  login latency and 503 (queue full) responses, and
+- stream /api/chat turns and record the gap between consecutive tokens.
+
+Modes:
+- legacy  bcrypt the way the previous sync endpoint ran it: on the request
+          thread pool, with verify_password hashing the password once more
+          before verifying (two bcrypt operations per login), unbounded
+- pool    the code as shipped: bcrypt in the password_hasher process pool
+          (--workers processes, --queue-limit waiting calls, --nice)
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_login_storm --cpus 0 --logins 32 --streams 10 --seconds 10
+    python -m benchmarks.bench_login_storm --mode legacy --cpus 0,1
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+import httpx
+import uvicorn
+from fastapi import FastAPI
+from langchain_core.messages import AIMessageChunk
+from langchain_core.runnables import RunnableGenerator
+from sqlalchemy.orm import sessionmaker
+from starlette.concurrency import run_in_threadpool
+
+from app.api.endpoints import auth as auth_router, chat as chat_router
+from app.core.security import get_password_hash, verify_password
+from app.db.session import create_app_engine, get_db
+from app.models.sql_models import Base, Conversation, User
+from app.services.chat_services import chat_service
+from app.services.password_hasher import PasswordHasher
+from app.services.title_generator import title_generator
+
+PASSWORD = "hunter2"
+
+
+class LegacyHasher:
+    """The previous login path: bcrypt on the request thread pool, hashing once more before verifying."""
+
+    @staticmethod
+    def _verify(password: str, hashed_password: str) -> bool:
+        get_password_hash(password)  # the removed `print(pwd_context.hash(...))`
+        return verify_password(password, hashed_password)
+
+    async def verify(self, password: str, hashed_password: str) -> bool:
+        return await run_in_threadpool(self._verify, password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await run_in_threadpool(get_password_hash, password)
+
+    def shutdown(self) -> None:
+        pass
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] * 1000
+
+
+def _patch(tokens: int, token_ms: float) -> None:
+    async def fake_tokens(inputs):
+        async for _ in inputs:
+            pass
+        for i in range(tokens):
+            await asyncio.sleep(token_ms / 1000)
+            yield AIMessageChunk(content=f"t{i} ")
+
+    async def fake_title(message: str, answer: str) -> str:
+        return "bench"
+
+    chat_service.get_model = lambda model_name: RunnableGenerator(fake_tokens)
+    title_generator.generate_title = fake_title
+
+
+def _serve(db_path: str, port: int, users: int) -> uvicorn.Server:
+    engine = create_app_engine(f"sqlite:///{db_path}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    application = FastAPI()
+    application.include_router(auth_router.router, prefix="/api/auth")
+    application.include_router(chat_router.router, prefix="/api")
+
+    def override_get_db():
+        db = factory()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    application.dependency_overrides[get_db] = override_get_db
+    hashed = get_password_hash(PASSWORD)
+    with factory() as db:
+        db.add_all([User(id=f"u{i}", username=f"u{i}", hashed_password=hashed, is_anonymous=False)
+                    for i in range(users)])
+        db.add(User(id="bench", username="bench", hashed_password="", device_id="bench-device", is_anonymous=True))
+        db.add(Conversation(id="bench", user_id="bench", title="bench"))
+        db.commit()
+
+    server = uvicorn.Server(uvicorn.Config(application, host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+async def _load(port: int, logins: int, streams: int, users: int, seconds: float) -> Dict[str, float]:
+    base = f"http://127.0.0.1:{port}/api"
+    deadline = time.perf_counter() + seconds
+    gaps: List[float] = []
+    login_times: List[float] = []
+    rejected = [0]
+    turns = [0]
+
+    async def login_client(client: httpx.AsyncClient, index: int) -> None:
+        payload = {"username": f"u{index % users}", "password": PASSWORD}
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            r = await client.post(f"{base}/auth/login", json=payload)
+            if r.status_code == 503:
+                rejected[0] += 1
+                await asyncio.sleep(float(r.headers.get("Retry-After", "1")))
+                continue
+            r.raise_for_status()
+            login_times.append(time.perf_counter() - started)
+
+    async def streamer(client: httpx.AsyncClient) -> None:
+        parent = None
+        while time.perf_counter() < deadline:
+            payload = {"message": "hello", "conversation_id": "bench", "parent_id": parent}
+            async with client.stream("POST", f"{base}/chat", json=payload,
+                                     headers={"X-Device-ID": "bench-device"}) as r:
+                last = None
+                async for line in r.aiter_lines():
+                    if not line.startswith("data: {"):
+                        continue
+                    data = json.loads(line[6:])
+                    if "content" in data:
+                        now = time.perf_counter()
+                        if last is not None:
+                            gaps.append(now - last)
+                        last = now
+                    elif "ai_node_id" in data:
+                        parent = data["ai_node_id"]
+            turns[0] += 1
+
+    limits = httpx.Limits(max_connections=logins + streams + 4)
+    started = time.perf_counter()
+    async with httpx.AsyncClient(timeout=120, limits=limits) as client:
+        await asyncio.gather(*[login_client(client, i) for i in range(logins)],
+                             *[streamer(client) for _ in range(streams)])
+    # requests in flight at the deadline still finish; rates use the real elapsed time
+    elapsed = time.perf_counter() - started
+    return {
+        "logins_per_s": len(login_times) / elapsed,
+        "login_p50": statistics.median(login_times) * 1000 if login_times else 0.0,
+        "login_p99": _percentile(login_times, 0.99),
+        "rejected": rejected[0],
+        "turns_per_s": turns[0] / elapsed,
+        "gap_p50": statistics.median(gaps) * 1000 if gaps else 0.0,
+        "gap_p99": _percentile(gaps, 0.99),
+        "gap_max": max(gaps, default=0.0) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mode", choices=["pool", "legacy"], default="pool")
+    parser.add_argument("--cpus", help="comma-separated CPU ids to pin to (default: current affinity)")
+    parser.add_argument("--logins", type=int, default=32, help="concurrent login clients")
+    parser.add_argument("--streams", type=int, default=10, help="concurrent chat streams")
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--workers", type=int, default=2, help="bcrypt processes (pool mode)")
+    parser.add_argument("--queue-limit", type=int, default=32, help="waiting bcrypt calls (pool mode)")
+    parser.add_argument("--nice", type=int, default=5, help="worker niceness increment (pool mode)")
+    parser.add_argument("--tokens", type=int, default=50, help="tokens per fake AI reply")
+    parser.add_argument("--token-ms", type=float, default=50.0)
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    if args.cpus:
+        os.sched_setaffinity(0, {int(cpu) for cpu in args.cpus.split(",")})
+    cpus = sorted(os.sched_getaffinity(0))
+    hashed_cost = get_password_hash(PASSWORD).split("$")[2]
+    _patch(args.tokens, args.token_ms)
+    hasher = LegacyHasher() if args.mode == "legacy" else \
+        PasswordHasher(workers=args.workers, queue_limit=args.queue_limit, nice=args.nice)
+    auth_router.password_hasher = hasher
+    if isinstance(hasher, PasswordHasher):
+        hasher.start(wait=True)
+    with tempfile.TemporaryDirectory() as tmp:
+        server = _serve(os.path.join(tmp, "bench.db"), args.port, args.users)
+        try:
+            r = asyncio.run(_load(args.port, args.logins, args.streams, args.users, args.seconds))
+        finally:
+            server.should_exit = True
+            hasher.shutdown()
+            time.sleep(0.5)
+    pool = "" if args.mode == "legacy" else f" workers={args.workers} queue={args.queue_limit} nice={args.nice}"
+    print(f"mode={args.mode}{pool} cpus={','.join(map(str, cpus))} bcrypt cost={hashed_cost} "
+          f"logins={args.logins} streams={args.streams} token={args.token_ms:.0f}ms")
+    print(f"logins/s {r['logins_per_s']:.1f}  login p50 {r['login_p50']:.0f} ms  p99 {r['login_p99']:.0f} ms  "
+          f"503s {r['rejected']}  |  turns/s {r['turns_per_s']:.2f}  token gap p50 {r['gap_p50']:.1f} ms  "
+          f"p99 {r['gap_p99']:.1f} ms  max {r['gap_max']:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
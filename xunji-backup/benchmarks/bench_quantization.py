@@ -0,0 +1,98 @@
+"""Benchmark: recall vs memory for quantized / truncated NumPy index settings.
+
+Builds a synthetic clustered corpus and compares every combination of
+RAG_NUMPY_QUANTIZATION x RAG_NUMPY_TRUNCATE_DIM x RAG_NUMPY_RERANK_FACTOR
+against exact float32 search:
+- recall@k
+- bytes scanned per query (the resident working set of the index)
+- bytes of full-precision vectors kept on disk for rerank
+- query latency p50/p95
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_quantization --docs 50000 --dim 768 --truncate 256,384
+"""
+
+import argparse
+import statistics
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.numpy_vector_store import NumpyVectorStore
+from benchmarks.bench_vector_backends import TableEmbeddings, percentile
+
+
+def build_corpus(n_docs: int, dim: int, n_queries: int, seed: int = 0):
+    """Clustered vectors with a decaying spectrum, so leading dimensions carry most signal."""
+    rng = np.random.default_rng(seed)
+    decay = np.exp(-np.arange(dim) / (dim / 4)).astype(np.float32)
+    centers = rng.normal(size=(max(n_docs // 100, 16), dim)).astype(np.float32) * decay
+    labels = rng.integers(0, centers.shape[0], size=n_docs + n_queries)
+    noise = 0.5 * rng.normal(size=(n_docs + n_queries, dim)).astype(np.float32) * decay
+    vectors = centers[labels] + noise
+    table = {f"chunk-{i}": vectors[i] for i in range(n_docs)}
+    queries = [f"query-{i}" for i in range(n_queries)]
+    for i, q in enumerate(queries):
+        table[q] = vectors[n_docs + i]
+    docs = [Document(page_content=f"chunk-{i}", metadata={"file_id": f"file-{i % 100}"}) for i in range(n_docs)]
+    return TableEmbeddings(table), docs, queries
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=50000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--truncate", default="0,256,384", help="comma separated truncate dims, 0 = full")
+    parser.add_argument("--rerank", default="0,4", help="comma separated rerank factors")
+    args = parser.parse_args()
+
+    embeddings, docs, queries = build_corpus(args.docs, args.dim, args.queries)
+    exact = NumpyVectorStore(directory=None, embedding_function=embeddings)
+    exact.add_documents(docs)
+    truth = {q: {d.page_content for d in exact.similarity_search(q, k=args.k)} for q in queries}
+
+    truncates = [int(t) for t in args.truncate.split(",") if t.strip()]
+    reranks = [int(r) for r in args.rerank.split(",") if r.strip()]
+    rows: List[Dict] = []
+    for quantization in ("none", "float16", "int8"):
+        for truncate in truncates:
+            for rerank in reranks:
+                if quantization == "none" and truncate == 0 and rerank:
+                    continue
+                store = NumpyVectorStore(
+                    directory=None,
+                    embedding_function=embeddings,
+                    quantization=quantization,
+                    truncate_dim=truncate,
+                    rerank_factor=rerank,
+                )
+                store.add_documents(docs)
+                latencies, hits = [], 0
+                for q in queries:
+                    start = time.perf_counter()
+                    got = store.similarity_search(q, k=args.k)
+                    latencies.append((time.perf_counter() - start) * 1000)
+                    hits += len({d.page_content for d in got} & truth[q])
+                stats = store.memory_stats()
+                rows.append({
+                    "setting": f"{quantization}/dim={truncate or args.dim}/rerank={rerank}",
+                    "recall": hits / (len(queries) * args.k),
+                    "scan_mb": stats["scan_bytes"] / 1024 / 1024,
+                    "full_mb": stats["full_bytes"] / 1024 / 1024,
+                    "p50": statistics.median(latencies),
+                    "p95": percentile(latencies, 0.95),
+                })
+
+    print(f"docs={args.docs} dim={args.dim} k={args.k} (baseline float32 = {args.docs * args.dim * 4 / 1024 / 1024:.1f} MB)")
+    print(f"{'setting':<32} {'recall':>7} {'scan MB':>8} {'full MB':>8} {'p50 ms':>7} {'p95 ms':>7}")
+    for r in sorted(rows, key=lambda r: r["scan_mb"]):
+        print(f"{r['setting']:<32} {r['recall']:>7.3f} {r['scan_mb']:>8.1f} {r['full_mb']:>8.1f} "
+              f"{r['p50']:>7.2f} {r['p95']:>7.2f}")
+
+
+if __name__ == "__main__":
+    main()
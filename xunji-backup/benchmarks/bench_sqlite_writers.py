@@ -0,0 +1,151 @@
+"""Benchmark: concurrent chat writers on SQLite, legacy engine vs the production profile.
+
+Each writer thread runs chat turns against its own conversation the way /chat
+does: commit the user message + tree node, read the last 20 history messages,
+commit the AI message + tree node. Reader threads page the conversation list
+and load message histories at the same time. Reports per profile:
+- chat turns per second and turn latency (p50 / p95 / p99)
+- reader requests per second and latency
+- "database is locked" errors
+
+Profiles:
+- legacy      rollback journal, default pragmas, QueuePool(20 + 30 overflow) with pre-ping
+- production  `create_app_engine`: WAL, synchronous=NORMAL, busy_timeout, mmap,
+              cache_size, temp_store=MEMORY, QueuePool(SQLITE_POOL_SIZE) without pre-ping
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_sqlite_writers --writers 16 --readers 8 --seconds 10
+    python -m benchmarks.bench_sqlite_writers --profile production --dir /data/tmp
+"""
+
+import argparse
+import os
+import statistics
+import tempfile
+import threading
+import time
+import uuid
+from typing import Dict, List
+
+from sqlalchemy import create_engine
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.db.session import create_app_engine
+from app.models.sql_models import Base, Conversation, Message, TreeNode, User
+from app.services.tree_service import tree_service
+
+
+def legacy_engine(url: str) -> Engine:
+    """The engine db/session.py built before the SQLite profile."""
+    return create_engine(url, connect_args={"check_same_thread": False}, pool_size=20, max_overflow=30,
+                         pool_timeout=60, pool_recycle=3600, pool_pre_ping=True)
+
+
+def _percentile(samples: List[float], pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct))] * 1000
+
+
+def run(engine: Engine, writers: int, readers: int, seconds: float) -> Dict[str, float]:
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with factory() as db:
+        db.add(User(id="bench", username="bench", hashed_password="x"))
+        db.add_all([Conversation(id=f"c{i}", user_id="bench") for i in range(writers)])
+        db.commit()
+
+    stop = threading.Event()
+    lock = threading.Lock()
+    turns: List[float] = []
+    reads: List[float] = []
+    errors = [0]
+
+    def writer(index: int) -> None:
+        conversation_id, parent = f"c{index}", None
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with factory() as db:
+                    for role in ("user", "ai"):
+                        message_id, node_id = str(uuid.uuid4()), str(uuid.uuid4())
+                        db.add(Message(id=message_id, conversation_id=conversation_id, role=role, content="x" * 400))
+                        node = TreeNode(id=node_id, conversation_id=conversation_id, message_id=message_id,
+                                        parent_id=parent)
+                        db.add(node)
+                        db.commit()
+                        if role == "user":
+                            tree_service.ancestors(db, node, include_self=False, limit=20)
+                        parent = node_id
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                turns.append(time.perf_counter() - started)
+
+    def reader(index: int) -> None:
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with factory() as db:
+                    db.query(Conversation).filter(Conversation.user_id == "bench") \
+                        .order_by(Conversation.updated_at.desc()).limit(50).all()
+                    db.query(Message.id, Message.content) \
+                        .filter(Message.conversation_id == f"c{index % max(writers, 1)}") \
+                        .order_by(Message.created_at.desc()).limit(100).all()
+            except OperationalError:
+                with lock:
+                    errors[0] += 1
+                continue
+            with lock:
+                reads.append(time.perf_counter() - started)
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+    return {
+        "turns_per_s": len(turns) / seconds,
+        "turn_p50": _percentile(turns, 0.50),
+        "turn_p95": _percentile(turns, 0.95),
+        "turn_p99": _percentile(turns, 0.99),
+        "reads_per_s": len(reads) / seconds,
+        "read_p50": statistics.median(reads) * 1000 if reads else 0.0,
+        "read_p99": _percentile(reads, 0.99),
+        "errors": errors[0],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--writers", type=int, default=16)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--seconds", type=float, default=10.0)
+    parser.add_argument("--profile", choices=["legacy", "production", "both"], default="both")
+    parser.add_argument("--dir", help="directory for the temporary database files (default: system temp)")
+    args = parser.parse_args()
+
+    profiles = ["legacy", "production"] if args.profile == "both" else [args.profile]
+    print(f"{args.writers} writers, {args.readers} readers, {args.seconds:.0f}s per profile")
+    print(f"{'profile':<12}{'turns/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}"
+          f"{'reads/s':>9}{'rd p50':>9}{'rd p99':>9}{'locked':>8}")
+    for profile in profiles:
+        with tempfile.TemporaryDirectory(dir=args.dir) as tmp:
+            url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+            engine = legacy_engine(url) if profile == "legacy" else create_app_engine(url, sqlite_profile=True)
+            r = run(engine, args.writers, args.readers, args.seconds)
+        print(f"{profile:<12}{r['turns_per_s']:>9.1f}{r['turn_p50']:>9.1f}{r['turn_p95']:>9.1f}{r['turn_p99']:>9.1f}"
+              f"{r['reads_per_s']:>9.1f}{r['read_p50']:>9.1f}{r['read_p99']:>9.1f}{r['errors']:>8}")
+
+
+if __name__ == "__main__":
+    main()
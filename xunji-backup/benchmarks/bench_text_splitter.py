@@ -0,0 +1,98 @@
+"""Benchmark: token-aware splitter vs the legacy fixed-character splitter.
+
+Generates mixed Chinese / English prose (or reads --file) and reports per splitter:
+- chunks per MB of input
+- throughput (MB/s)
+- duplicated characters introduced by overlap
+- share of chunks that end on a sentence or paragraph boundary
+- estimated tokens per chunk (mean / max)
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_text_splitter --mb 8
+    python -m benchmarks.bench_text_splitter --file ../rag/some.md
+"""
+
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from app.services.rag_service import CHUNK_OVERLAP_CHARS, CHUNK_SIZE_CHARS, rag_service
+from app.services.text_splitter import TokenAwareTextSplitter, estimate_tokens
+
+_ENDINGS = ("。", "！", "？", "；", ".", "!", "?", "\n")
+
+
+def synthetic_text(megabytes: float, seed: int = 0) -> str:
+    rng = random.Random(seed)
+    zh = "知识库检索增强生成系统需要把长文档切分成合适的片段以便向量化和召回"
+    en = "retrieval augmented generation splits long documents into passages for embedding and recall".split()
+    parts: List[str] = []
+    size = 0
+    target = int(megabytes * 1024 * 1024)
+    while size < target:
+        paragraph = []
+        for _ in range(rng.randint(2, 6)):
+            if rng.random() < 0.6:
+                start = rng.randint(0, len(zh) - 10)
+                sentence = zh[start:start + rng.randint(8, len(zh) - start)] + rng.choice("。！？")
+            else:
+                sentence = " ".join(rng.choice(en) for _ in range(rng.randint(6, 20))).capitalize() + ". "
+            paragraph.append(sentence)
+        block = "".join(paragraph) + "\n\n"
+        parts.append(block)
+        size += len(block.encode("utf-8"))
+    return "".join(parts)
+
+
+def measure(name: str, split: Callable[[str], List[str]], text: str, repeat: int) -> Dict:
+    megabytes = len(text.encode("utf-8")) / 1024 / 1024
+    timings = []
+    chunks: List[str] = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        chunks = split(text)
+        timings.append(time.perf_counter() - start)
+    tokens = [estimate_tokens(c) for c in chunks]
+    return {
+        "splitter": name,
+        "chunks_per_mb": len(chunks) / megabytes,
+        "mb_per_s": megabytes / min(timings),
+        "dup_pct": max(sum(len(c) for c in chunks) - len(text.strip()), 0) / len(text) * 100,
+        "boundary_pct": sum(1 for c in chunks if c.rstrip(" ").endswith(_ENDINGS)) / max(len(chunks), 1) * 100,
+        "tokens_mean": statistics.mean(tokens) if tokens else 0,
+        "tokens_max": max(tokens) if tokens else 0,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--mb", type=float, default=4.0, help="size of generated text")
+    parser.add_argument("--file", help="benchmark a real UTF-8 text file instead")
+    parser.add_argument("--chunk-tokens", type=int, default=512)
+    parser.add_argument("--overlap-tokens", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.file:
+        with open(args.file, "r", encoding="utf-8", errors="replace") as f:
+            text = f.read()
+    else:
+        text = synthetic_text(args.mb)
+
+    splitter = TokenAwareTextSplitter(chunk_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens)
+    results = [
+        measure(f"chars {CHUNK_SIZE_CHARS}/{CHUNK_OVERLAP_CHARS}", rag_service._split_text_by_chars, text, args.repeat),
+        measure(f"token {args.chunk_tokens}/{args.overlap_tokens}", splitter.split_text, text, args.repeat),
+    ]
+
+    print(f"input: {len(text.encode('utf-8')) / 1024 / 1024:.2f} MB, {len(text)} chars")
+    print(f"{'splitter':<16} {'chunks/MB':>10} {'MB/s':>7} {'dup %':>6} {'boundary %':>11} {'tok mean':>9} {'tok max':>8}")
+    for r in results:
+        print(f"{r['splitter']:<16} {r['chunks_per_mb']:>10.1f} {r['mb_per_s']:>7.2f} {r['dup_pct']:>6.1f} "
+              f"{r['boundary_pct']:>11.1f} {r['tokens_mean']:>9.0f} {r['tokens_max']:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""Benchmark: conversation-tree queries via materialized path vs parent_id walks.
+
+Builds one branched conversation (a long main chain with regenerated/edited
+branches forking off random earlier nodes) in a SQLite database and reports the
+median latency of each query shape:
+- path      root -> deepest leaf (recursive CTE vs `tree_service.ancestors`)
+- history   last 20 ancestors of the deepest leaf (per-node loop vs one query)
+- subtree   all descendants of a node near the root (recursive CTE vs path range)
+- siblings  other branches at the busiest fork
+- leaves    all leaves of the conversation / of a subtree
+plus the insert rate with path assignment.
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_tree_queries --nodes 10000
+    python -m benchmarks.bench_tree_queries --nodes 10000 --branch 0.3 --db /tmp/tree.db
+"""
+
+import argparse
+import os
+import random
+import statistics
+import time
+from typing import Callable, Dict, List, Optional
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import Session, sessionmaker
+
+from app.models.sql_models import Base, Conversation, Message, TreeNode, User
+from app.services.tree_service import tree_service
+
+_PATH_CTE = text("""
+    WITH RECURSIVE path_cte AS (
+        SELECT t.id, t.parent_id, t.message_id, 0 AS level FROM tree_nodes t WHERE t.id = :target_id
+        UNION ALL
+        SELECT t.id, t.parent_id, t.message_id, pc.level + 1 FROM tree_nodes t JOIN path_cte pc ON t.id = pc.parent_id
+    )
+    SELECT pc.id, m.id, m.role, m.content FROM path_cte pc JOIN messages m ON pc.message_id = m.id
+    ORDER BY pc.level DESC
+""")
+
+_SUBTREE_CTE = text("""
+    WITH RECURSIVE sub AS (
+        SELECT id FROM tree_nodes WHERE id = :root_id
+        UNION ALL
+        SELECT t.id FROM tree_nodes t JOIN sub ON t.parent_id = sub.id
+    )
+    SELECT t.* FROM tree_nodes t JOIN sub ON t.id = sub.id
+""")
+
+_SUBTREE_LEAVES_CTE = text("""
+    WITH RECURSIVE sub AS (
+        SELECT id FROM tree_nodes WHERE id = :root_id
+        UNION ALL
+        SELECT t.id FROM tree_nodes t JOIN sub ON t.parent_id = sub.id
+    )
+    SELECT t.* FROM tree_nodes t JOIN sub ON t.id = sub.id
+    WHERE NOT EXISTS (SELECT 1 FROM tree_nodes c WHERE c.parent_id = t.id)
+""")
+
+
+def build(db: Session, nodes: int, branch: float, seed: int) -> Dict[str, Optional[str]]:
+    """Insert a branched conversation, two nodes (user + ai) per commit like /chat does."""
+    rng = random.Random(seed)
+    db.add(User(id="bench", username="bench", hashed_password="x"))
+    db.add(Conversation(id="bench", user_id="bench"))
+    db.commit()
+    parents: Dict[str, Optional[str]] = {}
+    tip: Optional[str] = None
+    ids: List[str] = []
+    for i in range(0, nodes, 2):
+        parent = rng.choice(ids) if ids and rng.random() < branch else tip
+        for j, role in enumerate(("user", "ai")):
+            if i + j >= nodes:
+                break
+            node_id = f"n{i + j}"
+            db.add(Message(id=f"m{i + j}", conversation_id="bench", role=role, content=f"{role} {i + j} " + "x" * 200))
+            db.add(TreeNode(id=node_id, conversation_id="bench", message_id=f"m{i + j}", parent_id=parent))
+            parents[node_id] = parent
+            ids.append(node_id)
+            parent = node_id
+        db.commit()
+        tip = parent if rng.random() > branch else tip or parent
+    return parents
+
+
+def legacy_history(db: Session, node_id: str, limit: int) -> List[Message]:
+    """The per-node loop `get_history_from_tree` used before the path column."""
+    node = db.query(TreeNode).filter(TreeNode.id == node_id).first()
+    out, curr_id, count = [], node.parent_id, 0
+    while curr_id and count < limit:
+        node = db.query(TreeNode).filter(TreeNode.id == curr_id).first()
+        msg = db.query(Message).filter(Message.id == node.message_id).first()
+        out.append(msg)
+        curr_id, count = node.parent_id, count + 1
+    return out[::-1]
+
+
+def timed(fn: Callable[[], object], repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return statistics.median(samples) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--nodes", type=int, default=10000)
+    parser.add_argument("--branch", type=float, default=0.1, help="share of turns forking off an earlier node")
+    parser.add_argument("--db", help="SQLite file to build the tree in (default: in memory)")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.db and os.path.exists(args.db):
+        os.remove(args.db)
+    engine = create_engine(f"sqlite:///{args.db}" if args.db else "sqlite://")
+    Base.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+
+    started = time.perf_counter()
+    parents = build(db, args.nodes, args.branch, args.seed)
+    insert_s = time.perf_counter() - started
+    db.execute(text("ANALYZE"))
+
+    children: Dict[Optional[str], List[str]] = {}
+    for node_id, parent in parents.items():
+        children.setdefault(parent, []).append(node_id)
+    deepest = max(db.query(TreeNode).all(), key=lambda n: n.depth)
+    near_root = db.get(TreeNode, next(n for n in parents if len(children.get(n, [])) > 1))
+    fork = max(children, key=lambda p: len(children[p]) if p else 0)
+    fork_child = db.get(TreeNode, children[fork][0])
+
+    print(f"{args.nodes} nodes, depth {deepest.depth}, {sum(1 for n in parents if n not in children)} leaves, "
+          f"{len(children[fork])} branches at the busiest fork; inserted at {args.nodes / insert_s:.0f} nodes/s")
+    rows = [
+        ("path", lambda: db.execute(_PATH_CTE, {"target_id": deepest.id}).all(),
+         lambda: tree_service.ancestors(db, deepest)),
+        ("history(20)", lambda: legacy_history(db, deepest.id, 20),
+         lambda: tree_service.ancestors(db, deepest, include_self=False, limit=20)),
+        ("subtree", lambda: db.execute(_SUBTREE_CTE, {"root_id": near_root.id}).all(),
+         lambda: tree_service.subtree(db, near_root)),
+        ("siblings", lambda: db.query(TreeNode).filter(TreeNode.parent_id == fork).all(),
+         lambda: tree_service.siblings(db, fork_child)),
+        ("leaves(subtree)", lambda: db.execute(_SUBTREE_LEAVES_CTE, {"root_id": near_root.id}).all(),
+         lambda: tree_service.leaves(db, "bench", under=near_root)),
+        ("leaves(all)", None, lambda: tree_service.leaves(db, "bench")),
+    ]
+    print(f"{'query':<16}{'walk / CTE ms':>15}{'path ms':>10}")
+    for name, legacy, indexed in rows:
+        legacy_ms = f"{timed(legacy, args.repeat):.2f}" if legacy else "-"
+        print(f"{name:<16}{legacy_ms:>15}{timed(indexed, args.repeat):>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
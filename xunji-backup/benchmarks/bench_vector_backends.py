@@ -0,0 +1,175 @@
+"""Benchmark: Chroma vs NumPy (exact / IVF) vector backends.
+
+Builds a synthetic clustered corpus with precomputed embeddings (no embedding
+service needed), then measures for each backend:
+- insert throughput
+- cold open time (re-open of the persisted store)
+- unfiltered and file_id-filtered query latency (p50/p95)
+- recall@k against exact search
+- on-disk size
+
+and prints the RAG_VECTOR_BACKEND it recommends for this corpus size.
+
+Usage (from xunji-backup/):
+    python -m benchmarks.bench_vector_backends --docs 20000 --dim 768 --files 200
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import ChromaVectorStore
+
+
+class TableEmbeddings:
+    """Looks embeddings up by text so every backend sees identical vectors."""
+
+    def __init__(self, table: Dict[str, np.ndarray]) -> None:
+        self.table = table
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self.table[t].tolist() for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.table[text].tolist()
+
+
+def build_corpus(n_docs: int, dim: int, n_files: int, n_queries: int, seed: int = 0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(max(n_docs // 50, 8), dim)).astype(np.float32)
+    labels = rng.integers(0, centers.shape[0], size=n_docs + n_queries)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(n_docs + n_queries, dim)).astype(np.float32)
+    table = {f"chunk-{i}": vectors[i] for i in range(n_docs)}
+    queries = [f"query-{i}" for i in range(n_queries)]
+    for i, q in enumerate(queries):
+        table[q] = vectors[n_docs + i]
+    docs = [
+        Document(page_content=f"chunk-{i}", metadata={"file_id": f"file-{i % n_files}", "filename": "bench.md"})
+        for i in range(n_docs)
+    ]
+    return TableEmbeddings(table), docs, queries
+
+
+def dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def timed_queries(store: Any, queries: List[str], k: int, filter_fn: Callable[[int], Any]) -> List[float]:
+    latencies = []
+    for i, q in enumerate(queries):
+        start = time.perf_counter()
+        store.similarity_search(q, k=k, filter=filter_fn(i))
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def percentile(values: List[float], pct: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(len(ordered) * pct), len(ordered) - 1)]
+
+
+def run_backend(name: str, factory: Callable[[str], Any], docs: List[Document], queries: List[str],
+                k: int, n_files: int, batch: int, truth: Dict[str, set]) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    try:
+        store = factory(workdir)
+        start = time.perf_counter()
+        for i in range(0, len(docs), batch):
+            store.add_documents(docs[i:i + batch])
+        insert_s = time.perf_counter() - start
+        del store
+
+        start = time.perf_counter()
+        store = factory(workdir)
+        store.count()
+        open_s = time.perf_counter() - start
+
+        unfiltered = timed_queries(store, queries, k, lambda i: None)
+        filtered = timed_queries(
+            store, queries, k, lambda i: {"file_id": {"$in": [f"file-{(i + j) % n_files}" for j in range(5)]}}
+        )
+        hits = 0
+        for q in queries:
+            got = {d.page_content for d in store.similarity_search(q, k=k)}
+            hits += len(got & truth[q])
+        return {
+            "backend": name,
+            "insert_docs_per_s": len(docs) / insert_s,
+            "open_ms": open_s * 1000,
+            "p50_ms": statistics.median(unfiltered),
+            "p95_ms": percentile(unfiltered, 0.95),
+            "filtered_p95_ms": percentile(filtered, 0.95),
+            "recall": hits / (len(queries) * k),
+            "disk_mb": dir_size(workdir) / 1024 / 1024,
+        }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--docs", type=int, default=20000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--files", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=4)
+    parser.add_argument("--batch", type=int, default=500)
+    parser.add_argument("--ivf-lists", type=int, default=0, help="0 = sqrt(docs)")
+    parser.add_argument("--min-recall", type=float, default=0.95)
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    embeddings, docs, queries = build_corpus(args.docs, args.dim, args.files, args.queries)
+    exact = NumpyVectorStore(directory=None, embedding_function=embeddings)
+    exact.add_documents(docs)
+    truth = {q: {d.page_content for d in exact.similarity_search(q, k=args.k)} for q in queries}
+    ivf_lists = args.ivf_lists or max(int(np.sqrt(args.docs)), 8)
+
+    backends: Dict[str, Callable[[str], Any]] = {
+        "numpy": lambda d: NumpyVectorStore(directory=d, embedding_function=embeddings),
+        "numpy-ivf": lambda d: NumpyVectorStore(
+            directory=d, embedding_function=embeddings, ivf_lists=ivf_lists, ivf_nprobe=max(ivf_lists // 8, 1)
+        ),
+    }
+    if not args.skip_chroma:
+        backends["chroma"] = lambda d: ChromaVectorStore(
+            collection_name="bench", embedding_function=embeddings, persist_directory=d
+        )
+
+    results = [
+        run_backend(name, factory, docs, queries, args.k, args.files, args.batch, truth)
+        for name, factory in backends.items()
+    ]
+
+    header = f"{'backend':<10} {'ins/s':>9} {'open ms':>9} {'p50 ms':>8} {'p95 ms':>8} {'flt p95':>8} {'recall':>7} {'disk MB':>8}"
+    print(f"docs={args.docs} dim={args.dim} files={args.files} k={args.k}")
+    print(header)
+    for r in results:
+        print(
+            f"{r['backend']:<10} {r['insert_docs_per_s']:>9.0f} {r['open_ms']:>9.1f} {r['p50_ms']:>8.2f} "
+            f"{r['p95_ms']:>8.2f} {r['filtered_p95_ms']:>8.2f} {r['recall']:>7.3f} {r['disk_mb']:>8.1f}"
+        )
+
+    eligible = [r for r in results if r["recall"] >= args.min_recall] or results
+    best = min(eligible, key=lambda r: (r["p95_ms"] + r["open_ms"] / max(args.queries, 1)))
+    if best["backend"] == "numpy-ivf":
+        print(f"\n推荐: RAG_VECTOR_BACKEND=numpy RAG_NUMPY_IVF_LISTS={ivf_lists} "
+              f"RAG_NUMPY_IVF_NPROBE={max(ivf_lists // 8, 1)}")
+    else:
+        print(f"\n推荐: RAG_VECTOR_BACKEND={best['backend']}")
+
+
+if __name__ == "__main__":
+    main()
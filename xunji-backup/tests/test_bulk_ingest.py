@@ -0,0 +1,147 @@
+import hashlib
+import io
+import os
+import zipfile
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.api.endpoints import upload as upload_router
+from app.models.sql_models import Base, FileBlob, FileRecord, User
+from app.services import bulk_ingest_service as bulk_mod
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+
+
+class HashEmbeddings:
+    def __init__(self):
+        self.calls = 0
+
+    def _embed(self, text):
+        vec = np.zeros(16, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture()
+def SessionLocal():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    seed = factory()
+    seed.add(User(id="u1", username="u1", hashed_password="x"))
+    seed.commit()
+    seed.close()
+    return factory
+
+
+@pytest.fixture()
+def store(monkeypatch, tmp_path):
+    monkeypatch.setenv("RAG_FILE_PATH", str(tmp_path / "rag_files"))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+    vector_store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    monkeypatch.setattr(rag_service, "_get_vector_store", lambda: vector_store)
+    return vector_store
+
+
+def _zip(entries):
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w") as archive:
+        for name, body in entries.items():
+            archive.writestr(name, body)
+    return buf.getvalue()
+
+
+def test_run_dedupes_batches_and_reports_every_file(SessionLocal, store, tmp_path):
+    shared = b"Alpha beta gamma. Delta epsilon zeta."
+    archive = tmp_path / "kb.zip"
+    archive.write_bytes(_zip({
+        "team/a.md": shared,
+        "team/nested/b.txt": b"Rocket engine fuel.",
+        "team/copy.md": shared,
+        "team/logo.png": b"\x89PNG",
+        "__MACOSX/team/._a.md": b"junk",
+    }))
+    seen = []
+    service = bulk_mod.BulkIngestService(workers=2, batch_size=2)
+
+    job = service.run(SessionLocal, "u1", bulk_mod.iter_zip_sources(str(archive)), progress=seen.append)
+
+    assert job["status"] == "done"
+    assert job["counts"] == {"indexed": 2, "reused": 1, "skipped": 1, "failed": 0}
+    assert sorted(r["filename"] for r in seen) == ["a.md", "b.txt", "copy.md", "logo.png"]
+    assert store.embedding_function.calls == 2
+
+    db = SessionLocal()
+    records = db.query(FileRecord).all()
+    blobs = {b.id: b.ref_count for b in db.query(FileBlob).all()}
+    db.close()
+    assert len(records) == 3 and all(r.user_id == "u1" for r in records)
+    assert blobs[hashlib.sha256(shared).hexdigest()] == 2
+    assert sorted(os.listdir(tmp_path / "rag_files")) == sorted(f"{r.id}__{r.filename}" for r in records)
+
+
+def test_failed_embedding_cleans_up_and_continues(SessionLocal, store, tmp_path, monkeypatch):
+    original = rag_service.index_file
+
+    def flaky(path, filename, file_id):
+        if filename == "bad.md":
+            raise RuntimeError("parse error")
+        return original(path, filename, file_id)
+
+    monkeypatch.setattr(rag_service, "index_file", flaky)
+    archive = tmp_path / "kb.zip"
+    archive.write_bytes(_zip({"bad.md": b"broken", "good.md": b"Fine words here."}))
+
+    job = bulk_mod.BulkIngestService(workers=2).run(SessionLocal, "u1", bulk_mod.iter_zip_sources(str(archive)))
+
+    assert job["counts"]["failed"] == 1 and job["counts"]["indexed"] == 1
+    db = SessionLocal()
+    assert [r.filename for r in db.query(FileRecord).all()] == ["good.md"]
+    db.close()
+    assert len(os.listdir(tmp_path / "rag_files")) == 1
+
+
+def test_bulk_endpoint_accepts_files_and_zip(SessionLocal, store, tmp_path, monkeypatch):
+    monkeypatch.setattr(upload_router, "SessionLocal", SessionLocal)
+    monkeypatch.setattr(upload_router.upload_session_service, "staging_dir", str(tmp_path / "staging"))
+    application = FastAPI()
+    application.include_router(upload_router.router, prefix="/api")
+
+    async def override_current_user():
+        return User(id="u1", username="u1", hashed_password="x")
+
+    application.dependency_overrides[get_current_user] = override_current_user
+    client = TestClient(application)
+
+    r = client.post("/api/upload/bulk", files=[
+        ("files", ("one.md", b"First document body.", "text/markdown")),
+        ("files", ("kb.zip", _zip({"two.md": b"Second one.", "three.txt": b"Third one."}), "application/zip")),
+    ])
+    assert r.status_code == 202
+
+    job = client.get(f"/api/upload/bulk/{r.json()['job_id']}").json()
+    assert job["status"] == "done"
+    assert job["counts"]["indexed"] == 3
+    assert os.listdir(tmp_path / "staging" / ".bulk") == []  # staged archive removed after the job
+    assert client.get("/api/upload/bulk/unknown").status_code == 404
+
+    bad = client.post("/api/upload/bulk", files=[("files", ("x.zip", b"not a zip", "application/zip"))])
+    assert bad.status_code == 400
+    assert os.listdir(tmp_path / "staging" / ".bulk") == []
+    assert len(os.listdir(tmp_path / "rag_files")) == 3
@@ -1,11 +1,12 @@
 import base64
 import json
 import asyncio
+import threading
 
 import pytest
 from fastapi import FastAPI
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
@@ -133,9 +134,9 @@ def test_chat_attachment_saved_after_ai(app, db_session, monkeypatch):
         async for s in chat_mod.chat_response_generator(
             request=request,
             db=db_session,
-            user_node=user_node,
-            user_message=user_message,
-            is_new_conversation=False,
+            user_node_id=user_node.id,
+            user_message_id=user_message.id,
+            should_generate_title=False,
         ):
             chunks.append(s)
         return "".join(chunks)
@@ -176,3 +177,108 @@ def test_history_returns_attachment_metadata_no_url(app, db_session):
     assert msgs[0]["attachments"][0]["filename"] == "x.png"
     assert msgs[0]["attachments"][0]["storage_key"] == "k1"
     assert "url" not in msgs[0]["attachments"][0]
+
+
+def test_chat_turn_commits_at_most_twice(app, engine, db_session, monkeypatch):
+    from app.api.endpoints import chat as chat_mod
+
+    async def fake_stream(*args, **kwargs):
+        yield "hi"
+
+    async def fake_title(user_query, ai_response):
+        return "标题"
+
+    monkeypatch.setattr(chat_mod.chat_service, "astream_chat_with_model", fake_stream)
+    monkeypatch.setattr(chat_mod.title_generator, "generate_title", fake_title)
+
+    commits = []
+    event.listen(engine, "commit", lambda conn: commits.append(1))
+    client = TestClient(app)
+
+    # 新会话：会话 + 用户消息一次提交，AI 回复 + 标题一次提交
+    body = client.post("/api/chat", json={"message": "hello"}).text
+    events = [json.loads(line[6:]) for line in body.splitlines() if line.startswith("data: {")]
+    conversation_id = events[0]["session_id"]
+    ai_node_id = next(e["ai_node_id"] for e in events if "ai_node_id" in e)
+    assert any(e.get("new_title") == "标题" for e in events)
+    assert len(commits) == 2
+
+    commits.clear()
+    client.post("/api/chat", json={"message": "again", "conversation_id": conversation_id, "parent_id": ai_node_id})
+    assert len(commits) == 2
+
+    db_session.expire_all()
+    assert db_session.get(Conversation, conversation_id).title == "标题"
+    assert db_session.query(Message).filter(Message.conversation_id == conversation_id).count() == 4
+    assert db_session.get(TreeNode, ai_node_id).parent_id == events[0]["user_node_id"]
+
+
+def test_hung_title_does_not_hold_back_the_reply(app, db_session, monkeypatch):
+    from app.api.endpoints import chat as chat_mod
+
+    async def fake_stream(*args, **kwargs):
+        yield "hi"
+
+    async def hung_title(user_query, ai_response):
+        await asyncio.sleep(3600)
+
+    monkeypatch.setattr(chat_mod.chat_service, "astream_chat_with_model", fake_stream)
+    monkeypatch.setattr(chat_mod.title_generator, "generate_title", hung_title)
+    monkeypatch.setattr(chat_mod, "CHAT_TITLE_TIMEOUT_SECONDS", 0.05)
+
+    # 标题超时：回复照常保存并推送，会话保留初始标题
+    body = TestClient(app).post("/api/chat", json={"message": "hello"}).text
+    events = [json.loads(line[6:]) for line in body.splitlines() if line.startswith("data: {")]
+    conversation_id = events[0]["session_id"]
+    ai_node_id = next(e["ai_node_id"] for e in events if "ai_node_id" in e)
+    assert not any("new_title" in e for e in events)
+    assert body.rstrip().endswith("data: [DONE]")
+
+    db_session.expire_all()
+    assert db_session.get(TreeNode, ai_node_id).message.content == "hi"
+    assert db_session.get(Conversation, conversation_id).title == "新对话"
+
+
+def test_reply_saved_after_disconnect_sticks_user_to_primary(db_session, monkeypatch):
+    from app.api.endpoints import chat as chat_mod
+    from app.db import session as session_module
+
+    async def fake_stream(*args, **kwargs):
+        yield "hi"
+
+    released = threading.Event()
+
+    def slow_save_chat_attachments(**kwargs):
+        released.wait(5)
+        return []
+
+    monkeypatch.setattr(chat_mod.chat_service, "astream_chat_with_model", fake_stream)
+    monkeypatch.setattr(chat_mod, "save_chat_attachments", slow_save_chat_attachments)
+    monkeypatch.setattr(session_module, "ReplicaSessionLocal", object())
+    monkeypatch.setattr(session_module, "_sticky_until", {})
+
+    db_session.add(Conversation(id="c1", title="t", user_id="u1"))
+    db_session.add(Message(id="m1", conversation_id="c1", role="user", content="hello"))
+    db_session.add(TreeNode(id="n1", conversation_id="c1", message_id="m1"))
+    db_session.commit()
+    db_session.info["user_id"] = "u1"  # get_current_user 设置的当前用户
+    request = ChatRequest(message="hello", conversation_id="c1", user_id="u1")
+
+    async def disconnect():
+        stream = chat_mod.chat_response_generator(request=request, db=db_session, user_node_id="n1",
+                                                  user_message_id="m1", should_generate_title=False)
+        await stream.__anext__()
+        await stream.__anext__()
+        pending = asyncio.ensure_future(stream.__anext__())
+        await asyncio.sleep(0.1)
+        pending.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        released.set()
+
+    asyncio.run(disconnect())
+
+    # 断开后由独立会话保存的回复同样让该用户粘住主库
+    assert session_module.reads_from_primary("u1")
+    db_session.expire_all()
+    assert [m.content for m in db_session.query(Message).filter(Message.role == "ai")] == ["hi"]
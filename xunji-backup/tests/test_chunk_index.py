@@ -0,0 +1,125 @@
+import hashlib
+import io
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.sql_models import Base, DocumentChunk, FileRecord
+from app.services.chunk_index_service import chunk_index_service
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+from app.services.text_splitter import TokenAwareTextSplitter
+
+
+class HashEmbeddings:
+    def _embed(self, text):
+        vec = np.zeros(16, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class Upload:
+    def __init__(self, body):
+        self.file = io.BytesIO(body)
+
+
+@pytest.fixture()
+def db(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_FILE_PATH", str(tmp_path / "rag_files"))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    monkeypatch.setattr(rag_service, "_get_vector_store", lambda: store)
+    monkeypatch.setattr(rag_service, "splitter", TokenAwareTextSplitter(chunk_tokens=6))
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+V1 = "Alpha beta gamma.\n\nDelta epsilon zeta.\n\nEta theta iota.\n\nKappa lambda mu."
+
+
+def _rows(db, key):
+    return db.query(DocumentChunk).filter(DocumentChunk.vector_key == key).order_by(DocumentChunk.ordinal).all()
+
+
+def test_rows_follow_ingest_update_and_delete(db):
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(V1.encode()), "doc.md", None)
+    rows = _rows(db, record.id)
+    stored = rag_service.vector_store.get(filter={"file_id": record.id})
+
+    assert [r.ordinal for r in rows] == [0, 1, 2, 3]
+    assert {r.id for r in rows} == set(stored["ids"])
+    assert all(r.token_count > 0 and r.char_count > 0 for r in rows)
+    assert chunk_index_service.file_stats(db, [record.id])[record.id]["chunks"] == 4
+    assert chunk_index_service.stats(db)["files"] == 1
+
+    v2 = "Omega psi chi.\n\nAlpha beta gamma.\n\nKappa lambda mu."
+    knowledge_base_service.update_file(db, record, Upload(v2.encode()))
+    rows = _rows(db, record.id)
+    texts = dict(zip(*[rag_service.vector_store.get(ids=[r.id for r in rows])[k] for k in ("ids", "documents")]))
+    assert [texts[r.id] for r in rows] == ["Omega psi chi.", "Alpha beta gamma.", "Kappa lambda mu."]
+    assert rag_service.vector_store.count() == 3
+
+    knowledge_base_service.delete_files(db, [db.query(FileRecord).one()])
+    assert db.query(DocumentChunk).count() == 0
+    assert rag_service.vector_store.count() == 0
+
+
+def test_update_to_existing_content_reports_released_vectors(db):
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(V1.encode()), "doc.md", None)
+    other = "Omega psi chi.\n\nRho sigma tau."
+    knowledge_base_service.ingest_upload(db, Upload(other.encode()), "other.md", None)
+
+    stats = knowledge_base_service.update_file(db, record, Upload(other.encode()))
+    assert stats == {"chunks": 2, "reused": 2, "embedded": 0, "deleted": 4}
+    assert rag_service.vector_store.count() == 2
+
+
+def test_expand_neighbors_merges_adjacent_hits(db):
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(V1.encode()), "doc.md", None)
+    hits = rag_service.search("delta epsilon", filters={"file_id": record.id}, k=1)
+    assert hits[0].page_content == "Delta epsilon zeta."
+
+    blocks = chunk_index_service.expand_neighbors(db, hits, radius=1)
+    assert blocks == ["Alpha beta gamma.\nDelta epsilon zeta.\nEta theta iota."]
+
+    both = rag_service.search("delta epsilon eta theta", filters={"file_id": record.id}, k=2)
+    assert len(chunk_index_service.expand_neighbors(db, both, radius=1)) == 1
+
+
+def test_expand_neighbors_uses_the_hit_ordinal_for_duplicate_chunks(db):
+    text = ("Alpha beta gamma.\n\nDelta epsilon zeta.\n\nKappa lambda mu.\n\nRho sigma tau.\n\n"
+            "Eta theta iota.\n\nDelta epsilon zeta.\n\nOmega psi chi.")
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(text.encode()), "doc.md", None)
+    hits = rag_service.search("delta epsilon", filters={"file_id": record.id}, k=2)
+    assert [h.page_content for h in hits] == ["Delta epsilon zeta."] * 2
+
+    blocks = chunk_index_service.expand_neighbors(db, hits, radius=1)
+    assert sorted(blocks) == [
+        "Alpha beta gamma.\nDelta epsilon zeta.\nKappa lambda mu.",
+        "Eta theta iota.\nDelta epsilon zeta.\nOmega psi chi.",
+    ]
+
+
+def test_expand_neighbors_after_an_in_place_update_moves_a_kept_chunk(db):
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(V1.encode()), "doc.md", None)
+    v2 = "Omega psi chi.\n\nAlpha beta gamma.\n\nKappa lambda mu."
+    knowledge_base_service.update_file(db, record, Upload(v2.encode()))
+    hits = rag_service.search("alpha beta gamma", filters={"file_id": record.id}, k=1)
+    assert hits[0].metadata["ordinal"] == 0  # stored before the update moved it to 1
+
+    blocks = chunk_index_service.expand_neighbors(db, hits, radius=1)
+    assert blocks == ["Omega psi chi.\nAlpha beta gamma.\nKappa lambda mu."]
@@ -0,0 +1,65 @@
+from app.services.context_packer import ContextPacker, ContextSource, strip_overlap
+from app.services.model_manager import model_manager
+from app.services.text_splitter import estimate_tokens, truncate_to_tokens
+
+
+def test_strip_overlap_removes_shared_seam():
+    prev = "第一句话写在这里。第二句话也写在这里，作为重叠部分。"
+    nxt = "第二句话也写在这里，作为重叠部分。第三句话是新的内容。"
+    assert strip_overlap(prev, nxt) == "第三句话是新的内容。"
+    assert strip_overlap(prev, "完全无关的一段文字，没有任何重叠。") == "完全无关的一段文字，没有任何重叠。"
+
+
+def test_pack_dedupes_repeats_and_overlap_across_sources():
+    a = "Alpha beta gamma delta. Epsilon zeta eta theta iota."
+    b = "Epsilon zeta eta theta iota. Kappa lambda mu nu xi."
+    packed = ContextPacker().pack(
+        [ContextSource("本地知识库内容", [a, b, a]), ContextSource("上传附件内容", [a])],
+        budget_tokens=1000,
+    )
+
+    assert packed.text.count("Epsilon") == 1
+    assert "上传附件内容" not in packed.text
+    assert packed.deduped_tokens > 0
+    assert packed.dropped_tokens == 0
+
+
+def test_pack_respects_budget_and_reports_dropped_tokens():
+    sentences = "".join(f"这是第{i}条检索结果中的一句话。" for i in range(40))
+    items = [sentences, sentences.replace("检索", "召回"), sentences.replace("检索", "搜索")]
+    packer = ContextPacker()
+
+    packed = packer.pack([ContextSource("本地知识库内容", items)], budget_tokens=300)
+
+    assert packed.used_tokens <= 300
+    assert estimate_tokens(packed.text) <= 300
+    assert packed.dropped_tokens > 0
+    assert packed.text.startswith("【本地知识库内容】:\n这是第0条检索结果")
+    assert packed.text.endswith("。…")
+    stats = packed.sources["本地知识库内容"]
+    assert stats["kept_tokens"] + stats["dropped_tokens"] == stats["tokens"]
+
+
+def test_small_sources_leave_budget_to_large_ones():
+    small = ContextSource("联网搜索结果", ["短结果。"])
+    large = ContextSource("本地知识库内容", ["长文本内容。" * 200])
+
+    packed = ContextPacker().pack([small, large], budget_tokens=400)
+
+    assert packed.sources["联网搜索结果"]["dropped_tokens"] == 0
+    assert packed.sources["本地知识库内容"]["kept_tokens"] > 300
+
+
+def test_truncate_to_tokens_prefers_sentence_end_and_stops_early():
+    text = "一二三。四五六。" + "七" * 100000
+    end, tokens = truncate_to_tokens(text, 10)
+    assert text[:end] == "一二三。四五六。"
+    assert tokens == 8
+    assert truncate_to_tokens("字" * 50, 5) == (5, 5)
+
+
+def test_context_budget_uses_longest_model_prefix():
+    models = model_manager.CONTEXT_BUDGET_CONFIG["models"]
+    assert model_manager.get_context_budget("gpt-4o-mini") == models["gpt-4o"]
+    assert model_manager.get_context_budget("gpt-3.5-turbo") == models["gpt"]
+    assert model_manager.get_context_budget("unknown-model") == model_manager.CONTEXT_BUDGET_CONFIG["default"]
@@ -1,5 +1,3 @@
-import asyncio
-
 import pytest
 from fastapi import HTTPException
 from sqlalchemy import create_engine
@@ -53,24 +51,20 @@ class TestConversationInstructionCRUD:
         db_session.add_all([user1, conv1])
         db_session.commit()
 
-        asyncio.run(
-            create_conversation_instruction(
-                conversation_id=conv1.id,
-                payload=ConversationAiInstructionCreate(content="A"),
-                db=db_session,
-                current_user=user1,
-            )
+        create_conversation_instruction(
+            conversation_id=conv1.id,
+            payload=ConversationAiInstructionCreate(content="A"),
+            db=db_session,
+            current_user=user1,
         )
-        asyncio.run(
-            create_conversation_instruction(
-                conversation_id=conv1.id,
-                payload=ConversationAiInstructionCreate(content="B"),
-                db=db_session,
-                current_user=user1,
-            )
+        create_conversation_instruction(
+            conversation_id=conv1.id,
+            payload=ConversationAiInstructionCreate(content="B"),
+            db=db_session,
+            current_user=user1,
         )
 
-        rows = asyncio.run(get_conversation_instructions(conversation_id=conv1.id, db=db_session, current_user=user1))
+        rows = get_conversation_instructions(conversation_id=conv1.id, db=db_session, current_user=user1)
         assert [r.content for r in rows] == ["A", "B"]
         assert [r.sort_order for r in rows] == [1, 2]
 
@@ -78,23 +72,19 @@ class TestConversationInstructionCRUD:
         db_session.add_all([user1, conv1])
         db_session.commit()
 
-        created = asyncio.run(
-            create_conversation_instruction(
-                conversation_id=conv1.id,
-                payload=ConversationAiInstructionCreate(content="Old"),
-                db=db_session,
-                current_user=user1,
-            )
+        created = create_conversation_instruction(
+            conversation_id=conv1.id,
+            payload=ConversationAiInstructionCreate(content="Old"),
+            db=db_session,
+            current_user=user1,
         )
 
-        updated = asyncio.run(
-            update_conversation_instruction(
-                conversation_id=conv1.id,
-                instruction_id=created.id,
-                payload=ConversationAiInstructionUpdate(content="New", sort_order=5),
-                db=db_session,
-                current_user=user1,
-            )
+        updated = update_conversation_instruction(
+            conversation_id=conv1.id,
+            instruction_id=created.id,
+            payload=ConversationAiInstructionUpdate(content="New", sort_order=5),
+            db=db_session,
+            current_user=user1,
         )
         assert updated.content == "New"
         assert updated.sort_order == 5
@@ -103,21 +93,17 @@ class TestConversationInstructionCRUD:
         db_session.add_all([user1, conv1])
         db_session.commit()
 
-        created = asyncio.run(
-            create_conversation_instruction(
-                conversation_id=conv1.id,
-                payload=ConversationAiInstructionCreate(content="X"),
-                db=db_session,
-                current_user=user1,
-            )
+        created = create_conversation_instruction(
+            conversation_id=conv1.id,
+            payload=ConversationAiInstructionCreate(content="X"),
+            db=db_session,
+            current_user=user1,
         )
-        resp = asyncio.run(
-            delete_conversation_instruction(
-                conversation_id=conv1.id,
-                instruction_id=created.id,
-                db=db_session,
-                current_user=user1,
-            )
+        resp = delete_conversation_instruction(
+            conversation_id=conv1.id,
+            instruction_id=created.id,
+            db=db_session,
+            current_user=user1,
         )
         assert resp["message"] == "删除成功"
 
@@ -125,7 +111,7 @@ class TestConversationInstructionCRUD:
         assert row is not None
         assert row.is_deleted is True
 
-        rows = asyncio.run(get_conversation_instructions(conversation_id=conv1.id, db=db_session, current_user=user1))
+        rows = get_conversation_instructions(conversation_id=conv1.id, db=db_session, current_user=user1)
         assert rows == []
 
     def test_reject_empty_content(self, db_session, user1, conv1):
@@ -133,13 +119,11 @@ class TestConversationInstructionCRUD:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(
-                create_conversation_instruction(
-                    conversation_id=conv1.id,
-                    payload=ConversationAiInstructionCreate(content=""),
-                    db=db_session,
-                    current_user=user1,
-                )
+            create_conversation_instruction(
+                conversation_id=conv1.id,
+                payload=ConversationAiInstructionCreate(content=""),
+                db=db_session,
+                current_user=user1,
             )
         assert exc.value.status_code == 400
 
@@ -150,7 +134,7 @@ class TestConversationInstructionPermission:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(get_conversation_instructions(conversation_id=conv1.id, db=db_session, current_user=user2))
+            get_conversation_instructions(conversation_id=conv1.id, db=db_session, current_user=user2)
         assert exc.value.status_code == 404
 
     def test_cannot_create_on_other_users_conversation(self, db_session, user1, user2, conv1):
@@ -158,13 +142,11 @@ class TestConversationInstructionPermission:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(
-                create_conversation_instruction(
-                    conversation_id=conv1.id,
-                    payload=ConversationAiInstructionCreate(content="hack"),
-                    db=db_session,
-                    current_user=user2,
-                )
+            create_conversation_instruction(
+                conversation_id=conv1.id,
+                payload=ConversationAiInstructionCreate(content="hack"),
+                db=db_session,
+                current_user=user2,
             )
         assert exc.value.status_code == 404
 
@@ -0,0 +1,103 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.api.endpoints import history as history_router
+from app.db.session import get_db
+from app.models.sql_models import Base, Conversation, Message, TreeNode, User
+from app.services.tree_service import tree_service
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    tree_service.forget_versions()
+    yield engine
+    tree_service.forget_versions()
+
+
+@pytest.fixture()
+def SessionLocal(engine):
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(User(id="u1", username="u1", hashed_password="x"))
+    db.add(User(id="u2", username="u2", hashed_password="x"))
+    db.add(Conversation(id="c1", user_id="u1"))
+    db.commit()
+    # root -> a1 -> {q2 -> a2, q2' (edited branch)}
+    for node_id, parent, role, content in [
+        ("n0", None, "user", "hello " + "x" * 100),
+        ("n1", "n0", "ai", "hi"),
+        ("n2", "n1", "user", "first branch"),
+        ("n3", "n2", "ai", "answer"),
+        ("n4", "n1", "user", "second branch"),
+    ]:
+        db.add(Message(id=f"m-{node_id}", conversation_id="c1", role=role, content=content))
+        db.add(TreeNode(id=node_id, conversation_id="c1", message_id=f"m-{node_id}", parent_id=parent))
+        db.commit()
+    db.close()
+    return factory
+
+
+def _client(SessionLocal, user_id):
+    application = FastAPI()
+    application.include_router(history_router.router, prefix="/api")
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_current_user():
+        return User(id=user_id, username=user_id, hashed_password="x")
+
+    application.dependency_overrides[get_db] = override_get_db
+    application.dependency_overrides[get_current_user] = override_current_user
+    return TestClient(application)
+
+
+def test_tree_is_compact_adjacency(SessionLocal):
+    r = _client(SessionLocal, "u1").get("/api/conversations/c1/tree")
+    assert r.status_code == 200
+    tree = r.json()
+    assert tree["ids"] == ["n0", "n1", "n2", "n3", "n4"]
+    assert tree["parents"] == [-1, 0, 1, 2, 1]
+    assert tree["roles"] == ["user", "ai", "user", "ai", "user"]
+    assert tree["message_ids"][3] == "m-n3"
+    assert len(tree["previews"][0]) == history_router.TREE_PREVIEW_CHARS
+    assert r.headers["ETag"] == history_router._tree_etag(tree["version"])
+
+
+def test_tree_etag_answers_304_without_queries(engine, SessionLocal):
+    client = _client(SessionLocal, "u1")
+    etag = client.get("/api/conversations/c1/tree").headers["ETag"]
+
+    statements = []
+    capture = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        r = client.get("/api/conversations/c1/tree", headers={"If-None-Match": etag})
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+    assert r.status_code == 304 and r.headers["ETag"] == etag
+    assert statements == []
+
+    # Another user never gets a 304 from the cache.
+    assert _client(SessionLocal, "u2").get("/api/conversations/c1/tree", headers={"If-None-Match": etag}).status_code == 404
+
+    # A new node bumps the version on commit, so the old ETag no longer matches.
+    db = SessionLocal()
+    db.add(Message(id="m-n5", conversation_id="c1", role="ai", content="late"))
+    db.add(TreeNode(id="n5", conversation_id="c1", message_id="m-n5", parent_id="n4"))
+    db.commit()
+    db.close()
+    r = client.get("/api/conversations/c1/tree", headers={"If-None-Match": etag})
+    assert r.status_code == 200
+    assert r.headers["ETag"] != etag and r.json()["parents"][-1] == 4
@@ -0,0 +1,144 @@
+import hashlib
+import os
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.sql_models import Base, FileBlob, FileRecord
+from app.services import purge_service as purge_mod
+from app.services.directory_watch_service import DirectoryWatchService
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+from app.services.text_splitter import TokenAwareTextSplitter
+
+
+class HashEmbeddings:
+    def __init__(self):
+        self.texts = 0
+
+    def _embed(self, text):
+        vec = np.zeros(16, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture()
+def db():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    session = sessionmaker(autocommit=False, autoflush=False, bind=engine)()
+    yield session
+    session.close()
+
+
+@pytest.fixture()
+def watch_dir(tmp_path, monkeypatch):
+    directory = tmp_path / "rag_files"
+    directory.mkdir()
+    monkeypatch.setenv("RAG_FILE_PATH", str(directory))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    monkeypatch.setattr(rag_service, "_get_vector_store", lambda: store)
+    monkeypatch.setattr(rag_service, "splitter", TokenAwareTextSplitter(chunk_tokens=6))
+    return directory
+
+
+def _live(db):
+    return {r.source_path: r for r in db.query(FileRecord).filter(FileRecord.is_deleted == False).all()}
+
+
+def test_new_changed_and_deleted_files_stay_in_sync(db, watch_dir):
+    watcher = DirectoryWatchService(debounce=2)
+    (watch_dir / "team").mkdir()
+    (watch_dir / "team" / "guide.md").write_text("Alpha beta gamma.\n\nDelta epsilon zeta.")
+    (watch_dir / "12345678-1234-1234-1234-123456789abc__uploaded.md").write_text("managed by upload")
+    (watch_dir / "image.png").write_bytes(b"\x89PNG")
+
+    watcher.reconcile(db, now=0)
+    assert watcher.process_due(db, now=1) == {}
+    rel = os.path.join("team", "guide.md")
+    assert watcher.process_due(db, now=3) == {rel: "created"}
+    record = _live(db)[rel]
+    assert record.filename == "guide.md"
+    assert rag_service.vector_store.count() == 2
+
+    (watch_dir / "team" / "guide.md").write_text("Alpha beta gamma.\n\nOmega psi chi.")
+    os.utime(watch_dir / "team" / "guide.md", ns=(1, 10 ** 18))
+    watcher.poll(now=10)
+    embedded = rag_service.vector_store.embedding_function.texts
+    assert watcher.process_due(db, now=13) == {rel: "updated"}
+    assert rag_service.vector_store.embedding_function.texts == embedded + 1
+    db.refresh(record)
+    assert record.content_hash == knowledge_base_service.hash_file(str(watch_dir / "team" / "guide.md"))[0]
+
+    os.remove(watch_dir / "team" / "guide.md")
+    watcher.poll(now=20)
+    assert watcher.process_due(db, now=23) == {rel: "deleted"}
+    assert _live(db) == {}
+    assert db.query(FileBlob).count() == 0
+    assert rag_service.vector_store.count() == 0
+
+
+def test_debounce_waits_for_file_to_stop_changing(db, watch_dir):
+    watcher = DirectoryWatchService(debounce=2)
+    path = watch_dir / "big.txt"
+    path.write_text("partial")
+    watcher.poll(now=0)
+
+    path.write_text("partial content finished.")
+    assert watcher.process_due(db, now=3) == {}
+    assert watcher.process_due(db, now=6) == {"big.txt": "created"}
+
+
+def test_restart_reconciles_without_reembedding(db, watch_dir):
+    (watch_dir / "a.md").write_text("Rocket engine fuel.")
+    (watch_dir / "b.md").write_text("Orbit launch pad.")
+    first = DirectoryWatchService(debounce=0)
+    first.reconcile(db, now=0)
+    first.process_due(db, now=0)
+    embedded = rag_service.vector_store.embedding_function.texts
+
+    os.remove(watch_dir / "b.md")
+    second = DirectoryWatchService(debounce=0)
+    second.reconcile(db, now=0)
+
+    assert second.process_due(db, now=0) == {"a.md": "unchanged", "b.md": "deleted"}
+    assert rag_service.vector_store.embedding_function.texts == embedded
+    assert set(_live(db)) == {"a.md"}
+
+
+def test_purged_api_delete_is_not_reingested(db, watch_dir):
+    watcher = DirectoryWatchService(debounce=0)
+    (watch_dir / "a.md").write_text("Rocket engine fuel.")
+    watcher.reconcile(db, now=0)
+    watcher.process_due(db, now=0)
+    first = _live(db)["a.md"]
+    knowledge_base_service.delete_files(db, [first])
+
+    # An older deleted record of the same path is not needed by the watcher and is purged.
+    db.add(FileRecord(id="older", filename="a.md", user_id=first.user_id, source_path="a.md",
+                      content_hash="stale", is_deleted=True, created_at=first.created_at - timedelta(days=1),
+                      deleted_at=first.created_at))
+    db.commit()
+    tombstone = first.id
+    report = purge_mod.PurgeService(retention_days=0).run(lambda: db, now=datetime.now() + timedelta(seconds=1))
+    assert report["files"] == 1
+    assert {r.id for r in db.query(FileRecord)} == {tombstone}
+
+    restarted = DirectoryWatchService(debounce=0)
+    restarted.reconcile(db, now=0)
+    assert restarted.process_due(db, now=0) == {"a.md": "unchanged"}
+    assert _live(db) == {}
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.api.endpoints import history as history_router
+from app.db.session import get_db
+from app.models.sql_models import Base, Conversation, Message, TreeNode, User
+
+
+@pytest.fixture()
+def SessionLocal():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(User(id="u1", username="u1", hashed_password="x"))
+    base = datetime(2026, 1, 1)
+    for i in range(5):
+        db.add(Conversation(id=f"c{i}", user_id="u1", title=f"t{i}", updated_at=base + timedelta(minutes=i // 2)))
+    for i in range(7):
+        # Two messages share each timestamp, so the id breaks the tie.
+        db.add(Message(id=f"m{i}", conversation_id="c0", role="user", content=f"{i}" + "x" * 300,
+                       created_at=base + timedelta(seconds=i // 2)))
+        db.add(TreeNode(id=f"n{i}", conversation_id="c0", message_id=f"m{i}",
+                        parent_id=f"n{i - 1}" if i else None))
+    db.commit()
+    db.close()
+    return factory
+
+
+@pytest.fixture()
+def client(SessionLocal):
+    application = FastAPI()
+    application.include_router(history_router.router, prefix="/api")
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    async def override_current_user():
+        return User(id="u1", username="u1", hashed_password="x")
+
+    application.dependency_overrides[get_db] = override_get_db
+    application.dependency_overrides[get_current_user] = override_current_user
+    return TestClient(application)
+
+
+def _pages(client, url, **params):
+    seen, cursor = [], None
+    while True:
+        r = client.get(url, params={**params, **({"cursor": cursor} if cursor else {})})
+        assert r.status_code == 200
+        seen.append([row["id"] for row in r.json()])
+        cursor = r.headers.get("X-Next-Cursor")
+        if not cursor:
+            return seen
+
+
+def test_conversations_keyset_pages(client):
+    assert _pages(client, "/api/conversations", limit=2) == [["c4", "c3"], ["c2", "c1"], ["c0"]]
+    assert client.get("/api/conversations", params={"cursor": "bad"}).status_code == 400
+
+
+def test_messages_keyset_pages_and_light_view(client):
+    assert len(client.get("/api/conversations/c0/messages").json()) == 7
+
+    pages = _pages(client, "/api/conversations/c0/messages", limit=3)
+    assert pages == [["m0", "m1", "m2"], ["m3", "m4", "m5"], ["m6"]]
+    newest = _pages(client, "/api/conversations/c0/messages", limit=4, order="desc")
+    assert newest == [["m6", "m5", "m4", "m3"], ["m2", "m1", "m0"]]
+
+    light = client.get("/api/conversations/c0/messages", params={"view": "light", "limit": 1}).json()[0]
+    assert light["truncated"] is True and len(light["content"]) == history_router.MESSAGE_PREVIEW_CHARS
+    assert light["node_id"] == "n0"
+
+    full = client.get("/api/conversations/c0/messages/m0").json()
+    assert full["content"] == "0" + "x" * 300 and full["truncated"] is False
+    assert client.get("/api/conversations/c1/messages/m0").status_code == 404
@@ -13,7 +13,6 @@ from app.api.endpoints.instructions import (
     AiInstructionUpdate,
 )
 from app.models.sql_models import AiInstruction, Base, User
-import asyncio
 
 
 @pytest.fixture()
@@ -50,11 +49,11 @@ class TestInstructionCRUD:
         db_session.add(test_user)
         db_session.commit()
 
-        result = asyncio.run(create_instruction(
+        result = create_instruction(
             payload=AiInstructionCreate(content="Test instruction"),
             db=db_session,
             current_user=test_user,
-        ))
+        )
 
         assert result.content == "Test instruction"
         assert result.sort_order == 1
@@ -66,11 +65,11 @@ class TestInstructionCRUD:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(create_instruction(
+            create_instruction(
                 payload=AiInstructionCreate(content=""),
                 db=db_session,
                 current_user=test_user,
-            ))
+            )
         assert exc.value.status_code == 400
         assert "content 不能为空" in exc.value.detail
 
@@ -79,16 +78,16 @@ class TestInstructionCRUD:
         db_session.add(test_user)
         db_session.commit()
 
-        asyncio.run(create_instruction(
+        create_instruction(
             payload=AiInstructionCreate(content="First instruction"),
             db=db_session,
             current_user=test_user,
-        ))
-        asyncio.run(create_instruction(
+        )
+        create_instruction(
             payload=AiInstructionCreate(content="Second instruction"),
             db=db_session,
             current_user=test_user,
-        ))
+        )
 
         instructions = (
             db_session.query(AiInstruction)
@@ -108,9 +107,9 @@ class TestInstructionCRUD:
         db_session.add(test_user)
         db_session.commit()
 
-        result = asyncio.run(get_instructions(
+        result = get_instructions(
             db=db_session, current_user=test_user
-        ))
+        )
 
         assert result == []
 
@@ -128,9 +127,9 @@ class TestInstructionCRUD:
         db_session.add_all([instruction1, instruction2])
         db_session.commit()
 
-        result = asyncio.run(get_instructions(
+        result = get_instructions(
             db=db_session, current_user=test_user
-        ))
+        )
 
         assert len(result) == 2
         assert result[0].content == "First"
@@ -145,12 +144,12 @@ class TestInstructionCRUD:
         db_session.add(instruction)
         db_session.commit()
 
-        result = asyncio.run(update_instruction(
+        result = update_instruction(
             instruction_id=instruction.id,
             payload=AiInstructionUpdate(content="Updated content"),
             db=db_session,
             current_user=test_user,
-        ))
+        )
 
         assert result.content == "Updated content"
         assert result.sort_order == 1
@@ -164,12 +163,12 @@ class TestInstructionCRUD:
         db_session.add(instruction)
         db_session.commit()
 
-        result = asyncio.run(update_instruction(
+        result = update_instruction(
             instruction_id=instruction.id,
             payload=AiInstructionUpdate(sort_order=5),
             db=db_session,
             current_user=test_user,
-        ))
+        )
 
         assert result.sort_order == 5
 
@@ -182,11 +181,11 @@ class TestInstructionCRUD:
         db_session.add(instruction)
         db_session.commit()
 
-        result = asyncio.run(delete_instruction(
+        result = delete_instruction(
             instruction_id=instruction.id,
             db=db_session,
             current_user=test_user,
-        ))
+        )
 
         assert result["message"] == "删除成功"
 
@@ -203,11 +202,11 @@ class TestInstructionCRUD:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(delete_instruction(
+            delete_instruction(
                 instruction_id="nonexistent",
                 db=db_session,
                 current_user=test_user,
-            ))
+            )
         assert exc.value.status_code == 404
 
 
@@ -227,9 +226,9 @@ class TestInstructionPermissionIsolation:
         db_session.add(other_instruction)
         db_session.commit()
 
-        result = asyncio.run(get_instructions(
+        result = get_instructions(
             db=db_session, current_user=test_user
-        ))
+        )
 
         assert len(result) == 0
 
@@ -245,12 +244,12 @@ class TestInstructionPermissionIsolation:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(update_instruction(
+            update_instruction(
                 instruction_id=other_instruction.id,
                 payload=AiInstructionUpdate(content="Hacked"),
                 db=db_session,
                 current_user=test_user,
-            ))
+            )
         assert exc.value.status_code == 404
 
     def test_user_cannot_delete_other_user_instruction(
@@ -265,11 +264,11 @@ class TestInstructionPermissionIsolation:
         db_session.commit()
 
         with pytest.raises(HTTPException) as exc:
-            asyncio.run(delete_instruction(
+            delete_instruction(
                 instruction_id=other_instruction.id,
                 db=db_session,
                 current_user=test_user,
-            ))
+            )
         assert exc.value.status_code == 404
 
 
@@ -0,0 +1,227 @@
+import hashlib
+import os
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.api.endpoints import upload as upload_router
+from app.db.session import get_db
+from app.models.sql_models import Base, FileBlob, FileRecord, User
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+from app.services.text_splitter import TokenAwareTextSplitter
+
+
+class HashEmbeddings:
+    dim = 32
+
+    def __init__(self):
+        self.calls = 0
+
+    def _embed(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+@pytest.fixture()
+def SessionLocal():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture()
+def store(monkeypatch):
+    embeddings = HashEmbeddings()
+    vector_store = NumpyVectorStore(directory=None, embedding_function=embeddings)
+    monkeypatch.setattr(rag_service, "_get_vector_store", lambda: vector_store)
+    return vector_store
+
+
+@pytest.fixture()
+def client(SessionLocal, tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_FILE_PATH", str(tmp_path / "rag_files"))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+    application = FastAPI()
+    application.include_router(upload_router.router, prefix="/api")
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    seed = SessionLocal()
+    seed.add(User(id="u1", username="u1", hashed_password="x"))
+    seed.add(User(id="u2", username="u2", hashed_password="x"))
+    seed.commit()
+    seed.close()
+
+    current = {"user": "u1"}
+
+    async def override_current_user():
+        return User(id=current["user"], username=current["user"], hashed_password="x")
+
+    application.dependency_overrides[get_db] = override_get_db
+    application.dependency_overrides[get_current_user] = override_current_user
+    test_client = TestClient(application)
+    test_client.current = current
+    return test_client
+
+
+def _upload(client, name, body):
+    return client.post("/api/upload", files={"file": (name, body, "text/markdown")})
+
+
+def test_same_content_reuses_vectors_across_users(client, store, SessionLocal):
+    body = "Alpha beta gamma.\n\nDelta epsilon zeta.".encode("utf-8")
+
+    first = _upload(client, "a.md", body)
+    chunks = store.count()
+    client.current["user"] = "u2"
+    second = _upload(client, "copy.md", body)
+
+    assert first.status_code == 200 and second.status_code == 200
+    assert "复用" in second.json()["message"]
+    assert store.count() == chunks
+    assert store.embedding_function.calls == 1
+
+    db = SessionLocal()
+    blob = db.query(FileBlob).one()
+    assert blob.id == hashlib.sha256(body).hexdigest()
+    assert blob.ref_count == 2
+    assert blob.vector_key == first.json()["file_id"]
+    keys = knowledge_base_service.vector_keys(db, [second.json()["file_id"], "legacy-id"])
+    db.close()
+    assert keys == [first.json()["file_id"], "legacy-id"]
+
+
+def test_vectors_removed_only_with_last_reference(client, store, SessionLocal):
+    body = b"rocket engine fuel. orbit launch pad."
+    first = _upload(client, "a.md", body).json()["file_id"]
+    second = _upload(client, "b.md", body).json()["file_id"]
+    chunks = store.count()
+
+    assert client.delete(f"/api/files/{first}").status_code == 200
+    assert store.count() == chunks
+    assert client.delete(f"/api/files/{first}").status_code == 200
+
+    db = SessionLocal()
+    assert db.query(FileBlob).one().ref_count == 1
+    db.close()
+
+    assert client.delete(f"/api/files/{second}").status_code == 200
+    assert store.count() == 0
+    db = SessionLocal()
+    assert db.query(FileBlob).count() == 0
+    assert all(r.is_deleted for r in db.query(FileRecord).all())
+    db.close()
+
+
+@pytest.fixture()
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(rag_service, "splitter", TokenAwareTextSplitter(chunk_tokens=6))
+
+
+def _put(client, file_id, name, body):
+    return client.put(f"/api/files/{file_id}", files={"file": (name, body, "text/markdown")})
+
+
+def test_update_embeds_only_changed_chunks(client, store, small_chunks):
+    v1 = "Alpha beta gamma.\n\nDelta epsilon zeta.\n\nEta theta iota.".encode("utf-8")
+    v2 = "Alpha beta gamma.\n\nDelta epsilon zeta.\n\nKappa lambda mu.".encode("utf-8")
+    file_id = _upload(client, "doc.md", v1).json()["file_id"]
+
+    r = _put(client, file_id, "doc.md", v2)
+
+    assert r.status_code == 200
+    assert (r.json()["reused_chunks"], r.json()["embedded_chunks"], r.json()["deleted_chunks"]) == (2, 1, 1)
+    contents = {d.page_content for d in store.similarity_search("x", k=10, filter={"file_id": file_id})}
+    assert contents == {"Alpha beta gamma.", "Delta epsilon zeta.", "Kappa lambda mu."}
+    assert "未变化" in _put(client, file_id, "doc.md", v2).json()["message"]
+
+
+def test_update_of_shared_content_copies_on_write(client, store, small_chunks, SessionLocal):
+    v1 = "Alpha beta gamma.\n\nDelta epsilon zeta.".encode("utf-8")
+    v2 = "Alpha beta gamma.\n\nOmega psi chi.".encode("utf-8")
+    first = _upload(client, "a.md", v1).json()["file_id"]
+    second = _upload(client, "b.md", v1).json()["file_id"]
+    embed_calls = store.embedding_function.calls
+
+    r = _put(client, second, "b.md", v2).json()
+
+    assert (r["reused_chunks"], r["embedded_chunks"]) == (1, 1)
+    assert store.embedding_function.calls == embed_calls + 1
+    db = SessionLocal()
+    first_key, second_key = knowledge_base_service.vector_keys(db, [first, second])
+    assert {b.ref_count for b in db.query(FileBlob).all()} == {1}
+    db.close()
+    assert first_key == first and second_key != first
+    old = {d.page_content for d in store.similarity_search("x", k=10, filter={"file_id": first_key})}
+    new = {d.page_content for d in store.similarity_search("x", k=10, filter={"file_id": second_key})}
+    assert old == {"Alpha beta gamma.", "Delta epsilon zeta."}
+    assert new == {"Alpha beta gamma.", "Omega psi chi."}
+
+
+def test_update_rejects_other_owner_and_extension(client, store):
+    file_id = _upload(client, "doc.md", b"hello world.").json()["file_id"]
+    assert _put(client, file_id, "doc.pdf", b"x").status_code == 400
+    client.current["user"] = "u2"
+    assert _put(client, file_id, "doc.md", b"other.").status_code == 403
+
+
+def test_upload_writes_once_to_final_path(client, store, tmp_path, monkeypatch, small_chunks):
+    import tempfile
+
+    def no_temp_files(*args, **kwargs):
+        raise AssertionError("upload must not create temp copies")
+
+    monkeypatch.setattr(tempfile, "NamedTemporaryFile", no_temp_files)
+    body = "Alpha beta gamma.\n\nDelta epsilon zeta.".encode("utf-8")
+
+    file_id = _upload(client, "doc.md", body).json()["file_id"]
+    rag_dir = tmp_path / "rag_files"
+    assert os.listdir(rag_dir) == [f"{file_id}__doc.md"]
+    assert (rag_dir / f"{file_id}__doc.md").read_bytes() == body
+
+    assert _put(client, file_id, "doc.md", b"Omega psi chi.").status_code == 200
+    assert os.listdir(rag_dir) == [f"{file_id}__doc.md"]
+    assert (rag_dir / f"{file_id}__doc.md").read_bytes() == b"Omega psi chi."
+
+
+@pytest.mark.parametrize("name", ["/../../escaped.md", "../escaped.md", "..\\escaped.md", "sub/escaped.md"])
+def test_upload_refuses_traversal_filenames(client, store, tmp_path, name):
+    r = _upload(client, name, b"hello world.")
+    assert r.status_code == 400
+    assert not list(tmp_path.rglob("*escaped.md"))
+    with pytest.raises(ValueError):
+        knowledge_base_service.stored_file_path("f1", name)
+
+
+def test_stored_path_must_stay_under_base_dir(client, tmp_path):
+    outside = tmp_path / "outside"
+    outside.mkdir()
+    rag_dir = tmp_path / "rag_files"
+    rag_dir.mkdir()
+    # 存储目录里预先放了一个指向外部的符号链接
+    os.symlink(outside / "target.md", rag_dir / "f1__doc.md")
+    with pytest.raises(ValueError):
+        knowledge_base_service.stored_file_path("f1", "doc.md")
+    assert knowledge_base_service.stored_file_path("f2", "doc.md") == os.path.join(str(rag_dir), "f2__doc.md")
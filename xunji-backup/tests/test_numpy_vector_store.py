@@ -0,0 +1,291 @@
+import hashlib
+import multiprocessing
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+from app.services.numpy_vector_store import NumpyVectorStore
+
+
+class HashEmbeddings:
+    """Deterministic bag-of-words embeddings so similar texts land close together."""
+
+    dim = 64
+
+    def _embed(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def _docs():
+    return [
+        Document(page_content="apple banana cherry", metadata={"file_id": "f1", "filename": "a.md"}),
+        Document(page_content="dog cat mouse", metadata={"file_id": "f1", "filename": "a.md"}),
+        Document(page_content="apple pie recipe", metadata={"file_id": "f2", "filename": "b.md"}),
+        Document(page_content="rocket engine fuel", metadata={"file_id": "f3", "filename": "c.md"}),
+    ]
+
+
+def test_search_and_file_id_filters():
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    ids = store.add_documents(_docs())
+    assert len(ids) == 4
+    assert store.count() == 4
+
+    top = store.similarity_search("apple", k=2)
+    assert {d.page_content for d in top} == {"apple banana cherry", "apple pie recipe"}
+
+    only_f2 = store.similarity_search("apple", k=4, filter={"file_id": "f2"})
+    assert [d.metadata["file_id"] for d in only_f2] == ["f2"]
+
+    in_filter = store.similarity_search("apple", k=4, filter={"file_id": {"$in": ["f1", "f3"]}})
+    assert {d.metadata["file_id"] for d in in_filter} == {"f1", "f3"}
+
+    assert store.similarity_search("apple", k=4, filter={"file_id": "missing"}) == []
+
+
+def test_delete_by_file_ids_hides_rows():
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    store.add_documents(_docs())
+    store.delete_by_file_ids(["f1"])
+
+    assert store.count() == 2
+    assert all(d.metadata["file_id"] != "f1" for d in store.similarity_search("apple dog", k=4))
+
+
+def test_persists_to_mmap_and_reloads(tmp_path):
+    directory = str(tmp_path / "idx")
+    store = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    store.add_documents(_docs())
+    store.delete_by_file_ids(["f3"])
+
+    reopened = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    assert isinstance(reopened._codes, np.memmap)
+    assert reopened.count() == 3
+    assert reopened.similarity_search("rocket", k=4, filter={"file_id": "f3"}) == []
+    assert reopened.similarity_search("dog", k=1)[0].page_content == "dog cat mouse"
+
+
+def test_ivf_search_matches_exact_on_clustered_data():
+    rng = np.random.default_rng(1)
+    centers = rng.normal(size=(8, 16)).astype(np.float32)
+    vectors = {f"doc-{i}": (centers[i % 8] + 0.05 * rng.normal(size=16)).tolist() for i in range(400)}
+
+    class TableEmbeddings:
+        def embed_documents(self, texts):
+            return [vectors[t] for t in texts]
+
+        def embed_query(self, text):
+            return vectors[text]
+
+    docs = [Document(page_content=name, metadata={"file_id": "f"}) for name in vectors]
+    exact = NumpyVectorStore(directory=None, embedding_function=TableEmbeddings())
+    ivf = NumpyVectorStore(directory=None, embedding_function=TableEmbeddings(), ivf_lists=8, ivf_nprobe=2)
+    exact.add_documents(docs)
+    ivf.add_documents(docs)
+
+    assert ivf._centroids is not None
+    for query in ["doc-0", "doc-13", "doc-250"]:
+        expected = {d.page_content for d in exact.similarity_search(query, k=5)}
+        got = {d.page_content for d in ivf.similarity_search(query, k=5)}
+        assert len(expected & got) >= 4
+
+
+def test_dimension_mismatch_raises():
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    store.add_documents(_docs()[:1])
+
+    class Other(HashEmbeddings):
+        dim = 8
+
+    store.embedding_function = Other()
+    with pytest.raises(ValueError):
+        store.add_documents(_docs()[1:2])
+
+
+@pytest.mark.parametrize("quantization,truncate_dim", [("float16", 0), ("int8", 0), ("int8", 32)])
+def test_quantized_codes_with_rerank_keep_ranking(tmp_path, quantization, truncate_dim):
+    directory = str(tmp_path / quantization)
+    store = NumpyVectorStore(
+        directory=directory,
+        embedding_function=HashEmbeddings(),
+        quantization=quantization,
+        truncate_dim=truncate_dim,
+        rerank_factor=4,
+    )
+    store.add_documents(_docs())
+
+    stats = store.memory_stats()
+    assert stats["scan_bytes"] < 4 * 64 * 4
+    assert stats["full_bytes"] == 4 * 64 * 4
+
+    reopened = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    assert reopened.quantization == quantization
+    assert reopened.similarity_search("rocket fuel", k=1)[0].page_content == "rocket engine fuel"
+    assert reopened.similarity_search("dog", k=1, filter={"file_id": "f1"})[0].page_content == "dog cat mouse"
+
+
+def test_int8_without_rerank_drops_full_vectors():
+    store = NumpyVectorStore(
+        directory=None, embedding_function=HashEmbeddings(), quantization="int8", rerank_factor=0
+    )
+    store.add_documents(_docs())
+
+    assert store._full is None
+    assert store.memory_stats()["full_bytes"] == 0
+    assert store.similarity_search("apple pie", k=1)[0].page_content == "apple pie recipe"
+
+
+def test_unknown_quantization_raises():
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings(), quantization="int4")
+    with pytest.raises(ValueError):
+        store.add_documents(_docs())
+
+
+def test_get_delete_ids_and_add_embedded(tmp_path):
+    store = NumpyVectorStore(directory=str(tmp_path / "idx"), embedding_function=HashEmbeddings())
+    ids = store.add_documents(_docs())
+
+    rows = store.get(filter={"file_id": "f1"}, include_embeddings=True)
+    assert rows["ids"] == ids[:2]
+    assert len(rows["embeddings"]) == 2
+
+    copies = [Document(page_content=t, metadata={"file_id": "copy"}) for t in rows["documents"]]
+    store.add_embedded(copies, rows["embeddings"])
+    store.delete_ids([ids[0]])
+
+    reopened = NumpyVectorStore(directory=str(tmp_path / "idx"), embedding_function=HashEmbeddings())
+    assert reopened.get(filter={"file_id": "f1"})["documents"] == ["dog cat mouse"]
+    assert reopened.similarity_search("apple banana", k=1, filter={"file_id": "copy"})[0].page_content == "apple banana cherry"
+
+
+def test_add_that_crashes_before_header_does_not_misalign_records(tmp_path, monkeypatch):
+    directory = str(tmp_path / "idx")
+    store = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    store.add_documents(_docs()[:2])
+
+    def crash():
+        raise OSError("crash before the header was committed")
+
+    # records.jsonl has the new lines, index.json still says size=2
+    monkeypatch.setattr(store, "_write_header", crash)
+    with pytest.raises(OSError):
+        store.add_documents(_docs()[2:3])
+
+    reopened = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    assert reopened.count() == 2
+    with open(tmp_path / "idx" / "records.jsonl", encoding="utf-8") as f:
+        assert len(f.readlines()) == 2
+
+    new_id = reopened.add_documents(_docs()[3:4])[0]
+    for index in (reopened, NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())):
+        hit = index.similarity_search("rocket engine", k=1)[0]
+        assert (hit.id, hit.page_content) == (new_id, "rocket engine fuel")
+        assert index.get(filter={"file_id": "f1"})["documents"] == ["apple banana cherry", "dog cat mouse"]
+
+
+@pytest.mark.parametrize("keep_lines", [0, 1])
+def test_missing_or_short_records_file_still_opens(tmp_path, keep_lines):
+    directory = tmp_path / "idx"
+    NumpyVectorStore(directory=str(directory), embedding_function=HashEmbeddings()).add_documents(_docs()[:2])
+    records = directory / "records.jsonl"
+    lines = records.read_text(encoding="utf-8").splitlines(keepends=True)
+    if keep_lines:
+        records.write_text("".join(lines[:keep_lines]), encoding="utf-8")
+    else:
+        records.unlink()
+
+    store = NumpyVectorStore(directory=str(directory), embedding_function=HashEmbeddings())
+    assert store.count() == keep_lines
+    new_id = store.add_documents(_docs()[3:4])[0]
+
+    reopened = NumpyVectorStore(directory=str(directory), embedding_function=HashEmbeddings())
+    assert reopened.count() == keep_lines + 1
+    hit = reopened.similarity_search("rocket engine", k=1)[0]
+    assert (hit.id, hit.page_content) == (new_id, "rocket engine fuel")
+
+
+def test_compact_rewrites_live_rows_and_keeps_ids(tmp_path):
+    directory = str(tmp_path / "idx")
+    store = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    ids = store.add_documents(_docs() * 50)
+    store.delete_by_file_ids(["f1", "f3"])
+
+    stats = store.compact()
+    assert stats["removed"] == 150
+    assert stats["reclaimed_bytes"] > 0
+    assert store.count() == 50
+    assert store.get(ids=[ids[2]])["documents"] == ["apple pie recipe"]
+    assert store.get(ids=[ids[0]])["ids"] == []
+
+    reopened = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    assert reopened.count() == 50 and reopened._size == 50
+    assert reopened.similarity_search("apple", k=1, filter={"file_id": "f2"})[0].page_content == "apple pie recipe"
+    assert store.compact()["removed"] == 0
+    assert not (tmp_path / "idx.compact").exists() and not (tmp_path / "idx.old").exists()
+
+
+def test_compact_respects_min_deleted_ratio_and_memory_index():
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    store.add_documents(_docs())
+    store.delete_by_file_ids(["f3"])
+
+    assert store.compact(min_deleted_ratio=0.5)["removed"] == 0
+    assert store.compact()["removed"] == 1
+    store.add_documents(_docs()[:1])
+    assert store.count() == 4
+    assert store.similarity_search("rocket", k=4, filter={"file_id": "f3"}) == []
+
+
+def _add_batches(directory, tag, batches):
+    store = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    for i in range(batches):
+        store.add_documents([Document(page_content=f"{tag} doc {i}", metadata={"file_id": f"{tag}-{i}"})])
+
+
+def test_two_stores_on_one_directory_do_not_overwrite_each_other(tmp_path):
+    directory = str(tmp_path / "idx")
+    api = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    cli = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    api.add_documents(_docs()[:2])
+    cli.add_documents(_docs()[2:])  # must append after the api's rows, not over them
+    cli.delete_by_file_ids(["f1"])
+
+    assert api.count() == 2
+    assert api.similarity_search("rocket engine", k=1)[0].page_content == "rocket engine fuel"
+    api.add_documents([Document(page_content="dog cat mouse", metadata={"file_id": "f4"})])
+
+    reopened = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    rows = reopened.get()
+    assert sorted(zip(rows["documents"], (m["file_id"] for m in rows["metadatas"]))) == [
+        ("apple pie recipe", "f2"), ("dog cat mouse", "f4"), ("rocket engine fuel", "f3"),
+    ]
+
+
+def test_concurrent_writer_processes_keep_rows_aligned(tmp_path):
+    directory = str(tmp_path / "idx")
+    context = multiprocessing.get_context("spawn")
+    workers = [context.Process(target=_add_batches, args=(directory, tag, 15)) for tag in ("api", "cli")]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(60)
+        assert worker.exitcode == 0
+
+    store = NumpyVectorStore(directory=directory, embedding_function=HashEmbeddings())
+    assert store.count() == 30
+    rows = store.get(include_embeddings=True)
+    for document, metadata, vector in zip(rows["documents"], rows["metadatas"], rows["embeddings"]):
+        tag, i = metadata["file_id"].split("-")
+        assert document == f"{tag} doc {i}"
+        expected = np.asarray(HashEmbeddings().embed_query(document))
+        np.testing.assert_allclose(vector, expected / np.linalg.norm(expected), rtol=1e-5)
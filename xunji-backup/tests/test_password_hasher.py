@@ -0,0 +1,72 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import app.services.password_hasher as password_hasher_module
+from app.api.endpoints import auth as auth_router
+from app.core.security import get_password_hash, pwd_context, verify_password
+from app.db.session import get_db
+from app.models.sql_models import Base
+from app.services.password_hasher import PasswordHasher, PasswordHasherBusy
+
+
+@pytest.fixture()
+def client(monkeypatch):
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    application = FastAPI()
+    application.include_router(auth_router.router, prefix="/api/auth")
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    application.dependency_overrides[get_db] = override_get_db
+    hasher = PasswordHasher(workers=1, queue_limit=4, nice=0)
+    monkeypatch.setattr(auth_router, "password_hasher", hasher)
+    yield TestClient(application)
+    hasher.shutdown()
+
+
+def test_register_and_login_hash_in_worker_process(client):
+    assert client.post("/api/auth/register", json={"username": "alice", "password": "hunter2"}).status_code == 200
+    r = client.post("/api/auth/login", json={"username": "alice", "password": "hunter2"})
+    assert r.status_code == 200 and r.json()["username"] == "alice"
+    r = client.post("/api/auth/login", json={"username": "alice", "password": "wrong"})
+    assert r.status_code == 401
+
+
+def test_verify_password_hashes_once(monkeypatch):
+    hashed = get_password_hash("pw")
+    calls = []
+    monkeypatch.setattr(pwd_context, "hash", lambda *a, **k: calls.append(a))
+    assert verify_password("pw", hashed) and not verify_password("other", hashed)
+    assert calls == []
+
+
+def test_queue_limit_fails_fast(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(password_hasher_module, "verify_password", lambda *args: release.wait(5))
+    hasher = PasswordHasher(workers=0, queue_limit=1)
+
+    async def storm():
+        first = asyncio.ensure_future(hasher.verify("a", "h"))
+        second = asyncio.ensure_future(hasher.verify("b", "h"))
+        await asyncio.sleep(0)
+        with pytest.raises(PasswordHasherBusy):
+            await hasher.verify("c", "h")
+        release.set()
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(storm()) == [True, True]
+    assert asyncio.run(hasher.verify("d", "h"))
@@ -0,0 +1,109 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.endpoints import auth as auth_router, history as history_router
+from app.core.security import create_access_token
+from app.db.session import get_db
+from app.models.sql_models import Base, Conversation, User
+import app.services.principal_cache as principal_cache_module
+from app.services.principal_cache import PrincipalCache, Principal, principal_cache
+
+
+@pytest.fixture()
+def setup():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with SessionLocal() as db:
+        db.add(User(id="u1", username="anon_u1", hashed_password="", device_id="dev-1", is_anonymous=True))
+        db.add(Conversation(id="c1", user_id="u1", title="t"))
+        db.commit()
+
+    application = FastAPI()
+    application.include_router(history_router.router, prefix="/api")
+    application.include_router(auth_router.router, prefix="/api/auth")
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # get_current_user 不覆盖：要测的就是它的缓存
+    application.dependency_overrides[get_db] = override_get_db
+    user_queries = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _count(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith("SELECT") and "FROM users" in statement:
+            user_queries.append(statement)
+
+    principal_cache.clear()
+    yield TestClient(application), SessionLocal, user_queries
+    principal_cache.clear()
+
+
+def test_repeated_requests_skip_user_lookup(setup):
+    client, _, user_queries = setup
+    headers = {"X-Device-ID": "dev-1"}
+    assert client.get("/api/conversations", headers=headers).status_code == 200
+    assert len(user_queries) == 1
+
+    # 同一用户换成 Token（user_id）认证，也命中同一条缓存
+    token = create_access_token({"sub": "anon_u1", "user_id": "u1"})
+    for _ in range(3):
+        assert client.get("/api/conversations", headers=headers).json()[0]["id"] == "c1"
+        r = client.get("/api/conversations", headers={"Authorization": f"Bearer {token}"})
+        assert r.json()[0]["id"] == "c1"
+    assert len(user_queries) == 1
+
+
+def test_upgrade_account_invalidates_cached_principal(setup):
+    client, _, _ = setup
+    headers = {"X-Device-ID": "dev-1"}
+    client.get("/api/conversations", headers=headers)
+    assert principal_cache.get("device", "dev-1").is_anonymous
+
+    r = client.post("/api/auth/upgrade-account", headers=headers, json={"username": "alice", "password": None})
+    assert r.status_code == 200
+    assert principal_cache.get("device", "dev-1") is None
+    assert principal_cache.get("username", "anon_u1") is None
+
+    client.get("/api/conversations", headers=headers)
+    assert principal_cache.get("device", "dev-1") == Principal("u1", "alice", "dev-1", False)
+
+
+def test_deleted_user_is_forgotten(setup):
+    client, SessionLocal, _ = setup
+    client.get("/api/conversations", headers={"X-Device-ID": "dev-1"})
+    assert principal_cache.get("id", "u1")
+    with SessionLocal() as db:
+        db.delete(db.get(Conversation, "c1"))
+        db.delete(db.get(User, "u1"))
+        db.commit()
+    assert principal_cache.get("id", "u1") is None
+
+
+def test_cache_is_bounded_and_expires(monkeypatch):
+    cache = PrincipalCache(size=2, ttl=60)
+    a, b = Principal("a", "a", None, False), Principal("b", "b", "dev-b", True)
+    cache.remember(a, cache.version_token(), [("id", "a")])
+    cache.remember(b, cache.version_token(), [("id", "b"), ("device", "dev-b")])
+    assert cache.get("id", "a") is None  # 超出容量，最久未用的被淘汰
+    assert cache.get("device", "dev-b") == b
+
+    # 查库期间发生过失效，查到的结果不写回
+    token = cache.version_token()
+    cache.forget(["b"])
+    cache.remember(b, token, [("id", "b")])
+    assert cache.get("id", "b") is None
+
+    cache.remember(a, cache.version_token(), [("id", "a")])
+    now = principal_cache_module.time.monotonic()
+    monkeypatch.setattr(principal_cache_module.time, "monotonic", lambda: now + 61)
+    assert cache.get("id", "a") is None
@@ -0,0 +1,183 @@
+import hashlib
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.sql_models import (
+    Base,
+    Conversation,
+    FileRecord,
+    Message,
+    MessageAttachment,
+    TreeNode,
+    User,
+)
+from app.services import purge_service as purge_mod
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+from app.services.tree_service import tree_service
+
+
+class HashEmbeddings:
+    def _embed(self, text):
+        vec = np.zeros(16, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class Upload:
+    def __init__(self, body):
+        self.file = io.BytesIO(body)
+
+
+class FakeObjectStorage:
+    def __init__(self):
+        self.deleted = []
+        self.broken = set()
+
+    def delete_object(self, *, key, provider=None):
+        if key in self.broken:
+            raise RuntimeError("boom")
+        self.deleted.append(key)
+
+
+@pytest.fixture()
+def SessionLocal(tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_FILE_PATH", str(tmp_path / "rag_files"))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    monkeypatch.setattr(rag_service, "_get_vector_store", lambda: store)
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    seed = factory()
+    seed.add(User(id="u1", username="u1", hashed_password="x"))
+    seed.commit()
+    seed.close()
+    return factory
+
+
+@pytest.fixture()
+def storage(monkeypatch):
+    fake = FakeObjectStorage()
+    monkeypatch.setattr(purge_mod, "object_storage", fake)
+    return fake
+
+
+def _conversation(db, cid, deleted_at=None, attachment_key=None):
+    db.add(Conversation(id=cid, user_id="u1", is_deleted=deleted_at is not None, deleted_at=deleted_at))
+    db.add(Message(id=f"{cid}-m1", conversation_id=cid, role="user", content="hi"))
+    db.add(TreeNode(id=f"{cid}-n1", conversation_id=cid, message_id=f"{cid}-m1"))
+    if attachment_key:
+        db.add(MessageAttachment(conversation_id=cid, message_id=f"{cid}-m1", user_id="u1", filename="a.png",
+                                 size=10, storage_provider="cos", storage_key=attachment_key, url=""))
+
+
+def test_purges_conversations_past_retention(SessionLocal, storage):
+    now = datetime.now()
+    db = SessionLocal()
+    _conversation(db, "old", now - timedelta(days=40), attachment_key="k-old")
+    _conversation(db, "recent", now - timedelta(days=1), attachment_key="k-recent")
+    _conversation(db, "live", attachment_key="k-live")
+    _conversation(db, "stuck", now - timedelta(days=40), attachment_key="k-stuck")
+    # Soft-deleted before deleted_at existed: stamped now, purged after the retention period.
+    db.add(Conversation(id="legacy", user_id="u1", is_deleted=True))
+    db.commit()
+    db.close()
+    storage.broken.add("k-stuck")
+
+    service = purge_mod.PurgeService(retention_days=30, batch_size=1)
+    dry = service.run(SessionLocal, dry_run=True, now=now)
+    assert dry["conversations"] == 2 and storage.deleted == []
+
+    report = service.run(SessionLocal, now=now)
+    assert report["conversations"] == 1
+    assert report["messages"] == 1 and report["tree_nodes"] == 1 and report["attachments"] == 1
+    assert report["object_bytes"] == 10 and len(report["errors"]) == 1
+    assert storage.deleted == ["k-old"]
+
+    db = SessionLocal()
+    assert {c.id for c in db.query(Conversation)} == {"recent", "live", "stuck", "legacy"}
+    assert db.query(Message).filter(Message.conversation_id == "old").count() == 0
+    assert db.query(Conversation).filter(Conversation.id == "legacy").one().deleted_at == now
+    db.close()
+
+    assert service.run(SessionLocal, now=now + timedelta(days=31))["conversations"] == 2  # recent + legacy
+
+
+def test_purge_bumps_tree_versions_and_drops_cached_ones(SessionLocal, storage):
+    now = datetime.now()
+    db = SessionLocal()
+    _conversation(db, "live")
+    _conversation(db, "old", now - timedelta(days=40))
+    db.add(Message(id="live-m2", conversation_id="live", role="ai", content="bye"))
+    db.add(TreeNode(id="live-n2", conversation_id="live", message_id="live-m2", parent_id="live-n1",
+                    is_deleted=True, deleted_at=now - timedelta(days=40)))
+    db.commit()
+    version = db.get(Conversation, "live").tree_version
+    db.close()
+    for cid in ("live", "old"):
+        tree_service.remember_version(cid, "u1", version, tree_service.version_token())
+
+    report = purge_mod.PurgeService(retention_days=30).run(SessionLocal, now=now)
+    assert report["conversations"] == 1 and report["tree_nodes"] == 2
+
+    # 批量删除绕过了 flush 钩子：版本号仍要递增，缓存的旧版本也要失效，否则 If-None-Match 会拿到过期的 304
+    assert tree_service.cached_version("live", "u1") is None
+    assert tree_service.cached_version("old", "u1") is None
+    db = SessionLocal()
+    assert db.get(Conversation, "live").tree_version == version + 1
+    db.close()
+
+
+def test_purges_files_temp_vectors_and_orphans(SessionLocal, storage, tmp_path):
+    db = SessionLocal()
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(b"alpha beta gamma"), "doc.md", "u1")
+    stored = tmp_path / "rag_files" / f"{record.id}__doc.md"
+    assert stored.exists()
+    knowledge_base_service.delete_files(db, [record])
+    db.add(MessageAttachment(conversation_id="gone", message_id="gone", user_id="u1", filename="a.png", size=5,
+                             storage_provider="cos", storage_key="k-orphan", url="",
+                             created_at=datetime.now() - timedelta(days=1)))
+    db.commit()
+    db.close()
+
+    orphan = tmp_path / "rag_files" / "0c4e6bb5-6a4e-4d7e-9d0c-1234567890ab__lost.md"
+    orphan.write_bytes(b"x" * 7)
+    old = time.time() - 2 * 3600
+    os.utime(orphan, (old, old))
+    fresh = tmp_path / "rag_files" / "1c4e6bb5-6a4e-4d7e-9d0c-1234567890ab__new.md"
+    fresh.write_bytes(b"y")
+
+    temp = Document(page_content="temp text", metadata={"file_id": "temp-1", "temp": True, "temp_created_at": old})
+    live = Document(page_content="temp text", metadata={"file_id": "temp-2", "temp": True,
+                                                         "temp_created_at": time.time()})
+    rag_service.vector_store.add_documents([temp, live])
+
+    report = purge_mod.PurgeService(retention_days=0).run(SessionLocal, now=datetime.now() + timedelta(seconds=1))
+    assert report["files"] == 1 and report["orphan_files"] == 1
+    assert report["temp_vectors"] == 1 and report["attachments"] == 1
+    assert report["disk_bytes"] == len(b"alpha beta gamma") + 7
+    assert report["reclaimed_bytes"] == report["disk_bytes"] + 5
+    assert not stored.exists() and not orphan.exists() and fresh.exists()
+    assert rag_service.vector_store.get(filter={"temp": True})["metadatas"][0]["file_id"] == "temp-2"
+
+    db = SessionLocal()
+    assert db.query(FileRecord).count() == 0 and db.query(MessageAttachment).count() == 0
+    db.close()
@@ -0,0 +1,125 @@
+import re
+from datetime import datetime
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event, inspect, text
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.api.endpoints import history as history_router
+from app.api.endpoints import instructions as instructions_router
+from app.api.endpoints import upload as upload_router
+from app.db.migrations import MIGRATIONS, applied_versions, run_migrations
+from app.db.session import get_db
+from app.models.sql_models import (
+    AiInstruction,
+    Base,
+    Conversation,
+    ConversationAiInstruction,
+    FileRecord,
+    Message,
+    MessageAttachment,
+    TreeNode,
+    User,
+)
+
+_FULL_SCAN = re.compile(r"^SCAN (\w+)$")
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    return engine
+
+
+@pytest.fixture()
+def client(engine):
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    db = factory()
+    db.add(User(id="u1", username="u1", hashed_password="x"))
+    db.add(Conversation(id="c1", user_id="u1", title="t"))
+    for i in range(3):
+        db.add(Message(id=f"m{i}", conversation_id="c1", role="user", content=f"q{i}", created_at=datetime(2026, 1, 1, 0, i)))
+        db.add(TreeNode(id=f"n{i}", conversation_id="c1", message_id=f"m{i}", parent_id=f"n{i - 1}" if i else None))
+    db.add(MessageAttachment(conversation_id="c1", message_id="m0", user_id="u1", filename="a.png",
+                             storage_key="k", url="https://example.invalid/k"))
+    db.add(AiInstruction(user_id="u1", content="be brief"))
+    db.add(ConversationAiInstruction(conversation_id="c1", user_id="u1", content="in English"))
+    db.add(FileRecord(id="f1", user_id="u1", filename="a.txt", file_path="/tmp"))
+    db.commit()
+    db.close()
+
+    application = FastAPI()
+    for module in (history_router, instructions_router, upload_router):
+        application.include_router(module.router, prefix="/api")
+
+    def override_get_db():
+        session = factory()
+        try:
+            yield session
+        finally:
+            session.close()
+
+    async def override_current_user():
+        return User(id="u1", username="u1", hashed_password="x")
+
+    application.dependency_overrides[get_db] = override_get_db
+    application.dependency_overrides[get_current_user] = override_current_user
+    return TestClient(application)
+
+
+def test_migrations_add_indexes_to_an_old_schema(engine):
+    hot = ["ix_messages_conversation_created", "ix_tree_nodes_parent_id", "ix_files_user_deleted",
+           "ix_ai_instructions_user_order", "ix_conversation_ai_instructions_order"]
+    with engine.begin() as connection:
+        for name in hot:
+            connection.execute(text(f"DROP INDEX {name}"))
+        connection.execute(text("DELETE FROM schema_migrations WHERE version >= 5"))
+
+    assert run_migrations(engine) == [m.version for m in MIGRATIONS if m.version >= 5]
+    assert run_migrations(engine) == []
+    assert applied_versions(engine) == [m.version for m in MIGRATIONS]
+    inspector = inspect(engine)
+    names = {ix["name"] for table in inspector.get_table_names() for ix in inspector.get_indexes(table)}
+    assert set(hot) <= names
+
+
+def test_endpoint_queries_use_indexes(engine, client):
+    statements = []
+
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "WITH")) and not executemany:
+            statements.append((statement, parameters))
+
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        for url in (
+            "/api/conversations",
+            "/api/conversations/c1/messages",
+            "/api/conversations/c1/messages?limit=2&order=desc",
+            "/api/conversations/c1/messages/m1",
+            "/api/tree/path/n2",
+            "/api/conversations/c1/tree",
+            "/api/instructions",
+            "/api/conversations/c1/instructions",
+            "/api/files",
+        ):
+            assert client.get(url).status_code == 200, url
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+    assert statements
+    scans = []
+    with engine.connect() as connection:
+        for statement, parameters in statements:
+            plan = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters).fetchall()
+            for row in plan:
+                match = _FULL_SCAN.match(row[-1])
+                if match and match.group(1) in Base.metadata.tables:
+                    scans.append((match.group(1), statement))
+    assert scans == []
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+
+from app.api.endpoints import history as history_router, instructions as instructions_router
+from app.db import session as session_module
+from app.db.migrations import run_migrations
+from app.db.session import create_app_engine, get_db
+from app.models.sql_models import Base, Conversation, Message, TreeNode, User
+from app.services.tree_service import tree_service
+
+# 设置后额外在真实 PostgreSQL 上跑一遍建表、迁移与树查询，例如 postgresql+psycopg2://postgres@localhost/xunji_test
+TEST_POSTGRES_URL = os.getenv("TEST_POSTGRES_URL")
+
+
+def _seed(factory, title):
+    with factory() as db:
+        db.add(User(id="u1", username="u1", hashed_password="", device_id="dev-1", is_anonymous=True))
+        db.add(Conversation(id="c1", user_id="u1", title=title))
+        db.commit()
+
+
+@pytest.fixture()
+def databases(tmp_path, monkeypatch):
+    """两个 SQLite 文件充当主库与副本；副本只在建立时同步一次，之后的写入都不会复制过去（模拟复制延迟）"""
+    primary = create_app_engine(f"sqlite:///{(tmp_path / 'primary.db').as_posix()}")
+    replica_writer = create_app_engine(f"sqlite:///{(tmp_path / 'replica.db').as_posix()}")
+    for engine in (primary, replica_writer):
+        Base.metadata.create_all(bind=engine)
+    Primary = sessionmaker(autocommit=False, autoflush=False, bind=primary)
+    _seed(Primary, "primary title")
+    _seed(sessionmaker(bind=replica_writer), "replica title")
+    replica_writer.dispose()
+
+    replica = create_app_engine(f"sqlite:///{(tmp_path / 'replica.db').as_posix()}", read_only=True)
+    monkeypatch.setattr(session_module, "ReplicaSessionLocal", sessionmaker(bind=replica))
+    monkeypatch.setattr(session_module, "_sticky_until", {})
+    yield Primary, replica
+    primary.dispose()
+    replica.dispose()
+
+
+def _client(Primary):
+    application = FastAPI()
+    application.include_router(history_router.router, prefix="/api")
+    application.include_router(instructions_router.router, prefix="/api")
+
+    def override_get_db():
+        db = Primary()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    # get_current_user 不覆盖：它负责把用户记到主库会话上，写入提交后才会粘住主库
+    application.dependency_overrides[get_db] = override_get_db
+    return TestClient(application, headers={"X-Device-ID": "dev-1"})
+
+
+def test_reads_go_to_replica_until_user_writes(databases, monkeypatch):
+    Primary, _ = databases
+    client = _client(Primary)
+
+    assert client.get("/api/conversations").json()[0]["title"] == "replica title"
+    assert client.get("/api/instructions").json() == []
+
+    # 写入走主库，之后该用户的读请求粘在主库上，能读到自己刚写的数据
+    assert client.post("/api/instructions", json={"content": "be brief"}).status_code == 200
+    assert [i["content"] for i in client.get("/api/instructions").json()] == ["be brief"]
+    assert client.get("/api/conversations").json()[0]["title"] == "primary title"
+
+    # 粘滞期结束后回到副本（副本还没有复制到这条指令）
+    monkeypatch.setattr(session_module, "_sticky_until", {})
+    assert client.get("/api/instructions").json() == []
+
+
+def test_replica_connections_are_read_only(databases):
+    _, replica = databases
+    with pytest.raises(OperationalError):
+        with replica.begin() as conn:
+            conn.execute(text("UPDATE conversations SET title = 'x'"))
+
+
+@pytest.mark.skipif(not TEST_POSTGRES_URL, reason="TEST_POSTGRES_URL 未设置")
+def test_postgres_schema_and_tree_queries():
+    engine = create_app_engine(TEST_POSTGRES_URL)
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    run_migrations(engine)
+    factory = sessionmaker(bind=engine)
+    _seed(factory, "pg")
+    db = factory()
+    try:
+        # 一条主链，每第 7 个节点从根另起一个分支
+        for i in range(40):
+            parent = None if i == 0 else "n0" if i % 7 == 0 else f"n{i - 1}"
+            db.add(Message(id=f"m{i}", conversation_id="c1", role="user" if i % 2 == 0 else "ai", content=str(i)))
+            db.add(TreeNode(id=f"n{i}", conversation_id="c1", message_id=f"m{i}", parent_id=parent))
+            db.commit()
+        chain = [row.node_id for row in tree_service.ancestors(db, db.get(TreeNode, "n39"))]
+        assert chain == ["n0", "n35", "n36", "n37", "n38", "n39"]
+        assert {row.id for row in tree_service.subtree(db, db.get(TreeNode, "n0"))} == {f"n{i}" for i in range(40)}
+        timeout = db.execute(text("SELECT setting FROM pg_settings WHERE name = 'statement_timeout'")).scalar()
+        assert timeout == str(session_module.PG_STATEMENT_TIMEOUT_MS)
+    finally:
+        db.close()
+        Base.metadata.drop_all(bind=engine)
+        engine.dispose()
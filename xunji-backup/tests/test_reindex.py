@@ -0,0 +1,136 @@
+import hashlib
+import io
+import os
+
+import numpy as np
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.models.sql_models import Base
+from app.services import reindex_service as reindex_mod
+from app.services import rag_service as rag_mod
+from app.services.knowledge_base_service import knowledge_base_service
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+
+
+class ModelEmbeddings:
+    def __init__(self, model, dim):
+        self.model = model
+        self.dim = dim
+
+    def _embed(self, text):
+        vec = np.zeros(self.dim, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dim] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+def fake_build_embeddings(config):
+    return ModelEmbeddings(config["model"], 8 if config["model"] == "v1" else 24)
+
+
+class Upload:
+    def __init__(self, body):
+        self.file = io.BytesIO(body)
+
+
+@pytest.fixture()
+def SessionLocal():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture()
+def env(tmp_path, monkeypatch):
+    persist = tmp_path / "vectors"
+    monkeypatch.setenv("PERSIST_DIRECTORY", str(persist))
+    monkeypatch.setenv("RAG_FILE_PATH", str(tmp_path / "rag_files"))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+
+    def create_store(collection_name, persist_directory, embeddings=None):
+        return NumpyVectorStore(
+            directory=os.path.join(persist_directory, "numpy", collection_name),
+            embedding_function=embeddings or rag_service.embeddings,
+        )
+
+    config = {"provider": "fake", "model": "v1"}
+    monkeypatch.setattr(rag_service, "_create_vector_store", create_store)
+    monkeypatch.setattr(rag_service, "embedding_config", dict(config))
+    monkeypatch.setattr(rag_service, "embeddings", fake_build_embeddings(config))
+    monkeypatch.setattr(rag_service, "collection_name", "kb")
+    monkeypatch.setattr(rag_service, "_vector_store", None)
+    monkeypatch.setattr(rag_service, "_pointer_mtime", None)
+    monkeypatch.setattr(rag_mod, "build_embeddings", fake_build_embeddings)
+    monkeypatch.setattr(reindex_mod, "build_embeddings", fake_build_embeddings)
+    monkeypatch.setattr(reindex_mod, "RAG_COLLECTION_NAME", "kb")
+    # The environment now asks for the new model; the existing vectors were built with v1.
+    new_config = {"provider": "fake", "model": "v2"}
+    monkeypatch.setattr(reindex_mod, "embedding_config_from_env", lambda: dict(new_config))
+    monkeypatch.setattr(rag_mod, "embedding_config_from_env", lambda: dict(new_config))
+    return persist
+
+
+def _ingest(SessionLocal, name, body):
+    db = SessionLocal()
+    record, _ = knowledge_base_service.ingest_upload(db, Upload(body), name, None)
+    file_id = record.id
+    db.close()
+    return file_id
+
+
+def test_interrupted_reindex_resumes_and_switches(SessionLocal, env):
+    ids = [_ingest(SessionLocal, f"{i}.md", f"Document number {i} about rockets.".encode()) for i in range(3)]
+    old_store = rag_service.vector_store
+    assert rag_service.collection_name == "kb"
+
+    seen = []
+
+    def crash_after_first(key, status, error):
+        seen.append(key)
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        reindex_mod.ReindexService(workers=1).run(SessionLocal, progress=crash_after_first)
+    checkpoint = reindex_mod.reindex_service.load_checkpoint(str(env))
+    assert seen[0] in checkpoint["done"]
+    # Searches are still served by the old collection and model.
+    assert rag_service.vector_store is old_store and rag_service.embedding_config["model"] == "v1"
+
+    resumed = []
+    summary = reindex_mod.ReindexService(workers=2).run(SessionLocal, progress=lambda k, s, e: resumed.append(k))
+
+    assert summary["switched"] and summary["indexed"] == 3
+    assert seen[0] not in resumed and len(resumed) <= 2
+    assert summary["collection"] == checkpoint["collection"]
+    assert not os.path.exists(env / reindex_mod.CHECKPOINT_FILE)
+
+    store = rag_service.vector_store
+    assert rag_service.collection_name == summary["collection"]
+    assert rag_service.embedding_config["model"] == "v2" and store.embedding_function.dim == 24
+    assert store.count() == 3
+    assert {d.metadata["file_id"] for d in store.similarity_search("rockets", k=5)} == set(ids)
+
+
+def test_missing_files_block_switch_unless_allowed(SessionLocal, env, tmp_path):
+    keep = _ingest(SessionLocal, "keep.md", b"Kept document.")
+    gone = _ingest(SessionLocal, "gone.md", b"Lost document.")
+    os.remove(tmp_path / "rag_files" / f"{gone}__gone.md")
+
+    blocked = reindex_mod.ReindexService().run(SessionLocal)
+    assert not blocked["switched"] and blocked["missing"] == {gone: "gone.md"}
+    assert rag_service.collection_name == "kb"
+
+    done = reindex_mod.ReindexService().run(SessionLocal, allow_missing=True, drop_old=True)
+    assert done["switched"] and done["collection"] == blocked["collection"]
+    assert {d.metadata["file_id"] for d in rag_service.search("document", k=5)} == {keep}
+    assert not os.path.exists(env / "numpy" / "kb")
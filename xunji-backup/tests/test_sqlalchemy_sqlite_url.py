@@ -38,3 +38,20 @@ def test_normalize_sqlite_url_keeps_memory_database(monkeypatch: pytest.MonkeyPa
 
     normalized = module._normalize_database_url("sqlite:///:memory:")
     assert normalized == "sqlite:///:memory:"
+
+
+def test_sqlite_file_engine_applies_production_pragmas(tmp_path: Path, monkeypatch: pytest.MonkeyPatch):
+    module = _reload_session_module(monkeypatch, "sqlite:///:memory:")
+
+    engine = module.create_app_engine(f"sqlite:///{(tmp_path / 'xunji1.db').as_posix()}", sqlite_profile=True)
+    with engine.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "wal"
+        assert conn.exec_driver_sql("PRAGMA synchronous").scalar() == 1  # NORMAL
+        assert conn.exec_driver_sql("PRAGMA busy_timeout").scalar() == module.SQLITE_BUSY_TIMEOUT_MS
+    assert engine.pool.size() == module.SQLITE_POOL_SIZE
+    engine.dispose()
+
+    legacy = module.create_app_engine(f"sqlite:///{(tmp_path / 'legacy.db').as_posix()}", sqlite_profile=False)
+    with legacy.connect() as conn:
+        assert conn.exec_driver_sql("PRAGMA journal_mode").scalar() == "delete"
+    legacy.dispose()
@@ -0,0 +1,54 @@
+from app.services.text_splitter import TokenAwareTextSplitter, estimate_tokens
+
+
+def test_estimate_tokens_counts_cjk_and_words_without_slicing():
+    text = "前缀你好 world, hello。后缀"
+    assert estimate_tokens(text) == 2 + 2 + 2 + 1 + 2 + 1 + 2
+    assert estimate_tokens(text, 2, 4) == 2
+
+
+def test_chunks_end_on_sentence_boundaries_within_budget():
+    text = "".join(f"这是第{i}句话，内容比较完整。" for i in range(200))
+    splitter = TokenAwareTextSplitter(chunk_tokens=50)
+
+    spans = splitter.split_spans(text)
+    chunks = splitter.split_text(text)
+
+    assert len(chunks) > 1
+    assert all(c.endswith("。") for c in chunks)
+    assert all(tokens <= 50 for _, _, tokens in spans)
+    assert "".join(chunks) == text
+
+
+def test_prefers_paragraph_break_when_chunk_is_half_full():
+    para1 = "Alpha beta gamma. " * 4
+    para2 = "Delta epsilon zeta. " * 6
+    text = para1.strip() + "\n\n" + para2.strip()
+    splitter = TokenAwareTextSplitter(chunk_tokens=30)
+
+    chunks = splitter.split_text(text)
+
+    assert chunks[0] == para1.strip()
+
+
+def test_overlap_repeats_whole_sentences_only():
+    text = "一二三四五。六七八九十。" * 10
+    splitter = TokenAwareTextSplitter(chunk_tokens=12, overlap_tokens=6)
+
+    chunks = splitter.split_text(text)
+
+    assert len(chunks) > 2
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert nxt.startswith(prev[-6:])
+
+
+def test_oversized_sentence_is_hard_split():
+    text = "字" * 120
+    chunks = TokenAwareTextSplitter(chunk_tokens=50).split_text(text)
+    assert [len(c) for c in chunks] == [50, 50, 20]
+
+
+def test_empty_and_whitespace_input():
+    splitter = TokenAwareTextSplitter(chunk_tokens=10)
+    assert splitter.split_text("") == []
+    assert splitter.split_text("  \n\n  ") == []
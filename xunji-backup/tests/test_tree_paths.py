@@ -0,0 +1,142 @@
+import random
+import threading
+
+import pytest
+from sqlalchemy import create_engine, update
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.db.migrations import backfill_tree_paths
+from app.db.session import create_app_engine
+from app.models.sql_models import Base, Conversation, Message, TreeNode, User
+from app.services.tree_service import tree_service
+
+
+@pytest.fixture()
+def engine():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    return engine
+
+
+def _grow(db, count, seed=0):
+    """Random branched tree; half of the nodes are flushed one by one, the rest in one flush."""
+    rng = random.Random(seed)
+    db.add(User(id="u1", username="u1", hashed_password="x"))
+    db.add(Conversation(id="c1", user_id="u1"))
+    parents = {}
+    for i in range(count):
+        parent = None
+        if i:
+            parent = f"n{rng.randrange(i)}" if rng.random() < 0.3 else f"n{i - 1}"
+        parents[f"n{i}"] = parent
+        db.add(Message(id=f"m{i}", conversation_id="c1", role="user" if i % 2 == 0 else "ai", content=str(i)))
+        db.add(TreeNode(id=f"n{i}", conversation_id="c1", message_id=f"m{i}", parent_id=parent))
+        if i < count // 2:
+            db.flush()
+    db.commit()
+    return parents
+
+
+def _check(db, parents):
+    children = {}
+    for node_id, parent in parents.items():
+        children.setdefault(parent, []).append(node_id)
+
+    def chain(node_id):
+        out = []
+        while node_id:
+            out.append(node_id)
+            node_id = parents[node_id]
+        return out[::-1]
+
+    def below(node_id):
+        out, stack = set(), [node_id]
+        while stack:
+            current = stack.pop()
+            out.add(current)
+            stack.extend(children.get(current, []))
+        return out
+
+    nodes = {node.id: node for node in db.query(TreeNode).all()}
+    for node_id in random.Random(1).sample(sorted(parents), 40):
+        node = nodes[node_id]
+        assert [row.node_id for row in tree_service.ancestors(db, node)] == chain(node_id)
+        assert [row.node_id for row in tree_service.ancestors(db, node, include_self=False, limit=3)] == chain(node_id)[-4:-1]
+        assert {n.id for n in tree_service.subtree(db, node)} == below(node_id)
+        assert {n.id for n in tree_service.siblings(db, node)} == set(children[parents[node_id]]) - {node_id}
+        assert {n.id for n in tree_service.leaves(db, "c1", under=node)} == {
+            n for n in below(node_id) if n not in children
+        }
+    assert {n.id for n in tree_service.leaves(db, "c1")} == set(parents) - set(children)
+
+
+def test_paths_assigned_on_insert(engine):
+    db = sessionmaker(bind=engine)()
+    parents = _grow(db, 300)
+    _check(db, parents)
+
+    # Siblings added after others were hard-deleted must not reuse a taken ordinal.
+    branched = next(p for p in parents.values() if p and list(parents.values()).count(p) >= 2)
+    first = tree_service.subtree(db, db.get(TreeNode, branched), include_self=False)[0]
+    second = tree_service.siblings(db, first)[0]
+    doomed = [row.id for row in tree_service.subtree(db, first)]
+    db.query(TreeNode).filter(TreeNode.id.in_(doomed)).delete(synchronize_session=False)
+    db.commit()
+    db.add(Message(id="m-new", conversation_id="c1", role="user", content="new"))
+    db.add(TreeNode(id="n-new", conversation_id="c1", message_id="m-new", parent_id=second.parent_id))
+    db.commit()
+    paths = [n.path for n in tree_service.siblings(db, second, include_self=True)]
+    assert len(paths) == len(set(paths))
+
+
+def test_backfill_matches_insert_paths(engine):
+    db = sessionmaker(bind=engine)()
+    parents = _grow(db, 200, seed=3)
+    db.execute(update(TreeNode).values(path=None, depth=None))
+    db.commit()
+
+    assert backfill_tree_paths(engine) == 200
+    db.expire_all()
+    _check(db, parents)
+    assert backfill_tree_paths(engine) == 0
+
+
+def test_concurrent_children_get_distinct_paths(tmp_path):
+    """两个事务同时给同一父节点加子节点：后提交的必须看到先提交的兄弟，分到不同的 path"""
+    engine = create_app_engine(f"sqlite:///{(tmp_path / 'tree.db').as_posix()}")
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    with factory() as db:
+        db.add(User(id="u1", username="u1", hashed_password="x"))
+        db.add(Conversation(id="c1", user_id="u1"))
+        db.add(Message(id="m0", conversation_id="c1", role="user", content="0"))
+        db.add(TreeNode(id="n0", conversation_id="c1", message_id="m0"))
+        db.commit()
+
+    def add_child(db, i):
+        db.add(Message(id=f"m{i}", conversation_id="c1", role="ai", content=str(i)))
+        db.add(TreeNode(id=f"n{i}", conversation_id="c1", message_id=f"m{i}", parent_id="n0"))
+
+    first = factory()
+    add_child(first, 1)
+    first.flush()
+
+    def second():
+        with factory() as db:
+            add_child(db, 2)
+            db.commit()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    thread.join(0.3)
+    assert thread.is_alive()  # 等待第一个事务释放会话锁
+    first.commit()
+    first.close()
+    thread.join(10)
+
+    with factory() as db:
+        paths = {node.id: node.path for node in db.query(TreeNode)}
+        assert paths["n1"] != paths["n2"]
+        assert [row.node_id for row in tree_service.ancestors(db, db.get(TreeNode, "n2"))] == ["n0", "n2"]
+    engine.dispose()
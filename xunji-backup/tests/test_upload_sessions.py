@@ -0,0 +1,199 @@
+import hashlib
+import time
+
+import numpy as np
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+from app.api.deps import get_current_user
+from app.api.endpoints import upload_sessions as upload_sessions_router
+from app.models.sql_models import Base, FileRecord, User
+from app.services import upload_session_service as session_mod
+from app.services.numpy_vector_store import NumpyVectorStore
+from app.services.rag_service import rag_service
+
+
+class HashEmbeddings:
+    def _embed(self, text):
+        vec = np.zeros(16, dtype=np.float32)
+        for word in text.lower().split():
+            vec[int(hashlib.md5(word.encode()).hexdigest(), 16) % 16] += 1.0
+        return vec.tolist()
+
+    def embed_documents(self, texts):
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+BODY = b"Alpha beta gamma. Delta epsilon zeta. Eta theta iota."
+
+
+@pytest.fixture()
+def SessionLocal():
+    engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=engine)
+    factory = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    seed = factory()
+    seed.add(User(id="u1", username="u1", hashed_password="x"))
+    seed.commit()
+    seed.close()
+    return factory
+
+
+@pytest.fixture()
+def client(SessionLocal, tmp_path, monkeypatch):
+    monkeypatch.setenv("RAG_FILE_PATH", str(tmp_path / "rag_files"))
+    monkeypatch.setenv("SPLIT_FILENAME_ID", "__")
+    monkeypatch.setattr(session_mod.upload_session_service, "staging_dir", str(tmp_path / "staging"))
+    monkeypatch.setattr(upload_sessions_router, "SessionLocal", SessionLocal)
+    store = NumpyVectorStore(directory=None, embedding_function=HashEmbeddings())
+    monkeypatch.setattr(rag_service, "_get_vector_store", lambda: store)
+
+    application = FastAPI()
+    application.include_router(upload_sessions_router.router, prefix="/api")
+
+    async def override_current_user():
+        return User(id="u1", username="u1", hashed_password="x")
+
+    application.dependency_overrides[get_current_user] = override_current_user
+    return TestClient(application)
+
+
+def _put(client, session_id, start, data, sha=None):
+    headers = {"Content-Range": f"bytes {start}-{start + len(data) - 1}/{len(BODY)}"}
+    if sha:
+        headers["X-Chunk-SHA256"] = sha
+    return client.put(f"/api/upload/sessions/{session_id}", content=data, headers=headers)
+
+
+def test_resumable_upload_flow(client, SessionLocal, tmp_path):
+    created = client.post(
+        "/api/upload/sessions",
+        json={"filename": "doc.md", "size": len(BODY), "sha256": hashlib.sha256(BODY).hexdigest()},
+    ).json()
+    sid = created["session_id"]
+
+    assert _put(client, sid, 0, BODY[:20]).json()["offset"] == 20
+    gap = _put(client, sid, 30, BODY[30:40])
+    assert gap.status_code == 409 and gap.json()["detail"]["offset"] == 20
+    assert _put(client, sid, 0, BODY[:20]).json()["offset"] == 20
+    assert _put(client, sid, 20, BODY[20:40], sha="0" * 64).status_code == 400
+    assert client.get(f"/api/upload/sessions/{sid}").json()["offset"] == 20
+
+    chunk = BODY[20:]
+    assert _put(client, sid, 20, chunk, sha=hashlib.sha256(chunk).hexdigest()).json()["offset"] == len(BODY)
+
+    done = client.post(f"/api/upload/sessions/{sid}/complete")
+    assert done.status_code == 202
+    state = client.get(f"/api/upload/sessions/{sid}").json()
+    assert state["status"] == "done"
+
+    db = SessionLocal()
+    record = db.query(FileRecord).filter(FileRecord.id == state["file_id"]).one()
+    db.close()
+    assert record.content_hash == hashlib.sha256(BODY).hexdigest()
+    assert (tmp_path / "rag_files" / f"{record.id}__doc.md").read_bytes() == BODY
+    assert rag_service.vector_store.count() > 0
+
+
+def test_complete_rejects_incomplete_or_corrupt_upload(client):
+    sid = client.post(
+        "/api/upload/sessions", json={"filename": "doc.md", "size": len(BODY), "sha256": "ab" * 32}
+    ).json()["session_id"]
+    _put(client, sid, 0, BODY[:10])
+    assert client.post(f"/api/upload/sessions/{sid}/complete").status_code == 400
+
+    _put(client, sid, 10, BODY[10:])
+    r = client.post(f"/api/upload/sessions/{sid}/complete")
+    assert r.status_code == 400 and "sha256" in r.json()["detail"]
+
+
+def test_gc_removes_abandoned_sessions(client):
+    sid = client.post("/api/upload/sessions", json={"filename": "doc.md", "size": 10}).json()["session_id"]
+
+    assert session_mod.upload_session_service.gc(now=time.time()) == 0
+    assert session_mod.upload_session_service.gc(now=time.time() + session_mod.UPLOAD_SESSION_TTL_SECONDS + 1) == 1
+    assert client.get(f"/api/upload/sessions/{sid}").status_code == 404
+
+
+def test_abort_waits_for_a_running_chunk_write(client):
+    service = session_mod.upload_session_service
+    sid = client.post("/api/upload/sessions", json={"filename": "doc.md", "size": len(BODY)}).json()["session_id"]
+
+    service._claim(sid)  # a chunk write on this session is still running
+    try:
+        assert client.delete(f"/api/upload/sessions/{sid}").status_code == 409
+        assert client.get(f"/api/upload/sessions/{sid}").status_code == 200
+    finally:
+        service._release(sid)
+
+    assert client.delete(f"/api/upload/sessions/{sid}").status_code == 200
+    assert client.get(f"/api/upload/sessions/{sid}").status_code == 404
+
+
+def test_sessions_work_while_bulk_archives_are_staged(client, tmp_path):
+    service = session_mod.upload_session_service
+    archive = service.bulk_archive_path("job-1", 0)
+    with open(archive, "wb") as f:
+        f.write(b"PK")
+    # A ZIP staged next to the sessions by an older version, before archives got their own directory
+    stray = tmp_path / "staging" / "bulk-old-0.zip"
+    stray.write_bytes(b"PK")
+
+    r = client.post("/api/upload/sessions", json={"filename": "doc.md", "size": 10})
+    assert r.status_code == 200
+    assert tmp_path.joinpath("staging", ".bulk", "bulk-job-1-0.zip").exists() and stray.exists()
+
+    assert service.gc(now=time.time() + session_mod.UPLOAD_SESSION_TTL_SECONDS + 1) == 1
+    assert sorted(p.name for p in (tmp_path / "staging").iterdir()) == [".bulk"]
+    assert list((tmp_path / "staging" / ".bulk").iterdir()) == []
+
+
+@pytest.mark.parametrize("name", ["/../../escaped.md", "../escaped.md", "sub/escaped.md"])
+def test_create_refuses_traversal_filenames(client, tmp_path, name):
+    r = client.post("/api/upload/sessions", json={"filename": name, "size": len(BODY)})
+    assert r.status_code == 400
+    assert not (tmp_path / "staging").exists() or not list((tmp_path / "staging").iterdir())
+
+
+def test_chunk_write_runs_off_the_event_loop(client, monkeypatch):
+    import asyncio
+
+    sid = client.post("/api/upload/sessions", json={"filename": "doc.md", "size": len(BODY)}).json()["session_id"]
+    write_chunk = session_mod.upload_session_service.write_chunk
+    on_loop = []
+
+    def spy(*args, **kwargs):
+        try:
+            asyncio.get_running_loop()
+            on_loop.append(True)
+        except RuntimeError:
+            on_loop.append(False)
+        return write_chunk(*args, **kwargs)
+
+    monkeypatch.setattr(session_mod.upload_session_service, "write_chunk", spy)
+    assert _put(client, sid, 0, BODY[:10]).json()["offset"] == 10
+    assert on_loop == [False]
+
+
+def test_gc_fails_sessions_whose_ingest_died(client, monkeypatch):
+    service = session_mod.upload_session_service
+    sid = client.post("/api/upload/sessions", json={"filename": "doc.md", "size": len(BODY)}).json()["session_id"]
+    _put(client, sid, 0, BODY)
+    service.complete(sid, "u1")  # 不调度 ingest：模拟入库途中进程退出
+
+    now = time.time()
+    monkeypatch.setattr(session_mod, "UPLOAD_SESSION_PROCESSING_TIMEOUT_SECONDS", 60)
+    assert service.gc(now=now + 30) == 0
+    assert service.get(sid)["status"] == "processing"
+
+    assert service.gc(now=now + 61) == 0
+    state = client.get(f"/api/upload/sessions/{sid}").json()
+    assert state["status"] == "failed" and state["error"]
+    assert service.gc(now=time.time() + session_mod.UPLOAD_SESSION_TTL_SECONDS + 1) == 1